@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Hand-written helpers layered on top of the generated Dialogflow clients.
+
+The generated surface lives in :mod:`google.cloud.dialogflow_v2`; the
+modules in this package only use its public clients, transports and types
+(plus the documented transport extension points) and are never touched by
+the code generator.
+"""
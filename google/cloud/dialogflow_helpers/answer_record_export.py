@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Export answer records of a time range, one sub-window per pager.
+
+``list_answer_records`` is a single sequential pager. An
+:class:`AnswerRecordExporter` splits the requested range into windows,
+restricts each window's pager with a ``filter`` on a time field and
+walks ``concurrency`` windows at once. Records come out newest window
+first, each window in the server's order, so the stream is ordered just
+like one pager over the whole range::
+
+    python -m google.cloud.dialogflow_helpers.answer_record_export \\
+        --project my-project --start 2023-06-01T00:00:00Z \\
+        --end 2023-06-02T00:00:00Z --window-minutes 60 \\
+        --time-field answer_feedback.display_time \\
+        --output records.jsonl --checkpoint records.done
+
+Each window buffers at most ``buffer_pages`` pages ahead of the reader,
+so memory is bounded by ``concurrency * buffer_pages * page_size``
+records. With a checkpoint, finished windows are skipped on the next
+run and records of an interrupted window are not written twice.
+
+``filter`` is only honoured by the ``v2beta1`` ``AnswerRecordsClient``;
+``v2`` ignores it and would return every window's records in each one,
+so other clients are rejected.
+
+``AnswerRecord`` has no creation time of its own, so there is no
+default time field and the caller must name one.
+``answer_feedback.display_time`` is the nearest candidate, but whether
+the service accepts it in a filter is unverified. If the filter is
+rejected, the backend cannot split the export by time.
+"""
+import argparse
+import collections
+from concurrent import futures
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from google.protobuf import json_format, timestamp_pb2
+
+#: Largest page size the service accepts.
+MAX_PAGE_SIZE = 100
+
+Window = Tuple[datetime.datetime, datetime.datetime]
+
+_DONE = object()
+_POLL = 0.1
+
+
+def _rfc3339(value: datetime.datetime) -> str:
+    timestamp = timestamp_pb2.Timestamp()
+    # Naive datetimes are taken as UTC.
+    timestamp.FromDatetime(value)
+    return timestamp.ToJsonString()
+
+
+def time_windows(
+    start: datetime.datetime, end: datetime.datetime, step: datetime.timedelta
+) -> List[Window]:
+    """Split ``[start, end)`` into windows of ``step``, newest first. The
+    oldest window may be shorter.
+
+    Raises:
+        ValueError: ``step`` is not positive.
+    """
+    if step <= datetime.timedelta(0):
+        raise ValueError("step must be positive.")
+    windows = []
+    upper = end
+    while upper > start:
+        lower = max(upper - step, start)
+        windows.append((lower, upper))
+        upper = lower
+    return windows
+
+
+def window_filter(window: Window, time_field: str, filter: str = "") -> str:
+    """Return the ``list_answer_records`` filter selecting ``window`` on
+    ``time_field``, combined with ``filter``, e.g.
+    ``answer_feedback.display_time >= "2023-06-01T00:00:00Z" AND ...``.
+    """
+    lower, upper = window
+    expression = '{field} >= "{}" AND {field} < "{}"'.format(
+        _rfc3339(lower), _rfc3339(upper), field=time_field
+    )
+    if filter:
+        expression = "({}) AND {}".format(filter, expression)
+    return expression
+
+
+def window_key(window: Window) -> str:
+    """Return the checkpoint key of ``window``, ``<start>/<end>``."""
+    return "{}/{}".format(_rfc3339(window[0]), _rfc3339(window[1]))
+
+
+class Checkpoint(object):
+    """Progress of an export, appended to a text file.
+
+    Each line is either a finished window's key, or a window key and the
+    name of a record of that window already written. Records of finished
+    windows are dropped when the file is read.
+
+    Args:
+        path (str): The file; created if missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.finished: Set[str] = set()
+        self._records: Dict[str, Set[str]] = collections.defaultdict(set)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as stream:
+                for line in stream:
+                    key, _, name = line.strip().partition(" ")
+                    if not key:
+                        continue
+                    if name:
+                        self._records[key].add(name)
+                    else:
+                        self.finished.add(key)
+            for key in self.finished:
+                self._records.pop(key, None)
+        self._stream = open(path, "a", encoding="utf-8")
+
+    def exported(self, key: str) -> Set[str]:
+        """Return the names of records of window ``key`` already written."""
+        return self._records.get(key, set())
+
+    def add(self, key: str, names: Sequence[str]) -> None:
+        """Record ``names`` of window ``key`` as written."""
+        if names:
+            self._stream.write("".join("{} {}\n".format(key, n) for n in names))
+            self._stream.flush()
+
+    def finish(self, key: str) -> None:
+        """Record window ``key`` as complete."""
+        self.finished.add(key)
+        self._records.pop(key, None)
+        self._stream.write(key + "\n")
+        self._stream.flush()
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class ExportStats(object):
+    """Outcome of an :meth:`AnswerRecordExporter.export`.
+
+    Attributes:
+        records (int): Records written.
+        skipped (int): Records already in the checkpoint.
+        windows (int): Windows completed.
+        skipped_windows (int): Windows already in the checkpoint.
+        failed (Dict[str, str]): Windows whose pager failed, by key, with
+            the error. They are not checkpointed as complete.
+        elapsed (float): Seconds the export has run.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.skipped = 0
+        self.windows = 0
+        self.skipped_windows = 0
+        self.failed: Dict[str, str] = {}
+        self.elapsed = 0.0
+        self.started = time.monotonic()
+
+    @property
+    def records_per_second(self) -> float:
+        """float: Records written per second."""
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """Return a one-line report."""
+        return "{} records from {} windows in {:.1f}s ({:.0f} records/s){}{}".format(
+            self.records,
+            self.windows,
+            self.elapsed,
+            self.records_per_second,
+            ", {} skipped".format(self.skipped + self.skipped_windows)
+            if self.skipped or self.skipped_windows
+            else "",
+            ", {} windows failed".format(len(self.failed)) if self.failed else "",
+        )
+
+
+class _WindowReader(object):
+    """Reads one window's pages into a bounded queue."""
+
+    def __init__(self, key: str, buffer_pages: int, stop: threading.Event):
+        self.key = key
+        self.pages: "queue.Queue[Any]" = queue.Queue(maxsize=buffer_pages)
+        self._stop = stop
+
+    def put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.pages.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, client: Any, request: Dict[str, Any]) -> None:
+        try:
+            for page in client.list_answer_records(request=request).pages:
+                if not self.put(list(page.answer_records)):
+                    return
+        except Exception as exc:
+            self.put(exc)
+            return
+        self.put(_DONE)
+
+
+class AnswerRecordExporter(object):
+    """Lists answer records of many time windows concurrently.
+
+    Args:
+        client (google.cloud.dialogflow_v2beta1.AnswerRecordsClient): The
+            client; only ``v2beta1`` supports ``filter``.
+        time_field (str): Field the window filters compare, e.g.
+            ``answer_feedback.display_time``; see the module notes.
+        concurrency (int): Windows listed at once.
+        page_size (int): Page size of each pager, at most
+            :data:`MAX_PAGE_SIZE`.
+        buffer_pages (int): Pages each window reads ahead of the consumer.
+        checkpoint (Checkpoint): Progress of earlier runs to skip.
+
+    Raises:
+        TypeError: ``client`` is not a ``v2beta1`` client.
+        ValueError: ``page_size`` is out of range.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        time_field: str,
+        concurrency: int = 8,
+        page_size: int = MAX_PAGE_SIZE,
+        buffer_pages: int = 4,
+        checkpoint: Optional[Checkpoint] = None,
+    ):
+        if not type(client).__module__.startswith("google.cloud.dialogflow_v2beta1."):
+            raise TypeError(
+                "{} does not filter answer records; use "
+                "dialogflow_v2beta1.AnswerRecordsClient.".format(type(client).__name__)
+            )
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise ValueError(
+                "page_size must be between 1 and {}.".format(MAX_PAGE_SIZE)
+            )
+        self._client = client
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.buffer_pages = buffer_pages
+        self.time_field = time_field
+        self.checkpoint = checkpoint
+
+    def pages(
+        self,
+        parent: str,
+        windows: Sequence[Window],
+        filter: str = "",
+        stats: Optional[ExportStats] = None,
+    ) -> Iterator[Tuple[str, Optional[List[Any]]]]:
+        """Yield ``(window key, records)`` for each page of each window, in
+        window order, then ``(window key, None)`` once a window is
+        complete. Records already in the checkpoint are left out.
+
+        A window whose pager fails is recorded in ``stats.failed`` and
+        ends without the completion item.
+        """
+        stats = stats if stats is not None else ExportStats()
+        pending = collections.deque()
+        for window in windows:
+            key = window_key(window)
+            if self.checkpoint is not None and key in self.checkpoint.finished:
+                stats.skipped_windows += 1
+                continue
+            pending.append((key, window))
+        stop = threading.Event()
+        readers: "collections.deque[_WindowReader]" = collections.deque()
+
+        def start(executor):
+            key, window = pending.popleft()
+            reader = _WindowReader(key, self.buffer_pages, stop)
+            request = {
+                "parent": parent,
+                "filter": window_filter(window, self.time_field, filter),
+                "page_size": self.page_size,
+            }
+            executor.submit(reader.run, self._client, request)
+            readers.append(reader)
+
+        executor = futures.ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="answer-records"
+        )
+        try:
+            while pending and len(readers) < self.concurrency:
+                start(executor)
+            while readers:
+                reader = readers[0]
+                exported = (
+                    self.checkpoint.exported(reader.key)
+                    if self.checkpoint is not None
+                    else ()
+                )
+                while True:
+                    item = reader.pages.get()
+                    if item is _DONE:
+                        yield reader.key, None
+                        break
+                    if isinstance(item, Exception):
+                        stats.failed[reader.key] = "{}: {}".format(
+                            type(item).__name__, item
+                        )
+                        break
+                    if exported:
+                        records = [r for r in item if r.name not in exported]
+                        stats.skipped += len(item) - len(records)
+                        item = records
+                    yield reader.key, item
+                readers.popleft()
+                # A slot is free only once the consumer has drained a
+                # window, which bounds the read-ahead.
+                if pending:
+                    start(executor)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    def records(
+        self, parent: str, windows: Sequence[Window], filter: str = ""
+    ) -> Iterator[Any]:
+        """Yield the answer records of ``windows`` in order.
+
+        Args:
+            parent (str): The project and location, e.g.
+                ``projects/<Project ID>/locations/<Location ID>``.
+            windows (Sequence[Tuple[datetime, datetime]]): Disjoint
+                windows, newest first, e.g. from :func:`time_windows`.
+            filter (str): Filter combined with each window's.
+        """
+        for _, records in self.pages(parent, windows, filter):
+            if records:
+                yield from records
+
+    def export(
+        self,
+        parent: str,
+        windows: Sequence[Window],
+        output: IO[str],
+        filter: str = "",
+        progress=None,
+    ) -> ExportStats:
+        """Write the answer records of ``windows`` to ``output`` as JSON
+        lines, in order, and checkpoint each page after it is written.
+
+        Args:
+            progress (Callable[[ExportStats], None]): Called after each
+                page.
+
+        Returns:
+            ExportStats: Records written and failed windows.
+        """
+        stats = ExportStats()
+        for key, records in self.pages(parent, windows, filter, stats):
+            if records is None:
+                stats.windows += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.finish(key)
+            elif records:
+                output.write(
+                    "".join(
+                        json.dumps(
+                            json_format.MessageToDict(type(r).pb(r)),
+                            ensure_ascii=False,
+                            separators=(",", ":"),
+                        )
+                        + "\n"
+                        for r in records
+                    )
+                )
+                output.flush()
+                stats.records += len(records)
+                if self.checkpoint is not None:
+                    self.checkpoint.add(key, [r.name for r in records])
+            stats.elapsed = time.monotonic() - stats.started
+            if progress is not None:
+                progress(stats)
+        stats.elapsed = time.monotonic() - stats.started
+        return stats
+
+
+__all__ = (
+    "AnswerRecordExporter",
+    "Checkpoint",
+    "ExportStats",
+    "MAX_PAGE_SIZE",
+    "main",
+    "time_windows",
+    "window_filter",
+    "window_key",
+)
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    timestamp = timestamp_pb2.Timestamp()
+    timestamp.FromJsonString(value)
+    return timestamp.ToDatetime(tzinfo=datetime.timezone.utc)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Export a project's answer records from the command line."""
+    from google.cloud import dialogflow_v2beta1
+
+    parser = argparse.ArgumentParser(
+        description="Export answer records of a time range as JSON lines."
+    )
+    parser.add_argument("--project", required=True)
+    parser.add_argument("--location", default="global")
+    parser.add_argument("--start", required=True, type=_parse_time, help="RFC 3339.")
+    parser.add_argument("--end", required=True, type=_parse_time, help="RFC 3339.")
+    parser.add_argument("--window-minutes", type=float, default=60.0)
+    parser.add_argument("--filter", default="", help="Additional filter.")
+    parser.add_argument(
+        "--time-field",
+        required=True,
+        help="Field to filter windows on, e.g. answer_feedback.display_time.",
+    )
+    parser.add_argument("--output", default="-", help="Output file, or '-'.")
+    parser.add_argument("--checkpoint", help="File of exported windows and records.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=MAX_PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    windows = time_windows(
+        args.start, args.end, datetime.timedelta(minutes=args.window_minutes)
+    )
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    output = (
+        sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    )
+    last_report = [time.monotonic()]
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last_report[0] >= 10:
+            last_report[0] = now
+            print(stats.format(), file=sys.stderr)
+
+    try:
+        exporter = AnswerRecordExporter(
+            dialogflow_v2beta1.AnswerRecordsClient(),
+            args.time_field,
+            concurrency=args.concurrency,
+            page_size=args.page_size,
+            checkpoint=checkpoint,
+        )
+        stats = exporter.export(
+            "projects/{}/locations/{}".format(args.project, args.location),
+            windows,
+            output,
+            filter=args.filter,
+            progress=progress,
+        )
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if output is not sys.stdout:
+            output.close()
+    print(stats.format(), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
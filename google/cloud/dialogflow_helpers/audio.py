@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Audio input pipeline for streaming calls.
+
+:class:`AudioPipeline` turns raw audio (bytes, files, or sync/async byte
+iterators) into evenly sized ``input_audio`` chunks for
+``SessionsClient.streaming_detect_intent`` and
+``ParticipantsClient.streaming_analyze_content``. Input is read
+incrementally, so memory use is bounded by ``read_size`` and the chunk size
+regardless of the length of the recording.
+
+.. code-block:: python
+
+    from google.cloud.dialogflow_helpers import audio
+    from google.cloud.dialogflow_v2.types import AudioEncoding
+
+    pipeline = audio.AudioPipeline(
+        source_encoding=AudioEncoding.AUDIO_ENCODING_MULAW,
+        source_sample_rate_hertz=8000,
+        target_encoding=AudioEncoding.AUDIO_ENCODING_LINEAR_16,
+        target_sample_rate_hertz=16000,
+        vad=audio.EnergyVad(),
+    )
+    requests = audio.streaming_detect_intent_requests(
+        session, pipeline.chunks("call.ulaw"), pipeline.input_audio_config("en-US")
+    )
+    for response in client.streaming_detect_intent(requests=requests):
+        ...
+
+Transcoding and resampling are implemented for uncompressed audio
+(``LINEAR_16`` and ``MULAW``). Compressed encodings such as ``OGG_OPUS`` or
+``FLAC`` are accepted by the service as-is and are therefore only re-chunked;
+asking to transcode them or to run voice activity detection on them raises
+:class:`ValueError`.
+"""
+from array import array
+import os
+import sys
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from google.cloud.dialogflow_v2.types import audio_config, participant, session
+
+AudioEncoding = audio_config.AudioEncoding
+
+_PCM_SAMPLE_WIDTH = {
+    AudioEncoding.AUDIO_ENCODING_LINEAR_16: 2,
+    AudioEncoding.AUDIO_ENCODING_MULAW: 1,
+}
+
+#: Chunk duration recommended for streaming recognition.
+DEFAULT_CHUNK_MS = 100
+
+#: Chunk size used for compressed encodings, whose duration per byte is not
+#: known up front.
+DEFAULT_COMPRESSED_CHUNK_BYTES = 4096
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _ulaw_to_linear(value: int) -> int:
+    value = ~value & 0xFF
+    sign = value & 0x80
+    exponent = (value >> 4) & 0x07
+    mantissa = value & 0x0F
+    sample = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return -sample if sign else sample
+
+
+def _linear_to_ulaw(sample: int) -> int:
+    sign = 0x80 if sample < 0 else 0
+    magnitude = min(abs(sample), 32635) + 0x84
+    exponent = 7
+    mask = 0x4000
+    while exponent and not magnitude & mask:
+        exponent -= 1
+        mask >>= 1
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+_ULAW_DECODE = array("h", (_ulaw_to_linear(i) for i in range(256)))
+_ulaw_encode_table: Optional[bytes] = None
+
+
+def _ulaw_encode_lookup() -> bytes:
+    # 64 KiB; built on first use only.
+    global _ulaw_encode_table
+    if _ulaw_encode_table is None:
+        _ulaw_encode_table = bytes(
+            _linear_to_ulaw(sample) for sample in range(-32768, 32768)
+        )
+    return _ulaw_encode_table
+
+
+def decode_mulaw(data: bytes) -> array:
+    """Decode G.711 mu-law bytes to signed 16-bit samples."""
+    table = _ULAW_DECODE
+    return array("h", [table[byte] for byte in data])
+
+
+def encode_mulaw(samples: array) -> bytes:
+    """Encode signed 16-bit samples as G.711 mu-law bytes."""
+    table = _ulaw_encode_lookup()
+    return bytes([table[sample + 32768] for sample in samples])
+
+
+def bytes_per_second(encoding: AudioEncoding, sample_rate_hertz: int) -> Optional[int]:
+    """Return the byte rate of uncompressed audio, or ``None`` if
+    ``encoding`` is compressed."""
+    width = _PCM_SAMPLE_WIDTH.get(AudioEncoding(encoding))
+    if width is None or not sample_rate_hertz:
+        return None
+    return width * sample_rate_hertz
+
+
+def _decode_linear16(data: bytes) -> array:
+    samples = array("h")
+    samples.frombytes(data)
+    if _BIG_ENDIAN:  # pragma: NO COVER
+        samples.byteswap()
+    return samples
+
+
+def _encode_linear16(samples: array) -> bytes:
+    if _BIG_ENDIAN:  # pragma: NO COVER
+        samples = array("h", samples)
+        samples.byteswap()
+    return samples.tobytes()
+
+
+class _LinearResampler(object):
+    """Streaming linear-interpolation resampler for 16-bit samples.
+
+    Adequate for speech recognition; no anti-aliasing filter is applied when
+    downsampling.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int):
+        self._step = source_rate / float(target_rate)
+        self._position = 0.0
+        self._last: Optional[int] = None
+
+    def __call__(self, samples: array) -> array:
+        if self._last is not None:
+            window = array("h", [self._last])
+            window.extend(samples)
+        else:
+            window = samples
+        out = array("h")
+        if not window:
+            return out
+        end = len(window) - 1
+        position = self._position
+        step = self._step
+        while position < end:
+            index = int(position)
+            fraction = position - index
+            left = window[index]
+            out.append(int(left + (window[index + 1] - left) * fraction))
+            position += step
+        # ``window[end]`` becomes ``window[0]`` of the next call.
+        self._position = position - end
+        self._last = window[end]
+        return out
+
+
+class EnergyVad(object):
+    """Energy-based voice activity detection.
+
+    A chunk is considered speech when any ``frame_ms`` frame within it is
+    louder than ``threshold_dbfs``. Silence before the first speech is
+    dropped (keeping ``pre_roll_ms`` of it so onsets are not clipped), and
+    once speech has been followed by ``end_silence_ms`` of silence the
+    stream ends, if ``stop_on_silence`` is set.
+
+    Args:
+        threshold_dbfs (float): Energy threshold in dB relative to full
+            scale.
+        frame_ms (int): Analysis frame length.
+        pre_roll_ms (int): Silence kept before the first speech chunk.
+        end_silence_ms (int): Trailing silence that ends the utterance.
+        stop_on_silence (bool): Whether to stop the stream after the
+            utterance ends. If false, trailing silence is still sent.
+    """
+
+    def __init__(
+        self,
+        threshold_dbfs: float = -45.0,
+        frame_ms: int = 20,
+        pre_roll_ms: int = 200,
+        end_silence_ms: int = 1000,
+        stop_on_silence: bool = True,
+    ):
+        self.threshold_dbfs = threshold_dbfs
+        self.frame_ms = frame_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.end_silence_ms = end_silence_ms
+        self.stop_on_silence = stop_on_silence
+
+    def is_speech(self, samples: array, sample_rate_hertz: int) -> bool:
+        """Return whether any frame of ``samples`` exceeds the threshold."""
+        frame = max(int(sample_rate_hertz * self.frame_ms / 1000), 1)
+        # Compare mean squares to avoid a square root per frame.
+        threshold = (32768.0 * 10 ** (self.threshold_dbfs / 20.0)) ** 2
+        for start in range(0, len(samples), frame):
+            window = samples[start : start + frame]
+            energy = sum(s * s for s in window) / float(len(window))
+            if energy > threshold:
+                return True
+        return False
+
+
+class PipelineStats(object):
+    """Counters kept by an :class:`AudioPipeline`.
+
+    Attributes:
+        bytes_in (int): Source bytes read.
+        bytes_out (int): Audio bytes emitted in chunks.
+        chunks (int): Chunks emitted.
+        dropped_ms (float): Audio dropped as silence by voice activity
+            detection.
+        stopped_early (bool): Whether voice activity detection ended the
+            stream before the source was exhausted.
+    """
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.chunks = 0
+        self.dropped_ms = 0.0
+        self.stopped_early = False
+
+
+class _Processor(object):
+    """Push-based core shared by the sync and async entry points."""
+
+    def __init__(self, pipeline: "AudioPipeline"):
+        self._pipeline = pipeline
+        self._stats = pipeline.stats
+        self._pending = b""
+        self._buffer = array("h")
+        self._raw = bytearray()
+        self._resampler = None
+        if (
+            pipeline.pcm
+            and pipeline.source_sample_rate_hertz != pipeline.target_sample_rate_hertz
+        ):
+            self._resampler = _LinearResampler(
+                pipeline.source_sample_rate_hertz, pipeline.target_sample_rate_hertz
+            )
+        self._pre_roll: List[array] = []
+        self._speech_seen = False
+        self._silence_ms = 0.0
+        self.done = False
+
+    def _decode(self, data: bytes) -> array:
+        pipeline = self._pipeline
+        if pipeline.source_encoding == AudioEncoding.AUDIO_ENCODING_MULAW:
+            return decode_mulaw(data)
+        width = 2
+        data = self._pending + data
+        usable = len(data) - len(data) % width
+        self._pending = data[usable:]
+        return _decode_linear16(data[:usable])
+
+    def _encode(self, samples: array) -> bytes:
+        if self._pipeline.target_encoding == AudioEncoding.AUDIO_ENCODING_MULAW:
+            return encode_mulaw(samples)
+        return _encode_linear16(samples)
+
+    def _gate(self, samples: array) -> List[array]:
+        vad = self._pipeline.vad
+        if vad is None:
+            return [samples]
+        rate = self._pipeline.target_sample_rate_hertz
+        duration_ms = len(samples) * 1000.0 / rate
+        if vad.is_speech(samples, rate):
+            self._speech_seen = True
+            self._silence_ms = 0.0
+            released, self._pre_roll = self._pre_roll + [samples], []
+            return released
+        if not self._speech_seen:
+            self._pre_roll.append(samples)
+            kept_ms = 0.0
+            keep: List[array] = []
+            for chunk in reversed(self._pre_roll):
+                chunk_ms = len(chunk) * 1000.0 / rate
+                if kept_ms + chunk_ms > vad.pre_roll_ms and keep:
+                    self._stats.dropped_ms += chunk_ms
+                    continue
+                keep.insert(0, chunk)
+                kept_ms += chunk_ms
+            self._pre_roll = keep
+            return []
+        self._silence_ms += duration_ms
+        if vad.stop_on_silence and self._silence_ms >= vad.end_silence_ms:
+            self.done = True
+            self._stats.stopped_early = True
+        return [samples]
+
+    def _emit(self, samples: array) -> List[bytes]:
+        chunks = []
+        for gated in self._gate(samples):
+            data = self._encode(gated)
+            self._stats.chunks += 1
+            self._stats.bytes_out += len(data)
+            chunks.append(data)
+        return chunks
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Consume source bytes, returning any chunks that are complete."""
+        if self.done:
+            return []
+        self._stats.bytes_in += len(data)
+        pipeline = self._pipeline
+        if not pipeline.pcm:
+            self._raw.extend(data)
+            size = pipeline.chunk_bytes
+            chunks = []
+            while len(self._raw) >= size:
+                chunks.append(bytes(self._raw[:size]))
+                del self._raw[:size]
+            self._stats.chunks += len(chunks)
+            self._stats.bytes_out += size * len(chunks)
+            return chunks
+
+        samples = self._decode(data)
+        if self._resampler is not None:
+            samples = self._resampler(samples)
+        self._buffer.extend(samples)
+        size = pipeline.chunk_samples
+        chunks = []
+        while len(self._buffer) >= size and not self.done:
+            chunks.extend(self._emit(self._buffer[:size]))
+            del self._buffer[:size]
+        return chunks
+
+    def flush(self) -> List[bytes]:
+        """Return the final, possibly short, chunk."""
+        if self.done:
+            return []
+        self.done = True
+        if not self._pipeline.pcm:
+            if not self._raw:
+                return []
+            self._stats.chunks += 1
+            self._stats.bytes_out += len(self._raw)
+            return [bytes(self._raw)]
+        if not self._buffer:
+            return []
+        return self._emit(self._buffer)
+
+
+Source = Union[bytes, str, "os.PathLike[str]", BinaryIO, Iterable[bytes]]
+
+
+class AudioPipeline(object):
+    """Transcodes, resamples and re-chunks audio for streaming requests.
+
+    Args:
+        source_encoding (google.cloud.dialogflow_v2.types.AudioEncoding):
+            Encoding of the input audio.
+        source_sample_rate_hertz (int): Sample rate of the input audio.
+        target_encoding (google.cloud.dialogflow_v2.types.AudioEncoding):
+            Encoding to send; defaults to ``source_encoding``.
+        target_sample_rate_hertz (int): Sample rate to send; defaults to
+            ``source_sample_rate_hertz``.
+        chunk_ms (int): Duration of each emitted chunk for uncompressed
+            audio.
+        chunk_bytes (int): Size of each emitted chunk for compressed audio.
+        read_size (int): Bytes read from file sources at a time.
+        vad (EnergyVad): Optional voice activity detection.
+
+    Raises:
+        ValueError: If transcoding, resampling or voice activity detection
+            is requested for a compressed encoding.
+    """
+
+    def __init__(
+        self,
+        source_encoding: AudioEncoding,
+        source_sample_rate_hertz: int,
+        target_encoding: Optional[AudioEncoding] = None,
+        target_sample_rate_hertz: Optional[int] = None,
+        chunk_ms: int = DEFAULT_CHUNK_MS,
+        chunk_bytes: int = DEFAULT_COMPRESSED_CHUNK_BYTES,
+        read_size: int = 64 * 1024,
+        vad: Optional[EnergyVad] = None,
+    ):
+        self.source_encoding = AudioEncoding(source_encoding)
+        self.source_sample_rate_hertz = source_sample_rate_hertz
+        self.target_encoding = AudioEncoding(
+            source_encoding if target_encoding is None else target_encoding
+        )
+        self.target_sample_rate_hertz = (
+            target_sample_rate_hertz or source_sample_rate_hertz
+        )
+        self.read_size = read_size
+        self.vad = vad
+        self.stats = PipelineStats()
+
+        converting = (
+            self.source_encoding != self.target_encoding
+            or self.source_sample_rate_hertz != self.target_sample_rate_hertz
+        )
+        self.pcm = converting or vad is not None
+        if self.pcm:
+            for encoding in (self.source_encoding, self.target_encoding):
+                if encoding not in _PCM_SAMPLE_WIDTH:
+                    raise ValueError(
+                        "Transcoding and voice activity detection are only "
+                        "supported between LINEAR_16 and MULAW audio, got "
+                        "{}.".format(encoding.name)
+                    )
+        self.chunk_samples = max(
+            int(self.target_sample_rate_hertz * chunk_ms / 1000), 1
+        )
+        if self.target_encoding in _PCM_SAMPLE_WIDTH and not self.pcm:
+            # Pass-through of uncompressed audio is still chunked by time.
+            chunk_bytes = self.chunk_samples * _PCM_SAMPLE_WIDTH[self.target_encoding]
+        self.chunk_bytes = chunk_bytes
+
+    def input_audio_config(
+        self, language_code: str, **kwargs
+    ) -> audio_config.InputAudioConfig:
+        """Return an ``InputAudioConfig`` describing the emitted audio.
+
+        Additional keyword arguments are set on the config.
+        """
+        return audio_config.InputAudioConfig(
+            audio_encoding=self.target_encoding,
+            sample_rate_hertz=self.target_sample_rate_hertz,
+            language_code=language_code,
+            **kwargs,
+        )
+
+    def _read(self, source: Source) -> Iterator[bytes]:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = bytes(source)
+            for start in range(0, len(source), self.read_size):
+                yield source[start : start + self.read_size]
+        elif isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as stream:
+                yield from self._read(stream)
+        elif hasattr(source, "read"):
+            while True:
+                data = source.read(self.read_size)
+                if not data:
+                    break
+                yield data
+        else:
+            yield from source
+
+    def chunks(self, source: Source) -> Iterator[bytes]:
+        """Yield ``input_audio`` chunks from a bytes object, a path, a binary
+        file object or an iterable of byte strings."""
+        processor = _Processor(self)
+        for data in self._read(source):
+            yield from processor.feed(data)
+            if processor.done:
+                return
+        yield from processor.flush()
+
+    async def achunks(self, source: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """Async variant of :meth:`chunks` for async byte iterators."""
+        processor = _Processor(self)
+        async for data in source:
+            for chunk in processor.feed(data):
+                yield chunk
+            if processor.done:
+                return
+        for chunk in processor.flush():
+            yield chunk
+
+    @property
+    def chunk_duration_ms(self) -> Optional[float]:
+        """float: Duration of a full chunk, or ``None`` for compressed
+        audio."""
+        width = _PCM_SAMPLE_WIDTH.get(self.target_encoding)
+        if width is None:
+            return None
+        return self.chunk_samples * 1000.0 / self.target_sample_rate_hertz
+
+
+def _first_detect_intent_request(
+    session_name, input_config, query_params, single_utterance, kwargs
+):
+    if single_utterance:
+        input_config = audio_config.InputAudioConfig(input_config)
+        input_config.single_utterance = True
+    return session.StreamingDetectIntentRequest(
+        session=session_name,
+        query_input=session.QueryInput(audio_config=input_config),
+        query_params=query_params,
+        **kwargs,
+    )
+
+
+def streaming_detect_intent_requests(
+    session_name: str,
+    chunks: Iterable[bytes],
+    input_config: audio_config.InputAudioConfig,
+    query_params: Optional[session.QueryParameters] = None,
+    single_utterance: bool = False,
+    **kwargs,
+) -> Iterator[session.StreamingDetectIntentRequest]:
+    """Build the request stream for ``SessionsClient.streaming_detect_intent``.
+
+    The first request carries the session and configuration; every
+    following request carries one audio chunk. Additional keyword arguments
+    are set on the first request (e.g. ``output_audio_config``).
+    """
+    yield _first_detect_intent_request(
+        session_name, input_config, query_params, single_utterance, kwargs
+    )
+    for chunk in chunks:
+        yield session.StreamingDetectIntentRequest(input_audio=chunk)
+
+
+async def astreaming_detect_intent_requests(
+    session_name: str,
+    chunks: AsyncIterable[bytes],
+    input_config: audio_config.InputAudioConfig,
+    query_params: Optional[session.QueryParameters] = None,
+    single_utterance: bool = False,
+    **kwargs,
+) -> AsyncIterator[session.StreamingDetectIntentRequest]:
+    """Async variant of :func:`streaming_detect_intent_requests` for
+    ``SessionsAsyncClient``."""
+    yield _first_detect_intent_request(
+        session_name, input_config, query_params, single_utterance, kwargs
+    )
+    async for chunk in chunks:
+        yield session.StreamingDetectIntentRequest(input_audio=chunk)
+
+
+def streaming_analyze_content_requests(
+    participant_name: str,
+    chunks: Iterable[bytes],
+    input_config: audio_config.InputAudioConfig,
+    **kwargs,
+) -> Iterator[participant.StreamingAnalyzeContentRequest]:
+    """Build the request stream for
+    ``ParticipantsClient.streaming_analyze_content``.
+
+    Additional keyword arguments are set on the first request (e.g.
+    ``reply_audio_config`` or ``query_params``).
+    """
+    yield participant.StreamingAnalyzeContentRequest(
+        participant=participant_name, audio_config=input_config, **kwargs
+    )
+    for chunk in chunks:
+        yield participant.StreamingAnalyzeContentRequest(input_audio=chunk)
+
+
+async def astreaming_analyze_content_requests(
+    participant_name: str,
+    chunks: AsyncIterable[bytes],
+    input_config: audio_config.InputAudioConfig,
+    **kwargs,
+) -> AsyncIterator[participant.StreamingAnalyzeContentRequest]:
+    """Async variant of :func:`streaming_analyze_content_requests` for
+    ``ParticipantsAsyncClient``."""
+    yield participant.StreamingAnalyzeContentRequest(
+        participant=participant_name, audio_config=input_config, **kwargs
+    )
+    async for chunk in chunks:
+        yield participant.StreamingAnalyzeContentRequest(input_audio=chunk)
+
+
+__all__ = (
+    "AudioPipeline",
+    "EnergyVad",
+    "PipelineStats",
+    "astreaming_analyze_content_requests",
+    "astreaming_detect_intent_requests",
+    "bytes_per_second",
+    "decode_mulaw",
+    "encode_mulaw",
+    "streaming_analyze_content_requests",
+    "streaming_detect_intent_requests",
+)
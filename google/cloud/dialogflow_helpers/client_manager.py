@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Reuse clients across requests for many tenants.
+
+Creating a client per request pays for a new channel, TLS handshake and
+credential lookup every time, while keeping every tenant's client open
+leaks channels. A :class:`TenantClientManager` keeps one
+:class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel` per
+project and credentials, shared by that tenant's clients, in a least
+recently used cache:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import client_manager
+
+    manager = client_manager.TenantClientManager(max_channels=100)
+
+    def handle(project, credentials, request):
+        with manager.client(
+            dialogflow_v2.SessionsClient, project, credentials
+        ) as sessions:
+            return sessions.detect_intent(request=request)
+
+    print(manager.stats.hit_rate)
+
+Tenants idle for longer than ``idle_timeout`` are evicted on the next
+lookup, or by :meth:`TenantClientManager.evict_idle`, and the least
+recently used tenant is evicted when opening another would exceed
+``max_channels``. Eviction closes the tenant's transports. Clients
+borrowed with :meth:`TenantClientManager.client` are not evicted until
+they are returned.
+"""
+import asyncio as aio_lib
+import collections
+import contextlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from google.auth import credentials as ga_credentials  # type: ignore
+
+from google.cloud.dialogflow_helpers.instrumentation import Histogram
+from google.cloud.dialogflow_helpers.shared_channel import SharedChannel
+from google.cloud.dialogflow_v2.services.sessions.transports import (
+    SessionsGrpcTransport,
+)
+
+
+class ClientManagerStats(object):
+    """Cache metrics of a :class:`TenantClientManager`.
+
+    Attributes:
+        hits (int): Lookups served by an open client.
+        misses (int): Lookups that created a client.
+        channels_created (int): Tenant channels opened.
+        idle_evictions (int): Tenants evicted for being idle.
+        capacity_evictions (int): Tenants evicted to stay within
+            ``max_channels``.
+        creation_seconds (Histogram): Time to open a tenant channel and
+            create a client on it.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.channels_created = 0
+        self.idle_evictions = 0
+        self.capacity_evictions = 0
+        self.creation_seconds = Histogram()
+
+    @property
+    def hit_rate(self) -> float:
+        """float: Fraction of lookups served by an open client."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        """Return the metrics as a flat dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "channels_created": self.channels_created,
+            "idle_evictions": self.idle_evictions,
+            "capacity_evictions": self.capacity_evictions,
+            "creation_mean_seconds": self.creation_seconds.mean,
+            "creation_p99_seconds": self.creation_seconds.percentile(99),
+        }
+
+
+class _Tenant(object):
+    def __init__(self, channel: SharedChannel, credentials, now: float):
+        self.channel = channel
+        # Keeps id(credentials) in the key valid while cached.
+        self.credentials = credentials
+        self.clients: Dict[Callable, Any] = {}
+        self.last_used = now
+        self.borrowed = 0
+
+
+class TenantClientManager(object):
+    """An LRU cache of per-tenant clients.
+
+    Args:
+        max_channels (int): Most gRPC channels to keep open, across all
+            tenants. Each tenant uses ``pool_size`` channels.
+        idle_timeout (float): Seconds after which an unused tenant is
+            evicted; ``None`` keeps tenants until capacity runs out.
+        pool_size (int): Channels per tenant, see
+            :class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel`.
+        host (str): The API endpoint.
+        options (Sequence[Tuple[str, Any]]): Additional channel options.
+        asyncio (bool): Create async clients on ``grpc.aio`` channels.
+            Evicted tenants are then closed in a task on the running loop.
+        channel_factory (Callable[[str, Credentials], SharedChannel]):
+            Creates the shared channel for a project and credentials; by
+            default a
+            :class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel`
+            with the arguments above.
+        clock (Callable[[], float]): Monotonic time source.
+
+    Attributes:
+        stats (ClientManagerStats): Cache metrics.
+    """
+
+    def __init__(
+        self,
+        max_channels: int = 64,
+        idle_timeout: Optional[float] = 600.0,
+        pool_size: int = 1,
+        host: str = SessionsGrpcTransport.DEFAULT_HOST,
+        options: Optional[Sequence] = None,
+        asyncio: bool = False,
+        channel_factory: Optional[
+            Callable[[str, Optional[ga_credentials.Credentials]], SharedChannel]
+        ] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_channels < pool_size:
+            raise ValueError("max_channels must be at least pool_size.")
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.host = host
+        self.asyncio = asyncio
+        self.stats = ClientManagerStats()
+        self._options = options
+        self._channel_factory = channel_factory or (
+            lambda project, credentials: self._create_channel(credentials)
+        )
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._tenants: "collections.OrderedDict[Tuple[str, int], _Tenant]" = (
+            collections.OrderedDict()
+        )
+        self._closing: List[Any] = []
+        self._closed = False
+
+    @property
+    def tenants(self) -> int:
+        """int: Tenants with an open channel."""
+        return len(self._tenants)
+
+    @property
+    def channels(self) -> int:
+        """int: gRPC channels currently open."""
+        return len(self._tenants) * self.pool_size
+
+    def _create_channel(self, credentials) -> SharedChannel:
+        return SharedChannel(
+            host=self.host,
+            credentials=credentials,
+            pool_size=self.pool_size,
+            options=self._options,
+            asyncio=self.asyncio,
+        )
+
+    def get(
+        self,
+        client_class: Callable,
+        project: str,
+        credentials: Optional[ga_credentials.Credentials] = None,
+    ):
+        """Return the cached ``client_class`` for a tenant.
+
+        The client stays open until the tenant is evicted; use
+        :meth:`client` to keep it from being evicted while in use.
+
+        Args:
+            client_class (type): A v2 or v2beta1 client class, sync or
+                async to match ``asyncio``.
+            project (str): The tenant's project ID.
+            credentials (google.auth.credentials.Credentials): The
+                tenant's credentials; tenants are keyed by the object's
+                identity, so reuse it across calls.
+
+        Raises:
+            ValueError: If the manager is closed.
+        """
+        return self._get(client_class, project, credentials, borrow=False)[0]
+
+    def _get(self, client_class, project, credentials, borrow):
+        key = (project, id(credentials))
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise ValueError("The client manager is closed.")
+                now = self._clock()
+                self._evict_idle(now)
+                tenant = self._tenants.get(key)
+                if tenant is not None:
+                    self._tenants.move_to_end(key)
+                    client = tenant.clients.get(client_class)
+                    if client is not None:
+                        self.stats.hits += 1
+                        return client, self._checkout(tenant, now, borrow)
+            # Opening a channel can take a while; lookups of other tenants
+            # are not held up meanwhile.
+            start = time.perf_counter()
+            if tenant is None:
+                channel = self._channel_factory(project, credentials)
+                client = channel.client(client_class)
+            else:
+                channel = tenant.channel
+                try:
+                    client = channel.client(client_class)
+                except ValueError:
+                    # The tenant was evicted and its channel closed
+                    # meanwhile; look again.
+                    continue
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                current = self._tenants.get(key)
+                if not self._closed and current is tenant:
+                    if tenant is None:
+                        self._make_room()
+                        tenant = _Tenant(channel, credentials, now)
+                        self._tenants[key] = tenant
+                        self.stats.channels_created += 1
+                    if client_class not in tenant.clients:
+                        tenant.clients[client_class] = client
+                        self.stats.misses += 1
+                        self.stats.creation_seconds.add(elapsed)
+                        return client, self._checkout(tenant, now, borrow)
+            # Another lookup created the client first, or the tenant was
+            # evicted meanwhile: discard this one and look again.
+            self._discard(client, channel if tenant is None else None)
+
+    def _checkout(self, tenant: _Tenant, now: float, borrow: bool) -> _Tenant:
+        tenant.last_used = now
+        if borrow:
+            tenant.borrowed += 1
+        return tenant
+
+    def _discard(self, client, channel: Optional[SharedChannel]):
+        if self.asyncio:
+
+            async def close():
+                await client.transport.close()
+                if channel is not None:
+                    await channel.close()
+
+            task = aio_lib.get_running_loop().create_task(close())
+            with self._lock:
+                self._closing.append(task)
+            task.add_done_callback(self._closing.remove)
+        else:
+            client.transport.close()
+            if channel is not None:
+                channel.close()
+
+    @contextlib.contextmanager
+    def client(
+        self,
+        client_class: Callable,
+        project: str,
+        credentials: Optional[ga_credentials.Credentials] = None,
+    ):
+        """Borrow the cached ``client_class`` for a tenant.
+
+        A context manager yielding the same client as :meth:`get`. The
+        tenant is not evicted before the block exits.
+        """
+        client, tenant = self._get(client_class, project, credentials, borrow=True)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                tenant.borrowed -= 1
+                tenant.last_used = self._clock()
+
+    def _make_room(self):
+        for key, tenant in list(self._tenants.items()):
+            if (len(self._tenants) + 1) * self.pool_size <= self.max_channels:
+                return
+            # Borrowed tenants are skipped; the cap is exceeded until
+            # they are returned and evicted by a later lookup.
+            if not tenant.borrowed:
+                self._evict(key)
+                self.stats.capacity_evictions += 1
+
+    def _evict_idle(self, now: float) -> int:
+        if self.idle_timeout is None:
+            return 0
+        evicted = 0
+        for key, tenant in list(self._tenants.items()):
+            if not tenant.borrowed and now - tenant.last_used >= self.idle_timeout:
+                self._evict(key)
+                evicted += 1
+        self.stats.idle_evictions += evicted
+        return evicted
+
+    def evict_idle(self) -> int:
+        """Evict tenants idle for ``idle_timeout``; return how many."""
+        with self._lock:
+            return self._evict_idle(self._clock())
+
+    def evict(
+        self, project: str, credentials: Optional[ga_credentials.Credentials] = None
+    ) -> bool:
+        """Evict a tenant, e.g. after its credentials are revoked.
+
+        Returns:
+            bool: Whether the tenant was cached.
+        """
+        with self._lock:
+            return self._evict((project, id(credentials)))
+
+    def _evict(self, key) -> bool:
+        tenant = self._tenants.pop(key, None)
+        if tenant is None:
+            return False
+        if self.asyncio:
+            task = aio_lib.get_running_loop().create_task(self._aclose_tenant(tenant))
+            self._closing.append(task)
+            task.add_done_callback(self._closing.remove)
+        else:
+            for client in tenant.clients.values():
+                client.transport.close()
+            tenant.channel.close()
+        return True
+
+    async def _aclose_tenant(self, tenant: _Tenant):
+        for client in tenant.clients.values():
+            await client.transport.close()
+        await tenant.channel.close()
+
+    def close(self):
+        """Close every tenant's clients.
+
+        For an asyncio manager, await the result.
+        """
+        with self._lock:
+            self._closed = True
+            for key in list(self._tenants):
+                self._evict(key)
+        if self.asyncio:
+            return aio_lib.gather(*list(self._closing))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+__all__ = (
+    "ClientManagerStats",
+    "TenantClientManager",
+)
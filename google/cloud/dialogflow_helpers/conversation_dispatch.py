@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Run ``analyze_content`` in order per conversation, concurrently across
+conversations.
+
+Messages of one conversation must reach ``analyze_content`` in order,
+but different conversations are independent. The dispatchers here keep
+one lane per conversation, taken from the request's ``participant``,
+and run the head of every lane on a shared thread pool or event loop:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import conversation_dispatch
+
+    participants = dialogflow_v2.ParticipantsClient()
+    with conversation_dispatch.OrderedDispatcher(participants) as dispatcher:
+        future = dispatcher.submit(
+            participant=participant, text_input={"text": text, "language_code": "en"}
+        )
+        response = future.result()
+
+Each lane holds at most ``max_queue`` requests; :meth:`submit` blocks (or
+raises :class:`LaneFull`) until there is room. Requests get a
+``request_id`` if they have none, which the server uses to drop
+duplicates, and submitting a ``request_id`` again while it is queued, in
+flight or succeeded returns the original future instead of sending the
+message twice. A failed request may be submitted again.
+
+A request that fails does not stop its lane; later messages of the
+conversation are still sent.
+"""
+import asyncio
+import collections
+from concurrent import futures
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+import uuid
+
+from google.cloud.dialogflow_helpers.instrumentation import Histogram
+from google.cloud.dialogflow_v2.types import participant as gcd_participant
+
+_PARTICIPANTS = "/participants/"
+_MESSAGES = "/messages/"
+
+
+class LaneFull(Exception):
+    """A conversation's lane has ``max_queue`` requests waiting."""
+
+
+class LaneStats(NamedTuple):
+    """The state of one conversation's lane.
+
+    Attributes:
+        queued (int): Requests waiting, not counting the one in flight.
+        in_flight (bool): Whether a request is being sent.
+        lag (float): Seconds since the oldest unfinished request was
+            submitted.
+        completed (int): Requests finished, successfully or not, since
+            the lane was last empty. Empty lanes are dropped.
+    """
+
+    queued: int
+    in_flight: bool
+    lag: float
+    completed: int
+
+
+def _conversation(name: str) -> str:
+    # Participant and message names both extend the conversation name.
+    for separator in (_PARTICIPANTS, _MESSAGES):
+        if separator in name:
+            return name.split(separator, 1)[0]
+    return name
+
+
+def conversation_of(request: gcd_participant.AnalyzeContentRequest) -> str:
+    """Return the conversation of an ``AnalyzeContentRequest``."""
+    return _conversation(request.participant)
+
+
+class _Item(object):
+    __slots__ = ("request", "kwargs", "future", "submitted")
+
+    def __init__(self, request, kwargs, future, submitted):
+        self.request = request
+        self.kwargs = kwargs
+        self.future = future
+        self.submitted = submitted
+
+
+class _Lane(object):
+    def __init__(self):
+        self.queue: "collections.deque[_Item]" = collections.deque()
+        self.current: Optional[_Item] = None
+        self.completed = 0
+
+    def stats(self, now: float) -> LaneStats:
+        head = self.current or (self.queue[0] if self.queue else None)
+        return LaneStats(
+            queued=len(self.queue),
+            in_flight=self.current is not None,
+            lag=now - head.submitted if head is not None else 0.0,
+            completed=self.completed,
+        )
+
+
+class _Dispatcher(object):
+    def __init__(self, client, max_queue, dedup_size, clock):
+        self._client = client
+        self.max_queue = max_queue
+        self._dedup_size = dedup_size
+        self._clock = clock
+        self._lanes: Dict[str, _Lane] = {}
+        # request_id -> future, oldest first.
+        self._futures: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+        self._closed = False
+        self.wait = Histogram()
+
+    @staticmethod
+    def _request(request, kwargs):
+        request = gcd_participant.AnalyzeContentRequest(request or {})
+        for field in ("participant", "text_input", "event_input", "request_id"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        if not request.request_id:
+            request.request_id = str(uuid.uuid4())
+        return request
+
+    def _duplicate(self, request_id: str):
+        future = self._futures.get(request_id)
+        if future is None:
+            return None
+        if future.done() and (future.cancelled() or future.exception() is not None):
+            # Let callers retry failed requests.
+            del self._futures[request_id]
+            return None
+        return future
+
+    def _remember(self, request_id: str, future) -> None:
+        self._futures[request_id] = future
+        while len(self._futures) > self._dedup_size:
+            self._futures.popitem(last=False)
+
+    def _start(self, lane: _Lane) -> _Item:
+        item = lane.current = lane.queue.popleft()
+        self.wait.add(self._clock() - item.submitted)
+        return item
+
+    def _finish(self, conversation: str, lane: _Lane) -> None:
+        lane.current = None
+        lane.completed += 1
+        if not lane.queue and self._lanes.get(conversation) is lane:
+            del self._lanes[conversation]
+
+    def lag(self, conversation: str) -> float:
+        """Return the seconds since the oldest unfinished request of a
+        conversation was submitted, or ``0.0``.
+
+        ``conversation`` may also be a participant or message name.
+        """
+        lane = self._lanes.get(_conversation(conversation))
+        return lane.stats(self._clock()).lag if lane is not None else 0.0
+
+    def lanes(self) -> Dict[str, LaneStats]:
+        """Return the stats of every conversation with unfinished
+        requests."""
+        now = self._clock()
+        return {
+            conversation: lane.stats(now)
+            for conversation, lane in list(self._lanes.items())
+        }
+
+
+class OrderedDispatcher(_Dispatcher):
+    """Sends ``analyze_content`` requests from threads.
+
+    Args:
+        client (google.cloud.dialogflow_v2.ParticipantsClient): The client.
+        max_workers (int): Requests in flight at once, across
+            conversations. Ignored if ``executor`` is given.
+        max_queue (int): Requests waiting per conversation.
+        executor (concurrent.futures.Executor): Runs the requests;
+            by default a thread pool owned by the dispatcher.
+        dedup_size (int): Request IDs remembered for deduplication.
+        clock (Callable[[], float]): Monotonic time source.
+
+    Attributes:
+        wait (google.cloud.dialogflow_helpers.instrumentation.Histogram):
+            Seconds requests waited in their lane before being sent.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        max_workers: int = 16,
+        max_queue: int = 64,
+        executor: Optional[futures.Executor] = None,
+        dedup_size: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(client, max_queue, dedup_size, clock)
+        self._owns_executor = executor is None
+        self._executor = executor or futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="analyze-content"
+        )
+        self._condition = threading.Condition()
+
+    def submit(
+        self,
+        request=None,
+        block: bool = True,
+        queue_timeout: Optional[float] = None,
+        **kwargs
+    ) -> "futures.Future":
+        """Queue an ``analyze_content`` request behind earlier ones of its
+        conversation.
+
+        ``participant``, ``text_input``, ``event_input`` and ``request_id``
+        may be given as keyword arguments. Other keyword arguments, such as
+        ``timeout``, are passed to the client.
+
+        Args:
+            request (Union[AnalyzeContentRequest, dict]): The request.
+            block (bool): Wait for room in the lane instead of raising
+                :class:`LaneFull`.
+            queue_timeout (float): Seconds to wait for room, if blocking.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the
+            ``AnalyzeContentResponse``.
+
+        Raises:
+            LaneFull: The lane stayed full.
+            RuntimeError: The dispatcher is closed.
+        """
+        request = self._request(request, kwargs)
+        conversation = conversation_of(request)
+        deadline = None if queue_timeout is None else self._clock() + queue_timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The dispatcher is closed.")
+                future = self._duplicate(request.request_id)
+                if future is not None:
+                    return future
+                lane = self._lanes.get(conversation)
+                if lane is None or len(lane.queue) < self.max_queue:
+                    break
+                remaining = None if deadline is None else deadline - self._clock()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise LaneFull(conversation)
+                self._condition.wait(remaining)
+            future = futures.Future()
+            lane = self._lanes.setdefault(conversation, _Lane())
+            lane.queue.append(_Item(request, kwargs, future, self._clock()))
+            self._remember(request.request_id, future)
+            if lane.current is None:
+                self._schedule(conversation, lane)
+        return future
+
+    def _schedule(self, conversation: str, lane: _Lane) -> None:
+        item = self._start(lane)
+        self._executor.submit(self._run, conversation, lane, item)
+
+    def _run(self, conversation: str, lane: _Lane, item: _Item) -> None:
+        if item.future.set_running_or_notify_cancel():
+            try:
+                response = self._client.analyze_content(
+                    request=item.request, **item.kwargs
+                )
+            except BaseException as exc:
+                item.future.set_exception(exc)
+            else:
+                item.future.set_result(response)
+        with self._condition:
+            if lane.queue:
+                # One request per task, so that long lanes take turns with
+                # the others in the executor's queue.
+                lane.completed += 1
+                self._schedule(conversation, lane)
+            else:
+                self._finish(conversation, lane)
+            self._condition.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted request has finished.
+
+        Returns:
+            bool: ``False`` if ``timeout`` passed first.
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._condition:
+            while self._lanes:
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, wait: bool = True) -> None:
+        """Stop accepting requests and, if ``wait``, finish the queued
+        ones."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            self.join()
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "OrderedDispatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class AsyncOrderedDispatcher(_Dispatcher):
+    """Sends ``analyze_content`` requests on an event loop.
+
+    Args:
+        client (google.cloud.dialogflow_v2.ParticipantsAsyncClient): The
+            client.
+        max_concurrency (int): Requests in flight at once, across
+            conversations.
+        max_queue (int): Requests waiting per conversation.
+        dedup_size (int): Request IDs remembered for deduplication.
+        clock (Callable[[], float]): Monotonic time source.
+
+    Attributes:
+        wait (google.cloud.dialogflow_helpers.instrumentation.Histogram):
+            Seconds requests waited in their lane before being sent.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        dedup_size: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(client, max_queue, dedup_size, clock)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._condition: Optional[asyncio.Condition] = None
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+
+    def _primitives(self):
+        # Created lazily so they bind to the loop the dispatcher runs on.
+        if self._condition is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def submit(
+        self,
+        request=None,
+        block: bool = True,
+        queue_timeout: Optional[float] = None,
+        **kwargs
+    ) -> "asyncio.Future":
+        """Like :meth:`OrderedDispatcher.submit`; returns an
+        ``asyncio.Future`` once the request is queued."""
+        request = self._request(request, kwargs)
+        conversation = conversation_of(request)
+        condition = self._primitives()
+        loop = asyncio.get_running_loop()
+        deadline = None if queue_timeout is None else loop.time() + queue_timeout
+        async with condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The dispatcher is closed.")
+                # A failed request is forgotten here, so its retry is queued
+                # like a new request and waits for room.
+                future = self._duplicate(request.request_id)
+                if future is not None:
+                    return future
+                lane = self._lanes.get(conversation)
+                if lane is None or len(lane.queue) < self.max_queue:
+                    break
+                remaining = None if deadline is None else deadline - loop.time()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise LaneFull(conversation)
+                try:
+                    await asyncio.wait_for(condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise LaneFull(conversation)
+            future = loop.create_future()
+            lane = self._lanes.setdefault(conversation, _Lane())
+            lane.queue.append(_Item(request, kwargs, future, self._clock()))
+            self._remember(request.request_id, future)
+            if conversation not in self._tasks:
+                self._tasks[conversation] = asyncio.ensure_future(
+                    self._drain(conversation, lane)
+                )
+        return future
+
+    async def _drain(self, conversation: str, lane: _Lane) -> None:
+        condition = self._primitives()
+        try:
+            while True:
+                async with condition:
+                    if not lane.queue:
+                        self._finish(conversation, lane)
+                        condition.notify_all()
+                        return
+                    if lane.current is not None:
+                        lane.completed += 1
+                    item = self._start(lane)
+                    condition.notify_all()
+                async with self._semaphore:
+                    await self._send(item)
+        finally:
+            if self._tasks.get(conversation) is asyncio.current_task():
+                del self._tasks[conversation]
+
+    async def _send(self, item: _Item) -> None:
+        if item.future.cancelled():
+            return
+        try:
+            response = await self._client.analyze_content(
+                request=item.request, **item.kwargs
+            )
+        except asyncio.CancelledError:
+            item.future.cancel()
+            raise
+        except Exception as exc:
+            if not item.future.done():
+                item.future.set_exception(exc)
+        else:
+            if not item.future.done():
+                item.future.set_result(response)
+
+    async def join(self) -> None:
+        """Wait until every submitted request has finished."""
+        condition = self._primitives()
+        async with condition:
+            await condition.wait_for(lambda: not self._lanes)
+
+    async def close(self, wait: bool = True) -> None:
+        """Stop accepting requests and, if ``wait``, finish the queued
+        ones; otherwise cancel them."""
+        condition = self._primitives()
+        async with condition:
+            self._closed = True
+            condition.notify_all()
+        if wait:
+            await self.join()
+            return
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for lane in self._lanes.values():
+            for item in lane.queue:
+                item.future.cancel()
+        self._lanes.clear()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __aenter__(self) -> "AsyncOrderedDispatcher":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+__all__ = (
+    "AsyncOrderedDispatcher",
+    "LaneFull",
+    "LaneStats",
+    "OrderedDispatcher",
+    "conversation_of",
+)
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Export conversations, participants and messages as flat tables.
+
+A :class:`ConversationExporter` reads ``list_conversations`` page by
+page and fetches each conversation's messages (and, given a
+``ParticipantsClient``, its participants) on a thread pool. Rows are
+written one page at a time, so memory stays bounded by ``concurrency``
+times the page size however large the project is::
+
+    python -m google.cloud.dialogflow_helpers.conversation_export \\
+        --project my-project --location global --output-dir export/ \\
+        --format csv --filter 'lifecycle_state = "COMPLETED"'
+
+Each table goes to its own file, ``conversations``, ``participants``
+and ``messages``, as JSON lines or as CSV with a fixed header. Rows
+carry their conversation's name; messages of different conversations
+may interleave. Timestamps are RFC 3339 strings and enums are names.
+"""
+import argparse
+from concurrent import futures
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence
+
+from google.cloud.dialogflow_v2.types import conversation as gcd_conversation
+from google.cloud.dialogflow_v2.types import participant as gcd_participant
+
+NDJSON = "ndjson"
+CSV = "csv"
+FORMATS = (NDJSON, CSV)
+
+#: Columns of each table, in order.
+COLUMNS = {
+    "conversations": (
+        "name",
+        "lifecycle_state",
+        "conversation_stage",
+        "conversation_profile",
+        "start_time",
+        "end_time",
+    ),
+    "participants": ("conversation", "name", "role", "sip_recording_media_label"),
+    "messages": (
+        "conversation",
+        "name",
+        "participant",
+        "participant_role",
+        "language_code",
+        "create_time",
+        "send_time",
+        "content",
+        "sentiment_score",
+        "sentiment_magnitude",
+    ),
+}
+
+_LifecycleState = gcd_conversation.Conversation.LifecycleState
+_ConversationStage = gcd_conversation.Conversation.ConversationStage
+_Role = gcd_participant.Participant.Role
+
+
+def _time(pb, field: str) -> Optional[str]:
+    return getattr(pb, field).ToJsonString() if pb.HasField(field) else None
+
+
+def _enum(enum, value: int):
+    try:
+        return enum(value).name
+    except ValueError:
+        return value
+
+
+def conversation_row(pb) -> List[Any]:
+    """Return the ``conversations`` row of a raw ``Conversation`` proto."""
+    return [
+        pb.name,
+        _enum(_LifecycleState, pb.lifecycle_state),
+        _enum(_ConversationStage, pb.conversation_stage),
+        pb.conversation_profile,
+        _time(pb, "start_time"),
+        _time(pb, "end_time"),
+    ]
+
+
+def participant_row(conversation: str, pb) -> List[Any]:
+    """Return the ``participants`` row of a raw ``Participant`` proto."""
+    return [
+        conversation,
+        pb.name,
+        _enum(_Role, pb.role),
+        pb.sip_recording_media_label,
+    ]
+
+
+def message_row(conversation: str, pb) -> List[Any]:
+    """Return the ``messages`` row of a raw ``Message`` proto."""
+    if pb.HasField("sentiment_analysis") and pb.sentiment_analysis.HasField(
+        "query_text_sentiment"
+    ):
+        sentiment = pb.sentiment_analysis.query_text_sentiment
+        score, magnitude = sentiment.score, sentiment.magnitude
+    else:
+        score = magnitude = None
+    return [
+        conversation,
+        pb.name,
+        pb.participant,
+        _enum(_Role, pb.participant_role),
+        pb.language_code,
+        _time(pb, "create_time"),
+        _time(pb, "send_time"),
+        pb.content,
+        score,
+        magnitude,
+    ]
+
+
+class TableWriter(object):
+    """Writes rows of one table to a text stream.
+
+    Args:
+        stream (IO[str]): The destination.
+        columns (Sequence[str]): The column names.
+        format (str): :data:`NDJSON` or :data:`CSV`. CSV starts with a
+            header row; empty values are written as empty fields.
+    """
+
+    def __init__(self, stream: IO[str], columns: Sequence[str], format: str = NDJSON):
+        if format not in FORMATS:
+            raise ValueError("format must be one of {}".format(", ".join(FORMATS)))
+        self.stream = stream
+        self.columns = tuple(columns)
+        self.format = format
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._csv = None
+        if format == CSV:
+            self._csv = csv.writer(stream, lineterminator="\n")
+            self._csv.writerow(self.columns)
+
+    def write(self, rows: Iterable[Sequence[Any]]) -> int:
+        """Append rows, each in column order.
+
+        Returns:
+            int: The number of rows written.
+        """
+        if self._csv is not None:
+            lines = list(rows)
+            with self._lock:
+                self._csv.writerows(lines)
+                self.rows += len(lines)
+            return len(lines)
+        columns = self.columns
+        lines = [
+            json.dumps(
+                dict(zip(columns, row)), ensure_ascii=False, separators=(",", ":")
+            )
+            for row in rows
+        ]
+        if lines:
+            text = "\n".join(lines) + "\n"
+            with self._lock:
+                self.stream.write(text)
+                self.rows += len(lines)
+        return len(lines)
+
+
+class ExportStats(object):
+    """Progress of an export.
+
+    Attributes:
+        rows (Dict[str, int]): Rows written per table.
+        failed (Dict[str, str]): Conversations whose messages or
+            participants could not be read, with the error.
+        elapsed (float): Seconds the export has run.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, int] = dict.fromkeys(COLUMNS, 0)
+        self.failed: Dict[str, str] = {}
+        self.elapsed = 0.0
+        self.started = time.monotonic()
+
+    @property
+    def rows_per_second(self) -> float:
+        """float: Rows of all tables written per second."""
+        return sum(self.rows.values()) / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """Return a one-line report."""
+        return "{} in {:.1f}s ({:.0f} rows/s){}".format(
+            ", ".join(
+                "{} {}".format(count, table) for table, count in self.rows.items()
+            ),
+            self.elapsed,
+            self.rows_per_second,
+            ", {} failed".format(len(self.failed)) if self.failed else "",
+        )
+
+
+class ConversationExporter(object):
+    """Streams conversations and their messages into tables.
+
+    Args:
+        conversations_client (google.cloud.dialogflow_v2.ConversationsClient):
+            Lists conversations and messages.
+        writers (Dict[str, TableWriter]): Writers by table name; tables
+            without a writer are not fetched.
+        participants_client (google.cloud.dialogflow_v2.ParticipantsClient):
+            Lists participants, for the ``participants`` table.
+        concurrency (int): Conversations fetched at once.
+        page_size (int): Page size of the list calls.
+        progress (Callable[[ExportStats], None]): Called after each
+            conversation.
+    """
+
+    def __init__(
+        self,
+        conversations_client: Any,
+        writers: Dict[str, TableWriter],
+        participants_client: Any = None,
+        concurrency: int = 8,
+        page_size: int = 1000,
+        progress=None,
+    ):
+        unknown = set(writers) - set(COLUMNS)
+        if unknown:
+            raise ValueError("Unknown tables: {}".format(", ".join(sorted(unknown))))
+        if "participants" in writers and participants_client is None:
+            raise ValueError("The participants table needs a participants_client.")
+        self._conversations = conversations_client
+        self._participants = participants_client
+        self.writers = writers
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self._progress = progress
+        self._lock = threading.Lock()
+
+    def _write(self, stats: ExportStats, table: str, rows: List[List[Any]]) -> None:
+        written = self.writers[table].write(rows)
+        with self._lock:
+            stats.rows[table] += written
+
+    def _export_one(self, name: str, stats: ExportStats) -> None:
+        request = {"parent": name, "page_size": self.page_size}
+        try:
+            if "participants" in self.writers:
+                pager = self._participants.list_participants(request=request)
+                for page in pager.pages:
+                    self._write(
+                        stats,
+                        "participants",
+                        [
+                            participant_row(name, gcd_participant.Participant.pb(p))
+                            for p in page.participants
+                        ],
+                    )
+            if "messages" in self.writers:
+                pager = self._conversations.list_messages(request=request)
+                for page in pager.pages:
+                    self._write(
+                        stats,
+                        "messages",
+                        [
+                            message_row(name, gcd_participant.Message.pb(m))
+                            for m in page.messages
+                        ],
+                    )
+        except Exception as exc:
+            with self._lock:
+                stats.failed[name] = "{}: {}".format(type(exc).__name__, exc)
+        stats.elapsed = time.monotonic() - stats.started
+        if self._progress is not None:
+            self._progress(stats)
+
+    def export(self, parent: str, filter: str = "") -> ExportStats:
+        """Export the conversations of ``parent``, e.g.
+        ``projects/<Project ID>/locations/<Location ID>``, that match
+        ``filter``.
+
+        Returns:
+            ExportStats: The rows written and the failed conversations.
+        """
+        stats = ExportStats()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        pager = self._conversations.list_conversations(
+            request={"parent": parent, "filter": filter, "page_size": self.page_size}
+        )
+        with futures.ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="export"
+        ) as executor:
+            for page in pager.pages:
+                conversations = [
+                    gcd_conversation.Conversation.pb(c) for c in page.conversations
+                ]
+                if "conversations" in self.writers:
+                    self._write(
+                        stats,
+                        "conversations",
+                        [conversation_row(pb) for pb in conversations],
+                    )
+                for pb in conversations:
+                    # Read the next page only once workers are free.
+                    slots.acquire()
+                    executor.submit(self._export_one, pb.name, stats).add_done_callback(
+                        lambda _: slots.release()
+                    )
+        stats.elapsed = time.monotonic() - stats.started
+        return stats
+
+
+def open_writers(
+    directory: str, format: str = NDJSON, tables: Iterable[str] = tuple(COLUMNS)
+) -> Dict[str, TableWriter]:
+    """Create a writer per table in ``directory``, e.g.
+    ``messages.ndjson``. Close them with :func:`close_writers`."""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        table: TableWriter(
+            open(
+                os.path.join(directory, "{}.{}".format(table, format)),
+                "w",
+                encoding="utf-8",
+                newline="",
+            ),
+            COLUMNS[table],
+            format,
+        )
+        for table in tables
+    }
+
+
+def close_writers(writers: Dict[str, TableWriter]) -> None:
+    """Close the streams of writers from :func:`open_writers`."""
+    for writer in writers.values():
+        writer.stream.close()
+
+
+__all__ = (
+    "COLUMNS",
+    "CSV",
+    "ConversationExporter",
+    "ExportStats",
+    "FORMATS",
+    "NDJSON",
+    "TableWriter",
+    "close_writers",
+    "conversation_row",
+    "message_row",
+    "open_writers",
+    "participant_row",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Export a project's conversations from the command line."""
+    from google.cloud import dialogflow_v2
+
+    parser = argparse.ArgumentParser(
+        description="Export conversations, participants and messages."
+    )
+    parser.add_argument("--project", required=True)
+    parser.add_argument("--location", default="global")
+    parser.add_argument("--filter", default="", help="list_conversations filter.")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--format", choices=FORMATS, default=NDJSON)
+    parser.add_argument(
+        "--no-participants", action="store_true", help="Skip the participants table."
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    tables = [t for t in COLUMNS if not (args.no_participants and t == "participants")]
+    writers = open_writers(args.output_dir, args.format, tables)
+    last_report = [time.monotonic()]
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last_report[0] >= 10:
+            last_report[0] = now
+            print(stats.format(), file=sys.stderr)
+
+    try:
+        exporter = ConversationExporter(
+            dialogflow_v2.ConversationsClient(),
+            writers,
+            participants_client=(
+                None if args.no_participants else dialogflow_v2.ParticipantsClient()
+            ),
+            concurrency=args.concurrency,
+            page_size=args.page_size,
+            progress=progress,
+        )
+        stats = exporter.export(
+            "projects/{}/locations/{}".format(args.project, args.location), args.filter
+        )
+    finally:
+        close_writers(writers)
+    print(stats.format(), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Refresh access tokens in the background, before they expire.
+
+The transports attach credentials to each call through
+``credentials.before_request``, which refreshes an expired token inline.
+The RPC that happens to run into the expiry therefore waits for a round
+trip to the token endpoint. A :class:`BackgroundRefresher` refreshes the
+token from a daemon thread ahead of time, so ``before_request`` always
+finds a valid token:
+
+.. code-block:: python
+
+    import google.auth
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import credential_refresh
+
+    credentials, _ = google.auth.default(
+        scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    )
+    refresher = credential_refresh.refresh_in_background(credentials)
+    sessions = dialogflow_v2.SessionsClient(credentials=credentials)
+    participants = dialogflow_v2.ParticipantsAsyncClient(credentials=credentials)
+    ...
+    refresher.release()
+
+There is one refresher per credentials object, shared by every caller, so
+pass the same credentials to all clients. Refreshing happens on a thread
+for both the sync and the asyncio transports, since token requests are
+blocking and would otherwise stall the event loop.
+"""
+import datetime
+import threading
+from typing import Any, Dict, Optional
+
+from google.auth import _helpers as auth_helpers  # type: ignore
+from google.auth import credentials as ga_credentials  # type: ignore
+from google.auth.transport import requests as auth_requests  # type: ignore
+
+# google-auth treats tokens expiring within this window as invalid and
+# refreshes them inline, so the background refresh has to happen earlier.
+_AUTH_THRESHOLD = getattr(
+    auth_helpers, "REFRESH_THRESHOLD", datetime.timedelta(seconds=10)
+).total_seconds()
+
+#: Default time before expiry at which tokens are refreshed, in seconds.
+DEFAULT_MARGIN = max(300.0, _AUTH_THRESHOLD + 60.0)
+
+# How often to look again at credentials that report no expiry.
+_IDLE_INTERVAL = 60.0
+_MAX_BACKOFF = 60.0
+
+#: Default time :meth:`BackgroundRefresher.release` waits for the refresh
+#: thread to exit, in seconds.
+DEFAULT_RELEASE_TIMEOUT = 5.0
+
+_lock = threading.Lock()
+_refreshers: Dict[int, "BackgroundRefresher"] = {}
+
+
+def _utcnow() -> datetime.datetime:
+    # google-auth stores expiry as a naive UTC datetime.
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class BackgroundRefresher(object):
+    """Keeps a credentials object's token fresh from a daemon thread.
+
+    Use :func:`refresh_in_background` to get the shared instance for a
+    credentials object rather than constructing one directly.
+
+    Args:
+        credentials (google.auth.credentials.Credentials): The credentials
+            to refresh.
+        margin (float): Refresh this many seconds before expiry.
+        request (google.auth.transport.Request): Transport for token
+            requests; defaults to one backed by ``requests``.
+
+    Attributes:
+        refreshes (int): Successful refreshes.
+        failures (int): Failed refreshes; retried with exponential backoff.
+        last_error (Exception): The most recent refresh error.
+        last_duration (float): Seconds the most recent refresh took.
+    """
+
+    def __init__(
+        self,
+        credentials: ga_credentials.Credentials,
+        margin: float = DEFAULT_MARGIN,
+        request: Optional[Any] = None,
+    ):
+        self.credentials = credentials
+        self.margin = margin
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[Exception] = None
+        self.last_duration: Optional[float] = None
+        self._request = request or auth_requests.Request()
+        self._users = 0
+        # Guards starting and stopping the thread.
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """bool: Whether the refresh thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def seconds_until_refresh(self) -> float:
+        """Return how long to wait before the next refresh."""
+        credentials = self.credentials
+        if not credentials.token:
+            return 0.0
+        expiry = credentials.expiry
+        if expiry is None:
+            return _IDLE_INTERVAL
+        return (expiry - _utcnow()).total_seconds() - self.margin
+
+    def refresh(self) -> None:
+        """Refresh the token now, on the calling thread."""
+        start = _utcnow()
+        self.credentials.refresh(self._request)
+        self.last_duration = (_utcnow() - start).total_seconds()
+        self.refreshes += 1
+
+    def _run(self, stop: threading.Event):
+        backoff = 1.0
+        while not stop.is_set():
+            delay = self.seconds_until_refresh()
+            if delay > 0:
+                if stop.wait(delay):
+                    return
+                continue
+            try:
+                self.refresh()
+            except Exception as exc:
+                self.failures += 1
+                self.last_error = exc
+                if stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, _MAX_BACKOFF)
+            else:
+                backoff = 1.0
+                if self.seconds_until_refresh() <= 0:
+                    # The token lives shorter than the margin; refresh at
+                    # half its remaining lifetime instead of spinning.
+                    expiry = self.credentials.expiry
+                    remaining = (expiry - _utcnow()).total_seconds() if expiry else 0
+                    if stop.wait(max(remaining / 2, 1.0)):
+                        return
+
+    def start(self) -> None:
+        """Start the refresh thread, if it is not running."""
+        with self._thread_lock:
+            if self.running:
+                return
+            # A fresh event, so a thread being stopped cannot be revived.
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._stop,),
+                name="dialogflow-credential-refresh",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _halt(self) -> Optional[threading.Thread]:
+        with self._thread_lock:
+            self._stop.set()
+            thread, self._thread = self._thread, None
+        return thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the refresh thread."""
+        thread = self._halt()
+        if thread is not None:
+            thread.join(timeout)
+
+    def release(self, timeout: Optional[float] = DEFAULT_RELEASE_TIMEOUT) -> None:
+        """Drop one user of the shared refresher, stopping it when none
+        remain.
+
+        Waits at most ``timeout`` seconds for the thread to exit. A thread
+        still blocked in ``credentials.refresh()`` is left to finish on its
+        own; it is a daemon thread and will not refresh again.
+        """
+        with _lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _refreshers.get(id(self.credentials)) is self:
+                del _refreshers[id(self.credentials)]
+            # Under the lock, so a concurrent refresh_in_background cannot
+            # start the thread in between.
+            thread = self._halt()
+        if thread is not None:
+            thread.join(timeout)
+
+
+def refresh_in_background(
+    credentials: ga_credentials.Credentials,
+    margin: float = DEFAULT_MARGIN,
+    request: Optional[Any] = None,
+) -> BackgroundRefresher:
+    """Start refreshing ``credentials`` in the background.
+
+    Every call with the same credentials object returns the same running
+    refresher; call :meth:`BackgroundRefresher.release` once per call.
+    ``margin`` and ``request`` only apply to the first call.
+
+    Returns:
+        BackgroundRefresher: The shared refresher.
+    """
+    with _lock:
+        refresher = _refreshers.get(id(credentials))
+        if refresher is None:
+            refresher = BackgroundRefresher(credentials, margin=margin, request=request)
+            _refreshers[id(credentials)] = refresher
+        refresher._users += 1
+        refresher.start()
+    return refresher
+
+
+def enable_background_refresh(client_or_transport, **kwargs) -> BackgroundRefresher:
+    """Refresh the credentials of a client's transport in the background.
+
+    Works with sync and async clients and with gRPC and REST transports.
+    Keyword arguments are passed to :func:`refresh_in_background`.
+
+    Raises:
+        ValueError: If the transport has no credentials of its own, e.g.
+            because it was given a channel.
+    """
+    transport = getattr(client_or_transport, "transport", client_or_transport)
+    credentials = getattr(transport, "_credentials", None)
+    if not isinstance(credentials, ga_credentials.Credentials):
+        raise ValueError(
+            "The transport has no credentials to refresh; refresh the "
+            "credentials used to create its channel instead."
+        )
+    return refresh_in_background(credentials, **kwargs)
+
+
+__all__ = (
+    "BackgroundRefresher",
+    "DEFAULT_MARGIN",
+    "DEFAULT_RELEASE_TIMEOUT",
+    "enable_background_refresh",
+    "refresh_in_background",
+)
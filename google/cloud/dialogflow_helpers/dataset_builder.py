@@ -0,0 +1,611 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Build conversation datasets and import them.
+
+``import_conversation_data`` reads one conversation per JSON file. A
+:class:`DatasetBuilder` streams transcripts, validates and converts them
+to that format on a process pool, and writes the files into shards of
+about equal size, each a directory of a :class:`DirectorySink` or a
+prefix of a :class:`GcsSink`. :func:`import_conversation_data` then
+imports the shards and reports the operation's progress:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import dataset_builder
+
+    builder = dataset_builder.DatasetBuilder(
+        dataset_builder.GcsSink("gs://my-bucket/datasets/june"), shards=16
+    )
+    stats = builder.build(dataset_builder.read_transcripts("june.jsonl"))
+    dataset_builder.import_conversation_data(
+        dialogflow_v2.ConversationDatasetsClient(),
+        dataset_name,
+        builder.input_config(),
+        progress=print,
+    )
+
+Transcripts are dicts with an optional ``id`` and a list of ``entries``,
+each with a ``role`` (``AGENT``, ``HUMAN_AGENT`` and ``AUTOMATED_AGENT``
+are agents; ``CUSTOMER`` and ``END_USER`` are customers), a ``text`` and
+optionally a ``start_timestamp_usec`` or RFC 3339 ``time`` and a
+``user_id``. The same from the command line::
+
+    python -m google.cloud.dialogflow_helpers.dataset_builder \\
+        --input june.jsonl --output gs://my-bucket/datasets/june \\
+        --dataset projects/my-project/locations/global/conversationDatasets/123
+
+``GcsSink`` requires the ``google-cloud-storage`` package, installed
+with the ``storage`` extra.
+"""
+import argparse
+import collections
+from concurrent import futures
+import hashlib
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from google.protobuf import timestamp_pb2
+
+from google.cloud.dialogflow_v2.types import (
+    conversation_dataset as gcd_conversation_dataset,
+)
+from google.cloud.dialogflow_v2.types import gcs
+
+try:
+    from google.cloud import storage  # type: ignore
+except ImportError:  # pragma: NO COVER
+    storage = None
+
+AGENT = "AGENT"
+CUSTOMER = "CUSTOMER"
+
+#: Accepted roles and the role of the import format they map to.
+ROLES = {
+    "AGENT": AGENT,
+    "HUMAN_AGENT": AGENT,
+    "AUTOMATED_AGENT": AGENT,
+    "CUSTOMER": CUSTOMER,
+    "END_USER": CUSTOMER,
+}
+
+_USER_IDS = {AGENT: 1, CUSTOMER: 2}
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class InvalidTranscript(ValueError):
+    """A transcript cannot be converted."""
+
+
+def conversation_filename(name: str) -> str:
+    """Return the file name of the conversation with id ``name``.
+
+    Characters other than letters, digits, ``.``, ``_`` and ``-`` become
+    ``_``; if any were replaced, a short hash of ``name`` is appended so
+    that, e.g., ``a/b`` and ``a_b`` get different files.
+    """
+    safe = _UNSAFE.sub("_", name)
+    if safe != name:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        safe = "{}-{}".format(safe, digest)
+    return safe + ".json"
+
+
+def _usec(entry: Dict[str, Any]) -> Optional[int]:
+    if entry.get("start_timestamp_usec") is not None:
+        return int(entry["start_timestamp_usec"])
+    if entry.get("time"):
+        timestamp = timestamp_pb2.Timestamp()
+        try:
+            timestamp.FromJsonString(entry["time"])
+        except ValueError as exc:
+            raise InvalidTranscript("Invalid time {!r}.".format(entry["time"])) from exc
+        return timestamp.ToMicroseconds()
+    return None
+
+
+def convert_transcript(transcript: Dict[str, Any]) -> Dict[str, Any]:
+    """Return ``transcript`` in the format ``import_conversation_data``
+    reads.
+
+    Entries without a time are placed one second after the previous one.
+
+    Raises:
+        InvalidTranscript: An entry has an unknown role, no text or a
+            time before the previous entry's, or the transcript lacks
+            either an agent or a customer.
+    """
+    entries = []
+    last = None
+    for index, entry in enumerate(transcript.get("entries") or ()):
+        role = ROLES.get(str(entry.get("role", "")).upper())
+        if role is None:
+            raise InvalidTranscript(
+                "Entry {} has unknown role {!r}.".format(index, entry.get("role"))
+            )
+        text = (entry.get("text") or "").strip()
+        if not text:
+            raise InvalidTranscript("Entry {} has no text.".format(index))
+        usec = _usec(entry)
+        if usec is None:
+            usec = 0 if last is None else last + 1000000
+        elif last is not None and usec < last:
+            raise InvalidTranscript("Entry {} is out of order.".format(index))
+        last = usec
+        entries.append(
+            {
+                "start_timestamp_usec": usec,
+                "text": text,
+                "role": role,
+                "user_id": int(entry.get("user_id") or _USER_IDS[role]),
+            }
+        )
+    roles = {entry["role"] for entry in entries}
+    if roles != {AGENT, CUSTOMER}:
+        raise InvalidTranscript("A transcript needs both an agent and a customer.")
+    return {"conversation_info": {"categories": []}, "entries": entries}
+
+
+def _convert_batch(batch):
+    # Runs in the worker processes: only plain data crosses the boundary.
+    results = []
+    for key, transcript in batch:
+        try:
+            data = json.dumps(
+                convert_transcript(transcript),
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+        except (InvalidTranscript, TypeError, ValueError, AttributeError) as exc:
+            results.append((key, None, str(exc)))
+        else:
+            results.append((key, data, None))
+    return results
+
+
+def read_transcripts(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the transcripts of a JSON lines file, or ``-`` for stdin."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def shard_name(shard: int) -> str:
+    """Return the directory name of ``shard``, e.g. ``shard-00003``."""
+    return "shard-{:05d}".format(shard)
+
+
+class DirectorySink(object):
+    """Writes conversation files under a local directory.
+
+    Args:
+        root (str): The directory; created if missing.
+        uri (str): Cloud Storage location the directory is copied to
+            before importing, e.g. ``gs://bucket/prefix``; the import
+            cannot read local files.
+    """
+
+    def __init__(self, root: str, uri: Optional[str] = None):
+        self.root = root
+        self.uri = uri
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def write(self, shard: int, filename: str, data: bytes) -> None:
+        directory = os.path.join(self.root, shard_name(shard))
+        with self._lock:
+            if shard not in self._created:
+                os.makedirs(directory, exist_ok=True)
+                self._created.add(shard)
+        with open(os.path.join(directory, filename), "wb") as stream:
+            stream.write(data)
+
+    def pattern(self, shard: int) -> str:
+        """Return the wildcard URI of ``shard``'s files."""
+        if self.uri is None:
+            raise ValueError("DirectorySink needs a uri to import from.")
+        return "{}/{}/*.json".format(self.uri.rstrip("/"), shard_name(shard))
+
+
+class GcsSink(object):
+    """Writes conversation files to Cloud Storage.
+
+    Args:
+        uri (str): The destination, ``gs://<bucket>/<prefix>``.
+        client (google.cloud.storage.Client): The storage client.
+    """
+
+    def __init__(self, uri: str, client: Any = None):
+        if not uri.startswith("gs://"):
+            raise ValueError("uri must start with gs://")
+        if client is None:
+            if storage is None:
+                raise ImportError(
+                    "GcsSink requires the 'google-cloud-storage' package; "
+                    "install google-cloud-dialogflow[storage]."
+                )
+            client = storage.Client()
+        bucket, _, prefix = uri[len("gs://") :].partition("/")
+        self.uri = uri.rstrip("/")
+        self._bucket = client.bucket(bucket)
+        self._prefix = prefix.strip("/")
+
+    def write(self, shard: int, filename: str, data: bytes) -> None:
+        path = "/".join(p for p in (self._prefix, shard_name(shard), filename) if p)
+        self._bucket.blob(path).upload_from_string(
+            data, content_type="application/json"
+        )
+
+    def pattern(self, shard: int) -> str:
+        """Return the wildcard URI of ``shard``'s files."""
+        return "{}/{}/*.json".format(self.uri, shard_name(shard))
+
+
+class BuildStats(object):
+    """Outcome of a :meth:`DatasetBuilder.build`.
+
+    Attributes:
+        conversations (int): Conversations written.
+        invalid (int): Transcripts rejected.
+        shard_bytes (List[int]): Bytes written per shard.
+        shard_conversations (List[int]): Conversations written per shard.
+        elapsed (float): Seconds the build took.
+    """
+
+    def __init__(self, shards: int):
+        self.conversations = 0
+        self.invalid = 0
+        self.shard_bytes = [0] * shards
+        self.shard_conversations = [0] * shards
+        self.elapsed = 0.0
+
+    @property
+    def bytes(self) -> int:
+        """int: Bytes written."""
+        return sum(self.shard_bytes)
+
+    @property
+    def throughput(self) -> float:
+        """float: Transcripts processed per second."""
+        done = self.conversations + self.invalid
+        return done / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """Return a one-line report."""
+        return (
+            "{} conversations ({} bytes) in {} shards, {} invalid, "
+            "in {:.1f}s ({:.0f}/s)".format(
+                self.conversations,
+                self.bytes,
+                sum(1 for count in self.shard_conversations if count),
+                self.invalid,
+                self.elapsed,
+                self.throughput,
+            )
+        )
+
+
+class DatasetBuilder(object):
+    """Converts transcripts on a process pool into balanced shards.
+
+    Each conversation goes to the shard with the fewest bytes so far, so
+    shards end up within one conversation of each other in size. Files are
+    named by :func:`conversation_filename`; a transcript whose file name
+    was already written, such as one with a repeated ``id``, is rejected.
+
+    Args:
+        sink (Union[DirectorySink, GcsSink]): Where the files go.
+        shards (int): Number of shards.
+        processes (int): Worker processes converting transcripts; ``0``
+            converts in this process. Defaults to the CPU count.
+        batch_size (int): Transcripts sent to a worker at once.
+        writers (int): Threads writing files to the sink.
+        rejects (IO[str]): Receives a JSON line with the ``id`` and
+            ``error`` of every invalid transcript.
+        progress (Callable[[BuildStats], None]): Called after each batch.
+    """
+
+    def __init__(
+        self,
+        sink: Any,
+        shards: int = 16,
+        processes: Optional[int] = None,
+        batch_size: int = 100,
+        writers: int = 8,
+        rejects: Optional[IO[str]] = None,
+        progress: Optional[Callable[[BuildStats], None]] = None,
+    ):
+        if shards < 1:
+            raise ValueError("shards must be positive.")
+        self.sink = sink
+        self.shards = shards
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.batch_size = batch_size
+        self.writers = writers
+        self._rejects = rejects
+        self._progress = progress
+        self._stats: Optional[BuildStats] = None
+
+    def _batches(self, transcripts: Iterable[Dict[str, Any]]):
+        batch = []
+        names = {}
+        for index, transcript in enumerate(transcripts):
+            name = str(transcript.get("id") or "conversation-{}".format(index))
+            names[index] = name
+            batch.append((index, transcript))
+            if len(batch) >= self.batch_size:
+                yield batch, names
+                batch, names = [], {}
+        if batch:
+            yield batch, names
+
+    def _results(self, transcripts):
+        if not self.processes:
+            for batch, names in self._batches(transcripts):
+                yield _convert_batch(batch), names
+            return
+        with futures.ProcessPoolExecutor(max_workers=self.processes) as executor:
+            pending = collections.deque()
+            # Keep every worker busy while bounding what is read ahead.
+            for batch, names in self._batches(transcripts):
+                pending.append((executor.submit(_convert_batch, batch), names))
+                if len(pending) >= 2 * self.processes:
+                    future, names = pending.popleft()
+                    yield future.result(), names
+            while pending:
+                future, names = pending.popleft()
+                yield future.result(), names
+
+    def build(self, transcripts: Iterable[Dict[str, Any]]) -> BuildStats:
+        """Convert ``transcripts`` and write the valid ones to the sink.
+
+        Transcript ids must be unique; they name the files.
+
+        Returns:
+            BuildStats: Conversations written per shard and rejects.
+        """
+        stats = BuildStats(self.shards)
+        self._stats = stats
+        start = time.monotonic()
+        sizes = [(0, shard) for shard in range(self.shards)]
+        slots = threading.BoundedSemaphore(self.writers * 4)
+        errors: List[BaseException] = []
+        filenames: Set[str] = set()
+
+        def done(future):
+            slots.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+
+        with futures.ThreadPoolExecutor(
+            max_workers=self.writers, thread_name_prefix="dataset"
+        ) as executor:
+            for results, names in self._results(transcripts):
+                for key, data, error in results:
+                    name = names[key]
+                    filename = conversation_filename(name)
+                    if data is not None and filename in filenames:
+                        data = None
+                        error = "Duplicate conversation file {}.".format(filename)
+                    if data is None:
+                        stats.invalid += 1
+                        if self._rejects is not None:
+                            self._rejects.write(
+                                json.dumps({"id": name, "error": error}) + "\n"
+                            )
+                        continue
+                    size, shard = heapq.heappop(sizes)
+                    heapq.heappush(sizes, (size + len(data), shard))
+                    stats.shard_bytes[shard] += len(data)
+                    stats.shard_conversations[shard] += 1
+                    stats.conversations += 1
+                    filenames.add(filename)
+                    slots.acquire()
+                    executor.submit(
+                        self.sink.write, shard, filename, data
+                    ).add_done_callback(done)
+                if errors:
+                    break
+                stats.elapsed = time.monotonic() - start
+                if self._progress is not None:
+                    self._progress(stats)
+        if errors:
+            raise errors[0]
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+    def input_config(self) -> gcd_conversation_dataset.InputConfig:
+        """Return the ``InputConfig`` of the shards the last
+        :meth:`build` wrote."""
+        if self._stats is None:
+            raise ValueError("Nothing built yet.")
+        return gcd_conversation_dataset.InputConfig(
+            gcs_source=gcs.GcsSources(
+                uris=[
+                    self.sink.pattern(shard)
+                    for shard, count in enumerate(self._stats.shard_conversations)
+                    if count
+                ]
+            )
+        )
+
+
+def import_conversation_data(
+    client: Any,
+    dataset: str,
+    input_config: Any,
+    poll_interval: float = 10.0,
+    timeout: Optional[float] = None,
+    progress: Optional[Callable[[Any], None]] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    """Import ``input_config`` into ``dataset`` and wait for it.
+
+    Args:
+        client (google.cloud.dialogflow_v2.ConversationDatasetsClient): The
+            client.
+        dataset (str): The conversation dataset name.
+        input_config (google.cloud.dialogflow_v2.types.InputConfig): The
+            files to import, e.g. :meth:`DatasetBuilder.input_config`.
+        poll_interval (float): Seconds between progress checks.
+        timeout (float): Seconds to wait for the operation.
+        progress (Callable[[ImportConversationDataOperationMetadata], None]):
+            Called with the operation's metadata at each check, and once
+            when it is done.
+
+    Returns:
+        google.cloud.dialogflow_v2.types.ImportConversationDataOperationResponse:
+        The imported dataset and number of conversations.
+
+    Raises:
+        google.api_core.exceptions.GoogleAPICallError: The import failed.
+        concurrent.futures.TimeoutError: ``timeout`` passed first.
+    """
+    operation = client.import_conversation_data(
+        request={"name": dataset, "input_config": input_config}
+    )
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not operation.done():
+        if progress is not None and operation.metadata is not None:
+            progress(operation.metadata)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise futures.TimeoutError(
+                "Import into {} did not finish in {}s.".format(dataset, timeout)
+            )
+        sleep(poll_interval)
+    response = operation.result()
+    if progress is not None and operation.metadata is not None:
+        progress(operation.metadata)
+    return response
+
+
+__all__ = (
+    "AGENT",
+    "BuildStats",
+    "CUSTOMER",
+    "DatasetBuilder",
+    "DirectorySink",
+    "GcsSink",
+    "InvalidTranscript",
+    "ROLES",
+    "conversation_filename",
+    "convert_transcript",
+    "import_conversation_data",
+    "main",
+    "read_transcripts",
+    "shard_name",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Build a conversation dataset, and import it, from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Convert transcripts into conversation dataset shards."
+    )
+    parser.add_argument("--input", required=True, help="JSON lines file, or '-'.")
+    parser.add_argument(
+        "--output", required=True, help="Local directory or gs://bucket/prefix."
+    )
+    parser.add_argument(
+        "--dataset",
+        help="Conversation dataset to import into; requires a gs:// --output.",
+    )
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--rejects", help="File of rejected transcripts.")
+    args = parser.parse_args(argv)
+    if args.output.startswith("gs://"):
+        sink = GcsSink(args.output)
+    elif args.dataset:
+        # Nothing uploads a local directory; the import reads Cloud Storage.
+        parser.error("--dataset requires a gs:// --output")
+    else:
+        sink = DirectorySink(args.output)
+
+    rejects = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+    last_report = [time.monotonic()]
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last_report[0] >= 10:
+            last_report[0] = now
+            print(stats.format(), file=sys.stderr)
+
+    try:
+        builder = DatasetBuilder(
+            sink,
+            shards=args.shards,
+            processes=args.processes,
+            batch_size=args.batch_size,
+            rejects=rejects,
+            progress=progress,
+        )
+        stats = builder.build(read_transcripts(args.input))
+    finally:
+        if rejects is not None:
+            rejects.close()
+    print(stats.format(), file=sys.stderr)
+    if not args.dataset or not stats.conversations:
+        return 0
+
+    from google.cloud import dialogflow_v2
+
+    def report(metadata):
+        print(
+            "importing: {} partial failures".format(len(metadata.partial_failures)),
+            file=sys.stderr,
+        )
+
+    response = import_conversation_data(
+        dialogflow_v2.ConversationDatasetsClient(),
+        args.dataset,
+        builder.input_config(),
+        progress=report,
+    )
+    print(
+        "imported {} conversations into {}".format(
+            response.import_count, response.conversation_dataset
+        ),
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Half-close ``streaming_detect_intent`` as soon as the utterance ends.
+
+With ``single_utterance`` enabled the service sends an
+``END_OF_SINGLE_UTTERANCE`` recognition result once it has heard the end of
+speech, but only returns the ``query_result`` after the client half-closes
+the request stream. A request generator that keeps reading from a
+microphone or file wastes bandwidth and delays the result.
+:func:`streaming_detect_intent` stops the request stream at the next chunk
+boundary after that event:
+
+.. code-block:: python
+
+    from google.cloud.dialogflow_helpers import early_finalization
+
+    stream = early_finalization.streaming_detect_intent(client, requests)
+    for response in stream:
+        ...
+
+    print(stream.final_response.query_result.fulfillment_text)
+    print(stream.savings.result_latency)
+
+By default the rest of the request iterator is left unread, since with a
+live source such as a microphone reading it would block until the source
+ends. For finite sources (files, recordings), pass ``measure_skipped=True``
+to drain the unsent remainder once the call completes and count the audio
+that was saved.
+"""
+import threading
+import time
+from typing import AsyncIterable, Iterable, Optional
+
+from google.cloud.dialogflow_helpers import audio
+from google.cloud.dialogflow_v2.types import session
+
+_MessageType = session.StreamingRecognitionResult.MessageType
+
+
+class HalfCloseSavings(object):
+    """What half-closing early saved on a single call.
+
+    Times are in seconds since the call started and are ``None`` when the
+    corresponding event did not happen.
+
+    Attributes:
+        chunks_sent (int): Audio chunks sent to the service.
+        bytes_sent (int): Audio bytes sent to the service.
+        chunks_skipped (int): Audio chunks left unsent in the request
+            iterator. Without ``measure_skipped`` only the chunk read
+            when half-closing is counted.
+        bytes_skipped (int): Audio bytes left unsent.
+        audio_seconds_skipped (float): Duration of the unsent audio, for
+            uncompressed encodings; for a real-time source this is also the
+            wall time saved.
+        end_of_utterance_at (float): When the end of the utterance was
+            received.
+        half_closed_at (float): When the request stream was half-closed.
+        final_response_at (float): When the response carrying the
+            ``query_result`` was received.
+        early (bool): Whether the stream was half-closed before the request
+            iterator was exhausted.
+    """
+
+    def __init__(self):
+        self.chunks_sent = 0
+        self.bytes_sent = 0
+        self.chunks_skipped = 0
+        self.bytes_skipped = 0
+        self.audio_seconds_skipped: Optional[float] = None
+        self.end_of_utterance_at: Optional[float] = None
+        self.half_closed_at: Optional[float] = None
+        self.final_response_at: Optional[float] = None
+        self.early = False
+
+    @property
+    def result_latency(self) -> Optional[float]:
+        """float: From the end of the utterance to the final response."""
+        if self.end_of_utterance_at is None or self.final_response_at is None:
+            return None
+        return self.final_response_at - self.end_of_utterance_at
+
+    def __repr__(self):
+        return (
+            "HalfCloseSavings(chunks_sent={}, chunks_skipped={}, "
+            "bytes_skipped={}, audio_seconds_skipped={}, result_latency={})".format(
+                self.chunks_sent,
+                self.chunks_skipped,
+                self.bytes_skipped,
+                self.audio_seconds_skipped,
+                self.result_latency,
+            )
+        )
+
+
+class EarlyFinalizingStream(object):
+    """A ``streaming_detect_intent`` call that half-closes on the end of
+    the utterance.
+
+    Iterate over it (with ``for`` or ``async for``, depending on the client)
+    to receive the responses. Use :func:`streaming_detect_intent` or
+    :func:`streaming_detect_intent_async` to create one.
+
+    Attributes:
+        final_response (google.cloud.dialogflow_v2.types.StreamingDetectIntentResponse):
+            The last response carrying a ``query_result``, once received.
+        savings (HalfCloseSavings): Measurements for this call.
+    """
+
+    def __init__(
+        self,
+        requests,
+        on_final_transcript: bool = False,
+        single_utterance: bool = True,
+        measure_skipped: bool = False,
+    ):
+        self.final_response: Optional[session.StreamingDetectIntentResponse] = None
+        self.savings = HalfCloseSavings()
+        self._source = requests
+        self._on_final_transcript = on_final_transcript
+        self._single_utterance = single_utterance
+        self._measure_skipped = measure_skipped
+        self._bytes_per_second: Optional[int] = None
+        self._stop = threading.Event()
+        self._exhausted = False
+        self._start = time.monotonic()
+        self._responses = None
+
+    def _elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def _first(self, request) -> session.StreamingDetectIntentRequest:
+        request = session.StreamingDetectIntentRequest(request)
+        if "audio_config" in request.query_input:
+            config = request.query_input.audio_config
+            if self._single_utterance:
+                config.single_utterance = True
+            self._bytes_per_second = audio.bytes_per_second(
+                config.audio_encoding, config.sample_rate_hertz
+            )
+        return request
+
+    def _sent(self, request):
+        if request.input_audio:
+            self.savings.chunks_sent += 1
+            self.savings.bytes_sent += len(request.input_audio)
+
+    def _half_close(self):
+        self.savings.half_closed_at = self._elapsed()
+
+    def _requests(self, requests: Iterable):
+        first = True
+        for request in requests:
+            if first:
+                request = self._first(request)
+                first = False
+            elif self._stop.is_set():
+                self.savings.early = True
+                self._skip(request)
+                break
+            self._sent(request)
+            yield request
+        else:
+            self._exhausted = True
+        self._half_close()
+
+    async def _arequests(self, requests: AsyncIterable):
+        first = True
+        async for request in requests:
+            if first:
+                request = self._first(request)
+                first = False
+            elif self._stop.is_set():
+                self.savings.early = True
+                self._skip(request)
+                break
+            self._sent(request)
+            yield request
+        else:
+            self._exhausted = True
+        self._half_close()
+
+    def _skip(self, request):
+        self.savings.chunks_skipped += 1
+        self.savings.bytes_skipped += len(request.input_audio)
+
+    def _finish_skipped(self):
+        if self._bytes_per_second:
+            self.savings.audio_seconds_skipped = self.savings.bytes_skipped / float(
+                self._bytes_per_second
+            )
+
+    def _on_response(self, response: session.StreamingDetectIntentResponse):
+        result = response.recognition_result
+        if (
+            result.message_type == _MessageType.END_OF_SINGLE_UTTERANCE
+            or (self._on_final_transcript and result.is_final)
+        ) and not self._stop.is_set():
+            self.savings.end_of_utterance_at = self._elapsed()
+            self._stop.set()
+        if "query_result" in response:
+            self.final_response = response
+            self.savings.final_response_at = self._elapsed()
+
+    def __iter__(self):
+        for response in self._responses:
+            self._on_response(response)
+            yield response
+        if self._measure_skipped and not self._exhausted:
+            for request in self._source:
+                self._skip(request)
+        self._finish_skipped()
+
+    async def __aiter__(self):
+        async for response in self._responses:
+            self._on_response(response)
+            yield response
+        if self._measure_skipped and not self._exhausted:
+            async for request in self._source:
+                self._skip(request)
+        self._finish_skipped()
+
+
+def streaming_detect_intent(
+    client,
+    requests: Iterable[session.StreamingDetectIntentRequest],
+    on_final_transcript: bool = False,
+    single_utterance: bool = True,
+    measure_skipped: bool = False,
+    **kwargs,
+) -> EarlyFinalizingStream:
+    """Call ``client.streaming_detect_intent``, half-closing the request
+    stream once the end of the utterance is detected.
+
+    Args:
+        client (google.cloud.dialogflow_v2.SessionsClient): The client.
+        requests (Iterable[google.cloud.dialogflow_v2.types.StreamingDetectIntentRequest]):
+            The request stream; the first request carries the configuration.
+        on_final_transcript (bool): Also half-close on the first final
+            transcript, for streams without ``single_utterance``.
+        single_utterance (bool): Set ``single_utterance`` on the first
+            request's ``InputAudioConfig`` so the service detects the end
+            of the utterance.
+        measure_skipped (bool): Drain the unsent requests after the call to
+            count the audio saved. Only for finite sources; with a live
+            one this blocks until the source ends.
+        kwargs: Passed to ``client.streaming_detect_intent`` (e.g. ``retry``,
+            ``timeout`` or ``metadata``).
+
+    Returns:
+        EarlyFinalizingStream: Iterate over it to receive the responses.
+    """
+    requests = iter(requests)
+    stream = EarlyFinalizingStream(
+        requests,
+        on_final_transcript=on_final_transcript,
+        single_utterance=single_utterance,
+        measure_skipped=measure_skipped,
+    )
+    stream._responses = client.streaming_detect_intent(
+        requests=stream._requests(requests), **kwargs
+    )
+    return stream
+
+
+async def streaming_detect_intent_async(
+    client,
+    requests: AsyncIterable[session.StreamingDetectIntentRequest],
+    on_final_transcript: bool = False,
+    single_utterance: bool = True,
+    measure_skipped: bool = False,
+    **kwargs,
+) -> EarlyFinalizingStream:
+    """Async variant of :func:`streaming_detect_intent` for
+    :class:`~google.cloud.dialogflow_v2.SessionsAsyncClient`.
+
+    Returns:
+        EarlyFinalizingStream: Iterate over it with ``async for``.
+    """
+    requests = requests.__aiter__()
+    stream = EarlyFinalizingStream(
+        requests,
+        on_final_transcript=on_final_transcript,
+        single_utterance=single_utterance,
+        measure_skipped=measure_skipped,
+    )
+    stream._responses = await client.streaming_detect_intent(
+        requests=stream._arequests(requests), **kwargs
+    )
+    return stream
+
+
+__all__ = (
+    "EarlyFinalizingStream",
+    "HalfCloseSavings",
+    "streaming_detect_intent",
+    "streaming_detect_intent_async",
+)
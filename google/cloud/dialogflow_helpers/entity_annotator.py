@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Find an agent's entities in text without calling the API.
+
+An :class:`EntityAnnotator` compiles the synonyms of an agent's custom
+entity types into an Aho-Corasick automaton and finds them in text in a
+single pass, for pre-routing or analytics on traffic that never reaches
+``detect_intent``:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import entity_annotator
+
+    client = dialogflow_v2.EntityTypesClient()
+    annotator = entity_annotator.EntityAnnotator(
+        client.list_entity_types(parent="projects/my-project/agent")
+    )
+    for match in annotator.annotate("two large pizzas to New York"):
+        print(match.entity_type, match.value, match.start, match.end)
+
+Matching is case-insensitive, treats runs of whitespace as one space and
+only matches whole words. Overlapping matches resolve to the leftmost,
+then longest, span. By entity type kind:
+
+* ``KIND_MAP``: synonyms match and report the entity's reference value.
+* ``KIND_LIST``: entries match and report the matched text. Entries that
+  reference other custom entity types (``@type`` or ``@type:alias``)
+  match those types' synonyms; references to system entities are skipped.
+* ``KIND_REGEXP``: each entry is a regular expression.
+
+Automated expansion and fuzzy extraction are learned by the service and
+cannot be reproduced offline; matches of such types have
+:attr:`EntityMatch.expandable` set, as a hint that the service may match
+more.
+
+The annotator can be updated from the batch entity RPCs and the types it
+was built from, see :meth:`EntityAnnotator.update_entity_types` and
+:meth:`EntityAnnotator.update_entities`. The automaton is rebuilt on the
+next lookup after a change.
+
+Throughput can be measured with ``python -m
+google.cloud.dialogflow_helpers.entity_annotator`` on an exported agent
+and a file of utterances, one per line.
+"""
+import argparse
+import collections
+import io
+import json
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import zipfile
+
+from google.cloud.dialogflow_v2.types import entity_type as gcd_entity_type
+
+_Kind = gcd_entity_type.EntityType.Kind
+_AutoExpansionMode = gcd_entity_type.EntityType.AutoExpansionMode
+
+_WHITESPACE = re.compile(r"\s+")
+_REFERENCE = re.compile(r"^@([\w.-]+)(?::[\w-]+)?$")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text.strip()).lower()
+
+
+class EntityMatch(
+    collections.namedtuple(
+        "EntityMatch",
+        ["entity_type", "value", "start", "end", "text", "expandable"],
+    )
+):
+    """An entity found in text.
+
+    Attributes:
+        entity_type (str): The entity type's display name.
+        value (str): The entity value; for list entity types, the matched
+            text.
+        start (int): Offset of the match in the text.
+        end (int): Offset just past the match.
+        text (str): The matched text.
+        expandable (bool): Whether the service might match more of this
+            type, through automated expansion or fuzzy extraction.
+    """
+
+    __slots__ = ()
+
+
+class AnnotatorStats(object):
+    """Throughput of an :class:`EntityAnnotator`.
+
+    Attributes:
+        utterances (int): Texts annotated.
+        characters (int): Characters scanned.
+        matches (int): Entities found.
+        seconds (float): Time spent annotating.
+        builds (int): Times the automaton was (re)built.
+        build_seconds (float): Time spent building.
+    """
+
+    def __init__(self):
+        self.utterances = 0
+        self.characters = 0
+        self.matches = 0
+        self.seconds = 0.0
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    @property
+    def utterances_per_second(self) -> float:
+        """float: Annotation throughput."""
+        return self.utterances / self.seconds if self.seconds else 0.0
+
+    @property
+    def characters_per_second(self) -> float:
+        """float: Scanning throughput."""
+        return self.characters / self.seconds if self.seconds else 0.0
+
+    def format(self) -> str:
+        """Return a one-line summary."""
+        return (
+            "{} utterances, {} matches in {:.2f}s: {:.0f} utterances/s, "
+            "{:.0f} chars/s (built {} times, {:.3f}s)".format(
+                self.utterances,
+                self.matches,
+                self.seconds,
+                self.utterances_per_second,
+                self.characters_per_second,
+                self.builds,
+                self.build_seconds,
+            )
+        )
+
+
+class _Automaton(object):
+    """Aho-Corasick automaton over normalized phrases."""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Per state: (phrase length, payload index) of phrases ending there.
+        self.out: List[List[Tuple[int, int]]] = [[]]
+
+    def add(self, phrase: str, payload: int):
+        state = 0
+        for char in phrase:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = next_state
+        self.out[state].append((len(phrase), payload))
+
+    def finish(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def scan(self, text: str):
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in out[state]:
+                yield end - length, end, payload
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class EntityAnnotator(object):
+    """An in-memory matcher for an agent's custom entities.
+
+    Args:
+        entity_types (Iterable[EntityType]): The agent's entity types, e.g.
+            a ``list_entity_types`` pager, which is consumed as it streams.
+
+    Attributes:
+        stats (AnnotatorStats): Throughput counters.
+    """
+
+    def __init__(self, entity_types: Iterable[Any] = ()):
+        self.stats = AnnotatorStats()
+        self._lock = threading.Lock()
+        # Keyed by display name, which entity references use.
+        self._types: Dict[str, gcd_entity_type.EntityType] = {}
+        self._names: Dict[str, str] = {}
+        self._compiled: Optional[Tuple[Any, ...]] = None
+        self.update_entity_types(entity_types)
+
+    @classmethod
+    def from_agent_zip(
+        cls, agent: Union[str, bytes], language_code: str = "en"
+    ) -> "EntityAnnotator":
+        """Build an annotator from an exported agent.
+
+        Args:
+            agent (Union[str, bytes]): The path of the zip file returned by
+                ``AgentsClient.export_agent``, or its content.
+            language_code (str): The language of the entries to load.
+        """
+        source = io.BytesIO(agent) if isinstance(agent, bytes) else agent
+        entity_types = []
+        with zipfile.ZipFile(source) as archive:
+            names = set(archive.namelist())
+            for path in sorted(names):
+                if not path.startswith("entities/") or "_entries_" in path:
+                    continue
+                spec = json.loads(archive.read(path))
+                entries_path = "{}_entries_{}.json".format(path[:-5], language_code)
+                entries = (
+                    json.loads(archive.read(entries_path))
+                    if entries_path in names
+                    else []
+                )
+                if spec.get("isRegexp"):
+                    kind = _Kind.KIND_REGEXP
+                elif spec.get("isEnum"):
+                    kind = _Kind.KIND_LIST
+                else:
+                    kind = _Kind.KIND_MAP
+                entity_types.append(
+                    gcd_entity_type.EntityType(
+                        display_name=spec["name"],
+                        kind=kind,
+                        auto_expansion_mode=(
+                            _AutoExpansionMode.AUTO_EXPANSION_MODE_DEFAULT
+                            if spec.get("automatedExpansion")
+                            else _AutoExpansionMode.AUTO_EXPANSION_MODE_UNSPECIFIED
+                        ),
+                        enable_fuzzy_extraction=spec.get("allowFuzzyExtraction", False),
+                        entities=[
+                            {"value": e["value"], "synonyms": e.get("synonyms", [])}
+                            for e in entries
+                        ],
+                    )
+                )
+        return cls(entity_types)
+
+    @property
+    def entity_types(self) -> List[str]:
+        """List[str]: Display names of the loaded entity types."""
+        return sorted(self._types)
+
+    def _display_name(self, name: str) -> Optional[str]:
+        return self._names.get(name, name if name in self._types else None)
+
+    def update_entity_types(self, entity_types: Iterable[Any]) -> None:
+        """Add or replace entity types.
+
+        Accepts ``EntityType`` messages or dicts, e.g. a
+        ``list_entity_types`` pager or the ``entity_types`` of a
+        ``BatchUpdateEntityTypesResponse``.
+        """
+        with self._lock:
+            for entity_type in entity_types:
+                entity_type = gcd_entity_type.EntityType(entity_type)
+                self._types[entity_type.display_name] = entity_type
+                if entity_type.name:
+                    self._names[entity_type.name] = entity_type.display_name
+            self._compiled = None
+
+    def delete_entity_types(self, names: Iterable[str]) -> None:
+        """Remove entity types by resource or display name, as after
+        ``batch_delete_entity_types``."""
+        with self._lock:
+            for name in names:
+                display_name = self._display_name(name)
+                if display_name is not None:
+                    entity_type = self._types.pop(display_name)
+                    self._names.pop(entity_type.name, None)
+            self._compiled = None
+
+    def update_entities(self, parent: str, entities: Iterable[Any]) -> None:
+        """Add or replace entities by value, as after
+        ``batch_create_entities`` or ``batch_update_entities``.
+
+        Args:
+            parent (str): The entity type's resource or display name.
+            entities (Iterable[Entity]): ``Entity`` messages or dicts.
+
+        Raises:
+            KeyError: If the entity type is not loaded.
+        """
+        with self._lock:
+            entity_type = self._types[self._display_name(parent) or parent]
+            by_value = collections.OrderedDict(
+                (e.value, e) for e in entity_type.entities
+            )
+            for entity in entities:
+                entity = gcd_entity_type.EntityType.Entity(entity)
+                by_value[entity.value] = entity
+            entity_type.entities = list(by_value.values())
+            self._compiled = None
+
+    def delete_entities(self, parent: str, values: Iterable[str]) -> None:
+        """Remove entities by value, as after ``batch_delete_entities``.
+
+        Raises:
+            KeyError: If the entity type is not loaded.
+        """
+        with self._lock:
+            entity_type = self._types[self._display_name(parent) or parent]
+            values = set(values)
+            entity_type.entities = [
+                e for e in entity_type.entities if e.value not in values
+            ]
+            self._compiled = None
+
+    def _phrases(self, entity_type, seen):
+        """Yield (phrase, value or None) for a map or list entity type."""
+        if entity_type.kind == _Kind.KIND_LIST:
+            for entity in entity_type.entities:
+                reference = _REFERENCE.match(entity.value)
+                if reference is None:
+                    for synonym in entity.synonyms or [entity.value]:
+                        yield synonym, None
+                    continue
+                referenced = self._types.get(reference.group(1))
+                if referenced is not None and referenced.display_name not in seen:
+                    seen.add(referenced.display_name)
+                    yield from self._phrases(referenced, seen)
+        else:
+            for entity in entity_type.entities:
+                for synonym in entity.synonyms or [entity.value]:
+                    yield synonym, entity.value
+
+    def _compile(self):
+        start = time.perf_counter()
+        automaton = _Automaton()
+        payloads: List[Tuple[str, Optional[str], bool]] = []
+        index: Dict[Tuple[str, Optional[str]], int] = {}
+        patterns = []
+        for display_name, entity_type in self._types.items():
+            expandable = bool(
+                entity_type.auto_expansion_mode
+                == _AutoExpansionMode.AUTO_EXPANSION_MODE_DEFAULT
+                or entity_type.enable_fuzzy_extraction
+            )
+            if entity_type.kind == _Kind.KIND_REGEXP:
+                for entity in entity_type.entities:
+                    for pattern in entity.synonyms or [entity.value]:
+                        try:
+                            compiled = re.compile(pattern, re.IGNORECASE)
+                        except re.error:
+                            continue
+                        patterns.append((compiled, display_name, expandable))
+                continue
+            for phrase, value in self._phrases(entity_type, {display_name}):
+                phrase = _normalize(phrase)
+                if not phrase:
+                    continue
+                key = (display_name, value)
+                payload = index.get(key)
+                if payload is None:
+                    payload = index[key] = len(payloads)
+                    payloads.append((display_name, value, expandable))
+                automaton.add(phrase, payload)
+        automaton.finish()
+        self.stats.builds += 1
+        self.stats.build_seconds += time.perf_counter() - start
+        return automaton, payloads, patterns
+
+    def _get_compiled(self):
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    self._compiled = self._compile()
+                compiled = self._compiled
+        return compiled
+
+    def _annotate(self, text: str, compiled) -> List[EntityMatch]:
+        automaton, payloads, patterns = compiled
+        # Normalize while keeping a map back to offsets in ``text``.
+        lowered = text.lower()
+        if (
+            len(lowered) == len(text)
+            and "  " not in text
+            and not any(c in text for c in "\t\n\r\f\v")
+        ):
+            normalized, offsets = lowered, None
+        else:
+            chars: List[str] = []
+            offsets = []
+            previous_space = True
+            for i, char in enumerate(text):
+                if char.isspace():
+                    if previous_space:
+                        continue
+                    char = " "
+                    previous_space = True
+                else:
+                    previous_space = False
+                for lower in char.lower():
+                    chars.append(lower)
+                    offsets.append(i)
+            normalized = "".join(chars)
+            offsets.append(len(text))
+
+        candidates = []
+        length = len(normalized)
+        for start, end, payload in automaton.scan(normalized):
+            if start > 0 and _is_word_char(normalized[start - 1]):
+                continue
+            if end < length and _is_word_char(normalized[end]):
+                continue
+            if offsets is not None:
+                start = offsets[start]
+                end = offsets[end - 1] + 1
+            candidates.append((start, end, payloads[payload]))
+        for pattern, display_name, expandable in patterns:
+            for m in pattern.finditer(text):
+                if m.end() > m.start():
+                    candidates.append(
+                        (m.start(), m.end(), (display_name, None, expandable))
+                    )
+
+        # Leftmost, then longest; ties on a span keep every entity type.
+        candidates.sort(key=lambda c: (c[0], c[0] - c[1]))
+        matches = []
+        taken_end = -1
+        taken_span = None
+        for start, end, (display_name, value, expandable) in candidates:
+            if start < taken_end and (start, end) != taken_span:
+                continue
+            matched = text[start:end]
+            match = EntityMatch(
+                display_name,
+                matched if value is None else value,
+                start,
+                end,
+                matched,
+                expandable,
+            )
+            if match not in matches:
+                matches.append(match)
+            taken_end, taken_span = end, (start, end)
+        return matches
+
+    def annotate(self, text: str) -> List[EntityMatch]:
+        """Return the entities in ``text``, in order of position."""
+        return self.annotate_many([text])[0]
+
+    def annotate_many(self, texts: Iterable[str]) -> List[List[EntityMatch]]:
+        """Annotate a batch of texts; see :meth:`annotate`."""
+        compiled = self._get_compiled()
+        start = time.perf_counter()
+        results = []
+        characters = 0
+        matches = 0
+        for text in texts:
+            result = self._annotate(text, compiled)
+            characters += len(text)
+            matches += len(result)
+            results.append(result)
+        stats = self.stats
+        stats.seconds += time.perf_counter() - start
+        stats.utterances += len(results)
+        stats.characters += characters
+        stats.matches += matches
+        return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure entity annotation throughput on an exported agent."
+    )
+    parser.add_argument("agent", help="Exported agent zip file.")
+    parser.add_argument(
+        "utterances", help="Text file with one utterance per line, or '-'."
+    )
+    parser.add_argument("--language-code", default="en")
+    parser.add_argument(
+        "--batch-size", type=int, default=10000, help="Utterances per batch."
+    )
+    parser.add_argument(
+        "--print-matches", action="store_true", help="Print matches as JSON lines."
+    )
+    args = parser.parse_args(argv)
+
+    annotator = EntityAnnotator.from_agent_zip(args.agent, args.language_code)
+    source = (
+        sys.stdin if args.utterances == "-" else open(args.utterances, encoding="utf-8")
+    )
+    with source:
+        batch: List[str] = []
+        for line in source:
+            batch.append(line.rstrip("\n"))
+            if len(batch) >= args.batch_size:
+                _report(annotator, batch, args.print_matches)
+                batch = []
+        if batch:
+            _report(annotator, batch, args.print_matches)
+    print(annotator.stats.format(), file=sys.stderr)
+    return 0
+
+
+def _report(annotator: EntityAnnotator, batch: List[str], print_matches: bool):
+    results = annotator.annotate_many(batch)
+    if print_matches:
+        for text, matches in zip(batch, results):
+            print(
+                json.dumps(
+                    {"text": text, "matches": [match._asdict() for match in matches]}
+                )
+            )
+
+
+__all__ = (
+    "AnnotatorStats",
+    "EntityAnnotator",
+    "EntityMatch",
+)
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Watch environment histories for new entries.
+
+``get_environment_history`` returns an environment's whole history,
+newest entry first. An :class:`EnvironmentWatcher` remembers the newest
+entry it has seen of each environment and stops reading pages once it
+reaches it, so a poll that finds nothing new costs one small page:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import environment_history
+
+    watcher = environment_history.EnvironmentWatcher(
+        dialogflow_v2.EnvironmentsClient(), [environment]
+    )
+    watcher.subscribe(lambda name, version, previous: cache.invalidate(name))
+    for name, entry in watcher.watch(interval=30):
+        print(name, entry.agent_version, entry.description)
+
+Subscribers are called when an environment's ``agent_version``
+changes. :class:`AsyncEnvironmentWatcher` does the same with an
+``EnvironmentsAsyncClient``. :attr:`EnvironmentWatcher.cursors` can be
+saved and passed back in to resume after a restart.
+"""
+import asyncio
+import threading
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from google.protobuf import timestamp_pb2
+
+from google.cloud.dialogflow_v2.types import environment as gcd_environment
+
+_Entry = gcd_environment.EnvironmentHistory.Entry
+
+#: Called with the environment, its new agent version and the previous one.
+Subscriber = Callable[[str, str, Optional[str]], None]
+
+
+def _key(entry_pb) -> Tuple[int, int]:
+    return entry_pb.create_time.seconds, entry_pb.create_time.nanos
+
+
+class _Cursor(object):
+    __slots__ = ("create_time", "agent_version")
+
+    def __init__(self, create_time: Tuple[int, int], agent_version: str):
+        self.create_time = create_time
+        self.agent_version = agent_version
+
+
+class _Watcher(object):
+    def __init__(self, client, environments, page_size, from_start, cursors):
+        self._client = client
+        self.page_size = page_size
+        self.from_start = from_start
+        self._environments: List[str] = []
+        self._cursors: Dict[str, _Cursor] = {}
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        for name, cursor in (cursors or {}).items():
+            timestamp = timestamp_pb2.Timestamp()
+            timestamp.FromJsonString(cursor["create_time"])
+            self._cursors[name] = _Cursor(
+                (timestamp.seconds, timestamp.nanos), cursor["agent_version"]
+            )
+        for name in environments:
+            self.add(name)
+
+    def add(self, environment: str) -> None:
+        """Watch ``environment``, e.g.
+        ``projects/<Project ID>/agent/environments/<Environment ID>``."""
+        with self._lock:
+            if environment not in self._environments:
+                self._environments.append(environment)
+
+    def remove(self, environment: str) -> None:
+        """Stop watching ``environment`` and forget its cursor."""
+        with self._lock:
+            if environment in self._environments:
+                self._environments.remove(environment)
+            self._cursors.pop(environment, None)
+
+    @property
+    def environments(self) -> List[str]:
+        """List[str]: The environments watched."""
+        with self._lock:
+            return list(self._environments)
+
+    def agent_version(self, environment: str) -> Optional[str]:
+        """Return the newest agent version seen of ``environment``."""
+        cursor = self._cursors.get(environment)
+        return None if cursor is None else cursor.agent_version
+
+    @property
+    def cursors(self) -> Dict[str, Dict[str, str]]:
+        """Dict[str, Dict[str, str]]: The newest entry seen per
+        environment, as its ``create_time`` and ``agent_version``; pass
+        it to the constructor to resume."""
+        result = {}
+        for name, cursor in list(self._cursors.items()):
+            timestamp = timestamp_pb2.Timestamp(
+                seconds=cursor.create_time[0], nanos=cursor.create_time[1]
+            )
+            result[name] = {
+                "create_time": timestamp.ToJsonString(),
+                "agent_version": cursor.agent_version,
+            }
+        return result
+
+    def subscribe(self, subscriber: Subscriber) -> Callable[[], None]:
+        """Call ``subscriber(environment, agent_version, previous)`` when
+        an environment's agent version changes.
+
+        Returns:
+            Callable[[], None]: Unsubscribes.
+        """
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        def unsubscribe():
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+
+        return unsubscribe
+
+    def _request(self, environment: str) -> Dict[str, Any]:
+        # Without a cursor, only the newest entry is needed to prime it.
+        primed = environment in self._cursors or self.from_start
+        return {
+            "parent": environment,
+            "page_size": self.page_size if primed else 1,
+        }
+
+    def _scan(self, environment: str, entries, new: List[Any]) -> bool:
+        """Collect the entries of a page newer than the cursor; return
+        whether older pages are still needed."""
+        cursor = self._cursors.get(environment)
+        if cursor is None and not self.from_start:
+            if entries:
+                pb = _Entry.pb(entries[0])
+                self._cursors[environment] = _Cursor(_key(pb), pb.agent_version)
+            return False
+        for entry in entries:
+            if cursor is not None and _key(_Entry.pb(entry)) <= cursor.create_time:
+                return False
+            new.append(entry)
+        return True
+
+    def _advance(self, environment: str, new: List[Any]) -> List[Tuple[str, Any]]:
+        new.reverse()
+        if not new:
+            return []
+        cursor = self._cursors.get(environment)
+        previous = None if cursor is None else cursor.agent_version
+        changes = []
+        for entry in new:
+            if entry.agent_version != previous:
+                changes.append((entry.agent_version, previous))
+                previous = entry.agent_version
+        newest = _Entry.pb(new[-1])
+        self._cursors[environment] = _Cursor(_key(newest), newest.agent_version)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for agent_version, before in changes:
+            for subscriber in subscribers:
+                subscriber(environment, agent_version, before)
+        return [(environment, entry) for entry in new]
+
+
+class EnvironmentWatcher(_Watcher):
+    """Polls environment histories for new entries.
+
+    Args:
+        client (google.cloud.dialogflow_v2.EnvironmentsClient): The client.
+        environments (Iterable[str]): Environments to watch.
+        page_size (int): Entries per history page, at most 1000.
+        from_start (bool): Yield the whole history of environments
+            without a cursor; by default their newest entry only becomes
+            the cursor.
+        cursors (Dict[str, Dict[str, str]]): :attr:`cursors` of an
+            earlier watcher.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        environments: Iterable[str] = (),
+        page_size: int = 100,
+        from_start: bool = False,
+        cursors: Optional[Dict[str, Dict[str, str]]] = None,
+    ):
+        super().__init__(client, environments, page_size, from_start, cursors)
+
+    def poll(self, environment: str) -> List[Tuple[str, Any]]:
+        """Return the new ``(environment, entry)`` pairs of
+        ``environment``, oldest first, and notify subscribers."""
+        new: List[Any] = []
+        pager = self._client.get_environment_history(request=self._request(environment))
+        for page in pager.pages:
+            if not self._scan(environment, page.entries, new):
+                break
+        return self._advance(environment, new)
+
+    def poll_all(self) -> List[Tuple[str, Any]]:
+        """Poll every environment watched."""
+        return [item for name in self.environments for item in self.poll(name)]
+
+    def watch(
+        self, interval: float = 30.0, stop: Optional[threading.Event] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """Poll every ``interval`` seconds and yield new
+        ``(environment, entry)`` pairs until ``stop`` is set."""
+        stop = stop if stop is not None else threading.Event()
+        while not stop.is_set():
+            for name in self.environments:
+                yield from self.poll(name)
+            stop.wait(interval)
+
+
+class AsyncEnvironmentWatcher(_Watcher):
+    """Polls environment histories for new entries, asynchronously.
+
+    Args:
+        client (google.cloud.dialogflow_v2.EnvironmentsAsyncClient): The
+            client.
+
+    The other arguments are those of :class:`EnvironmentWatcher`.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        environments: Iterable[str] = (),
+        page_size: int = 100,
+        from_start: bool = False,
+        cursors: Optional[Dict[str, Dict[str, str]]] = None,
+    ):
+        super().__init__(client, environments, page_size, from_start, cursors)
+
+    async def poll(self, environment: str) -> List[Tuple[str, Any]]:
+        """Return the new ``(environment, entry)`` pairs of
+        ``environment``, oldest first, and notify subscribers."""
+        new: List[Any] = []
+        pager = await self._client.get_environment_history(
+            request=self._request(environment)
+        )
+        async for page in pager.pages:
+            if not self._scan(environment, page.entries, new):
+                break
+        return self._advance(environment, new)
+
+    async def poll_all(self) -> List[Tuple[str, Any]]:
+        """Poll every environment watched concurrently."""
+        results = await asyncio.gather(*(self.poll(n) for n in self.environments))
+        return [item for result in results for item in result]
+
+    async def watch(self, interval: float = 30.0) -> AsyncIterator[Tuple[str, Any]]:
+        """Poll every ``interval`` seconds and yield new
+        ``(environment, entry)`` pairs; stop by leaving the loop."""
+        while True:
+            for item in await self.poll_all():
+                yield item
+            await asyncio.sleep(interval)
+
+
+__all__ = (
+    "AsyncEnvironmentWatcher",
+    "EnvironmentWatcher",
+    "Subscriber",
+)
@@ -0,0 +1,753 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""In-process fake Dialogflow gRPC server for offline load testing.
+
+:class:`FakeDialogflowServer` serves the Sessions, Participants, Intents and
+EntityTypes services over a real gRPC server bound to a local port, using
+the same request and response types as the generated clients. Clients,
+transports, retries and streaming paths can therefore be exercised end to
+end without network access or credentials:
+
+.. code-block:: python
+
+    import grpc
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import fake_server
+
+    with fake_server.FakeDialogflowServer() as server:
+        server.set_latency("*", fake_server.LogNormalLatency(median=0.05))
+        server.inject_error(
+            "Sessions.DetectIntent", grpc.StatusCode.UNAVAILABLE, rate=0.01
+        )
+        client = server.create_client(dialogflow_v2.SessionsClient)
+        client.detect_intent(
+            session="projects/p/agent/sessions/s",
+            query_input={"text": {"text": "hi", "language_code": "en"}},
+        )
+        print(server.calls)
+
+Methods are named ``"Service.Method"`` (e.g. ``"Sessions.DetectIntent"``);
+``"*"`` applies to every method without a more specific setting.
+
+Without canned responses the server behaves plausibly rather than
+faithfully: ``DetectIntent`` and ``AnalyzeContent`` echo the input text,
+streaming recognition returns partial and final transcripts for the audio
+it receives, long-running operations complete immediately, and other
+methods echo the resource in the request (or return an empty response).
+
+The server can also be run standalone::
+
+    python -m google.cloud.dialogflow_helpers.fake_server --address localhost:8080
+"""
+import argparse
+import collections.abc
+from concurrent import futures
+import importlib
+import math
+import random
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    get_type_hints,
+)
+import uuid
+
+from google.longrunning import operations_pb2  # type: ignore
+from google.protobuf import any_pb2, json_format  # type: ignore
+import grpc  # type: ignore
+from grpc.experimental import aio  # type: ignore
+
+DEFAULT_SERVICES = ("sessions", "participants", "intents", "entity_types")
+
+# Result types of the long-running methods, which only the clients know.
+_OPERATION_RESULTS = {
+    "BatchUpdateIntents": "BatchUpdateIntentsResponse",
+    "BatchUpdateEntityTypes": "BatchUpdateEntityTypesResponse",
+    "ImportConversationData": "ImportConversationDataOperationResponse",
+}
+
+_TRANSCRIPT = 1
+_END_OF_SINGLE_UTTERANCE = 2
+
+
+class LatencyDistribution(object):
+    """Base class for simulated server processing time, in seconds."""
+
+    def sample(self, rng: random.Random) -> float:
+        """Return a latency drawn from the distribution."""
+        raise NotImplementedError()
+
+
+class FixedLatency(LatencyDistribution):
+    """Always ``seconds``."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def sample(self, rng: random.Random) -> float:
+        return self.seconds
+
+
+class UniformLatency(LatencyDistribution):
+    """Uniform between ``low`` and ``high``."""
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.uniform(self.low, self.high)
+
+
+class NormalLatency(LatencyDistribution):
+    """Normal with the given ``mean`` and ``stddev``, clamped at zero."""
+
+    def __init__(self, mean: float, stddev: float):
+        self.mean = mean
+        self.stddev = stddev
+
+    def sample(self, rng: random.Random) -> float:
+        return max(rng.gauss(self.mean, self.stddev), 0.0)
+
+
+class LogNormalLatency(LatencyDistribution):
+    """Log-normal with the given ``median``; ``sigma`` controls the tail.
+
+    Service latencies are usually long-tailed, which this models better
+    than a normal distribution.
+    """
+
+    def __init__(self, median: float, sigma: float = 0.5):
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+class EmpiricalLatency(LatencyDistribution):
+    """Resamples observed latencies, e.g. from a production trace."""
+
+    def __init__(self, samples: Sequence[float]):
+        if not samples:
+            raise ValueError("At least one latency sample is required.")
+        self.samples = list(samples)
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.choice(self.samples)
+
+
+class ErrorRule(object):
+    """Fails a fraction of calls with a gRPC status.
+
+    Args:
+        code (grpc.StatusCode): The status to return.
+        rate (float): Fraction of calls to fail, between 0 and 1.
+        details (str): The status message.
+        limit (int): Stop injecting after this many errors.
+    """
+
+    def __init__(
+        self,
+        code: grpc.StatusCode,
+        rate: float = 1.0,
+        details: str = "Injected error",
+        limit: Optional[int] = None,
+    ):
+        self.code = code
+        self.rate = rate
+        self.details = details
+        self.limit = limit
+        self.injected = 0
+
+    def _fire(self, rng: random.Random) -> bool:
+        if self.limit is not None and self.injected >= self.limit:
+            return False
+        if rng.random() >= self.rate:
+            return False
+        self.injected += 1
+        return True
+
+
+class _Method(object):
+    __slots__ = (
+        "service",
+        "name",
+        "path",
+        "kind",
+        "request_type",
+        "response_type",
+    )
+
+    def __init__(self, service, name, path, kind, request_type, response_type):
+        self.service = service
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.request_type = request_type
+        self.response_type = response_type
+
+    @property
+    def key(self) -> str:
+        return "{}.{}".format(self.service, self.name)
+
+
+class _Stub(object):
+    """Returned by a :class:`_RecordingChannel` in place of a gRPC stub."""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+
+    def __call__(self, *args, **kwargs):
+        raise NotImplementedError(self.path)
+
+
+class _RecordingChannel(object):
+    """Stands in for a generated gRPC transport's channel, so that the
+    transport's RPC properties return a :class:`_Stub`."""
+
+    def __getattr__(self, kind):
+        def stub(path, request_serializer=None, response_deserializer=None):
+            return _Stub(kind, path)
+
+        return stub
+
+
+def _signature(transport_class, name: str) -> Optional[Tuple[Any, Any]]:
+    # The transport's RPC properties are annotated with the method's input
+    # and output message types, as Callable[[Request], Response].
+    attribute = getattr(transport_class, name, None)
+    if not isinstance(attribute, property):
+        return None
+    hint = get_type_hints(attribute.fget).get("return")
+    if getattr(hint, "__origin__", None) is not collections.abc.Callable:
+        return None
+    request_type, response_type = hint.__args__
+    return request_type, response_type
+
+
+def _discover(version: str, service: str) -> List[_Method]:
+    module = importlib.import_module(
+        "google.cloud.dialogflow_{}.services.{}.transports.grpc".format(
+            version, service
+        )
+    )
+    name = "".join(part.title() for part in service.split("_"))
+    transport_class = getattr(module, name + "GrpcTransport")
+    transport = transport_class(channel=_RecordingChannel())
+    methods = []
+    for rpc in sorted(dir(transport_class)):
+        signature = _signature(transport_class, rpc)
+        if signature is None:
+            continue
+        stub = getattr(transport, rpc)
+        full_service, method = stub.path.lstrip("/").split("/")
+        # The operations and locations mixins are not served.
+        if not full_service.startswith("google.cloud.dialogflow."):
+            continue
+        methods.append(
+            _Method(
+                full_service.rsplit(".", 1)[-1],
+                method,
+                stub.path,
+                stub.kind,
+                *signature,
+            )
+        )
+    return methods
+
+
+def _is_proto_plus(message_type) -> bool:
+    return hasattr(message_type, "meta")
+
+
+def _serializer(message_type) -> Callable[[Any], bytes]:
+    if _is_proto_plus(message_type):
+        return message_type.serialize
+    return lambda message: message.SerializeToString()
+
+
+def _deserializer(message_type) -> Callable[[bytes], Any]:
+    if _is_proto_plus(message_type):
+        return message_type.deserialize
+    return message_type.FromString
+
+
+def _coerce(message_type, value):
+    if isinstance(value, dict):
+        if _is_proto_plus(message_type):
+            return message_type(value)
+        return json_format.ParseDict(value, message_type())
+    return value
+
+
+def _words(text: str, fraction: float) -> str:
+    words = text.split()
+    return " ".join(words[: max(int(len(words) * fraction), 1)])
+
+
+class FakeDialogflowServer(object):
+    """A local gRPC server implementing Dialogflow services.
+
+    Args:
+        version (str): API version whose protos to serve, ``"v2"`` or
+            ``"v2beta1"``.
+        services (Sequence[str]): Services to serve, as module names of
+            ``google.cloud.dialogflow_<version>.services``.
+        address (str): Address to bind; port ``0`` picks a free port.
+        max_workers (int): Server threads. Simulated latency holds a
+            thread, so this bounds the concurrency the server can absorb.
+        latency (LatencyDistribution): Default latency for every method.
+        seed (int): Seed for latency sampling and error injection.
+        transcript (str): Text recognized from streamed audio.
+        partial_every (int): Audio chunks between partial transcripts.
+        utterance_chunks (int): Audio chunks after which a
+            ``single_utterance`` stream ends.
+
+    Attributes:
+        calls (Dict[str, int]): Calls received per method.
+        errors (Dict[str, int]): Errors injected per method.
+    """
+
+    def __init__(
+        self,
+        version: str = "v2",
+        services: Sequence[str] = DEFAULT_SERVICES,
+        address: str = "localhost:0",
+        max_workers: int = 32,
+        latency: Optional[LatencyDistribution] = None,
+        seed: Optional[int] = None,
+        transcript: str = "hello world",
+        partial_every: int = 5,
+        utterance_chunks: int = 10,
+    ):
+        self.version = version
+        self.transcript = transcript
+        self.partial_every = partial_every
+        self.utterance_chunks = utterance_chunks
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._bind = address
+        self._max_workers = max_workers
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latency: Dict[str, LatencyDistribution] = {}
+        if latency is not None:
+            self._latency["*"] = latency
+        self._errors: Dict[str, List[ErrorRule]] = {}
+        self._responses: Dict[str, Any] = {}
+        self._methods: Dict[str, _Method] = {}
+        for service in services:
+            for method in _discover(version, service):
+                self._methods[method.key] = method
+        self._server = None
+        self._address: Optional[str] = None
+
+    def methods(self) -> List[str]:
+        """Return the names of the methods served."""
+        return sorted(self._methods)
+
+    def _check_method(self, method: str):
+        if method != "*" and method not in self._methods:
+            raise ValueError("Unknown method {!r}.".format(method))
+
+    def set_latency(self, method: str, latency: Optional[LatencyDistribution]):
+        """Set the latency distribution of ``method`` (or ``"*"``).
+
+        Streaming methods apply it before each response. ``None`` removes
+        the setting.
+        """
+        self._check_method(method)
+        if latency is None:
+            self._latency.pop(method, None)
+        else:
+            self._latency[method] = latency
+
+    def inject_error(
+        self,
+        method: str,
+        code: grpc.StatusCode,
+        rate: float = 1.0,
+        details: str = "Injected error",
+        limit: Optional[int] = None,
+    ) -> ErrorRule:
+        """Fail a fraction of calls to ``method`` (or ``"*"``) with ``code``.
+
+        Rules accumulate; see :class:`ErrorRule` for the arguments.
+        """
+        self._check_method(method)
+        rule = ErrorRule(code, rate=rate, details=details, limit=limit)
+        self._errors.setdefault(method, []).append(rule)
+        return rule
+
+    def clear_errors(self, method: Optional[str] = None):
+        """Remove the error rules of ``method``, or all of them."""
+        if method is None:
+            self._errors.clear()
+        else:
+            self._errors.pop(method, None)
+
+    def set_response(self, method: str, response: Any):
+        """Return a canned response from ``method``.
+
+        ``response`` may be a message or a dict of the method's response
+        type, a list of them for streaming methods, or a callable taking
+        the request (or request iterator) and the ``grpc.ServicerContext``
+        and returning either of those. ``None`` restores the default.
+        """
+        self._check_method(method)
+        if response is None:
+            self._responses.pop(method, None)
+        else:
+            self._responses[method] = response
+
+    # Serving
+
+    def _sleep(self, method: _Method):
+        latency = self._latency.get(method.key) or self._latency.get("*")
+        if latency is not None:
+            with self._lock:
+                seconds = latency.sample(self._rng)
+            time.sleep(seconds)
+
+    def _begin(self, method: _Method, context):
+        rules = self._errors.get(method.key, []) + self._errors.get("*", [])
+        with self._lock:
+            self.calls[method.key] = self.calls.get(method.key, 0) + 1
+            for rule in rules:
+                if rule._fire(self._rng):
+                    self.errors[method.key] = self.errors.get(method.key, 0) + 1
+                    break
+            else:
+                rule = None
+        if rule is not None:
+            self._sleep(method)
+            context.abort(rule.code, rule.details)
+
+    def _respond(self, method: _Method, request, context):
+        canned = self._responses.get(method.key)
+        if canned is None:
+            default = getattr(self, "_default_" + method.name, None)
+            if default is not None:
+                return default(method, request)
+            return self._default(method, request)
+        if callable(canned):
+            canned = canned(request, context)
+        if method.kind in ("unary_stream", "stream_stream"):
+            return [_coerce(method.response_type, item) for item in canned]
+        return _coerce(method.response_type, canned)
+
+    def _handler(self, method: _Method):
+        serialize = _serializer(method.response_type)
+        deserialize = _deserializer(method.request_type)
+
+        def unary(request, context):
+            self._begin(method, context)
+            response = self._respond(method, request, context)
+            self._sleep(method)
+            return response
+
+        def streaming(request, context):
+            self._begin(method, context)
+            for response in self._respond(method, request, context):
+                self._sleep(method)
+                yield response
+
+        if method.kind.endswith("_stream"):
+            behavior = streaming
+        else:
+            behavior = unary
+        factory = getattr(grpc, method.kind + "_rpc_method_handler")
+        return factory(
+            behavior, request_deserializer=deserialize, response_serializer=serialize
+        )
+
+    def start(self) -> str:
+        """Start serving and return the bound address."""
+        if self._server is not None:
+            raise ValueError("The server is already running.")
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=self._max_workers))
+        handlers: Dict[str, Dict[str, Any]] = {}
+        for method in self._methods.values():
+            service = method.path.lstrip("/").split("/")[0]
+            handlers.setdefault(service, {})[method.name] = self._handler(method)
+        server.add_generic_rpc_handlers(
+            [
+                grpc.method_handlers_generic_handler(service, rpcs)
+                for service, rpcs in handlers.items()
+            ]
+        )
+        host = self._bind.rsplit(":", 1)[0]
+        port = server.add_insecure_port(self._bind)
+        server.start()
+        self._server = server
+        self._address = "{}:{}".format(host, port)
+        return self._address
+
+    def stop(self, grace: Optional[float] = None):
+        """Stop serving, waiting up to ``grace`` seconds for active calls."""
+        if self._server is not None:
+            self._server.stop(grace).wait()
+            self._server = None
+
+    @property
+    def address(self) -> str:
+        """str: The ``host:port`` the server is bound to."""
+        if self._address is None:
+            raise ValueError("The server has not been started.")
+        return self._address
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def create_channel(self, asyncio: bool = False):
+        """Return an insecure channel to the server."""
+        if asyncio:
+            return aio.insecure_channel(self.address)
+        return grpc.insecure_channel(self.address)
+
+    def create_client(self, client_class, **kwargs):
+        """Return ``client_class`` connected to the server.
+
+        Async clients get an asyncio channel. Additional keyword arguments
+        are passed to the client.
+        """
+        asyncio = client_class.__name__.endswith("AsyncClient")
+        transport_class = client_class.get_transport_class(
+            "grpc_asyncio" if asyncio else "grpc"
+        )
+        transport = transport_class(channel=self.create_channel(asyncio=asyncio))
+        return client_class(transport=transport, **kwargs)
+
+    # Default behavior
+
+    def _default(self, method: _Method, request):
+        response_type = method.response_type
+        if response_type is operations_pb2.Operation:
+            result = any_pb2.Any()
+            if method.name in _OPERATION_RESULTS:
+                package = type(request).pb().DESCRIPTOR.full_name.rsplit(".", 1)[0]
+                result.type_url = "type.googleapis.com/{}.{}".format(
+                    package, _OPERATION_RESULTS[method.name]
+                )
+            else:
+                result.type_url = "type.googleapis.com/google.protobuf.Empty"
+            return operations_pb2.Operation(
+                name="operations/{}".format(uuid.uuid4()), done=True, response=result
+            )
+        if not _is_proto_plus(response_type):
+            return response_type()
+        # Echo the resource in the request, e.g. for Create/Update methods.
+        for name, field in type(request).meta.fields.items():
+            if field.message is response_type and name in request:
+                return response_type(getattr(request, name))
+        if "name" in response_type.meta.fields and "name" in type(request).meta.fields:
+            return response_type(name=request.name)
+        return response_type()
+
+    def _query_result(self, query_input) -> Dict[str, Any]:
+        if "text" in query_input:
+            text = query_input.text.text
+            language_code = query_input.text.language_code
+        elif "event" in query_input:
+            text = query_input.event.name
+            language_code = query_input.event.language_code
+        else:
+            text = self.transcript
+            language_code = query_input.audio_config.language_code
+        return {
+            "query_text": text,
+            "language_code": language_code,
+            "fulfillment_text": text,
+            "intent": {"display_name": "Default Fallback Intent"},
+            "intent_detection_confidence": 1.0,
+        }
+
+    def _default_DetectIntent(self, method: _Method, request):
+        return method.response_type(
+            response_id=str(uuid.uuid4()),
+            query_result=self._query_result(request.query_input),
+        )
+
+    def _default_AnalyzeContent(self, method: _Method, request):
+        if "event_input" in request:
+            text = request.event_input.name
+        else:
+            text = request.text_input.text
+        return method.response_type(
+            reply_text=text,
+            message={"participant": request.participant, "content": text},
+        )
+
+    def _recognize(self, method: _Method, requests, first_config, is_single):
+        """Yield recognition results for streamed audio, then the request
+        that configured the stream and whether any audio was received."""
+        response_type = method.response_type
+        chunks = 0
+        ended = False
+        first = None
+        for request in requests:
+            if first is None:
+                first = request
+            if not request.input_audio or ended:
+                continue
+            chunks += 1
+            if chunks % self.partial_every == 0:
+                yield response_type(
+                    recognition_result={
+                        "message_type": _TRANSCRIPT,
+                        "transcript": _words(
+                            self.transcript, chunks / float(self.utterance_chunks)
+                        ),
+                    }
+                )
+            if is_single(first) and chunks >= self.utterance_chunks:
+                ended = True
+                yield response_type(
+                    recognition_result={
+                        "message_type": _END_OF_SINGLE_UTTERANCE,
+                    }
+                )
+        if chunks:
+            yield response_type(
+                recognition_result={
+                    "message_type": _TRANSCRIPT,
+                    "transcript": self.transcript,
+                    "is_final": True,
+                }
+            )
+        first_config.append(first)
+
+    def _default_StreamingDetectIntent(self, method: _Method, requests):
+        first: List[Any] = []
+
+        def is_single(request):
+            return (
+                request.single_utterance
+                or request.query_input.audio_config.single_utterance
+            )
+
+        yield from self._recognize(method, requests, first, is_single)
+        request = first[0]
+        if request is None:
+            return
+        yield method.response_type(
+            response_id=str(uuid.uuid4()),
+            query_result=self._query_result(request.query_input),
+        )
+
+    def _default_StreamingAnalyzeContent(self, method: _Method, requests):
+        first: List[Any] = []
+        texts: List[str] = []
+
+        def tee(requests):
+            for request in requests:
+                if request.input_text:
+                    texts.append(request.input_text)
+                yield request
+
+        def is_single(request):
+            return request.audio_config.single_utterance
+
+        yield from self._recognize(method, tee(requests), first, is_single)
+        request = first[0]
+        if request is None:
+            return
+        text = " ".join(texts) if texts else self.transcript
+        yield method.response_type(
+            reply_text=text,
+            message={"participant": request.participant, "content": text},
+        )
+
+
+def _parse_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Run a fake Dialogflow gRPC server for load testing."
+    )
+    parser.add_argument("--address", default="localhost:8080")
+    parser.add_argument("--version", default="v2", choices=("v2", "v2beta1"))
+    parser.add_argument("--max-workers", type=int, default=32)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0.0,
+        help="Median latency of every method; log-normally distributed.",
+    )
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of calls failing with UNAVAILABLE.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    """Run the server until interrupted."""
+    args = _parse_args(argv)
+    latency = None
+    if args.latency_ms:
+        latency = LogNormalLatency(args.latency_ms / 1000.0, args.latency_sigma)
+    server = FakeDialogflowServer(
+        version=args.version,
+        address=args.address,
+        max_workers=args.max_workers,
+        latency=latency,
+        seed=args.seed,
+    )
+    if args.error_rate:
+        server.inject_error("*", grpc.StatusCode.UNAVAILABLE, rate=args.error_rate)
+    print("Serving on {}".format(server.start()), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+__all__ = (
+    "DEFAULT_SERVICES",
+    "EmpiricalLatency",
+    "ErrorRule",
+    "FakeDialogflowServer",
+    "FixedLatency",
+    "LatencyDistribution",
+    "LogNormalLatency",
+    "NormalLatency",
+    "UniformLatency",
+    "main",
+)
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    main()
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Coalesce answer feedback into fewer ``update_answer_record`` calls.
+
+Agent desktops report feedback on a suggestion in steps: displayed, then
+clicked, then a correctness rating, each as its own
+``update_answer_record`` call. A :class:`FeedbackWriter` holds the
+updates of each answer record for ``window`` seconds, merges them along
+their update masks and sends one update with the union of the masks:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import feedback_writer
+
+    writer = feedback_writer.FeedbackWriter(dialogflow_v2.AnswerRecordsClient())
+    writer.record(answer_record, {"displayed": True, "display_time": now})
+    writer.record(answer_record, {"clicked": True, "click_time": now})
+    ...
+    writer.close()
+
+Updates are sent from a background thread, at most ``max_concurrency``
+at a time and never two for the same record at once, so later feedback
+always lands last. Transient errors are retried with exponential
+backoff. :meth:`FeedbackWriter.close`, which also runs at interpreter
+exit, sends everything still pending before it returns.
+"""
+import atexit
+import collections
+from concurrent import futures
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+import weakref
+
+from google.api_core import exceptions as core_exceptions
+from google.protobuf import field_mask_pb2
+
+from google.cloud.dialogflow_v2.types import answer_record as gcd_answer_record
+
+#: Errors that are retried.
+RETRYABLE = (
+    core_exceptions.Aborted,
+    core_exceptions.DeadlineExceeded,
+    core_exceptions.InternalServerError,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.ServiceUnavailable,
+)
+
+_FEEDBACK = "answer_feedback"
+_MAX_BACKOFF = 30.0
+
+
+# On CPython 3.9+ concurrent.futures shuts its executors down from a
+# threading exit hook, which runs before atexit handlers. Hooks run in
+# reverse order of registration, so one registered later runs before
+# the executors stop. The hook is private; without it, writers are
+# closed from atexit and send what is left inline.
+_register_threading_exit: Optional[Callable[[Callable[[], None]], None]] = (
+    getattr(threading, "_register_atexit", None) if sys.version_info >= (3, 9) else None
+)
+
+# Writers to close at exit; closed or collected ones drop out.
+_open_writers: "weakref.WeakSet[FeedbackWriter]" = weakref.WeakSet()
+_exit_lock = threading.Lock()
+_exit_registered = False
+
+
+def _close_open_writers() -> None:
+    for writer in list(_open_writers):
+        writer.close()
+
+
+def _register_exit(writer: "FeedbackWriter") -> None:
+    global _exit_registered
+    with _exit_lock:
+        _open_writers.add(writer)
+        if _exit_registered:
+            return
+        _exit_registered = True
+        if _register_threading_exit is not None:
+            try:
+                _register_threading_exit(_close_open_writers)
+                return
+            except RuntimeError:  # pragma: NO COVER
+                # Registering fails once the interpreter is shutting down.
+                pass
+        atexit.register(_close_open_writers)
+
+
+def feedback_paths(feedback: gcd_answer_record.AnswerFeedback) -> Set[str]:
+    """Return the update mask paths, relative to ``AnswerRecord``, of the
+    fields set in ``feedback``."""
+    pb = gcd_answer_record.AnswerFeedback.pb(feedback)
+    return {
+        "{}.{}".format(_FEEDBACK, descriptor.name) for descriptor, _ in pb.ListFields()
+    }
+
+
+class _Update(object):
+    __slots__ = ("record", "paths", "due", "attempts")
+
+    def __init__(self, record, paths: Set[str], due: float):
+        # The raw AnswerRecord proto.
+        self.record = record
+        self.paths = paths
+        self.due = due
+        self.attempts = 0
+
+    def merge(self, record, paths: Set[str]) -> None:
+        """Apply a later update on top of this one."""
+        field_mask_pb2.FieldMask(paths=sorted(paths)).MergeMessage(
+            record,
+            self.record,
+            replace_message_field=True,
+            replace_repeated_field=True,
+        )
+        self.paths |= paths
+
+
+class FeedbackStats(object):
+    """Counters of a :class:`FeedbackWriter`.
+
+    Attributes:
+        recorded (int): Calls to :meth:`FeedbackWriter.record`.
+        coalesced (int): Updates merged into a pending one.
+        sent (int): Successful ``update_answer_record`` calls.
+        retries (int): Calls retried after a transient error.
+        failed (int): Updates dropped after a permanent error or too many
+            attempts.
+    """
+
+    def __init__(self):
+        self.recorded = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        return dict(
+            recorded=self.recorded,
+            coalesced=self.coalesced,
+            sent=self.sent,
+            retries=self.retries,
+            failed=self.failed,
+        )
+
+
+class FeedbackWriter(object):
+    """Sends coalesced answer record updates in the background.
+
+    Args:
+        client (google.cloud.dialogflow_v2.AnswerRecordsClient): The client.
+        window (float): Seconds an answer record's first pending update
+            waits for more updates to merge.
+        max_concurrency (int): Updates in flight at once.
+        max_attempts (int): Attempts per update for retryable errors.
+        timeout (float): Timeout of each ``update_answer_record`` call.
+        on_error (Callable[[str, Exception], None]): Called with the answer
+            record name and error of every dropped update.
+        flush_at_exit (bool): Call :meth:`close` at interpreter exit.
+        clock (Callable[[], float]): Monotonic time source.
+
+    Attributes:
+        stats (FeedbackStats): Counters.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        window: float = 2.0,
+        max_concurrency: int = 4,
+        max_attempts: int = 5,
+        timeout: Optional[float] = 30.0,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+        flush_at_exit: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._client = client
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.stats = FeedbackStats()
+        self._on_error = on_error
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._pending: "collections.OrderedDict[str, _Update]" = (
+            collections.OrderedDict()
+        )
+        self._in_flight: Set[str] = set()
+        self._closed = False
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="feedback"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="feedback-writer", daemon=True
+        )
+        self._thread.start()
+        if flush_at_exit:
+            _register_exit(self)
+
+    def record(
+        self,
+        answer_record: str,
+        feedback: Any,
+        update_mask: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Queue feedback for an answer record.
+
+        Args:
+            answer_record (str): The answer record name.
+            feedback (Union[AnswerFeedback, dict]): The feedback.
+            update_mask (Iterable[str]): Paths relative to ``AnswerRecord``,
+                e.g. ``answer_feedback.clicked``; by default the fields set
+                in ``feedback``. Use it to clear fields.
+
+        Raises:
+            RuntimeError: The writer is closed.
+        """
+        feedback = gcd_answer_record.AnswerFeedback(feedback)
+        paths = (
+            set(update_mask) if update_mask is not None else feedback_paths(feedback)
+        )
+        record = gcd_answer_record.AnswerRecord.pb(
+            gcd_answer_record.AnswerRecord(name=answer_record, answer_feedback=feedback)
+        )
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The feedback writer is closed.")
+            self.stats.recorded += 1
+            pending = self._pending.get(answer_record)
+            if pending is not None:
+                pending.merge(record, paths)
+                self.stats.coalesced += 1
+                return
+            self._pending[answer_record] = _Update(
+                record, paths, self._clock() + self.window
+            )
+            self._condition.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """int: Answer records with updates not yet sent."""
+        with self._condition:
+            return len(self._pending) + len(self._in_flight)
+
+    def _run(self) -> None:
+        with self._condition:
+            while not (self._closed and not self._pending and not self._in_flight):
+                now = self._clock()
+                wait = None
+                inline = False
+                for name, update in list(self._pending.items()):
+                    if len(self._in_flight) >= self.max_concurrency:
+                        break
+                    if name in self._in_flight:
+                        continue
+                    # Closing skips the window but not retry backoff.
+                    if update.due > now and not (self._closed and update.attempts == 0):
+                        remaining = update.due - now
+                        wait = remaining if wait is None else min(wait, remaining)
+                        continue
+                    del self._pending[name]
+                    self._in_flight.add(name)
+                    try:
+                        self._executor.submit(self._send, name, update)
+                    except RuntimeError:
+                        # The executor refuses work during interpreter
+                        # shutdown; send from this thread instead.
+                        self._condition.release()
+                        try:
+                            self._send(name, update)
+                        finally:
+                            self._condition.acquire()
+                        # The pending updates may have changed meanwhile.
+                        inline = True
+                        break
+                if not inline:
+                    self._condition.wait(wait)
+
+    def _send(self, name: str, update: _Update) -> None:
+        update.attempts += 1
+        request = gcd_answer_record.UpdateAnswerRecordRequest(
+            answer_record=gcd_answer_record.AnswerRecord.wrap(update.record),
+            update_mask=field_mask_pb2.FieldMask(paths=sorted(update.paths)),
+        )
+        error = None
+        dropped = False
+        try:
+            self._client.update_answer_record(request=request, timeout=self.timeout)
+        except Exception as exc:
+            error = exc
+        with self._condition:
+            self._in_flight.discard(name)
+            if error is None:
+                self.stats.sent += 1
+            elif isinstance(error, RETRYABLE) and update.attempts < self.max_attempts:
+                self.stats.retries += 1
+                update.due = self._clock() + min(
+                    2.0 ** (update.attempts - 1), _MAX_BACKOFF
+                )
+                later = self._pending.pop(name, None)
+                if later is not None:
+                    # Feedback recorded meanwhile goes on top.
+                    update.merge(later.record, later.paths)
+                self._pending[name] = update
+            else:
+                self.stats.failed += 1
+                dropped = True
+            self._condition.notify_all()
+        if dropped and self._on_error is not None:
+            self._on_error(name, error)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send all pending updates without waiting out the window, and
+        wait for them. Retries still back off.
+
+        Returns:
+            bool: ``False`` if ``timeout`` passed first.
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._condition:
+            now = self._clock()
+            for update in self._pending.values():
+                if not update.attempts:
+                    update.due = min(update.due, now)
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting feedback and deliver everything pending,
+        retries included.
+
+        Returns:
+            bool: ``False`` if ``timeout`` passed before all updates were
+            delivered or dropped.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        done = not self._thread.is_alive()
+        if done:
+            self._executor.shutdown(wait=True)
+        _open_writers.discard(self)
+        return done
+
+    def __enter__(self) -> "FeedbackWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+__all__ = (
+    "FeedbackStats",
+    "FeedbackWriter",
+    "RETRYABLE",
+    "feedback_paths",
+)
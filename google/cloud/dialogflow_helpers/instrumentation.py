@@ -0,0 +1,921 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Per-RPC latency and payload-size instrumentation for all transports.
+
+:func:`instrument` attaches to an existing client (or transport) of any
+Dialogflow service and reports one :class:`RpcRecord` per logical call to
+an :class:`RpcRecorder`:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import instrumentation
+
+    recorder = instrumentation.HistogramRecorder()
+    client = dialogflow_v2.SessionsClient()
+    instrumentation.instrument(client, recorder)
+
+    client.detect_intent(request=request)
+    print(recorder.latency("Sessions.DetectIntent").percentile(99))
+
+The hooks sit below the retry layer, so every attempt is counted and the
+time spent (de)serializing messages is reported separately from the time
+spent waiting on the network:
+
+* gRPC and gRPC-asyncio: the channel is wrapped so that the request
+  serializer and response deserializer of every stub are timed and the
+  serialized sizes are recorded.
+* REST: the transport's ``*RestInterceptor`` is wrapped so that each
+  ``pre_*``/``post_*`` pair delimits an attempt, and a response hook on the
+  underlying HTTP session records bytes on the wire and network time.
+
+The async clients wrap the transport stubs themselves on every call instead
+of going through ``_wrapped_methods``, so on ``grpc_asyncio`` each attempt is
+reported as its own record. REST calls made outside ``_wrapped_methods``
+(e.g. through a long-running operations client) are not recorded.
+"""
+import bisect
+import contextvars
+import functools
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as core_exceptions
+import grpc  # type: ignore
+from grpc.experimental import aio  # type: ignore
+
+try:
+    from opentelemetry import metrics as otel_metrics  # type: ignore
+    from opentelemetry import trace as otel_trace  # type: ignore
+except ImportError:  # pragma: NO COVER
+    otel_metrics = None
+    otel_trace = None
+
+# Transport class name suffixes and the kind they implement. The generated
+# asyncio transports do not override ``kind``, so the class name is used.
+_TRANSPORT_SUFFIXES = (
+    ("GrpcAsyncIOTransport", "grpc_asyncio"),
+    ("GrpcTransport", "grpc"),
+    ("RestTransport", "rest"),
+)
+
+# The record of the logical call currently in flight, if any.
+_current_record: contextvars.ContextVar = contextvars.ContextVar(
+    "dialogflow_rpc_record", default=None
+)
+
+
+class RpcRecord(object):
+    """Measurements taken for a single logical RPC.
+
+    Attributes:
+        method (str): The method, as ``"<Service>.<Rpc>"``, e.g.
+            ``"Sessions.DetectIntent"``.
+        transport (str): The transport kind (``"grpc"``,
+            ``"grpc_asyncio"`` or ``"rest"``).
+        start_time (float): Wall-clock start of the call, in seconds since
+            the epoch.
+        latency (float): Total duration of the call in seconds, including
+            retries and backoff. For streaming calls this runs until the
+            response stream is exhausted.
+        attempts (int): Number of attempts sent to the server.
+        request_bytes (int): Serialized bytes sent, summed over attempts
+            and stream messages.
+        response_bytes (int): Serialized bytes received.
+        marshal_seconds (float): Time spent serializing requests and
+            deserializing responses.
+        network_seconds (float): Time spent in attempts that was not
+            spent marshalling.
+        status (str): ``"OK"`` or the name of the error status code.
+    """
+
+    __slots__ = (
+        "method",
+        "transport",
+        "start_time",
+        "latency",
+        "attempts",
+        "request_bytes",
+        "response_bytes",
+        "marshal_seconds",
+        "network_seconds",
+        "status",
+        "_started",
+        "_attempt_seconds",
+        "_attempt_started",
+        "_finished",
+    )
+
+    def __init__(self, method: str, transport: str):
+        self.method = method
+        self.transport = transport
+        self.start_time = time.time()
+        self.latency = 0.0
+        self.attempts = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.marshal_seconds = 0.0
+        self.network_seconds = 0.0
+        self.status = "OK"
+        self._started = time.perf_counter()
+        self._attempt_seconds = 0.0
+        self._attempt_started: Optional[float] = None
+        self._finished = False
+
+    @property
+    def retries(self) -> int:
+        """int: Number of attempts beyond the first."""
+        return max(self.attempts - 1, 0)
+
+    def _begin_attempt(self):
+        self._end_attempt()
+        self.attempts += 1
+        self._attempt_started = time.perf_counter()
+
+    def _end_attempt(self):
+        if self._attempt_started is not None:
+            self._attempt_seconds += time.perf_counter() - self._attempt_started
+            self._attempt_started = None
+
+    def __repr__(self):
+        return (
+            "RpcRecord(method={!r}, transport={!r}, latency={:.6f}, attempts={}, "
+            "request_bytes={}, response_bytes={}, marshal_seconds={:.6f}, "
+            "network_seconds={:.6f}, status={!r})".format(
+                self.method,
+                self.transport,
+                self.latency,
+                self.attempts,
+                self.request_bytes,
+                self.response_bytes,
+                self.marshal_seconds,
+                self.network_seconds,
+                self.status,
+            )
+        )
+
+
+class RpcRecorder(object):
+    """Receives a completed :class:`RpcRecord` for every instrumented call.
+
+    Override :meth:`record` in a subclass to forward measurements to a
+    metrics backend. It is invoked on whichever thread (or event loop)
+    finished the call, so implementations must be thread-safe.
+    """
+
+    def record(self, rpc_record: RpcRecord) -> None:
+        """Handle a completed call."""
+
+
+class Histogram(object):
+    """A fixed-bucket histogram with approximate percentiles.
+
+    Buckets grow geometrically from ``lowest`` to ``highest`` so the relative
+    error of :meth:`percentile` is bounded by ``growth``; values outside the
+    range are clamped into the first or last bucket.
+
+    Args:
+        lowest (float): Upper bound of the first bucket.
+        highest (float): Upper bound of the last regular bucket.
+        growth (float): Ratio between consecutive bucket bounds.
+    """
+
+    def __init__(self, lowest: float = 1e-4, highest: float = 600.0, growth=1.1):
+        bounds = []
+        bound = lowest
+        while bound < highest:
+            bounds.append(bound)
+            bound *= growth
+        bounds.append(highest)
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float) -> None:
+        """Record a single observation."""
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        """Fold the observations of a histogram with the same bounds into
+        this one."""
+        if other._bounds != self._bounds:
+            raise ValueError("Cannot merge histograms with different buckets.")
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        """float: The arithmetic mean, or ``0.0`` when empty."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Return the approximate ``percent``-th percentile (0-100).
+
+        Returns ``0.0`` when the histogram is empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(percent, 0.0) / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            if not count:
+                continue
+            if seen + count >= rank:
+                lower = self._bounds[index - 1] if index else 0.0
+                upper = self._bounds[index] if index < len(self._bounds) else self.max
+                fraction = (rank - seen) / count
+                value = lower + (upper - lower) * fraction
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max  # pragma: NO COVER
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """Return ``(upper_bound, count)`` pairs for non-empty buckets.
+
+        The overflow bucket is reported with an upper bound of ``inf``.
+        """
+        bounds = self._bounds + [float("inf")]
+        return [(bounds[i], c) for i, c in enumerate(self._counts) if c]
+
+
+class MethodStats(object):
+    """Aggregated measurements for one method, kept by
+    :class:`HistogramRecorder`."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.marshal = Histogram()
+        self.network = Histogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.calls = 0
+        self.attempts = 0
+        self.statuses: Dict[str, int] = {}
+
+    @property
+    def retries(self) -> int:
+        """int: Total attempts beyond the first, over all calls."""
+        return self.attempts - self.calls
+
+
+class HistogramRecorder(RpcRecorder):
+    """An in-memory recorder that keeps per-method :class:`MethodStats`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, MethodStats] = {}
+
+    def record(self, rpc_record: RpcRecord) -> None:
+        with self._lock:
+            stats = self._stats.get(rpc_record.method)
+            if stats is None:
+                stats = self._stats[rpc_record.method] = MethodStats()
+            stats.latency.add(rpc_record.latency)
+            stats.marshal.add(rpc_record.marshal_seconds)
+            stats.network.add(rpc_record.network_seconds)
+            stats.request_bytes += rpc_record.request_bytes
+            stats.response_bytes += rpc_record.response_bytes
+            stats.calls += 1
+            stats.attempts += rpc_record.attempts
+            stats.statuses[rpc_record.status] = (
+                stats.statuses.get(rpc_record.status, 0) + 1
+            )
+
+    def methods(self) -> List[str]:
+        """Return the names of all methods seen so far."""
+        with self._lock:
+            return sorted(self._stats)
+
+    def stats(self, method: str) -> MethodStats:
+        """Return the :class:`MethodStats` for ``method``.
+
+        Raises:
+            KeyError: If no call to ``method`` has been recorded.
+        """
+        with self._lock:
+            return self._stats[method]
+
+    def latency(self, method: str) -> Histogram:
+        """Shortcut for ``stats(method).latency``."""
+        return self.stats(method).latency
+
+
+class OpenTelemetryRecorder(RpcRecorder):
+    """Reports calls as OpenTelemetry spans and metrics.
+
+    Requires the ``opentelemetry-api`` package, available through the
+    ``opentelemetry`` extra of this library.
+
+    Args:
+        tracer_provider: Optional tracer provider; defaults to the global one.
+        meter_provider: Optional meter provider; defaults to the global one.
+    """
+
+    def __init__(self, tracer_provider=None, meter_provider=None):
+        if otel_trace is None:
+            raise ImportError(
+                "OpenTelemetryRecorder requires the 'opentelemetry-api' package; "
+                "install google-cloud-dialogflow[opentelemetry]."
+            )
+        self._tracer = otel_trace.get_tracer(__name__, tracer_provider=tracer_provider)
+        meter = otel_metrics.get_meter(__name__, meter_provider=meter_provider)
+        self._duration = meter.create_histogram(
+            "dialogflow.client.rpc.duration", unit="s"
+        )
+        self._marshal = meter.create_histogram(
+            "dialogflow.client.rpc.marshal_duration", unit="s"
+        )
+        self._request_size = meter.create_histogram(
+            "dialogflow.client.rpc.request.size", unit="By"
+        )
+        self._response_size = meter.create_histogram(
+            "dialogflow.client.rpc.response.size", unit="By"
+        )
+        self._attempts = meter.create_counter("dialogflow.client.rpc.attempts")
+
+    def record(self, rpc_record: RpcRecord) -> None:
+        service, _, method = rpc_record.method.partition(".")
+        attributes = {
+            "rpc.system": "grpc" if rpc_record.transport.startswith("grpc") else "http",
+            "rpc.service": service,
+            "rpc.method": method,
+            "dialogflow.transport": rpc_record.transport,
+            "dialogflow.status": rpc_record.status,
+        }
+        start_ns = int(rpc_record.start_time * 1e9)
+        span = self._tracer.start_span(
+            rpc_record.method,
+            kind=otel_trace.SpanKind.CLIENT,
+            start_time=start_ns,
+            attributes=dict(
+                attributes,
+                **{
+                    "dialogflow.attempts": rpc_record.attempts,
+                    "dialogflow.request_bytes": rpc_record.request_bytes,
+                    "dialogflow.response_bytes": rpc_record.response_bytes,
+                    "dialogflow.marshal_seconds": rpc_record.marshal_seconds,
+                    "dialogflow.network_seconds": rpc_record.network_seconds,
+                },
+            ),
+        )
+        span.end(end_time=start_ns + int(rpc_record.latency * 1e9))
+        self._duration.record(rpc_record.latency, attributes)
+        self._marshal.record(rpc_record.marshal_seconds, attributes)
+        self._request_size.record(rpc_record.request_bytes, attributes)
+        self._response_size.record(rpc_record.response_bytes, attributes)
+        self._attempts.add(rpc_record.attempts, attributes)
+
+
+def status_of(exc: BaseException) -> str:
+    """Return the status recorded for a failed call, e.g. ``"UNAVAILABLE"``.
+
+    The gRPC status code name if ``exc`` carries one, otherwise the
+    exception's class name.
+    """
+    if isinstance(exc, core_exceptions.GoogleAPICallError):
+        if exc.grpc_status_code is not None:
+            return exc.grpc_status_code.name
+        return str(exc.code)
+    if isinstance(exc, grpc.RpcError) and callable(getattr(exc, "code", None)):
+        return exc.code().name
+    return type(exc).__name__
+
+
+class _Instrumentation(object):
+    """State shared by all hooks installed on a single transport."""
+
+    def __init__(self, service: str, kind: str, recorder: RpcRecorder):
+        self.service = service
+        self.kind = kind
+        self.recorder = recorder
+
+    def start(self, rpc: str) -> RpcRecord:
+        return RpcRecord("{}.{}".format(self.service, rpc), self.kind)
+
+    def finish(self, record: RpcRecord, exc: Optional[BaseException] = None):
+        if record._finished:
+            return
+        record._finished = True
+        record._end_attempt()
+        record.latency = time.perf_counter() - record._started
+        if exc is not None:
+            record.status = status_of(exc)
+        if self.kind == "rest":
+            record.marshal_seconds = max(
+                record._attempt_seconds - record.network_seconds, 0.0
+            )
+        else:
+            record.network_seconds = max(
+                record._attempt_seconds - record.marshal_seconds, 0.0
+            )
+        self.recorder.record(record)
+
+    def attempt(self, rpc: str) -> Tuple[RpcRecord, bool]:
+        """Begin an attempt, returning its record and whether the attempt
+        owns it (i.e. there is no enclosing logical call)."""
+        record = _current_record.get()
+        owned = record is None or record._finished
+        if owned:
+            record = self.start(rpc)
+        record._begin_attempt()
+        return record, owned
+
+
+# ---------------------------------------------------------------------------
+# Logical calls (``_wrapped_methods``)
+# ---------------------------------------------------------------------------
+
+
+class _ResponseIterator(object):
+    """Proxies a response stream, finishing the record once it is
+    exhausted and making the record current while messages are
+    deserialized."""
+
+    def __init__(self, wrapped, record, instrumentation):
+        self._wrapped = wrapped
+        self._record = record
+        self._instrumentation = instrumentation
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _current_record.set(self._record)
+        try:
+            return next(self._wrapped)
+        except StopIteration:
+            self._instrumentation.finish(self._record)
+            raise
+        except Exception as exc:
+            self._instrumentation.finish(self._record, exc)
+            raise
+        finally:
+            _current_record.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class _InstrumentedMethod(object):
+    """Wraps an entry of a synchronous transport's ``_wrapped_methods``."""
+
+    def __init__(self, wrapped, rpc, streaming, instrumentation):
+        self._wrapped = wrapped
+        self._rpc = rpc
+        self._streaming = streaming
+        self._instrumentation = instrumentation
+        functools.update_wrapper(self, wrapped)
+
+    def __call__(self, *args, **kwargs):
+        record = self._instrumentation.start(self._rpc)
+        token = _current_record.set(record)
+        try:
+            response = self._wrapped(*args, **kwargs)
+        except Exception as exc:
+            self._instrumentation.finish(record, exc)
+            raise
+        finally:
+            _current_record.reset(token)
+        if self._streaming:
+            return _ResponseIterator(response, record, self._instrumentation)
+        self._instrumentation.finish(record)
+        return response
+
+
+# ---------------------------------------------------------------------------
+# gRPC
+# ---------------------------------------------------------------------------
+
+
+def _timed_serializer(serializer, outgoing):
+    if serializer is None:
+        return None
+
+    def _serialize(message):
+        started = time.perf_counter()
+        data = serializer(message)
+        record = _current_record.get()
+        if record is not None:
+            record.marshal_seconds += time.perf_counter() - started
+            if outgoing:
+                record.request_bytes += len(data)
+            else:  # pragma: NO COVER
+                record.response_bytes += len(data)
+        return data
+
+    return _serialize
+
+
+def _timed_deserializer(deserializer):
+    if deserializer is None:
+        return None
+
+    def _deserialize(data):
+        started = time.perf_counter()
+        message = deserializer(data)
+        record = _current_record.get()
+        if record is not None:
+            record.marshal_seconds += time.perf_counter() - started
+            record.response_bytes += len(data)
+        return message
+
+    return _deserialize
+
+
+def _bind_requests(requests, record):
+    # gRPC consumes request streams on its own thread, which does not see
+    # the caller's context; re-establish it before each message is
+    # serialized.
+    for request in requests:
+        _current_record.set(record)
+        yield request
+
+
+class _MultiCallableMixin(object):
+    _streaming_request = False
+    _streaming_response = False
+
+    def __init__(self, callable_, method, instrumentation):
+        self._callable = callable_
+        self.method = method
+        self._rpc = method.rsplit("/", 1)[-1]
+        self._instrumentation = instrumentation
+
+    def _invoke(self, target, request, args, kwargs):
+        record, owned = self._instrumentation.attempt(self._rpc)
+        if self._streaming_request:
+            request = _bind_requests(request, record)
+        token = _current_record.set(record)
+        try:
+            response = target(request, *args, **kwargs)
+        except Exception as exc:
+            record._end_attempt()
+            if owned:
+                self._instrumentation.finish(record, exc)
+            raise
+        finally:
+            _current_record.reset(token)
+        if self._streaming_response:
+            # The attempt lasts until the stream is exhausted.
+            if owned:
+                return _ResponseIterator(response, record, self._instrumentation)
+            return response
+        record._end_attempt()
+        if owned:
+            self._instrumentation.finish(record)
+        return response
+
+    def __call__(self, request, *args, **kwargs):
+        return self._invoke(self._callable, request, args, kwargs)
+
+
+class _UnaryUnary(_MultiCallableMixin, grpc.UnaryUnaryMultiCallable):
+    def with_call(self, request, *args, **kwargs):
+        return self._invoke(self._callable.with_call, request, args, kwargs)
+
+    def future(self, request, *args, **kwargs):
+        return self._callable.future(request, *args, **kwargs)
+
+
+class _UnaryStream(_MultiCallableMixin, grpc.UnaryStreamMultiCallable):
+    _streaming_response = True
+
+
+class _StreamUnary(_MultiCallableMixin, grpc.StreamUnaryMultiCallable):
+    _streaming_request = True
+
+    def with_call(self, requests, *args, **kwargs):
+        return self._invoke(self._callable.with_call, requests, args, kwargs)
+
+    def future(self, requests, *args, **kwargs):
+        return self._callable.future(requests, *args, **kwargs)
+
+
+class _StreamStream(_MultiCallableMixin, grpc.StreamStreamMultiCallable):
+    _streaming_request = True
+    _streaming_response = True
+
+
+class _InstrumentedChannel(object):
+    """A ``grpc.Channel`` proxy whose stubs report to an instrumentation."""
+
+    _factories = {
+        "unary_unary": _UnaryUnary,
+        "unary_stream": _UnaryStream,
+        "stream_unary": _StreamUnary,
+        "stream_stream": _StreamStream,
+    }
+
+    def __init__(self, channel, instrumentation):
+        self._channel = channel
+        self._instrumentation = instrumentation
+
+    def _stub(self, arity, method, request_serializer, response_deserializer, kwargs):
+        callable_ = getattr(self._channel, arity)(
+            method,
+            request_serializer=_timed_serializer(request_serializer, True),
+            response_deserializer=_timed_deserializer(response_deserializer),
+            **kwargs,
+        )
+        return self._factories[arity](callable_, method, self._instrumentation)
+
+    def unary_unary(
+        self, method, request_serializer=None, response_deserializer=None, **kwargs
+    ):
+        return self._stub(
+            "unary_unary", method, request_serializer, response_deserializer, kwargs
+        )
+
+    def unary_stream(
+        self, method, request_serializer=None, response_deserializer=None, **kwargs
+    ):
+        return self._stub(
+            "unary_stream", method, request_serializer, response_deserializer, kwargs
+        )
+
+    def stream_unary(
+        self, method, request_serializer=None, response_deserializer=None, **kwargs
+    ):
+        return self._stub(
+            "stream_unary", method, request_serializer, response_deserializer, kwargs
+        )
+
+    def stream_stream(
+        self, method, request_serializer=None, response_deserializer=None, **kwargs
+    ):
+        return self._stub(
+            "stream_stream", method, request_serializer, response_deserializer, kwargs
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+# ---------------------------------------------------------------------------
+# gRPC asyncio
+# ---------------------------------------------------------------------------
+
+
+class _AioCall(object):
+    """Proxies a ``grpc.aio`` call object, ending the attempt when the
+    response (or response stream) completes."""
+
+    def __init__(self, call, record, owned, instrumentation):
+        self._call = call
+        self._record = record
+        self._owned = owned
+        self._instrumentation = instrumentation
+
+    def _done(self, exc=None):
+        self._record._end_attempt()
+        if self._owned:
+            self._instrumentation.finish(self._record, exc)
+
+    def __await__(self):
+        try:
+            response = yield from self._call.__await__()
+        except Exception as exc:
+            self._done(exc)
+            raise
+        self._done()
+        return response
+
+    async def _aiter(self):
+        try:
+            async for response in self._call:
+                yield response
+        except Exception as exc:
+            self._done(exc)
+            raise
+        self._done()
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def read(self):
+        try:
+            response = await self._call.read()
+        except Exception as exc:
+            self._done(exc)
+            raise
+        if response is aio.EOF:
+            self._done()
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._call, name)
+
+
+class _AioMultiCallableMixin(_MultiCallableMixin):
+    def __call__(self, request, *args, **kwargs):
+        record, owned = self._instrumentation.attempt(self._rpc)
+        # grpc.aio runs the call in a task that copies the current context,
+        # so the (de)serializers see the record without further help.
+        token = _current_record.set(record)
+        try:
+            call = self._callable(request, *args, **kwargs)
+        except Exception as exc:
+            record._end_attempt()
+            if owned:
+                self._instrumentation.finish(record, exc)
+            raise
+        finally:
+            _current_record.reset(token)
+        return _AioCall(call, record, owned, self._instrumentation)
+
+
+class _AioUnaryUnary(_AioMultiCallableMixin, aio.UnaryUnaryMultiCallable):
+    pass
+
+
+class _AioUnaryStream(_AioMultiCallableMixin, aio.UnaryStreamMultiCallable):
+    pass
+
+
+class _AioStreamUnary(_AioMultiCallableMixin, aio.StreamUnaryMultiCallable):
+    pass
+
+
+class _AioStreamStream(_AioMultiCallableMixin, aio.StreamStreamMultiCallable):
+    pass
+
+
+class _InstrumentedAioChannel(_InstrumentedChannel):
+    """A ``grpc.aio.Channel`` proxy whose stubs report to an
+    instrumentation."""
+
+    _factories = {
+        "unary_unary": _AioUnaryUnary,
+        "unary_stream": _AioUnaryStream,
+        "stream_unary": _AioStreamUnary,
+        "stream_stream": _AioStreamStream,
+    }
+
+
+# ---------------------------------------------------------------------------
+# REST
+# ---------------------------------------------------------------------------
+
+
+class _InstrumentedRestInterceptor(object):
+    """Delegates to a ``*RestInterceptor``, using each ``pre_*``/``post_*``
+    pair to delimit an attempt of the current logical call."""
+
+    def __init__(self, interceptor):
+        self._interceptor = interceptor
+
+    def __getattr__(self, name):
+        hook = getattr(self._interceptor, name)
+        if name.startswith("pre_"):
+
+            def pre(request, metadata):
+                record = _current_record.get()
+                if record is not None:
+                    record._begin_attempt()
+                return hook(request, metadata)
+
+            return pre
+        if name.startswith("post_"):
+
+            def post(response):
+                response = hook(response)
+                record = _current_record.get()
+                if record is not None:
+                    record._end_attempt()
+                return response
+
+            return post
+        return hook
+
+
+def _rest_response_hook(response, *args, **kwargs):
+    record = _current_record.get()
+    if record is not None:
+        body = response.request.body if response.request is not None else None
+        record.request_bytes += len(body or b"")
+        record.response_bytes += len(response.content or b"")
+        record.network_seconds += response.elapsed.total_seconds()
+        if response.status_code >= 400:
+            # The transport raises before reaching the ``post_*`` hook.
+            record._end_attempt()
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Public entry point
+# ---------------------------------------------------------------------------
+
+
+def _describe(transport) -> Tuple[str, str]:
+    """Return the service name and kind of a generated transport."""
+    name = type(transport).__name__
+    for suffix, kind in _TRANSPORT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)], kind
+    raise ValueError("Unsupported transport: {!r}".format(type(transport)))
+
+
+def _is_streaming(key) -> bool:
+    return isinstance(
+        key, (grpc.UnaryStreamMultiCallable, grpc.StreamStreamMultiCallable)
+    )
+
+
+def _rpc_name(key) -> str:
+    method = getattr(key, "method", None)
+    if method is not None:
+        return method.rsplit("/", 1)[-1]
+    # REST stubs are nested classes named after the RPC, e.g. ``_DetectIntent``.
+    return type(key).__name__.lstrip("_")
+
+
+def instrument(client_or_transport, recorder: RpcRecorder, *, client_info=None):
+    """Instrument every method of a client's transport.
+
+    Args:
+        client_or_transport: A Dialogflow client, async client or
+            transport instance.
+        recorder (RpcRecorder): Receives a record for each call.
+        client_info (google.api_core.gapic_v1.client_info.ClientInfo):
+            The client info the transport was created with. Defaults to the
+            transport module's ``DEFAULT_CLIENT_INFO``; only pass this if the
+            client was built with a custom one.
+
+    Returns:
+        The instrumented transport.
+
+    Raises:
+        ValueError: If the transport is already instrumented or of an
+            unknown kind.
+    """
+    transport = getattr(client_or_transport, "transport", client_or_transport)
+    service, kind = _describe(transport)
+    if getattr(transport, "_dialogflow_instrumentation", None) is not None:
+        raise ValueError("The transport is already instrumented.")
+    instrumentation = _Instrumentation(service, kind, recorder)
+
+    if kind == "grpc":
+        transport._grpc_channel = _InstrumentedChannel(
+            transport._grpc_channel, instrumentation
+        )
+        transport._stubs.clear()
+    elif kind == "grpc_asyncio":
+        transport._grpc_channel = _InstrumentedAioChannel(
+            transport._grpc_channel, instrumentation
+        )
+        transport._stubs.clear()
+    else:
+        transport._interceptor = _InstrumentedRestInterceptor(transport._interceptor)
+        transport._session.hooks["response"].append(_rest_response_hook)
+
+    # Rebuild the wrapped methods so they close over the instrumented stubs.
+    if client_info is None:
+        client_info = sys.modules[type(transport).__module__].DEFAULT_CLIENT_INFO
+    transport._prep_wrapped_messages(client_info)
+    if kind != "grpc_asyncio":
+        transport._wrapped_methods = {
+            key: _InstrumentedMethod(
+                wrapped, _rpc_name(key), _is_streaming(key), instrumentation
+            )
+            for key, wrapped in transport._wrapped_methods.items()
+        }
+    transport._dialogflow_instrumentation = instrumentation
+    return transport
+
+
+__all__ = (
+    "Histogram",
+    "HistogramRecorder",
+    "MethodStats",
+    "OpenTelemetryRecorder",
+    "RpcRecord",
+    "RpcRecorder",
+    "instrument",
+    "status_of",
+)
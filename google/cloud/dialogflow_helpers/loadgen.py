@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Load generator for ``detect_intent`` and ``analyze_content``.
+
+Drives ``SessionsClient.detect_intent``, ``SessionsClient.streaming_detect_intent``
+or ``ParticipantsClient.analyze_content`` at a fixed concurrency (closed
+loop) or a target rate (open loop) and reports latency percentiles,
+throughput, error codes and client CPU time per request::
+
+    dialogflow-loadgen --project my-project --utterances utterances.txt \\
+        --method detect_intent --transport grpc --qps 50 --duration 60
+
+    # Offline, against a fake server started in a subprocess:
+    dialogflow-loadgen --fake --fake-latency-ms 40 --concurrency 16
+
+    # Against a server that is already running:
+    python -m google.cloud.dialogflow_helpers.fake_server --address localhost:8080 &
+    dialogflow-loadgen --endpoint localhost:8080 --insecure --transport grpc_asyncio
+
+In open-loop mode latency is measured from the time a request was
+scheduled rather than sent, so a client that cannot keep up shows it in the
+tail instead of silently lowering the offered load.
+
+Client CPU is the process CPU time of the run, which includes gRPC's
+internal threads. Use ``--fake`` (which runs the server in a separate
+process) rather than an in-process server when comparing CPU.
+"""
+import argparse
+import asyncio
+from concurrent import futures
+import itertools
+import json
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from google.auth import credentials as ga_credentials
+import grpc  # type: ignore
+from grpc.experimental import aio  # type: ignore
+
+from google.cloud.dialogflow_helpers import audio
+from google.cloud.dialogflow_helpers.instrumentation import Histogram, status_of
+from google.cloud.dialogflow_v2.services.participants import (
+    ParticipantsAsyncClient,
+    ParticipantsClient,
+)
+from google.cloud.dialogflow_v2.services.sessions import (
+    SessionsAsyncClient,
+    SessionsClient,
+)
+from google.cloud.dialogflow_v2.types import AudioEncoding, session
+
+METHODS = ("detect_intent", "streaming_detect_intent", "analyze_content")
+TRANSPORTS = ("grpc", "grpc_asyncio", "rest")
+
+# Bound on requests in flight in open-loop mode unless --concurrency is set.
+_DEFAULT_OPEN_LOOP_CONCURRENCY = 64
+
+
+class LoadResult(object):
+    """Outcome of a load run.
+
+    Attributes:
+        latency (google.cloud.dialogflow_helpers.instrumentation.Histogram):
+            Latency of every request, successful or not, in seconds.
+        ok (int): Successful requests.
+        errors (Dict[str, int]): Failed requests by status code.
+        elapsed (float): Wall time of the run, in seconds.
+        cpu_seconds (float): Process CPU time used during the run.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.ok = 0
+        self.errors: Dict[str, int] = {}
+        self.elapsed = 0.0
+        self.cpu_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, latency: float, exc: Optional[BaseException]):
+        with self._lock:
+            self.latency.add(latency)
+            if exc is None:
+                self.ok += 1
+            else:
+                code = status_of(exc)
+                self.errors[code] = self.errors.get(code, 0) + 1
+
+    @property
+    def requests(self) -> int:
+        """int: Requests completed."""
+        return self.latency.count
+
+    @property
+    def throughput(self) -> float:
+        """float: Successful requests per second."""
+        return self.ok / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cpu_per_request(self) -> float:
+        """float: Process CPU seconds per completed request."""
+        return self.cpu_seconds / self.requests if self.requests else 0.0
+
+    def as_dict(self, percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, Any]:
+        """Return the result as a JSON-serializable dict."""
+        latency = {
+            "p{}".format(percent): self.latency.percentile(percent)
+            for percent in percentiles
+        }
+        latency["mean"] = self.latency.mean
+        latency["max"] = self.latency.max if self.requests else 0.0
+        return {
+            "requests": self.requests,
+            "ok": self.ok,
+            "errors": dict(self.errors),
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "latency": latency,
+            "cpu_per_request": self.cpu_per_request,
+        }
+
+    def format(self) -> str:
+        """Return a human-readable report."""
+        summary = self.as_dict()
+        latency = summary["latency"]
+        lines = [
+            "requests:   {} ({} ok, {} failed) in {:.2f}s".format(
+                self.requests, self.ok, self.requests - self.ok, self.elapsed
+            ),
+            "throughput: {:.1f} req/s".format(self.throughput),
+            "latency:    p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, "
+            "mean {:.1f} ms, max {:.1f} ms".format(
+                latency["p50"] * 1000,
+                latency["p90"] * 1000,
+                latency["p99"] * 1000,
+                latency["mean"] * 1000,
+                latency["max"] * 1000,
+            ),
+            "client cpu: {:.3f} ms/request".format(self.cpu_per_request * 1000),
+        ]
+        if self.errors:
+            lines.append(
+                "errors:     "
+                + ", ".join(
+                    "{}={}".format(code, count)
+                    for code, count in sorted(self.errors.items())
+                )
+            )
+        return "\n".join(lines)
+
+
+class _Budget(object):
+    """Hands out request indices until the duration or count is used up."""
+
+    def __init__(self, duration: Optional[float], total: Optional[int]):
+        if duration is None and total is None:
+            raise ValueError("Either a duration or a number of requests is required.")
+        self._counter = itertools.count()
+        self._total = total
+        self._deadline = None
+        self._duration = duration
+        self.start = 0.0
+
+    def begin(self):
+        self.start = time.monotonic()
+        if self._duration is not None:
+            self._deadline = self.start + self._duration
+
+    def next(self, at: Optional[float] = None) -> Optional[int]:
+        index = next(self._counter)
+        if self._total is not None and index >= self._total:
+            return None
+        now = time.monotonic() if at is None else at
+        if self._deadline is not None and now >= self._deadline:
+            return None
+        return index
+
+
+def run(
+    call: Callable[[int], Any],
+    concurrency: Optional[int] = None,
+    qps: Optional[float] = None,
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    warmup: int = 0,
+) -> LoadResult:
+    """Run ``call`` under load from a pool of threads.
+
+    Args:
+        call (Callable[[int], Any]): Issues one request; receives the
+            request index.
+        concurrency (int): Requests in flight. Defaults to 1 in closed-loop
+            mode and 64 in open-loop mode.
+        qps (float): Target rate. If unset, each of the ``concurrency``
+            workers issues requests back to back.
+        duration (float): Stop issuing requests after this many seconds.
+        requests (int): Stop after this many requests.
+        warmup (int): Requests issued, sequentially and unmeasured, first.
+
+    Returns:
+        LoadResult: The measurements.
+    """
+    for index in range(warmup):
+        try:
+            call(index)
+        except Exception:
+            pass
+    budget = _Budget(duration, requests)
+    result = LoadResult()
+
+    def issue(index, scheduled):
+        exc = None
+        try:
+            call(index)
+        except Exception as e:
+            exc = e
+        result._record(time.monotonic() - scheduled, exc)
+
+    def worker():
+        while True:
+            index = budget.next()
+            if index is None:
+                return
+            issue(index, time.monotonic())
+
+    cpu = time.process_time()
+    budget.begin()
+    if qps is None:
+        threads = [
+            threading.Thread(target=worker, daemon=True)
+            for _ in range(concurrency or 1)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        in_flight = concurrency or _DEFAULT_OPEN_LOOP_CONCURRENCY
+        semaphore = threading.BoundedSemaphore(in_flight)
+
+        def issue_and_release(index, scheduled):
+            try:
+                issue(index, scheduled)
+            finally:
+                semaphore.release()
+
+        with futures.ThreadPoolExecutor(max_workers=in_flight) as executor:
+            for slot in itertools.count():
+                scheduled = budget.start + slot / qps
+                index = budget.next(at=scheduled)
+                if index is None:
+                    break
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                semaphore.acquire()
+                executor.submit(issue_and_release, index, scheduled)
+    result.elapsed = time.monotonic() - budget.start
+    result.cpu_seconds = time.process_time() - cpu
+    return result
+
+
+async def run_async(
+    call: Callable[[int], Awaitable[Any]],
+    concurrency: Optional[int] = None,
+    qps: Optional[float] = None,
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    warmup: int = 0,
+) -> LoadResult:
+    """Async variant of :func:`run` for coroutine functions, e.g. calls
+    through the asyncio clients."""
+    for index in range(warmup):
+        try:
+            await call(index)
+        except Exception:
+            pass
+    budget = _Budget(duration, requests)
+    result = LoadResult()
+
+    async def issue(index, scheduled):
+        exc = None
+        try:
+            await call(index)
+        except Exception as e:
+            exc = e
+        result._record(time.monotonic() - scheduled, exc)
+
+    async def worker():
+        while True:
+            index = budget.next()
+            if index is None:
+                return
+            await issue(index, time.monotonic())
+
+    cpu = time.process_time()
+    budget.begin()
+    if qps is None:
+        await asyncio.gather(*(worker() for _ in range(concurrency or 1)))
+    else:
+        semaphore = asyncio.Semaphore(concurrency or _DEFAULT_OPEN_LOOP_CONCURRENCY)
+        tasks = set()
+
+        async def issue_and_release(index, scheduled):
+            try:
+                await issue(index, scheduled)
+            finally:
+                semaphore.release()
+
+        for slot in itertools.count():
+            scheduled = budget.start + slot / qps
+            index = budget.next(at=scheduled)
+            if index is None:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await semaphore.acquire()
+            task = asyncio.ensure_future(issue_and_release(index, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    result.elapsed = time.monotonic() - budget.start
+    result.cpu_seconds = time.process_time() - cpu
+    return result
+
+
+def _read_utterances(path: Optional[str]) -> List[str]:
+    if path is None:
+        return ["hello"]
+    with open(path, encoding="utf-8") as stream:
+        utterances = [line.strip() for line in stream if line.strip()]
+    if not utterances:
+        raise ValueError("No utterances found in {}.".format(path))
+    return utterances
+
+
+def _read_audio(args) -> List[List[bytes]]:
+    pipeline = audio.AudioPipeline(
+        AudioEncoding[args.audio_encoding], args.sample_rate_hertz
+    )
+    # Chunked up front so that file I/O does not count towards latency.
+    return [list(pipeline.chunks(path)) for path in args.audio]
+
+
+def _create_client(sync_class, async_class, args):
+    if args.transport == "grpc_asyncio":
+        client_class = async_class
+    else:
+        client_class = sync_class
+    if args.insecure:
+        transport_class = sync_class.get_transport_class(args.transport)
+        if args.transport == "grpc":
+            transport = transport_class(channel=grpc.insecure_channel(args.endpoint))
+        elif args.transport == "grpc_asyncio":
+            transport = transport_class(channel=aio.insecure_channel(args.endpoint))
+        else:
+            transport = transport_class(
+                host=args.endpoint,
+                url_scheme="http",
+                credentials=ga_credentials.AnonymousCredentials(),
+            )
+        return client_class(transport=transport)
+    client_options = {"api_endpoint": args.endpoint} if args.endpoint else None
+    return client_class(transport=args.transport, client_options=client_options)
+
+
+def _build_call(args, utterances: List[str], audio_chunks: List[List[bytes]]):
+    """Return the function issuing request ``index`` for the chosen method."""
+    asynchronous = args.transport == "grpc_asyncio"
+    kwargs = {"timeout": args.timeout}
+
+    def text(index):
+        return {
+            "text": utterances[index % len(utterances)],
+            "language_code": args.language_code,
+        }
+
+    if args.method == "analyze_content":
+        client = _create_client(ParticipantsClient, ParticipantsAsyncClient, args)
+        participant = ParticipantsClient.participant_path(
+            args.project, args.conversation, args.participant
+        )
+
+        def analyze_content(index):
+            return client.analyze_content(
+                participant=participant, text_input=text(index), **kwargs
+            )
+
+        return client, analyze_content
+
+    client = _create_client(SessionsClient, SessionsAsyncClient, args)
+
+    def session_path(index):
+        return SessionsClient.session_path(
+            args.project, "loadgen-{}".format(index % args.sessions)
+        )
+
+    if args.method == "detect_intent":
+
+        def detect_intent(index):
+            return client.detect_intent(
+                session=session_path(index),
+                query_input={"text": text(index)},
+                **kwargs,
+            )
+
+        return client, detect_intent
+
+    def stream_requests(index):
+        if not audio_chunks:
+            yield session.StreamingDetectIntentRequest(
+                session=session_path(index), query_input={"text": text(index)}
+            )
+            return
+        yield session.StreamingDetectIntentRequest(
+            session=session_path(index),
+            query_input={
+                "audio_config": {
+                    "audio_encoding": AudioEncoding[args.audio_encoding],
+                    "sample_rate_hertz": args.sample_rate_hertz,
+                    "language_code": args.language_code,
+                    "single_utterance": True,
+                }
+            },
+        )
+        for chunk in audio_chunks[index % len(audio_chunks)]:
+            yield session.StreamingDetectIntentRequest(input_audio=chunk)
+
+    if asynchronous:
+
+        async def arequests(index):
+            for request in stream_requests(index):
+                yield request
+
+        async def streaming_detect_intent_async(index):
+            stream = await client.streaming_detect_intent(
+                requests=arequests(index), **kwargs
+            )
+            async for _ in stream:
+                pass
+
+        return client, streaming_detect_intent_async
+
+    def streaming_detect_intent(index):
+        for _ in client.streaming_detect_intent(
+            requests=stream_requests(index), **kwargs
+        ):
+            pass
+
+    return client, streaming_detect_intent
+
+
+def _start_fake_server(args) -> subprocess.Popen:
+    command = [
+        sys.executable,
+        "-m",
+        "google.cloud.dialogflow_helpers.fake_server",
+        "--address",
+        "localhost:0",
+        "--latency-ms",
+        str(args.fake_latency_ms),
+    ]
+    if args.fake_error_rate:
+        command += ["--error-rate", str(args.fake_error_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Serving on "):
+        process.kill()
+        raise RuntimeError("The fake server failed to start.")
+    args.endpoint = line[len("Serving on ") :].strip()
+    args.insecure = True
+    return process
+
+
+def _parse_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="dialogflow-loadgen",
+        description="Generate load against Dialogflow detect_intent and "
+        "analyze_content.",
+    )
+    parser.add_argument("--method", choices=METHODS, default="detect_intent")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="grpc")
+    parser.add_argument("--project", default="loadgen")
+    parser.add_argument("--utterances", help="File with one utterance per line.")
+    parser.add_argument("--language-code", default="en-US")
+    parser.add_argument(
+        "--sessions", type=int, default=100, help="Distinct session ids to use."
+    )
+    parser.add_argument("--conversation", default="loadgen")
+    parser.add_argument("--participant", default="loadgen")
+    parser.add_argument(
+        "--audio",
+        nargs="*",
+        default=[],
+        help="Raw audio files to stream with streaming_detect_intent; "
+        "utterances are sent as text if omitted.",
+    )
+    parser.add_argument(
+        "--audio-encoding",
+        default="AUDIO_ENCODING_LINEAR_16",
+        choices=[encoding.name for encoding in AudioEncoding],
+    )
+    parser.add_argument("--sample-rate-hertz", type=int, default=16000)
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--qps", type=float, help="Target rate (open loop).")
+    load.add_argument("--concurrency", type=int, help="Requests in flight.")
+    load.add_argument("--duration", type=float, help="Seconds to run.")
+    load.add_argument("--requests", type=int, help="Requests to issue.")
+    load.add_argument("--warmup", type=int, default=0)
+    load.add_argument("--timeout", type=float, default=30.0)
+
+    endpoint = parser.add_argument_group("endpoint")
+    endpoint.add_argument("--endpoint", help="host:port of the API endpoint.")
+    endpoint.add_argument(
+        "--insecure",
+        action="store_true",
+        help="Connect to --endpoint without TLS or credentials.",
+    )
+    endpoint.add_argument(
+        "--fake",
+        action="store_true",
+        help="Start a fake server in a subprocess and target it.",
+    )
+    endpoint.add_argument("--fake-latency-ms", type=float, default=0.0)
+    endpoint.add_argument("--fake-error-rate", type=float, default=0.0)
+
+    parser.add_argument("--json", action="store_true", help="Print JSON.")
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        args.duration = 10.0
+    if args.insecure and not args.endpoint:
+        parser.error("--insecure requires --endpoint")
+    if args.fake and args.transport == "rest":
+        parser.error("the fake server only supports gRPC transports")
+    if args.transport == "rest" and args.method.startswith("streaming_"):
+        parser.error("{} is not available over REST".format(args.method))
+    return args
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    """Run the load generator from the command line."""
+    args = _parse_args(argv)
+    server = _start_fake_server(args) if args.fake else None
+    try:
+        utterances = _read_utterances(args.utterances)
+        audio_chunks = _read_audio(args) if args.audio else []
+        options = dict(
+            concurrency=args.concurrency,
+            qps=args.qps,
+            duration=args.duration,
+            requests=args.requests,
+            warmup=args.warmup,
+        )
+        if args.transport == "grpc_asyncio":
+
+            async def run_in_loop():
+                # The asyncio channel must be created on the running loop.
+                client, call = _build_call(args, utterances, audio_chunks)
+                try:
+                    return await run_async(call, **options)
+                finally:
+                    await client.transport.close()
+
+            result = asyncio.run(run_in_loop())
+        else:
+            client, call = _build_call(args, utterances, audio_chunks)
+            with client:
+                result = run(call, **options)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.json:
+        summary = result.as_dict()
+        summary.update(method=args.method, transport=args.transport)
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        print("{} over {}".format(args.method, args.transport))
+        print(result.format())
+    return 0
+
+
+__all__ = (
+    "LoadResult",
+    "METHODS",
+    "TRANSPORTS",
+    "main",
+    "run",
+    "run_async",
+)
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
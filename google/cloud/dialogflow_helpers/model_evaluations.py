@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Fetch, cache and compare conversation model evaluations.
+
+An :class:`EvaluationFetcher` lists the evaluations of many conversation
+models concurrently. Finished evaluations never change, so they are kept
+in an :class:`EvaluationCache`, optionally backed by a directory.
+:func:`comparison_table` lines their smart reply metrics up side by side:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import model_evaluations
+
+    fetcher = model_evaluations.EvaluationFetcher(
+        dialogflow_v2.ConversationModelsClient(),
+        model_evaluations.EvaluationCache("evaluations/"),
+    )
+    evaluations = fetcher.evaluations(models)
+    columns, rows = model_evaluations.comparison_table(evaluations)
+    print(model_evaluations.format_table(columns, rows))
+
+The same from the command line::
+
+    python -m google.cloud.dialogflow_helpers.model_evaluations \\
+        --project my-project --cache-dir evaluations/ --sort recall@3
+
+Listing is the only way to discover new evaluations, and it returns them
+in full. So :meth:`EvaluationFetcher.evaluations` makes the same list
+RPCs whether or not the cache is warm. The cache saves RPCs for
+:meth:`EvaluationFetcher.get` of known names, and for
+``cached_only=True`` (``--cached-only``), which reads the cache without
+listing and so can miss new evaluations.
+"""
+import argparse
+from concurrent import futures
+import csv
+import os
+import sys
+import threading
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib import parse
+
+from google.cloud.dialogflow_v2.types import (
+    conversation_model as gcd_conversation_model,
+)
+
+TEXT = "text"
+CSV = "csv"
+FORMATS = (TEXT, CSV)
+
+#: Columns that precede the ``recall@N`` columns.
+COLUMNS = (
+    "model",
+    "evaluation",
+    "display_name",
+    "create_time",
+    "conversation_count",
+    "allowlist_coverage",
+)
+
+_Evaluation = gcd_conversation_model.ConversationModelEvaluation
+
+
+def model_of(evaluation: str) -> str:
+    """Return the conversation model of an evaluation name."""
+    return evaluation.rsplit("/evaluations/", 1)[0]
+
+
+def is_finished(evaluation: Any) -> bool:
+    """Whether ``evaluation`` carries its metrics, i.e. can be cached."""
+    return _Evaluation.pb(evaluation).HasField("smart_reply_metrics")
+
+
+class EvaluationCache(object):
+    """Finished evaluations by name, in memory and in ``directory``.
+
+    Each evaluation is stored as its serialized proto in a file named
+    after the URL-quoted evaluation name. Files are read once, when the
+    cache is created.
+
+    Args:
+        directory (str): Directory to persist to; created if missing.
+            ``None`` keeps the cache in memory only.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._evaluations: Dict[str, bytes] = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for filename in os.listdir(directory):
+                if not filename.endswith(".pb"):
+                    continue
+                with open(os.path.join(directory, filename), "rb") as stream:
+                    self._evaluations[parse.unquote(filename[:-3])] = stream.read()
+
+    def __len__(self) -> int:
+        return len(self._evaluations)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._evaluations
+
+    def get(self, name: str) -> Optional[Any]:
+        """Return the cached evaluation ``name``, or ``None``."""
+        data = self._evaluations.get(name)
+        return None if data is None else _Evaluation.deserialize(data)
+
+    def put(self, evaluation: Any) -> bool:
+        """Cache ``evaluation`` if it is finished.
+
+        Returns:
+            bool: Whether it was cached.
+        """
+        if not is_finished(evaluation):
+            return False
+        data = _Evaluation.serialize(evaluation)
+        with self._lock:
+            if self._evaluations.get(evaluation.name) == data:
+                return True
+            self._evaluations[evaluation.name] = data
+            if self.directory is not None:
+                path = os.path.join(
+                    self.directory, parse.quote(evaluation.name, safe="") + ".pb"
+                )
+                # Write then rename, so a reader never sees half a file.
+                with open(path + ".tmp", "wb") as stream:
+                    stream.write(data)
+                os.replace(path + ".tmp", path)
+        return True
+
+    def names(self, model: Optional[str] = None) -> List[str]:
+        """Return the cached evaluation names, of ``model`` if given."""
+        return sorted(
+            name
+            for name in self._evaluations
+            if model is None or model_of(name) == model
+        )
+
+
+class EvaluationFetcher(object):
+    """Reads evaluations of many models at once through a cache.
+
+    Args:
+        client (google.cloud.dialogflow_v2.ConversationModelsClient): The
+            client.
+        cache (EvaluationCache): Finished evaluations; an in-memory cache
+            by default.
+        concurrency (int): RPCs in flight at once.
+
+    Attributes:
+        rpcs (int): List and get calls made.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        cache: Optional[EvaluationCache] = None,
+        concurrency: int = 8,
+    ):
+        self._client = client
+        self.cache = cache if cache is not None else EvaluationCache()
+        self.concurrency = concurrency
+        self.rpcs = 0
+        self._lock = threading.Lock()
+
+    def _count(self) -> None:
+        with self._lock:
+            self.rpcs += 1
+
+    def models(self, parent: str) -> List[Any]:
+        """Return the conversation models of ``parent``, e.g.
+        ``projects/<Project ID>/locations/<Location ID>``."""
+        models = []
+        for page in self._client.list_conversation_models(
+            request={"parent": parent}
+        ).pages:
+            self._count()
+            models.extend(page.conversation_models)
+        return models
+
+    def _list(self, model: str) -> List[Any]:
+        evaluations = []
+        for page in self._client.list_conversation_model_evaluations(
+            request={"parent": model}
+        ).pages:
+            self._count()
+            evaluations.extend(page.conversation_model_evaluations)
+        for evaluation in evaluations:
+            self.cache.put(evaluation)
+        return evaluations
+
+    def _get(self, name: str) -> Any:
+        cached = self.cache.get(name)
+        if cached is not None:
+            return cached
+        self._count()
+        evaluation = self._client.get_conversation_model_evaluation(
+            request={"name": name}
+        )
+        self.cache.put(evaluation)
+        return evaluation
+
+    def _map(self, function, items: Sequence[str]) -> List[Any]:
+        if len(items) <= 1:
+            return [function(item) for item in items]
+        with futures.ThreadPoolExecutor(
+            max_workers=min(self.concurrency, len(items)),
+            thread_name_prefix="evaluations",
+        ) as executor:
+            return list(executor.map(function, items))
+
+    def get(self, names: Iterable[str]) -> List[Any]:
+        """Return the evaluations ``names``, in order, fetching those not
+        cached concurrently."""
+        return self._map(self._get, list(names))
+
+    def evaluations(
+        self, models: Iterable[Any], cached_only: bool = False
+    ) -> List[Any]:
+        """Return the evaluations of ``models``, names or
+        ``ConversationModel`` messages, grouped by model in order.
+
+        Every model is listed on each call, since listing is how new
+        evaluations are found and it returns them in full; the cache is
+        only refreshed here, not read. ``cached_only`` skips listing, makes
+        no RPCs and returns only the cached evaluations.
+        """
+        models = [getattr(m, "name", m) for m in models]
+        if cached_only:
+            return [
+                self.cache.get(name)
+                for model in models
+                for name in self.cache.names(model)
+            ]
+        return [e for evaluations in self._map(self._list, models) for e in evaluations]
+
+
+def _recall_column(n: int) -> str:
+    return "recall@{}".format(n)
+
+
+def comparison_table(
+    evaluations: Iterable[Any], sort: Optional[str] = None
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Return the columns and one row per evaluation of their smart reply
+    metrics.
+
+    The columns are :data:`COLUMNS` followed by a ``recall@N`` column for
+    every ``N`` any evaluation reports; rows lacking one have ``None``.
+
+    Args:
+        evaluations (Iterable[ConversationModelEvaluation]): The
+            evaluations.
+        sort (str): Column to sort by, descending; rows without a value
+            go last.
+
+    Raises:
+        ValueError: ``sort`` is not a column.
+    """
+    rows = []
+    top_n = set()
+    for evaluation in evaluations:
+        pb = _Evaluation.pb(evaluation)
+        metrics = pb.smart_reply_metrics
+        row = {
+            "model": model_of(pb.name),
+            "evaluation": pb.name,
+            "display_name": pb.display_name,
+            "create_time": pb.create_time.ToJsonString()
+            if pb.HasField("create_time")
+            else None,
+            "conversation_count": metrics.conversation_count
+            if pb.HasField("smart_reply_metrics")
+            else None,
+            "allowlist_coverage": metrics.allowlist_coverage
+            if pb.HasField("smart_reply_metrics")
+            else None,
+        }
+        for top in metrics.top_n_metrics:
+            row[_recall_column(top.n)] = top.recall
+            top_n.add(top.n)
+        rows.append(row)
+    columns = list(COLUMNS) + [_recall_column(n) for n in sorted(top_n)]
+    for row in rows:
+        for column in columns:
+            row.setdefault(column, None)
+    if sort is not None:
+        if sort not in columns:
+            raise ValueError("Unknown column {!r}.".format(sort))
+        rows = sorted(
+            (row for row in rows if row[sort] is not None),
+            key=lambda row: row[sort],
+            reverse=True,
+        ) + [row for row in rows if row[sort] is None]
+    return columns, rows
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.4f}".format(value)
+    return str(value)
+
+
+def format_table(
+    columns: Sequence[str], rows: Sequence[Dict[str, Any]], short_names: bool = True
+) -> str:
+    """Return ``rows`` as an aligned text table.
+
+    Args:
+        short_names (bool): Show only the last segment of the model and
+            evaluation names.
+    """
+
+    def cell(column, value):
+        if short_names and column in ("model", "evaluation") and value:
+            value = value.rsplit("/", 1)[-1]
+        return _cell(value)
+
+    table = [list(columns)] + [[cell(c, row[c]) for c in columns] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+    return "\n".join(
+        "  ".join(
+            value.rjust(width) if i >= 4 else value.ljust(width)
+            for i, (value, width) in enumerate(zip(line, widths))
+        ).rstrip()
+        for line in table
+    )
+
+
+def write_csv(
+    stream: IO[str], columns: Sequence[str], rows: Sequence[Dict[str, Any]]
+) -> None:
+    """Write ``rows`` to ``stream`` as CSV with a header; missing values
+    are empty."""
+    writer = csv.writer(stream, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(
+        ["" if row[c] is None else row[c] for c in columns] for row in rows
+    )
+
+
+__all__ = (
+    "COLUMNS",
+    "CSV",
+    "EvaluationCache",
+    "EvaluationFetcher",
+    "FORMATS",
+    "TEXT",
+    "comparison_table",
+    "format_table",
+    "is_finished",
+    "main",
+    "model_of",
+    "write_csv",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Compare a project's conversation model evaluations from the command
+    line."""
+    from google.cloud import dialogflow_v2
+
+    parser = argparse.ArgumentParser(
+        description="Compare smart reply metrics of conversation model evaluations."
+    )
+    parser.add_argument("--project", required=True)
+    parser.add_argument("--location", default="global")
+    parser.add_argument(
+        "--model",
+        action="append",
+        help="Conversation model name or ID; all models by default.",
+    )
+    parser.add_argument("--cache-dir", help="Directory of cached evaluations.")
+    parser.add_argument(
+        "--cached-only",
+        action="store_true",
+        help="Use cached evaluations only, without listing; makes no RPCs.",
+    )
+    parser.add_argument("--sort", help="Column to sort by, e.g. recall@3.")
+    parser.add_argument("--format", choices=FORMATS, default=TEXT)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    parent = "projects/{}/locations/{}".format(args.project, args.location)
+    fetcher = EvaluationFetcher(
+        dialogflow_v2.ConversationModelsClient(),
+        EvaluationCache(args.cache_dir),
+        concurrency=args.concurrency,
+    )
+    if args.model:
+        models = [
+            m if "/" in m else "{}/conversationModels/{}".format(parent, m)
+            for m in args.model
+        ]
+    elif args.cached_only:
+        models = sorted({model_of(name) for name in fetcher.cache.names()})
+    else:
+        models = fetcher.models(parent)
+    evaluations = fetcher.evaluations(models, cached_only=args.cached_only)
+    try:
+        columns, rows = comparison_table(evaluations, sort=args.sort)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.format == CSV:
+        write_csv(sys.stdout, columns, rows)
+    else:
+        print(format_table(columns, rows))
+    print("{} evaluations, {} RPCs".format(len(rows), fetcher.rpcs), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
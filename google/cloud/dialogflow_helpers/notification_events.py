@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Decode conversation profile Pub/Sub notifications lazily.
+
+A ``NotificationConfig`` publishes ``ConversationEvent`` and
+``HumanAgentAssistantEvent`` messages either as serialized protos or as
+JSON. Decoding every notification into proto-plus types with
+``json_format.Parse`` is costly when most consumers only look at the
+conversation and event type. The decoders here detect the format from the
+payload and return views that read the top-level fields directly, and
+build proto-plus messages only for ``new_message_payload``,
+``error_status`` or ``suggestion_results`` when they are accessed:
+
+.. code-block:: python
+
+    from google.cloud.dialogflow_helpers import notification_events
+
+    def callback(pubsub_message):
+        event = notification_events.decode_conversation_event(pubsub_message.data)
+        if event.type_ == event.Type.NEW_MESSAGE:
+            handle(event.conversation, event.new_message_payload.content)
+        pubsub_message.ack()
+
+    events = notification_events.decode_batch(
+        [m.message.data for m in pull_response.received_messages],
+        notification_events.ConversationEventView,
+    )
+
+The views are read-only. Use ``to_message()`` for a full proto-plus
+message.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
+
+from google.protobuf import json_format
+from google.rpc import status_pb2  # type: ignore
+
+from google.cloud.dialogflow_v2.types import (
+    conversation_event,
+    conversation_profile,
+    human_agent_assistant_event,
+)
+from google.cloud.dialogflow_v2.types import participant as gcd_participant
+
+MessageFormat = conversation_profile.NotificationConfig.MessageFormat
+
+_WHITESPACE = b" \t\r\n"
+
+
+def detect_format(data: Union[bytes, str]) -> MessageFormat:
+    """Return whether a notification payload is ``JSON`` or ``PROTO``.
+
+    JSON payloads are objects and start with ``{``; the serialized events
+    cannot, as that byte would be a group start tag for field 15. After
+    leading whitespace it is ambiguous: ``\\n`` is also the tag of an
+    event's first field, followed by its length, so such payloads are
+    only JSON if they parse as JSON.
+    """
+    if isinstance(data, str) or data[:1] == b"{":
+        return MessageFormat.JSON
+    if data.lstrip(_WHITESPACE)[:1] == b"{":
+        try:
+            json.loads(data)
+        except ValueError:
+            return MessageFormat.PROTO
+        return MessageFormat.JSON
+    return MessageFormat.PROTO
+
+
+def _payload(data: Any) -> Union[bytes, str]:
+    # Pub/Sub messages carry the payload in ``data``.
+    return getattr(data, "data", data)
+
+
+def _parse_json(data: Dict[str, Any], message_type):
+    pb = message_type.pb()()
+    json_format.ParseDict(data, pb, ignore_unknown_fields=True)
+    return pb
+
+
+class _EventView(object):
+    """Common lazy decoding of a notification payload."""
+
+    _message_type: Any = None
+    __slots__ = ("format", "_data", "_pb", "_json", "_cache")
+
+    def __init__(
+        self, data: Union[bytes, str], message_format: Optional[MessageFormat] = None
+    ):
+        if (
+            message_format is None
+            or message_format == MessageFormat.MESSAGE_FORMAT_UNSPECIFIED
+        ):
+            message_format = detect_format(data)
+        self.format = message_format
+        self._data = data
+        self._pb = None
+        self._json: Optional[Dict[str, Any]] = None
+        self._cache: Dict[str, Any] = {}
+
+    def _proto(self):
+        if self._pb is None:
+            self._pb = self._message_type.pb().FromString(self._data)
+        return self._pb
+
+    def _object(self) -> Dict[str, Any]:
+        if self._json is None:
+            self._json = json.loads(self._data)
+        return self._json
+
+    def _string(self, field: str) -> str:
+        if self.format == MessageFormat.JSON:
+            return self._object().get(field, "")
+        return getattr(self._proto(), field)
+
+    def _message(self, field: str, json_field: str, message_type, wrap=True):
+        try:
+            return self._cache[field]
+        except KeyError:
+            pass
+        if self.format == MessageFormat.JSON:
+            data = self._object()
+            # Publishers use the JSON names; accept the proto names too.
+            value = data.get(json_field, data.get(field))
+            pb = None if value is None else _parse_json(value, message_type)
+        else:
+            proto = self._proto()
+            pb = getattr(proto, field) if proto.HasField(field) else None
+        if pb is not None and wrap:
+            pb = message_type.wrap(pb)
+        self._cache[field] = pb
+        return pb
+
+    def to_message(self):
+        """Return the event as a proto-plus message."""
+        if self.format == MessageFormat.JSON:
+            pb = _parse_json(self._object(), self._message_type)
+        else:
+            pb = self._proto()
+        return self._message_type.wrap(pb)
+
+    def __repr__(self):
+        return "<{} conversation={!r}>".format(type(self).__name__, self.conversation)
+
+
+class ConversationEventView(_EventView):
+    """A lazily decoded ``ConversationEvent``.
+
+    Args:
+        data (Union[bytes, str]): The Pub/Sub message data.
+        message_format (MessageFormat): The payload format; detected if
+            omitted.
+    """
+
+    _message_type = conversation_event.ConversationEvent
+    Type = conversation_event.ConversationEvent.Type
+    __slots__ = ()
+
+    @property
+    def conversation(self) -> str:
+        """str: The conversation the event is about."""
+        return self._string("conversation")
+
+    @property
+    def type_(self) -> "conversation_event.ConversationEvent.Type":
+        """ConversationEvent.Type: The event type."""
+        if self.format == MessageFormat.JSON:
+            data = self._object()
+            value = data.get("type", data.get("type_", 0))
+            if isinstance(value, str):
+                return self.Type[value]
+            return self.Type(value)
+        return self.Type(self._proto().type_)
+
+    @property
+    def error_status(self) -> Optional[status_pb2.Status]:
+        """google.rpc.status_pb2.Status: The error, for
+        ``UNRECOVERABLE_ERROR`` events; otherwise ``None``."""
+        return self._message("error_status", "errorStatus", _Status, wrap=False)
+
+    @property
+    def new_message_payload(self) -> Optional[gcd_participant.Message]:
+        """google.cloud.dialogflow_v2.types.Message: The new message, for
+        ``NEW_MESSAGE`` events; otherwise ``None``."""
+        return self._message(
+            "new_message_payload", "newMessagePayload", gcd_participant.Message
+        )
+
+
+class HumanAgentAssistantEventView(_EventView):
+    """A lazily decoded ``HumanAgentAssistantEvent``.
+
+    Args:
+        data (Union[bytes, str]): The Pub/Sub message data.
+        message_format (MessageFormat): The payload format; detected if
+            omitted.
+    """
+
+    _message_type = human_agent_assistant_event.HumanAgentAssistantEvent
+    __slots__ = ()
+
+    @property
+    def conversation(self) -> str:
+        """str: The conversation the suggestions are for."""
+        return self._string("conversation")
+
+    @property
+    def participant(self) -> str:
+        """str: The participant the suggestions are for."""
+        return self._string("participant")
+
+    @property
+    def suggestion_results(self) -> List[gcd_participant.SuggestionResult]:
+        """List[google.cloud.dialogflow_v2.types.SuggestionResult]: The
+        suggestions."""
+        try:
+            return self._cache["suggestion_results"]
+        except KeyError:
+            pass
+        wrap = gcd_participant.SuggestionResult.wrap
+        if self.format == MessageFormat.JSON:
+            data = self._object()
+            values = data.get("suggestionResults", data.get("suggestion_results", ()))
+            results = [
+                wrap(_parse_json(value, gcd_participant.SuggestionResult))
+                for value in values
+            ]
+        else:
+            results = [wrap(pb) for pb in self._proto().suggestion_results]
+        self._cache["suggestion_results"] = results
+        return results
+
+
+class _Status(object):
+    """Adapts ``google.rpc.Status`` to the proto-plus ``pb()`` interface."""
+
+    @staticmethod
+    def pb():
+        return status_pb2.Status
+
+
+def decode_conversation_event(
+    data: Union[bytes, str], message_format: Optional[MessageFormat] = None
+) -> ConversationEventView:
+    """Decode a ``ConversationEvent`` notification."""
+    return ConversationEventView(_payload(data), message_format)
+
+
+def decode_human_agent_assistant_event(
+    data: Union[bytes, str], message_format: Optional[MessageFormat] = None
+) -> HumanAgentAssistantEventView:
+    """Decode a ``HumanAgentAssistantEvent`` notification."""
+    return HumanAgentAssistantEventView(_payload(data), message_format)
+
+
+def decode_batch(
+    payloads: Iterable[Any],
+    view_class: Type[_EventView] = ConversationEventView,
+    message_format: Optional[MessageFormat] = None,
+) -> List[_EventView]:
+    """Decode a batch of notifications of one event type.
+
+    Args:
+        payloads (Iterable[Union[bytes, str, pubsub_v1.types.PubsubMessage]]):
+            Payloads, or Pub/Sub messages with a ``data`` attribute.
+        view_class (type): :class:`ConversationEventView` or
+            :class:`HumanAgentAssistantEventView`.
+        message_format (MessageFormat): The format of all payloads;
+            detected per payload if omitted.
+
+    Returns:
+        List: A view per payload, in order.
+    """
+    return [view_class(_payload(data), message_format) for data in payloads]
+
+
+__all__ = (
+    "ConversationEventView",
+    "HumanAgentAssistantEventView",
+    "MessageFormat",
+    "decode_batch",
+    "decode_conversation_event",
+    "decode_human_agent_assistant_event",
+    "detect_format",
+)
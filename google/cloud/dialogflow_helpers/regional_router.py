@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Route each request to the regional endpoint of its resource.
+
+Agents outside the global location are only served by their regional
+endpoint, ``{location}-dialogflow.googleapis.com``. A
+:class:`RegionalRouter` reads the location from the ``session``,
+``parent`` or ``name`` of each request and sends it to a client for that
+location. The clients are created on first use, each on a
+:class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel`,
+and kept open for later requests:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import regional_router
+
+    router = regional_router.RegionalRouter(dialogflow_v2.SessionsClient)
+    router.detect_intent(
+        session="projects/p/locations/europe-west1/agent/sessions/s",
+        query_input=query_input,
+    )
+    router.close()
+
+Streaming methods are routed on their first request, which is read ahead
+and sent first.
+"""
+import asyncio
+import itertools
+import threading
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+)
+
+from google.auth import credentials as ga_credentials  # type: ignore
+
+from google.cloud.dialogflow_helpers.shared_channel import SharedChannel
+
+#: The location served by the global endpoint.
+GLOBAL_LOCATION = "global"
+
+_DEFAULT_ENDPOINT = "dialogflow.googleapis.com"
+
+# Request fields naming the resource a call acts on, most specific first.
+_RESOURCE_FIELDS = (
+    "session",
+    "participant",
+    "conversation",
+    "parent",
+    "name",
+)
+
+# Keep idle regional channels connected instead of letting them drop to
+# IDLE after the default 30 minutes and reconnect on the next request.
+_WARM_OPTIONS = [
+    ("grpc.client_idle_timeout_ms", 2**31 - 1),
+    ("grpc.keepalive_time_ms", 300000),
+    ("grpc.keepalive_permit_without_calls", 1),
+]
+
+
+def endpoint_for(location: Optional[str]) -> str:
+    """Return the Dialogflow API endpoint serving ``location``."""
+    if not location or location == GLOBAL_LOCATION:
+        return _DEFAULT_ENDPOINT
+    return "{}-{}".format(location, _DEFAULT_ENDPOINT)
+
+
+def _field(request: Any, name: str) -> Optional[str]:
+    if isinstance(request, dict):
+        value = request.get(name)
+    else:
+        value = getattr(request, name, None)
+    return value if isinstance(value, str) and value else None
+
+
+async def _prepend(first: Any, rest: AsyncIterable) -> AsyncIterator:
+    yield first
+    async for item in rest:
+        yield item
+
+
+class RegionalRouter(object):
+    """Dispatches a client's methods to per-location clients.
+
+    Every method of ``client_class`` is available on the router with the
+    same arguments, plus an optional ``location`` that skips detection.
+
+    Args:
+        client_class (type): A v2 or v2beta1 gRPC client class, sync or
+            async, e.g. ``SessionsClient``.
+        credentials (google.auth.credentials.Credentials): Credentials for
+            all locations; resolved from the environment if omitted.
+        pool_size (int): Channels per location, see
+            :class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel`.
+        options (Sequence[Tuple[str, Any]]): Additional channel options.
+        default_location (str): Location of requests whose resource names
+            none, e.g. ``projects/p/agent/sessions/s``.
+        endpoints (Mapping[str, str]): Endpoint overrides by location.
+        channel_factory (Callable[[str], SharedChannel]): Creates the
+            shared channel for an endpoint; by default a
+            :class:`~google.cloud.dialogflow_helpers.shared_channel.SharedChannel`
+            with the arguments above.
+        asyncio (bool): Whether ``client_class`` is an async client;
+            detected from its name if omitted.
+
+    Attributes:
+        calls (Dict[str, int]): Calls dispatched per location.
+    """
+
+    def __init__(
+        self,
+        client_class: Callable,
+        credentials: Optional[ga_credentials.Credentials] = None,
+        pool_size: int = 1,
+        options: Optional[Sequence] = None,
+        default_location: str = GLOBAL_LOCATION,
+        endpoints: Optional[Dict[str, str]] = None,
+        channel_factory: Optional[Callable[[str], SharedChannel]] = None,
+        asyncio: Optional[bool] = None,
+    ):
+        if asyncio is None:
+            asyncio = client_class.__name__.endswith("AsyncClient")
+        self.client_class = client_class
+        self.default_location = default_location
+        self.asyncio = asyncio
+        self.calls: Dict[str, int] = {}
+        self._credentials = credentials
+        self._pool_size = pool_size
+        self._options = _WARM_OPTIONS + list(options or ())
+        self._endpoints = dict(endpoints or {})
+        self._channel_factory = channel_factory or self._create_channel
+        self._lock = threading.Lock()
+        self._channels: Dict[str, SharedChannel] = {}
+        self._clients: Dict[str, Any] = {}
+        self._closed = False
+        # Templates without a location can still match a regional name by
+        # absorbing ``locations/*`` into ``project``; such matches carry no
+        # location and fall through to the prefix check.
+        parsers = [
+            getattr(client_class, name)
+            for name in sorted(dir(client_class))
+            if name.startswith("parse_")
+            and name.endswith("_path")
+            and not name.startswith("parse_common_")
+        ]
+        self._parsers: List[Callable[[str], Dict[str, str]]] = parsers
+        self._parse_location = client_class.parse_common_location_path
+        # Only the transport's RPCs are routed; the client's static and class
+        # helpers such as ``session_path`` are not methods of a location.
+        transport_class = client_class.get_transport_class("grpc")
+        self._rpcs = frozenset(
+            name
+            for name in dir(transport_class)
+            if isinstance(getattr(transport_class, name, None), property)
+            and callable(getattr(client_class, name, None))
+        )
+
+    @property
+    def locations(self) -> List[str]:
+        """List[str]: Locations with an open client."""
+        with self._lock:
+            return sorted(self._clients)
+
+    def location_of(self, resource: str) -> str:
+        """Return the location of a resource name.
+
+        The client's ``parse_*_path`` helpers are tried first, then the
+        ``projects/*/locations/*`` prefix of the name.
+        """
+        for parse in self._parsers:
+            location = parse(resource).get("location")
+            if location:
+                return location
+        prefix = "/".join(resource.split("/")[:4])
+        location = self._parse_location(prefix).get("location")
+        return location or self.default_location
+
+    def _request_location(self, request: Any, kwargs: Dict[str, Any]) -> str:
+        for name in _RESOURCE_FIELDS:
+            resource = _field(kwargs, name)
+            if resource is None and request is not None:
+                resource = _field(request, name)
+            if resource is not None:
+                return self.location_of(resource)
+        return self.default_location
+
+    def _create_channel(self, host: str) -> SharedChannel:
+        return SharedChannel(
+            host=host,
+            credentials=self._credentials,
+            pool_size=self._pool_size,
+            options=self._options,
+            asyncio=self.asyncio,
+        )
+
+    def client_for(self, location: str):
+        """Return the client for ``location``, creating it if needed."""
+        with self._lock:
+            if self._closed:
+                raise ValueError("The router is closed.")
+            client = self._clients.get(location)
+        if client is not None:
+            return client
+        # Connecting can be slow; do it without blocking other locations.
+        host = self._endpoints.get(location) or endpoint_for(location)
+        channel = self._channel_factory(host)
+        client = channel.client(self.client_class)
+        with self._lock:
+            closed = self._closed
+            existing = None if closed else self._clients.get(location)
+            if not closed and existing is None:
+                self._channels[location] = channel
+                self._clients[location] = client
+                return client
+        # Another caller created the location's client first, or the
+        # router was closed meanwhile.
+        if self.asyncio:
+            asyncio.ensure_future(self._aclose({location: client}, {location: channel}))
+        else:
+            client.transport.close()
+            channel.close()
+        if closed:
+            raise ValueError("The router is closed.")
+        return existing
+
+    def warm(self, locations: Iterable[str]) -> None:
+        """Create the clients for ``locations`` and start connecting."""
+        for location in locations:
+            self.client_for(location)
+            with self._lock:
+                channel = self._channels.get(location)
+            if channel is not None:
+                channel.connect()
+
+    def _dispatch(self, location: str):
+        client = self.client_for(location)
+        with self._lock:
+            self.calls[location] = self.calls.get(location, 0) + 1
+        return client
+
+    def _route(self, method: str) -> Callable:
+        def call(request=None, location=None, **kwargs):
+            if location is None:
+                location = self._request_location(request, kwargs)
+            return getattr(self._dispatch(location), method)(request, **kwargs)
+
+        def stream(requests=None, location=None, **kwargs):
+            if location is None:
+                requests = iter(requests)
+                first = next(requests, None)
+                location = self._request_location(first, {})
+                if first is not None:
+                    requests = itertools.chain((first,), requests)
+            return getattr(self._dispatch(location), method)(requests, **kwargs)
+
+        async def astream(requests=None, location=None, **kwargs):
+            if location is None:
+                requests = requests.__aiter__()
+                try:
+                    first = await requests.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                location = self._request_location(first, {})
+                if first is not None:
+                    requests = _prepend(first, requests)
+            return await getattr(self._dispatch(location), method)(requests, **kwargs)
+
+        if not method.startswith("streaming_"):
+            return call
+        return astream if self.asyncio else stream
+
+    def __getattr__(self, name: str):
+        if name not in self.__dict__.get("_rpcs", ()):
+            raise AttributeError(name)
+        return self._route(name)
+
+    def close(self):
+        """Close every client and channel.
+
+        For an async router, await the result.
+        """
+        with self._lock:
+            self._closed = True
+            clients, self._clients = self._clients, {}
+            channels, self._channels = self._channels, {}
+        if self.asyncio:
+            return self._aclose(clients, channels)
+        for location, client in clients.items():
+            client.transport.close()
+            channels[location].close()
+
+    async def _aclose(self, clients, channels):
+        for location, client in clients.items():
+            await client.transport.close()
+            await channels[location].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+__all__ = (
+    "GLOBAL_LOCATION",
+    "RegionalRouter",
+    "endpoint_for",
+)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Compiled resource name templates.
+
+An opt-in alternative to the ``*_path`` and ``parse_*_path`` helpers of
+the generated clients, for code that renders or parses many names. Each
+template, such as ``"projects/{project}/agent/intents/{intent}"``, is
+compiled once into a pattern and a printf-style format, rather than
+rebuilding them on every call:
+
+.. code-block:: python
+
+    from google.cloud.dialogflow_helpers import resource_names
+
+    intent = resource_names.path_template(
+        "projects/{project}/agent/intents/{intent}"
+    )
+    intent.render(project="p", intent="i")
+    intent.parse("projects/p/agent/intents/i")
+    intent.parse_many(names)
+
+Parsing matches the generated helpers exactly: every variable is a
+non-greedy ``.+?`` and a name that does not match parses to ``{}``.
+"""
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_VARIABLE = re.compile(r"\{(\w+)\}")
+
+
+class PathTemplate(object):
+    """A compiled resource name template.
+
+    Args:
+        template (str): The template, with ``{variable}`` segments.
+
+    Attributes:
+        template (str): The template.
+        variables (Tuple[str, ...]): Its variables, in order.
+        pattern (re.Pattern): The compiled parse pattern.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        literals = _VARIABLE.split(template)[::2]
+        self.variables: Tuple[str, ...] = tuple(_VARIABLE.findall(template))
+        self.pattern = re.compile(
+            "^{}$".format(
+                "".join(
+                    re.escape(literal) + "(?P<{}>.+?)".format(variable)
+                    for literal, variable in zip(literals, self.variables)
+                )
+                + re.escape(literals[-1])
+            )
+        )
+        self._format = "%s".join(literal.replace("%", "%%") for literal in literals)
+        self._match = self.pattern.match
+
+    def render(self, *args: str, **kwargs: str) -> str:
+        """Return the resource name for the template's variables.
+
+        Values are given by name, or positionally in template order.
+        """
+        if kwargs:
+            args += tuple(kwargs[variable] for variable in self.variables[len(args) :])
+        return self._format % args
+
+    def parse(self, path: str) -> Dict[str, str]:
+        """Return the variables of ``path``, or ``{}`` if it does not
+        match."""
+        m = self._match(path)
+        return m.groupdict() if m else {}
+
+    def parse_many(self, paths: Iterable[str]) -> List[Dict[str, str]]:
+        """Parse a batch of names; see :meth:`parse`."""
+        match = self._match
+        return [m.groupdict() if m else {} for m in map(match, paths)]
+
+    def matches(self, path: str) -> bool:
+        """Return whether ``path`` matches the template."""
+        return self._match(path) is not None
+
+    def __repr__(self):
+        return "PathTemplate({!r})".format(self.template)
+
+
+_templates: Dict[str, PathTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def path_template(template: str) -> PathTemplate:
+    """Return the shared compiled :class:`PathTemplate` for ``template``."""
+    try:
+        return _templates[template]
+    except KeyError:
+        with _templates_lock:
+            return _templates.setdefault(template, PathTemplate(template))
+
+
+def parse_many(
+    paths: Iterable[str], templates: Sequence[str]
+) -> List[Tuple[Optional[str], Dict[str, str]]]:
+    """Parse names that may match any of several templates.
+
+    Args:
+        paths (Iterable[str]): Resource names.
+        templates (Sequence[str]): Templates to try, in order.
+
+    Returns:
+        List[Tuple[Optional[str], Dict[str, str]]]: For each name, the
+        first matching template and its variables, or ``(None, {})``.
+    """
+    compiled = [path_template(template) for template in templates]
+    results = []
+    for path in paths:
+        for template in compiled:
+            variables = template.parse(path)
+            if variables:
+                results.append((template.template, variables))
+                break
+        else:
+            results.append((None, {}))
+    return results
+
+
+__all__ = (
+    "PathTemplate",
+    "parse_many",
+    "path_template",
+)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Mirror a session's active contexts locally.
+
+Every ``QueryResult`` carries the session's active contexts after the
+turn in ``output_contexts``, with their remaining lifespans. A
+:class:`SessionContexts` keeps a copy of them from each
+``detect_intent`` or ``analyze_content`` response, so routing code can
+read contexts without ``ContextsClient.list_contexts`` or
+``get_context`` calls. Writes are held until the next query and sent in
+its ``QueryParameters.contexts`` instead of a ``create_context`` call:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import session_contexts
+
+    sessions = dialogflow_v2.SessionsClient()
+    contexts = session_contexts.SessionContexts(
+        sessions.session_path("my-project", "my-session")
+    )
+    contexts.set_context("order-flow", lifespan_count=3, parameters={"id": 7})
+    response = contexts.detect_intent(sessions, query_input=query_input)
+    if contexts.get_context("awaiting-confirmation"):
+        ...
+
+Reads include pending writes. A context disappears when its lifespan
+runs out in a later response, or locally once the session has seen no
+turn for ``ttl`` seconds, matching the server's 20 minute expiry.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from google.cloud.dialogflow_v2.types import context as gcd_context
+from google.cloud.dialogflow_v2.types import participant, session
+
+#: Seconds after the last turn at which the server expires contexts.
+DEFAULT_TTL = 20 * 60.0
+
+_CONTEXTS = "/contexts/"
+
+
+def _context_id(name: str) -> str:
+    # The API treats context IDs case-insensitively and returns them in
+    # lower case.
+    return name.rsplit("/", 1)[-1].lower()
+
+
+def _has(message: Any, field: str) -> bool:
+    return field in type(message).meta.fields and field in message
+
+
+def query_result_of(response: Any) -> Optional[session.QueryResult]:
+    """Return the ``QueryResult`` in a (streaming) detect intent or
+    analyze content response, or ``None`` if it has none."""
+    if _has(response, "query_result"):
+        return response.query_result
+    if _has(response, "automated_agent_reply"):
+        reply = response.automated_agent_reply
+        if "detect_intent_response" in reply:
+            return reply.detect_intent_response.query_result
+    return None
+
+
+class SessionContexts(object):
+    """A local copy of one session's contexts.
+
+    Args:
+        session (str): The session, e.g.
+            ``projects/<Project ID>/agent/sessions/<Session ID>``. For
+            ``analyze_content`` it may be omitted and is then learned from
+            the first response with contexts.
+        ttl (float): Seconds without a turn after which all contexts
+            expire.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    def __init__(
+        self,
+        session: Optional[str] = None,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.session = session
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._contexts: Dict[str, gcd_context.Context] = {}
+        self._pending: Dict[str, gcd_context.Context] = {}
+        self._last_turn: Optional[float] = None
+
+    def _session(self) -> str:
+        if self.session is None:
+            raise ValueError(
+                "The session is not known yet; pass it to SessionContexts."
+            )
+        return self.session
+
+    def _expire(self):
+        if self._last_turn is not None and self._clock() - self._last_turn >= self.ttl:
+            self._contexts.clear()
+            self._last_turn = None
+
+    def _view(self) -> Dict[str, gcd_context.Context]:
+        self._expire()
+        view = dict(self._contexts)
+        for key, context in self._pending.items():
+            if context.lifespan_count > 0:
+                view[key] = context
+            else:
+                view.pop(key, None)
+        return view
+
+    def list_contexts(self) -> List[gcd_context.Context]:
+        """Return the active contexts, including pending writes."""
+        with self._lock:
+            return [gcd_context.Context(c) for c in self._view().values()]
+
+    def get_context(self, context_id: str) -> Optional[gcd_context.Context]:
+        """Return a context by ID or full name, or ``None`` if inactive."""
+        with self._lock:
+            context = self._view().get(_context_id(context_id))
+        return gcd_context.Context(context) if context is not None else None
+
+    def __contains__(self, context_id: str) -> bool:
+        with self._lock:
+            return _context_id(context_id) in self._view()
+
+    def set_context(
+        self,
+        context_id: str,
+        lifespan_count: int = 5,
+        parameters: Optional[Mapping[str, Any]] = None,
+    ) -> gcd_context.Context:
+        """Activate or replace a context with the next query.
+
+        Args:
+            context_id (str): The context ID or full name.
+            lifespan_count (int): Turns the context stays active for.
+            parameters (Mapping[str, Any]): The context parameters.
+
+        Returns:
+            google.cloud.dialogflow_v2.types.Context: The pending context.
+        """
+        if _CONTEXTS in context_id:
+            name = context_id
+        else:
+            name = self._session() + _CONTEXTS + context_id
+        context = gcd_context.Context(name=name, lifespan_count=lifespan_count)
+        if parameters:
+            context.parameters = dict(parameters)
+        with self._lock:
+            self._pending[_context_id(name)] = context
+        return context
+
+    def delete_context(self, context_id: str) -> None:
+        """Deactivate a context with the next query."""
+        self.set_context(context_id, lifespan_count=0)
+
+    @property
+    def pending(self) -> List[gcd_context.Context]:
+        """List[google.cloud.dialogflow_v2.types.Context]: Writes not yet
+        sent."""
+        with self._lock:
+            return list(self._pending.values())
+
+    def query_params(
+        self, query_params: Optional[session.QueryParameters] = None
+    ) -> session.QueryParameters:
+        """Return ``query_params`` with the pending writes added.
+
+        The writes are taken from the queue; pass the result of the query
+        to :meth:`observe`, or to :meth:`restore` with the writes if the
+        query failed.
+        """
+        return self._take(query_params)[0]
+
+    def _take(self, query_params):
+        params = session.QueryParameters(query_params or {})
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        # Contexts the caller set explicitly win over queued writes.
+        given = {_context_id(c.name) for c in params.contexts}
+        taken = [c for key, c in pending.items() if key not in given]
+        params.contexts.extend(taken)
+        return params, taken
+
+    def restore(self, contexts: List[gcd_context.Context]) -> None:
+        """Queue writes again after the query carrying them failed."""
+        with self._lock:
+            for context in contexts:
+                self._pending.setdefault(_context_id(context.name), context)
+
+    def observe(self, response: Any) -> bool:
+        """Update the mirror from a response.
+
+        Accepts ``DetectIntentResponse``, ``AnalyzeContentResponse`` and
+        their streaming counterparts.
+
+        Returns:
+            bool: Whether the response contained a query result.
+        """
+        result = query_result_of(response)
+        if result is None:
+            return False
+        with self._lock:
+            self._contexts = {
+                _context_id(c.name): c
+                for c in result.output_contexts
+                if c.lifespan_count > 0
+            }
+            if self.session is None and result.output_contexts:
+                self.session = result.output_contexts[0].name.split(_CONTEXTS)[0]
+            self._last_turn = self._clock()
+        return True
+
+    def load(self, contexts_client: Any) -> None:
+        """Replace the mirror with the server's contexts, e.g. when
+        resuming a session this process has not seen before."""
+        contexts = list(contexts_client.list_contexts(parent=self._session()))
+        with self._lock:
+            self._contexts = {_context_id(c.name): c for c in contexts}
+            self._last_turn = self._clock()
+
+    def _detect_intent_request(self, request, kwargs):
+        request = session.DetectIntentRequest(request or {})
+        for field in ("query_input", "output_audio_config"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        if not request.session:
+            request.session = self._session()
+        request.query_params, taken = self._take(
+            request.query_params if "query_params" in request else None
+        )
+        return request, taken
+
+    def _analyze_content_request(self, request, kwargs):
+        request = participant.AnalyzeContentRequest(request or {})
+        for field in ("participant", "text_input", "event_input"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        request.query_params, taken = self._take(
+            request.query_params if "query_params" in request else None
+        )
+        return request, taken
+
+    def detect_intent(self, client: Any, request=None, **kwargs):
+        """Call ``client.detect_intent`` with the pending writes.
+
+        ``query_input`` and ``output_audio_config`` may be given as keyword
+        arguments; ``session`` defaults to this session. Other keyword
+        arguments, such as ``timeout``, are passed to the client.
+        """
+        request, taken = self._detect_intent_request(request, kwargs)
+        try:
+            response = client.detect_intent(request=request, **kwargs)
+        except Exception:
+            self.restore(taken)
+            raise
+        self.observe(response)
+        return response
+
+    async def adetect_intent(self, client: Any, request=None, **kwargs):
+        """Like :meth:`detect_intent`, for ``SessionsAsyncClient``."""
+        request, taken = self._detect_intent_request(request, kwargs)
+        try:
+            response = await client.detect_intent(request=request, **kwargs)
+        except Exception:
+            self.restore(taken)
+            raise
+        self.observe(response)
+        return response
+
+    def analyze_content(self, client: Any, request=None, **kwargs):
+        """Call ``client.analyze_content`` with the pending writes.
+
+        ``participant``, ``text_input`` and ``event_input`` may be given as
+        keyword arguments. Other keyword arguments are passed to the client.
+        """
+        request, taken = self._analyze_content_request(request, kwargs)
+        try:
+            response = client.analyze_content(request=request, **kwargs)
+        except Exception:
+            self.restore(taken)
+            raise
+        self.observe(response)
+        return response
+
+    async def aanalyze_content(self, client: Any, request=None, **kwargs):
+        """Like :meth:`analyze_content`, for ``ParticipantsAsyncClient``."""
+        request, taken = self._analyze_content_request(request, kwargs)
+        try:
+            response = await client.analyze_content(request=request, **kwargs)
+        except Exception:
+            self.restore(taken)
+            raise
+        self.observe(response)
+        return response
+
+
+__all__ = (
+    "DEFAULT_TTL",
+    "SessionContexts",
+    "query_result_of",
+)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Send session entities only when they change.
+
+A :class:`SessionEntityManager` remembers a hash of the entities last
+sent for each session and entity type, and when the session will expire
+on the server. Setting the same entities again is free. Changed or
+expired entity types are attached to the next query through
+``QueryParameters.session_entity_types`` instead of a
+``SessionEntityTypesClient`` call:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import session_entities
+
+    manager = session_entities.SessionEntityManager()
+
+    def turn(sessions, session, user, query_input):
+        manager.set_entities(session, "contact", user.contacts)
+        return manager.detect_intent(
+            sessions, session=session, query_input=query_input
+        )
+
+When no query is coming, :meth:`SessionEntityManager.sync` pushes the
+changes with ``create_session_entity_type`` or
+``update_session_entity_type`` instead.
+
+The server drops a session's entity types together with the session,
+``ttl`` seconds after its last query; every query through the manager
+(or passed to :meth:`SessionEntityManager.touch`) extends that.
+"""
+import collections
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from google.api_core import exceptions as core_exceptions
+
+from google.cloud.dialogflow_v2.types import (
+    session_entity_type as gcd_session_entity_type,
+)
+from google.cloud.dialogflow_v2.types import entity_type, participant
+from google.cloud.dialogflow_v2.types import session as gcd_session
+
+#: Seconds after a session's last query at which the server drops it.
+DEFAULT_TTL = 20 * 60.0
+
+# Re-send entity types this long before they are due to expire, so a
+# query racing the expiry still finds them.
+_EXPIRY_MARGIN = 30.0
+
+_OverrideMode = gcd_session_entity_type.SessionEntityType.EntityOverrideMode
+
+#: Session entities replace the agent's entities of the type.
+OVERRIDE = _OverrideMode.ENTITY_OVERRIDE_MODE_OVERRIDE
+#: Session entities extend the agent's entities of the type.
+SUPPLEMENT = _OverrideMode.ENTITY_OVERRIDE_MODE_SUPPLEMENT
+
+Entities = Union[Mapping[str, Iterable[str]], Iterable[Any]]
+
+
+def _entities(entities: Entities) -> List[entity_type.EntityType.Entity]:
+    if isinstance(entities, Mapping):
+        return [
+            entity_type.EntityType.Entity(value=value, synonyms=list(synonyms))
+            for value, synonyms in entities.items()
+        ]
+    return [entity_type.EntityType.Entity(entity) for entity in entities]
+
+
+def entities_hash(
+    entities: Iterable[entity_type.EntityType.Entity], override_mode: int
+) -> str:
+    """Return a hash of an entity set that ignores ordering."""
+    canonical = sorted(
+        (entity.value, tuple(sorted(entity.synonyms))) for entity in entities
+    )
+    return hashlib.sha256(repr((int(override_mode), canonical)).encode()).hexdigest()
+
+
+class _EntityState(object):
+    def __init__(self):
+        self.desired: Optional[gcd_session_entity_type.SessionEntityType] = None
+        self.desired_hash: Optional[str] = None
+        self.sent_hash: Optional[str] = None
+
+
+class _SessionState(object):
+    def __init__(self, now: float):
+        self.entity_types: Dict[str, _EntityState] = {}
+        self.last_used = now
+        # The last query the server saw, if any.
+        self.last_query: Optional[float] = None
+
+
+class SessionEntityManager(object):
+    """Tracks the session entities sent for many sessions.
+
+    Args:
+        ttl (float): Seconds after a session's last query at which the
+            server drops its entity types.
+        clock (Callable[[], float]): Monotonic time source.
+
+    Attributes:
+        sent (int): Entity types sent inline or by RPC.
+        skipped (int): :meth:`set_entities` calls that changed nothing.
+    """
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self.sent = 0
+        self.skipped = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Least recently used first, for pruning.
+        self._sessions: "collections.OrderedDict[str, _SessionState]" = (
+            collections.OrderedDict()
+        )
+
+    def _prune(self, now: float):
+        # Sessions unused for ttl are gone on the server too.
+        while self._sessions:
+            state = next(iter(self._sessions.values()))
+            if now - state.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def _expired(self, state: _SessionState, now: float) -> bool:
+        if state.last_query is None:
+            return True
+        return now >= state.last_query + self.ttl - _EXPIRY_MARGIN
+
+    def _state(self, session: str, now: float) -> _SessionState:
+        self._prune(now)
+        state = self._sessions.get(session)
+        if state is None:
+            state = self._sessions[session] = _SessionState(now)
+        else:
+            self._sessions.move_to_end(session)
+        state.last_used = now
+        return state
+
+    def set_entities(
+        self,
+        session: str,
+        entity_type_name: str,
+        entities: Entities,
+        override_mode: int = OVERRIDE,
+    ) -> bool:
+        """Set a session's entities for an entity type.
+
+        Args:
+            session (str): The session name.
+            entity_type_name (str): The entity type's display name.
+            entities (Union[Mapping[str, Iterable[str]], Iterable[Entity]]):
+                A mapping of values to synonyms, or ``Entity`` messages or
+                dicts.
+            override_mode (int): ``OVERRIDE`` or ``SUPPLEMENT`` the agent's
+                entity type.
+
+        Returns:
+            bool: Whether the entities differ from those last set.
+        """
+        entities = _entities(entities)
+        digest = entities_hash(entities, override_mode)
+        with self._lock:
+            state = self._state(session, self._clock())
+            entity_state = state.entity_types.setdefault(
+                entity_type_name, _EntityState()
+            )
+            if entity_state.desired_hash == digest:
+                self.skipped += 1
+                return False
+            entity_state.desired_hash = digest
+            entity_state.desired = gcd_session_entity_type.SessionEntityType(
+                name="{}/entityTypes/{}".format(session, entity_type_name),
+                entity_override_mode=override_mode,
+                entities=entities,
+            )
+        return True
+
+    def forget(self, session: str) -> None:
+        """Drop all state for a session, e.g. when it ends."""
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def pending(self, session: str) -> List[gcd_session_entity_type.SessionEntityType]:
+        """Return the entity types the server is missing for a session.
+
+        These are the changed ones, or all of them if the session may have
+        expired on the server.
+        """
+        with self._lock:
+            return [desired for _, desired in self._pending(session, self._clock())]
+
+    def _pending(self, session, now):
+        state = self._sessions.get(session)
+        if state is None:
+            return []
+        expired = self._expired(state, now)
+        return [
+            (key, entity_state.desired)
+            for key, entity_state in state.entity_types.items()
+            if entity_state.desired is not None
+            and (expired or entity_state.sent_hash != entity_state.desired_hash)
+        ]
+
+    def touch(self, session: str, sent: Iterable[Tuple[str, str]] = ()) -> None:
+        """Record a successful query in a session.
+
+        Args:
+            session (str): The session name.
+            sent (Iterable[Tuple[str, str]]): ``(entity type, hash)`` pairs
+                that the query carried.
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None:
+                return
+            if self._expired(state, now):
+                # The server may have dropped whatever was not re-sent.
+                for entity_state in state.entity_types.values():
+                    entity_state.sent_hash = None
+            self._mark_sent(state, sent)
+            state.last_query = now
+            state.last_used = now
+            self._sessions.move_to_end(session)
+
+    def _mark_sent(self, state: _SessionState, sent: Iterable[Tuple[str, str]]):
+        for key, digest in sent:
+            entity_state = state.entity_types.get(key)
+            if entity_state is not None:
+                entity_state.sent_hash = digest
+                self.sent += 1
+
+    def query_params(
+        self, session: str, query_params: Optional[gcd_session.QueryParameters] = None
+    ) -> Tuple[gcd_session.QueryParameters, List[Tuple[str, str]]]:
+        """Attach a session's missing entity types to ``query_params``.
+
+        Returns:
+            Tuple[QueryParameters, List[Tuple[str, str]]]: The parameters,
+            and what they carry to pass to :meth:`touch` once the query
+            succeeds.
+        """
+        params = gcd_session.QueryParameters(query_params or {})
+        given = {s.name for s in params.session_entity_types}
+        with self._lock:
+            pending, sent = self._take(session)
+        params.session_entity_types.extend(
+            desired for desired in pending if desired.name not in given
+        )
+        return params, sent
+
+    def _take(self, session):
+        pending = self._pending(session, self._clock())
+        state = self._sessions.get(session)
+        sent = [(key, state.entity_types[key].desired_hash) for key, _ in pending]
+        return [desired for _, desired in pending], sent
+
+    def sync(self, client: Any, session: str, **kwargs) -> int:
+        """Push a session's missing entity types with ``client``, a
+        ``SessionEntityTypesClient``.
+
+        Keyword arguments, such as ``timeout``, are passed to the client.
+        Creating or updating entity types does not extend the session's
+        lifetime on the server, so only a query (:meth:`touch`) does.
+
+        Returns:
+            int: The number of entity types sent.
+        """
+        with self._lock:
+            pending, sent = self._take(session)
+        for desired in pending:
+            try:
+                client.update_session_entity_type(session_entity_type=desired, **kwargs)
+            except core_exceptions.NotFound:
+                client.create_session_entity_type(
+                    parent=session, session_entity_type=desired, **kwargs
+                )
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is not None:
+                self._mark_sent(state, sent)
+        return len(sent)
+
+    def detect_intent(self, client: Any, request=None, **kwargs):
+        """Call ``client.detect_intent`` with the session's missing entity
+        types attached.
+
+        ``session`` and ``query_input`` may be given as keyword arguments.
+        Other keyword arguments, such as ``timeout``, are passed to the
+        client.
+        """
+        request = gcd_session.DetectIntentRequest(request or {})
+        for field in ("session", "query_input"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        request.query_params, sent = self.query_params(
+            request.session,
+            request.query_params if "query_params" in request else None,
+        )
+        response = client.detect_intent(request=request, **kwargs)
+        self.touch(request.session, sent)
+        return response
+
+    def analyze_content(self, client: Any, session: str, request=None, **kwargs):
+        """Call ``client.analyze_content`` with the missing entity types of
+        ``session``, the conversation's session.
+
+        ``participant``, ``text_input`` and ``event_input`` may be given as
+        keyword arguments. Other keyword arguments are passed to the client.
+        """
+        request = participant.AnalyzeContentRequest(request or {})
+        for field in ("participant", "text_input", "event_input"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        request.query_params, sent = self.query_params(
+            session, request.query_params if "query_params" in request else None
+        )
+        response = client.analyze_content(request=request, **kwargs)
+        self.touch(session, sent)
+        return response
+
+
+__all__ = (
+    "DEFAULT_TTL",
+    "OVERRIDE",
+    "SUPPLEMENT",
+    "SessionEntityManager",
+    "entities_hash",
+)
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""One gRPC channel shared by every Dialogflow service client.
+
+Each generated client normally creates its own channel, so an application
+using several services opens one connection per service, and resolves
+credentials for each. :class:`SharedChannel` creates the channel (or a
+small round-robin pool of channels) once and hands reference-counted
+handles to the transports of any number of clients:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import shared_channel
+
+    with shared_channel.SharedChannel() as channel:
+        sessions = channel.client(dialogflow_v2.SessionsClient)
+        contexts = channel.client(dialogflow_v2.ContextsClient)
+        intents = channel.client(dialogflow_v2.IntentsClient)
+        ...
+
+Closing a client (including leaving its ``with`` block) only releases its
+handle. The underlying channels are closed once the :class:`SharedChannel`
+and every client created from it have been closed.
+"""
+import itertools
+import threading
+from typing import Any, Callable, List, Optional, Sequence
+
+from google.auth import credentials as ga_credentials  # type: ignore
+import grpc  # type: ignore
+from grpc.experimental import aio  # type: ignore
+
+from google.cloud.dialogflow_v2.services.sessions.transports import (
+    SessionsGrpcAsyncIOTransport,
+    SessionsGrpcTransport,
+)
+
+_CHANNEL_OPTIONS = [
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+
+class _RoundRobin(object):
+    """Spreads calls over one multicallable per channel."""
+
+    def __init__(self, callables: Sequence[Any]):
+        self._callables = list(callables)
+        self._next = itertools.cycle(self._callables).__next__
+
+    def __call__(self, *args, **kwargs):
+        return self._next()(*args, **kwargs)
+
+    def with_call(self, *args, **kwargs):
+        return self._next().with_call(*args, **kwargs)
+
+    def future(self, *args, **kwargs):
+        return self._next().future(*args, **kwargs)
+
+
+# ``google.api_core`` only wraps multicallables it recognises by type.
+class _UnaryUnary(_RoundRobin, grpc.UnaryUnaryMultiCallable):
+    pass
+
+
+class _UnaryStream(_RoundRobin, grpc.UnaryStreamMultiCallable):
+    pass
+
+
+class _StreamUnary(_RoundRobin, grpc.StreamUnaryMultiCallable):
+    pass
+
+
+class _StreamStream(_RoundRobin, grpc.StreamStreamMultiCallable):
+    pass
+
+
+class _AioUnaryUnary(_RoundRobin, aio.UnaryUnaryMultiCallable):
+    pass
+
+
+class _AioUnaryStream(_RoundRobin, aio.UnaryStreamMultiCallable):
+    pass
+
+
+class _AioStreamUnary(_RoundRobin, aio.StreamUnaryMultiCallable):
+    pass
+
+
+class _AioStreamStream(_RoundRobin, aio.StreamStreamMultiCallable):
+    pass
+
+
+class _PoolMixin(object):
+    _multicallables: Sequence[type] = ()
+
+    def __init__(self, channels):
+        self._channels = list(channels)
+
+    def _round_robin(self, kind, index, method, args, kwargs):
+        return self._multicallables[index](
+            [
+                getattr(channel, kind)(method, *args, **kwargs)
+                for channel in self._channels
+            ]
+        )
+
+    def unary_unary(self, method, *args, **kwargs):
+        return self._round_robin("unary_unary", 0, method, args, kwargs)
+
+    def unary_stream(self, method, *args, **kwargs):
+        return self._round_robin("unary_stream", 1, method, args, kwargs)
+
+    def stream_unary(self, method, *args, **kwargs):
+        return self._round_robin("stream_unary", 2, method, args, kwargs)
+
+    def stream_stream(self, method, *args, **kwargs):
+        return self._round_robin("stream_stream", 3, method, args, kwargs)
+
+
+class _ChannelPool(_PoolMixin, grpc.Channel):
+    """A ``grpc.Channel`` spreading calls over several channels."""
+
+    _multicallables = (_UnaryUnary, _UnaryStream, _StreamUnary, _StreamStream)
+
+    def subscribe(self, callback, try_to_connect=False):
+        for channel in self._channels:
+            channel.subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        for channel in self._channels:
+            channel.unsubscribe(callback)
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class _AioChannelPool(_PoolMixin, aio.Channel):
+    """An ``aio.Channel`` spreading calls over several channels."""
+
+    _multicallables = (
+        _AioUnaryUnary,
+        _AioUnaryStream,
+        _AioStreamUnary,
+        _AioStreamStream,
+    )
+
+    def get_state(self, try_to_connect=False):
+        states = [
+            channel.get_state(try_to_connect=try_to_connect)
+            for channel in self._channels
+        ]
+        if grpc.ChannelConnectivity.READY in states:
+            return grpc.ChannelConnectivity.READY
+        return states[0]
+
+    async def wait_for_state_change(self, last_observed_state):
+        await self._channels[0].wait_for_state_change(last_observed_state)
+
+    async def channel_ready(self):
+        for channel in self._channels:
+            await channel.channel_ready()
+
+    async def close(self, grace=None):
+        for channel in self._channels:
+            await channel.close(grace)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class _Handle(object):
+    """Delegates to the shared channel; closing releases one reference."""
+
+    def __init__(self, shared: "SharedChannel"):
+        self._shared = shared
+        self._channel = shared._channel
+        self._released = False
+
+    def _release_once(self) -> bool:
+        with self._shared._lock:
+            released, self._released = self._released, True
+        return not released
+
+    def unary_unary(self, method, *args, **kwargs):
+        return self._channel.unary_unary(method, *args, **kwargs)
+
+    def unary_stream(self, method, *args, **kwargs):
+        return self._channel.unary_stream(method, *args, **kwargs)
+
+    def stream_unary(self, method, *args, **kwargs):
+        return self._channel.stream_unary(method, *args, **kwargs)
+
+    def stream_stream(self, method, *args, **kwargs):
+        return self._channel.stream_stream(method, *args, **kwargs)
+
+
+class _ChannelHandle(_Handle, grpc.Channel):
+    def subscribe(self, callback, try_to_connect=False):
+        self._channel.subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        self._channel.unsubscribe(callback)
+
+    def close(self):
+        if self._release_once():
+            self._shared._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class _AioChannelHandle(_Handle, aio.Channel):
+    def get_state(self, try_to_connect=False):
+        return self._channel.get_state(try_to_connect=try_to_connect)
+
+    async def wait_for_state_change(self, last_observed_state):
+        await self._channel.wait_for_state_change(last_observed_state)
+
+    async def channel_ready(self):
+        await self._channel.channel_ready()
+
+    async def close(self, grace=None):
+        if self._release_once():
+            await self._shared._arelease(grace)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class SharedChannel(object):
+    """A gRPC channel, or pool of channels, shared by service clients.
+
+    The constructor arguments mirror those of the generated gRPC
+    transports.
+
+    Args:
+        host (str): The API endpoint, e.g. a regional
+            ``"us-central1-dialogflow.googleapis.com"``.
+        credentials (google.auth.credentials.Credentials): Credentials;
+            resolved from the environment if omitted.
+        credentials_file (str): A file to load credentials from.
+        scopes (Sequence[str]): OAuth scopes; defaults to the Dialogflow
+            scopes.
+        quota_project_id (str): A project to use for billing and quota.
+        ssl_credentials (grpc.ChannelCredentials): SSL credentials for the
+            channel.
+        pool_size (int): Number of channels to spread calls over. Each
+            channel has its own connection; more than one helps when a
+            single HTTP/2 connection's concurrent stream limit is reached.
+        options (Sequence[Tuple[str, Any]]): Additional channel options.
+        asyncio (bool): Create ``grpc.aio`` channels for the async clients.
+        channels (Sequence[grpc.Channel]): Use these channels instead of
+            creating them, e.g. insecure channels to a local server. They
+            are closed with the shared channel.
+    """
+
+    def __init__(
+        self,
+        host: str = SessionsGrpcTransport.DEFAULT_HOST,
+        credentials: Optional[ga_credentials.Credentials] = None,
+        credentials_file: Optional[str] = None,
+        scopes: Optional[Sequence[str]] = None,
+        quota_project_id: Optional[str] = None,
+        ssl_credentials: Optional[grpc.ChannelCredentials] = None,
+        pool_size: int = 1,
+        options: Optional[Sequence] = None,
+        asyncio: bool = False,
+        channels: Optional[Sequence[Any]] = None,
+    ):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1.")
+        self.host = host
+        self.asyncio = asyncio
+        self._lock = threading.Lock()
+        # The SharedChannel itself holds one reference until closed.
+        self._refs = 1
+        self._held = True
+        self._closed = False
+        if channels is None:
+            transport_class = (
+                SessionsGrpcAsyncIOTransport if asyncio else SessionsGrpcTransport
+            )
+            channel_options = _CHANNEL_OPTIONS + list(options or ())
+            if pool_size > 1:
+                # Otherwise channels with equal arguments share connections.
+                channel_options.append(("grpc.use_local_subchannel_pool", 1))
+            if ":" not in host:
+                host += ":443"
+            channels = [
+                transport_class.create_channel(
+                    host,
+                    credentials=credentials,
+                    credentials_file=credentials_file,
+                    scopes=scopes,
+                    ssl_credentials=ssl_credentials,
+                    quota_project_id=quota_project_id,
+                    options=channel_options,
+                )
+                for _ in range(pool_size)
+            ]
+        if not channels:
+            raise ValueError("At least one channel is required.")
+        self._channels: List[Any] = list(channels)
+        if len(self._channels) == 1:
+            self._channel = self._channels[0]
+        elif asyncio:
+            self._channel = _AioChannelPool(self._channels)
+        else:
+            self._channel = _ChannelPool(self._channels)
+
+    @property
+    def references(self) -> int:
+        """int: Open handles, including the one held by this object until
+        :meth:`close`."""
+        return self._refs
+
+    @property
+    def closed(self) -> bool:
+        """bool: Whether the underlying channels have been closed."""
+        return self._closed
+
+    def acquire(self):
+        """Return a new handle to the shared channel.
+
+        The handle is a ``grpc.Channel`` (or ``grpc.aio.Channel``) whose
+        ``close()`` releases the reference instead of closing the channel.
+
+        Raises:
+            ValueError: If the channel has already been closed.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("The shared channel is closed.")
+            self._refs += 1
+        if self.asyncio:
+            return _AioChannelHandle(self)
+        return _ChannelHandle(self)
+
+    def _drop(self) -> bool:
+        with self._lock:
+            self._refs -= 1
+            if self._refs or self._closed:
+                return False
+            self._closed = True
+            return True
+
+    def _release(self):
+        if self._drop():
+            self._channel.close()
+
+    async def _arelease(self, grace=None):
+        if self._drop():
+            await self._channel.close(grace)
+
+    def transport(self, transport_class: Callable, **kwargs):
+        """Return an instance of ``transport_class`` using a new handle.
+
+        ``transport_class`` must be a gRPC transport matching ``asyncio``.
+        Additional keyword arguments are passed to it.
+        """
+        if transport_class.__name__.endswith("AsyncIOTransport") != self.asyncio:
+            raise ValueError(
+                "{} does not match a shared channel with asyncio={}.".format(
+                    transport_class.__name__, self.asyncio
+                )
+            )
+        return transport_class(host=self.host, channel=self.acquire(), **kwargs)
+
+    def client(self, client_class: Callable, **kwargs):
+        """Return ``client_class`` using a new handle.
+
+        Works with any v2 or v2beta1 client, sync or async depending on
+        ``asyncio``. Additional keyword arguments are passed to the client.
+        """
+        transport_class = client_class.get_transport_class(
+            "grpc_asyncio" if self.asyncio else "grpc"
+        )
+        return client_class(transport=self.transport(transport_class), **kwargs)
+
+    def connect(self):
+        """Start connecting the underlying channels without waiting.
+
+        Channels otherwise connect on their first call, which then pays for
+        the TLS handshake.
+        """
+        for channel in self._channels:
+            if self.asyncio:
+                channel.get_state(try_to_connect=True)
+            else:
+                channel.subscribe(_ignore_state, try_to_connect=True)
+                channel.unsubscribe(_ignore_state)
+
+    def close(self):
+        """Release this object's reference.
+
+        The channels are closed now if no clients remain, otherwise when the
+        last one is closed. For an asyncio shared channel, await the result.
+        """
+        with self._lock:
+            held, self._held = self._held, False
+        if self.asyncio:
+            return self._arelease() if held else _noop()
+        if held:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def _ignore_state(state):
+    pass
+
+
+async def _noop():
+    return None
+
+
+__all__ = ("SharedChannel",)
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Latency breakdowns for streaming audio calls.
+
+When ``enable_debugging_info`` is set on the first request of a
+``streaming_detect_intent`` or ``streaming_analyze_content`` call, the
+service attaches a
+:class:`~google.cloud.dialogflow_v2.types.CloudConversationDebuggingInfo` to
+its responses. :class:`StreamLatencyTracker` combines it with timestamps
+taken on the client while the stream is running:
+
+.. code-block:: python
+
+    from google.cloud.dialogflow_helpers import streaming_latency
+
+    tracker = streaming_latency.StreamLatencyTracker()
+    for response in tracker.streaming_detect_intent(client, requests):
+        ...
+
+    breakdown = tracker.breakdowns[-1]
+    print(breakdown.time_to_first_partial, breakdown.post_half_close_latency)
+    print(tracker.summary())
+
+Client-side durations describe our own audio pipeline (how long it took to
+produce the first chunk, how long we kept sending after the service asked
+us to stop), while the remaining ones are measured by the service or are
+dominated by it.
+"""
+import datetime
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from google.cloud.dialogflow_helpers.instrumentation import Histogram
+from google.cloud.dialogflow_v2.types import participant, session
+
+_END_OF_SINGLE_UTTERANCE = (
+    session.StreamingRecognitionResult.MessageType.END_OF_SINGLE_UTTERANCE
+)
+_TRANSCRIPT = session.StreamingRecognitionResult.MessageType.TRANSCRIPT
+
+
+def _seconds(value: Optional[datetime.timedelta]) -> Optional[float]:
+    return value.total_seconds() if value else None
+
+
+def _between(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return end - start
+
+
+class LatencyBreakdown(object):
+    """Latency components of a single streaming call, in seconds.
+
+    Any component that could not be measured (e.g. because the stream was
+    text only, or the service did not return debugging info) is ``None``.
+
+    Attributes:
+        session (str): The session or participant the stream was sent to.
+        first_chunk_delay (float): Client-side: from opening the stream to
+            handing the first audio chunk to gRPC.
+        send_duration (float): Client-side: from the first to the last
+            audio chunk.
+        time_to_first_partial (float): From the first audio chunk to the
+            first partial transcript.
+        time_to_final_transcript (float): From the first audio chunk to the
+            first final transcript.
+        half_close_lag (float): Client-side: from receiving
+            ``END_OF_SINGLE_UTTERANCE`` to half-closing the request stream.
+            Large values mean the request generator kept producing audio
+            after the service stopped listening.
+        post_half_close_latency (float): From half-closing the request
+            stream to receiving the final response (query result or
+            agent reply).
+        total (float): From opening the stream to the final response.
+        audio_chunks (int): Number of audio chunks sent by the client.
+        audio_bytes (int): Audio bytes sent by the client.
+        server_audio_chunks (int): Audio chunks the service saw.
+        first_audio_duration (float): Server-side: duration of the first
+            audio chunk.
+        speech_end_offset (float): Server-side: end of speech relative to
+            the start of the audio.
+        endpointing_delay (float): Server-side: from the end of speech to
+            the end-of-single-utterance signal, in audio time.
+        speech_partial_offsets (List[float]): Server-side offsets of partial
+            speech results, relative to the start of the stream.
+        no_speech_timeout (float): Server-side no-speech timeout in effect.
+        streaming_lag (float): How far the client's half-close in streaming
+            time trailed its half-close in audio time. Positive values mean
+            audio was sent slower than real time.
+    """
+
+    def __init__(self, session_name: str):
+        self.session = session_name
+        self.first_chunk_delay: Optional[float] = None
+        self.send_duration: Optional[float] = None
+        self.time_to_first_partial: Optional[float] = None
+        self.time_to_final_transcript: Optional[float] = None
+        self.half_close_lag: Optional[float] = None
+        self.post_half_close_latency: Optional[float] = None
+        self.total: Optional[float] = None
+        self.audio_chunks = 0
+        self.audio_bytes = 0
+        self.server_audio_chunks: Optional[int] = None
+        self.first_audio_duration: Optional[float] = None
+        self.speech_end_offset: Optional[float] = None
+        self.endpointing_delay: Optional[float] = None
+        self.speech_partial_offsets: List[float] = []
+        self.no_speech_timeout: Optional[float] = None
+        self.streaming_lag: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the breakdown as a plain dictionary."""
+        return dict(vars(self))
+
+    def __repr__(self):
+        return "LatencyBreakdown({})".format(
+            ", ".join(
+                "{}={!r}".format(k, v)
+                for k, v in vars(self).items()
+                if v is not None and k != "speech_partial_offsets"
+            )
+        )
+
+
+# Components that are aggregated into histograms by the tracker.
+HISTOGRAM_COMPONENTS = (
+    "first_chunk_delay",
+    "send_duration",
+    "time_to_first_partial",
+    "time_to_final_transcript",
+    "half_close_lag",
+    "post_half_close_latency",
+    "total",
+    "endpointing_delay",
+    "streaming_lag",
+)
+
+
+class StreamTimeline(object):
+    """Client-side timestamps and server debugging info of one stream.
+
+    Wrap the request iterator with :meth:`requests` and the response
+    iterator with :meth:`responses` (or use one of the tracker's
+    convenience methods), then call :meth:`breakdown` once the stream has
+    finished.
+    """
+
+    def __init__(self, tracker: Optional["StreamLatencyTracker"] = None):
+        self._tracker = tracker
+        self.session = ""
+        self.opened = time.perf_counter()
+        self.first_chunk_sent: Optional[float] = None
+        self.last_chunk_sent: Optional[float] = None
+        self.half_closed: Optional[float] = None
+        self.first_partial_received: Optional[float] = None
+        self.first_final_received: Optional[float] = None
+        self.end_of_utterance_received: Optional[float] = None
+        self.final_response_received: Optional[float] = None
+        self.closed: Optional[float] = None
+        self.audio_chunks = 0
+        self.audio_bytes = 0
+        self.debugging_info: Optional[session.CloudConversationDebuggingInfo] = None
+
+    # Requests -------------------------------------------------------------
+
+    def _on_request(self, request):
+        now = time.perf_counter()
+        if not self.session:
+            self.session = getattr(request, "session", "") or getattr(
+                request, "participant", ""
+            )
+        if request.input_audio:
+            self.audio_chunks += 1
+            self.audio_bytes += len(request.input_audio)
+            if self.first_chunk_sent is None:
+                self.first_chunk_sent = now
+            self.last_chunk_sent = now
+
+    def _on_half_close(self):
+        self.half_closed = time.perf_counter()
+
+    def requests(self, requests):
+        """Wrap a (sync or async) request iterator, recording when audio
+        chunks are sent and when the stream is half-closed."""
+        if hasattr(requests, "__aiter__"):
+            return self._arequests(requests)
+        return self._requests(requests)
+
+    def _requests(self, requests: Iterable) -> Iterator:
+        for request in requests:
+            self._on_request(request)
+            yield request
+        self._on_half_close()
+
+    async def _arequests(self, requests: AsyncIterator) -> AsyncIterator:
+        async for request in requests:
+            self._on_request(request)
+            yield request
+        self._on_half_close()
+
+    # Responses ------------------------------------------------------------
+
+    def _on_response(self, response):
+        now = time.perf_counter()
+        if "recognition_result" in response:
+            result = response.recognition_result
+            if result.message_type == _END_OF_SINGLE_UTTERANCE:
+                if self.end_of_utterance_received is None:
+                    self.end_of_utterance_received = now
+            elif result.message_type == _TRANSCRIPT:
+                if result.is_final:
+                    if self.first_final_received is None:
+                        self.first_final_received = now
+                elif self.first_partial_received is None:
+                    self.first_partial_received = now
+        elif self.final_response_received is None:
+            self.final_response_received = now
+        if "debugging_info" in response:
+            self.debugging_info = response.debugging_info
+
+    def _on_close(self):
+        if self.closed is None:
+            self.closed = time.perf_counter()
+            if self._tracker is not None:
+                self._tracker._add(self.breakdown())
+
+    def responses(self, responses):
+        """Wrap a (sync or async) response iterator. The stream's breakdown
+        is reported to the tracker once the iterator is exhausted."""
+        if hasattr(responses, "__aiter__"):
+            return self._aresponses(responses)
+        return self._responses(responses)
+
+    def _responses(self, responses: Iterable) -> Iterator:
+        try:
+            for response in responses:
+                self._on_response(response)
+                yield response
+        finally:
+            self._on_close()
+
+    async def _aresponses(self, responses: AsyncIterator) -> AsyncIterator:
+        try:
+            async for response in responses:
+                self._on_response(response)
+                yield response
+        finally:
+            self._on_close()
+
+    # Breakdown ------------------------------------------------------------
+
+    def breakdown(self) -> LatencyBreakdown:
+        """Compute the :class:`LatencyBreakdown` from what has been observed
+        so far."""
+        result = LatencyBreakdown(self.session)
+        result.audio_chunks = self.audio_chunks
+        result.audio_bytes = self.audio_bytes
+        result.first_chunk_delay = _between(self.opened, self.first_chunk_sent)
+        result.send_duration = _between(self.first_chunk_sent, self.last_chunk_sent)
+        result.time_to_first_partial = _between(
+            self.first_chunk_sent, self.first_partial_received
+        )
+        result.time_to_final_transcript = _between(
+            self.first_chunk_sent, self.first_final_received
+        )
+        half_close_lag = _between(self.end_of_utterance_received, self.half_closed)
+        if half_close_lag is not None:
+            # Half-closing before the service asked for it costs nothing.
+            result.half_close_lag = max(half_close_lag, 0.0)
+        result.post_half_close_latency = _between(
+            self.half_closed, self.final_response_received
+        )
+        result.total = _between(self.opened, self.final_response_received)
+
+        info = self.debugging_info
+        if info is not None:
+            result.server_audio_chunks = info.audio_data_chunks
+            result.first_audio_duration = _seconds(info.first_audio_duration)
+            result.speech_end_offset = _seconds(info.result_end_time_offset)
+            result.speech_partial_offsets = [
+                offset.total_seconds()
+                for offset in info.speech_partial_results_end_times
+            ]
+            result.no_speech_timeout = _seconds(info.no_speech_timeout)
+            result.endpointing_delay = _between(
+                result.speech_end_offset,
+                _seconds(info.single_utterance_end_time_offset),
+            )
+            result.streaming_lag = _between(
+                _seconds(info.client_half_close_time_offset),
+                _seconds(info.client_half_close_streaming_time_offset),
+            )
+        return result
+
+
+class StreamLatencyTracker(object):
+    """Collects :class:`LatencyBreakdown` for many streams and aggregates
+    them into histograms.
+
+    Args:
+        keep (int): Number of most recent breakdowns kept in
+            :attr:`breakdowns`. Histograms cover every stream regardless.
+    """
+
+    def __init__(self, keep: int = 1000):
+        self._keep = keep
+        self._lock = threading.Lock()
+        self.breakdowns: List[LatencyBreakdown] = []
+        self.histograms: Dict[str, Histogram] = {
+            name: Histogram() for name in HISTOGRAM_COMPONENTS
+        }
+
+    def timeline(self) -> StreamTimeline:
+        """Start tracking a new stream."""
+        return StreamTimeline(self)
+
+    def _add(self, breakdown: LatencyBreakdown):
+        with self._lock:
+            self.breakdowns.append(breakdown)
+            del self.breakdowns[: -self._keep]
+            for name, histogram in self.histograms.items():
+                value = getattr(breakdown, name)
+                if value is not None:
+                    histogram.add(max(value, 0.0))
+
+    def summary(self, percentiles=(50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """Return ``{component: {"count": n, "p50": ..., ...}}`` for every
+        component that has been observed at least once."""
+        with self._lock:
+            summary = {}
+            for name, histogram in self.histograms.items():
+                if not histogram.count:
+                    continue
+                stats = {"count": histogram.count, "mean": histogram.mean}
+                for percent in percentiles:
+                    stats["p{}".format(percent)] = histogram.percentile(percent)
+                summary[name] = stats
+            return summary
+
+    @staticmethod
+    def _enable_debugging_info(requests, first_type):
+        first = True
+        for request in requests:
+            if first:
+                request = first_type(request)
+                request.enable_debugging_info = True
+                first = False
+            yield request
+
+    @staticmethod
+    async def _aenable_debugging_info(requests, first_type):
+        first = True
+        async for request in requests:
+            if first:
+                request = first_type(request)
+                request.enable_debugging_info = True
+                first = False
+            yield request
+
+    def _stream(self, method, request_type, requests, kwargs):
+        timeline = self.timeline()
+        if hasattr(requests, "__aiter__"):
+            requests = self._aenable_debugging_info(requests, request_type)
+        else:
+            requests = self._enable_debugging_info(requests, request_type)
+        return timeline, method(requests=timeline.requests(requests), **kwargs)
+
+    def streaming_detect_intent(self, client, requests, **kwargs):
+        """Call ``client.streaming_detect_intent`` with debugging info
+        enabled, tracking the stream.
+
+        Works with :class:`~google.cloud.dialogflow_v2.SessionsClient`. For
+        the async client use :meth:`streaming_detect_intent_async`.
+
+        Returns:
+            Iterator[google.cloud.dialogflow_v2.types.StreamingDetectIntentResponse]
+        """
+        timeline, responses = self._stream(
+            client.streaming_detect_intent,
+            session.StreamingDetectIntentRequest,
+            requests,
+            kwargs,
+        )
+        return timeline.responses(responses)
+
+    async def streaming_detect_intent_async(self, client, requests, **kwargs):
+        """Async variant of :meth:`streaming_detect_intent` for
+        :class:`~google.cloud.dialogflow_v2.SessionsAsyncClient`.
+
+        Returns:
+            AsyncIterator[google.cloud.dialogflow_v2.types.StreamingDetectIntentResponse]
+        """
+        timeline, responses = self._stream(
+            client.streaming_detect_intent,
+            session.StreamingDetectIntentRequest,
+            requests,
+            kwargs,
+        )
+        return timeline.responses(await responses)
+
+    def streaming_analyze_content(self, client, requests, **kwargs):
+        """Call ``client.streaming_analyze_content`` with debugging info
+        enabled, tracking the stream.
+
+        Returns:
+            Iterator[google.cloud.dialogflow_v2.types.StreamingAnalyzeContentResponse]
+        """
+        timeline, responses = self._stream(
+            client.streaming_analyze_content,
+            participant.StreamingAnalyzeContentRequest,
+            requests,
+            kwargs,
+        )
+        return timeline.responses(responses)
+
+    async def streaming_analyze_content_async(self, client, requests, **kwargs):
+        """Async variant of :meth:`streaming_analyze_content` for
+        :class:`~google.cloud.dialogflow_v2.ParticipantsAsyncClient`.
+
+        Returns:
+            AsyncIterator[google.cloud.dialogflow_v2.types.StreamingAnalyzeContentResponse]
+        """
+        timeline, responses = self._stream(
+            client.streaming_analyze_content,
+            participant.StreamingAnalyzeContentRequest,
+            requests,
+            kwargs,
+        )
+        return timeline.responses(await responses)
+
+
+__all__ = (
+    "HISTOGRAM_COMPONENTS",
+    "LatencyBreakdown",
+    "StreamLatencyTracker",
+    "StreamTimeline",
+)
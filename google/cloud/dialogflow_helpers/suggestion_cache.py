@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Cache agent assist suggestions per participant and message.
+
+``suggest_articles``, ``suggest_faq_answers`` and
+``suggest_smart_replies`` compute suggestions for a participant from the
+conversation up to ``latest_message``. The answer only changes when a
+message is added, yet agent desktops tend to ask again on every render.
+A :class:`SuggestionCache` keeps the responses, keyed by participant,
+feature, latest message and context size, and is also fed the
+suggestions ``analyze_content`` already returns, so most lookups never
+reach the server:
+
+.. code-block:: python
+
+    from google.cloud import dialogflow_v2
+    from google.cloud.dialogflow_helpers import suggestion_cache
+
+    participants = dialogflow_v2.ParticipantsClient()
+    cache = suggestion_cache.SuggestionCache()
+
+    response = cache.analyze_content(
+        participants, participant=end_user, text_input=text_input
+    )
+    ...
+    faqs = cache.suggest_faq_answers(participants, parent=human_agent)
+
+``AnalyzeContentResponse`` does not name the participants its
+``human_agent_suggestion_results`` and ``end_user_suggestion_results``
+are for. The cache learns them from the ``message`` of each response, or
+they can be given to :meth:`SuggestionCache.observe` and
+:meth:`SuggestionCache.set_participant`.
+
+A request without ``latest_message`` means the latest message of the
+conversation, which the cache only knows if every message went through
+it. Requests with ``assist_query_params`` or ``current_text_input`` are
+not cached.
+"""
+import collections
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud.dialogflow_v2.types import conversation_profile
+from google.cloud.dialogflow_v2.types import participant as gcd_participant
+
+Feature = conversation_profile.SuggestionFeature.Type
+Role = gcd_participant.Participant.Role
+
+#: The context size the server uses when a request does not set one.
+DEFAULT_CONTEXT_SIZE = 20
+
+# Messages to keep suggestions for, per participant and feature.
+_MESSAGES_KEPT = 4
+
+_PARTICIPANTS = "/participants/"
+_MESSAGES = "/messages/"
+
+# (request type, response type, SuggestionResult field, client method)
+_FEATURES = {
+    Feature.ARTICLE_SUGGESTION: (
+        gcd_participant.SuggestArticlesRequest,
+        gcd_participant.SuggestArticlesResponse,
+        "suggest_articles_response",
+        "suggest_articles",
+    ),
+    Feature.FAQ: (
+        gcd_participant.SuggestFaqAnswersRequest,
+        gcd_participant.SuggestFaqAnswersResponse,
+        "suggest_faq_answers_response",
+        "suggest_faq_answers",
+    ),
+    Feature.SMART_REPLY: (
+        gcd_participant.SuggestSmartRepliesRequest,
+        gcd_participant.SuggestSmartRepliesResponse,
+        "suggest_smart_replies_response",
+        "suggest_smart_replies",
+    ),
+}
+
+
+def _conversation(name: str) -> str:
+    # Participant and message names both extend the conversation name.
+    for separator in (_PARTICIPANTS, _MESSAGES):
+        if separator in name:
+            return name.split(separator, 1)[0]
+    return name
+
+
+class _Entry(object):
+    __slots__ = ("requested", "actual", "response")
+
+    def __init__(self, requested: int, actual: int, response: Any):
+        self.requested = requested
+        self.actual = actual
+        self.response = response
+
+    def covers(self, context_size: int) -> bool:
+        # A response built from fewer messages than requested used the
+        # whole conversation, so it also answers any larger request.
+        if context_size == self.requested:
+            return True
+        return 0 < self.actual < self.requested and context_size >= self.actual
+
+
+class _ConversationState(object):
+    def __init__(self):
+        self.latest_message: Optional[str] = None
+        self.participants: Dict[int, str] = {}
+        # (participant, feature) -> latest_message -> entries, oldest
+        # message first.
+        self.entries: Dict[
+            Tuple[str, int], "collections.OrderedDict[str, List[_Entry]]"
+        ] = {}
+
+
+class SuggestionCache(object):
+    """Suggestion responses for many conversations.
+
+    Args:
+        context_size (int): The context size of the conversation
+            profile's suggestion query configs, which ``analyze_content``
+            suggestions are computed with.
+        max_conversations (int): Conversations to keep, least recently
+            used ones are dropped first.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that needed an RPC.
+    """
+
+    def __init__(
+        self,
+        context_size: int = DEFAULT_CONTEXT_SIZE,
+        max_conversations: int = 10000,
+    ):
+        self.context_size = context_size
+        self.max_conversations = max_conversations
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conversations: "collections.OrderedDict[str, _ConversationState]" = (
+            collections.OrderedDict()
+        )
+
+    def _state(self, conversation: str) -> _ConversationState:
+        state = self._conversations.get(conversation)
+        if state is None:
+            state = self._conversations[conversation] = _ConversationState()
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(conversation)
+        return state
+
+    def set_participant(self, participant: str, role: int) -> None:
+        """Record the participant that plays ``role``, a
+        ``Participant.Role``, in its conversation."""
+        with self._lock:
+            self._state(_conversation(participant)).participants[role] = participant
+
+    def forget(self, conversation: str) -> None:
+        """Drop a conversation, e.g. once it has been completed."""
+        with self._lock:
+            self._conversations.pop(_conversation(conversation), None)
+
+    def _put(self, participant, feature, requested, response):
+        state = self._state(_conversation(participant))
+        messages = state.entries.setdefault(
+            (participant, feature), collections.OrderedDict()
+        )
+        entries = messages.get(response.latest_message)
+        if entries is None:
+            entries = messages[response.latest_message] = []
+            while len(messages) > _MESSAGES_KEPT:
+                messages.popitem(last=False)
+        entries[:] = [entry for entry in entries if entry.requested != requested]
+        entries.append(_Entry(requested, response.context_size, response))
+
+    def put(
+        self,
+        participant: str,
+        feature: int,
+        response: Any,
+        context_size: Optional[int] = None,
+    ) -> None:
+        """Cache a suggestion response.
+
+        Args:
+            participant (str): The participant the suggestions are for.
+            feature (int): A ``SuggestionFeature.Type``.
+            response (Union[SuggestArticlesResponse, SuggestFaqAnswersResponse, SuggestSmartRepliesResponse]):
+                The response.
+            context_size (int): The context size requested; defaults to
+                the cache's ``context_size``.
+        """
+        if not response.latest_message:
+            return
+        with self._lock:
+            self._put(
+                participant,
+                Feature(feature),
+                context_size or self.context_size,
+                response,
+            )
+
+    def observe(
+        self,
+        response: gcd_participant.AnalyzeContentResponse,
+        human_agent: Optional[str] = None,
+        end_user: Optional[str] = None,
+    ) -> int:
+        """Cache the suggestions in an ``AnalyzeContentResponse``.
+
+        Args:
+            response (google.cloud.dialogflow_v2.types.AnalyzeContentResponse):
+                The response.
+            human_agent (str): The human agent participant, if not known
+                yet.
+            end_user (str): The end user participant, if not known yet.
+
+        Returns:
+            int: The number of suggestion responses cached.
+        """
+        message = response.message
+        for participant, role in (
+            (human_agent, Role.HUMAN_AGENT),
+            (end_user, Role.END_USER),
+            (message.participant, message.participant_role),
+        ):
+            if participant and role in (Role.HUMAN_AGENT, Role.END_USER):
+                self.set_participant(participant, role)
+        if not message.name:
+            return 0
+        cached = 0
+        with self._lock:
+            state = self._state(_conversation(message.name))
+            state.latest_message = message.name
+            for role, results in (
+                (Role.HUMAN_AGENT, response.human_agent_suggestion_results),
+                (Role.END_USER, response.end_user_suggestion_results),
+            ):
+                participant = state.participants.get(role)
+                if participant is None:
+                    continue
+                for result in results:
+                    for feature, (_, _, field, _) in _FEATURES.items():
+                        if field in result and getattr(result, field).latest_message:
+                            self._put(
+                                participant,
+                                feature,
+                                self.context_size,
+                                getattr(result, field),
+                            )
+                            cached += 1
+        return cached
+
+    def get(self, feature: int, request: Any) -> Optional[Any]:
+        """Return the cached response to a suggestion request, or
+        ``None``.
+
+        Args:
+            feature (int): A ``SuggestionFeature.Type``.
+            request (Union[SuggestArticlesRequest, SuggestFaqAnswersRequest, SuggestSmartRepliesRequest]):
+                The request.
+        """
+        feature = Feature(feature)
+        request_type = _FEATURES[feature][0]
+        request = request_type(request)
+        fields = type(request).meta.fields
+        if any(
+            field in fields and field in request
+            for field in ("assist_query_params", "current_text_input")
+        ):
+            return None
+        context_size = request.context_size or DEFAULT_CONTEXT_SIZE
+        with self._lock:
+            state = self._conversations.get(_conversation(request.parent))
+            if state is None:
+                return None
+            latest_message = request.latest_message or state.latest_message
+            messages = state.entries.get((request.parent, feature))
+            if not latest_message or not messages:
+                return None
+            for entry in messages.get(latest_message, ()):
+                if entry.covers(context_size):
+                    self._conversations.move_to_end(_conversation(request.parent))
+                    return entry.response
+        return None
+
+    def _request(self, feature, request, kwargs):
+        request = _FEATURES[feature][0](request or {})
+        for field in ("parent", "latest_message", "context_size"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        return request
+
+    def _lookup(self, feature, request):
+        response = self.get(feature, request)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def _suggest(self, feature, client, request, kwargs):
+        request = self._request(feature, request, kwargs)
+        response = self._lookup(feature, request)
+        if response is None:
+            method = getattr(client, _FEATURES[feature][3])
+            response = method(request=request, **kwargs)
+            self.put(
+                request.parent,
+                feature,
+                response,
+                request.context_size or DEFAULT_CONTEXT_SIZE,
+            )
+        return response
+
+    async def _asuggest(self, feature, client, request, kwargs):
+        request = self._request(feature, request, kwargs)
+        response = self._lookup(feature, request)
+        if response is None:
+            method = getattr(client, _FEATURES[feature][3])
+            response = await method(request=request, **kwargs)
+            self.put(
+                request.parent,
+                feature,
+                response,
+                request.context_size or DEFAULT_CONTEXT_SIZE,
+            )
+        return response
+
+    def suggest_articles(self, client: Any, request=None, **kwargs):
+        """Return ``client.suggest_articles(request)`` from the cache if
+        possible.
+
+        ``parent``, ``latest_message`` and ``context_size`` may be given as
+        keyword arguments. Other keyword arguments, such as ``timeout``,
+        are passed to the client.
+        """
+        return self._suggest(Feature.ARTICLE_SUGGESTION, client, request, kwargs)
+
+    def suggest_faq_answers(self, client: Any, request=None, **kwargs):
+        """Like :meth:`suggest_articles`, for ``suggest_faq_answers``."""
+        return self._suggest(Feature.FAQ, client, request, kwargs)
+
+    def suggest_smart_replies(self, client: Any, request=None, **kwargs):
+        """Like :meth:`suggest_articles`, for ``suggest_smart_replies``."""
+        return self._suggest(Feature.SMART_REPLY, client, request, kwargs)
+
+    async def asuggest_articles(self, client: Any, request=None, **kwargs):
+        """Like :meth:`suggest_articles`, for ``ParticipantsAsyncClient``."""
+        return await self._asuggest(Feature.ARTICLE_SUGGESTION, client, request, kwargs)
+
+    async def asuggest_faq_answers(self, client: Any, request=None, **kwargs):
+        """Like :meth:`suggest_faq_answers`, for ``ParticipantsAsyncClient``."""
+        return await self._asuggest(Feature.FAQ, client, request, kwargs)
+
+    async def asuggest_smart_replies(self, client: Any, request=None, **kwargs):
+        """Like :meth:`suggest_smart_replies`, for
+        ``ParticipantsAsyncClient``."""
+        return await self._asuggest(Feature.SMART_REPLY, client, request, kwargs)
+
+    def _analyze_content_request(self, request, kwargs):
+        request = gcd_participant.AnalyzeContentRequest(request or {})
+        for field in ("participant", "text_input", "event_input"):
+            if field in kwargs:
+                setattr(request, field, kwargs.pop(field))
+        return request
+
+    def analyze_content(
+        self,
+        client: Any,
+        request=None,
+        human_agent: Optional[str] = None,
+        end_user: Optional[str] = None,
+        **kwargs
+    ):
+        """Call ``client.analyze_content`` and cache the suggestions it
+        returns; see :meth:`observe`.
+
+        ``participant``, ``text_input`` and ``event_input`` may be given as
+        keyword arguments. Other keyword arguments are passed to the client.
+        """
+        request = self._analyze_content_request(request, kwargs)
+        response = client.analyze_content(request=request, **kwargs)
+        self.observe(response, human_agent=human_agent, end_user=end_user)
+        return response
+
+    async def aanalyze_content(
+        self,
+        client: Any,
+        request=None,
+        human_agent: Optional[str] = None,
+        end_user: Optional[str] = None,
+        **kwargs
+    ):
+        """Like :meth:`analyze_content`, for ``ParticipantsAsyncClient``."""
+        request = self._analyze_content_request(request, kwargs)
+        response = await client.analyze_content(request=request, **kwargs)
+        self.observe(response, human_agent=human_agent, end_user=end_user)
+        return response
+
+
+__all__ = (
+    "DEFAULT_CONTEXT_SIZE",
+    "Feature",
+    "SuggestionCache",
+)
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Summarize many conversations concurrently.
+
+A :class:`BatchSummarizer` takes conversations from an iterable, usually
+a ``list_conversations`` pager, and summarizes each with
+``generate_stateless_summary`` or ``suggest_conversation_summary`` on a
+thread pool, at most ``concurrency`` at a time and at most ``qps``
+requests per second. Results are written as JSON lines as they finish,
+and finished conversations are appended to a checkpoint file so an
+interrupted run resumes where it stopped::
+
+    python -m google.cloud.dialogflow_helpers.summary_batch \\
+        --project my-project --location global \\
+        --conversation-profile projects/my-project/conversationProfiles/p \\
+        --filter 'lifecycle_state = "COMPLETED"' \\
+        --output summaries.jsonl --checkpoint summaries.done --qps 5
+
+For ``generate_stateless_summary`` the messages are read with
+``list_messages``, which returns the newest first, so only the first
+``max_context_size`` messages are fetched. Memory therefore grows with
+``concurrency`` and ``max_context_size``, not with the backlog.
+"""
+import argparse
+import collections
+from concurrent import futures
+import json
+import os
+import sys
+import threading
+import time
+from typing import IO, Any, Callable, Dict, Iterable, Optional, Sequence, Set
+
+from google.api_core import exceptions as core_exceptions
+
+from google.cloud.dialogflow_helpers.instrumentation import Histogram
+from google.cloud.dialogflow_v2.types import conversation as gcd_conversation
+from google.cloud.dialogflow_v2.types import participant as gcd_participant
+
+STATELESS = "stateless"
+SUGGEST = "suggest"
+MODES = (STATELESS, SUGGEST)
+
+#: The server's default and maximum ``max_context_size``.
+DEFAULT_MAX_CONTEXT_SIZE = 500
+MAX_CONTEXT_SIZE = 1000
+
+_MinimalConversation = (
+    gcd_conversation.GenerateStatelessSummaryRequest.MinimalConversation
+)
+
+
+class RateLimiter(object):
+    """Spaces calls ``1 / qps`` seconds apart across threads.
+
+    Args:
+        qps (float): Calls per second; ``None`` disables the limit.
+        clock (Callable[[], float]): Monotonic time source.
+        sleep (Callable[[float], None]): Sleeps for a number of seconds.
+    """
+
+    def __init__(
+        self,
+        qps: Optional[float],
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.qps = qps
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self) -> None:
+        """Wait for the next slot."""
+        if not self.qps:
+            return
+        with self._lock:
+            now = self._clock()
+            # Idle time does not build up a burst.
+            slot = max(self._next, now)
+            self._next = slot + 1.0 / self.qps
+        if slot > now:
+            self._sleep(slot - now)
+
+
+def location_of(conversation: str) -> str:
+    """Return the ``projects/<Project ID>/locations/<Location ID>`` of a
+    conversation name, ``global`` if it has no location."""
+    segments = conversation.split("/")
+    if len(segments) > 3 and segments[2] == "locations":
+        return "/".join(segments[:4])
+    return "/".join(segments[:2] + ["locations", "global"])
+
+
+def minimal_conversation(
+    messages: Iterable[gcd_participant.Message],
+    parent: str,
+    max_context_size: int = DEFAULT_MAX_CONTEXT_SIZE,
+) -> _MinimalConversation:
+    """Build a ``MinimalConversation`` from ``list_messages`` results.
+
+    Args:
+        messages (Iterable[google.cloud.dialogflow_v2.types.Message]):
+            Messages, newest first, as ``list_messages`` returns them. No
+            more than ``max_context_size`` are read, so passing a pager
+            fetches only the pages needed.
+        parent (str): The location to charge, e.g.
+            ``projects/<Project ID>/locations/<Location ID>``.
+        max_context_size (int): The number of newest messages to keep.
+
+    Returns:
+        MinimalConversation: The messages in chronological order, with
+        only the fields summarization uses.
+    """
+    newest_first = []
+    for message in messages:
+        if len(newest_first) >= max_context_size:
+            break
+        minimal = gcd_participant.Message(
+            name=message.name,
+            content=message.content,
+            language_code=message.language_code,
+            participant=message.participant,
+            participant_role=message.participant_role,
+        )
+        if "send_time" in message:
+            minimal.send_time = message.send_time
+        newest_first.append(minimal)
+    newest_first.reverse()
+    return _MinimalConversation(messages=newest_first, parent=parent)
+
+
+def _error(exc: Exception) -> str:
+    if isinstance(exc, core_exceptions.GoogleAPICallError):
+        code = exc.grpc_status_code.name if exc.grpc_status_code else "UNKNOWN"
+        return "{}: {}".format(code, exc.message)
+    return "{}: {}".format(type(exc).__name__, exc)
+
+
+def _read_checkpoint(path: Optional[str]) -> Set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as stream:
+        return {line.strip() for line in stream if line.strip()}
+
+
+class SummaryStats(object):
+    """Outcome of a :meth:`BatchSummarizer.run`.
+
+    Attributes:
+        succeeded (int): Conversations summarized.
+        failed (int): Conversations whose summary failed.
+        skipped (int): Conversations already in the checkpoint.
+        errors (Dict[str, int]): Failures by status code name.
+        latency (google.cloud.dialogflow_helpers.instrumentation.Histogram):
+            Seconds per conversation, fetching messages included.
+        elapsed (float): Seconds the run took.
+    """
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors: Dict[str, int] = collections.Counter()
+        self.latency = Histogram()
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """float: Conversations summarized or failed per second."""
+        done = self.succeeded + self.failed
+        return done / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """Return a one-line report."""
+        return (
+            "{} summarized, {} failed, {} skipped in {:.1f}s "
+            "({:.2f}/s, p50 {:.2f}s, p99 {:.2f}s)".format(
+                self.succeeded,
+                self.failed,
+                self.skipped,
+                self.elapsed,
+                self.throughput,
+                self.latency.percentile(50),
+                self.latency.percentile(99),
+            )
+        )
+
+
+class BatchSummarizer(object):
+    """Summarizes conversations concurrently.
+
+    Args:
+        client (google.cloud.dialogflow_v2.ConversationsClient): The client.
+        output (IO[str]): Receives one JSON object per conversation.
+        mode (str): :data:`STATELESS` to send the messages with
+            ``generate_stateless_summary``, or :data:`SUGGEST` for
+            ``suggest_conversation_summary`` on the stored conversation.
+        conversation_profile (google.cloud.dialogflow_v2.types.ConversationProfile):
+            Required for :data:`STATELESS`.
+        max_context_size (int): Newest messages to summarize.
+        concurrency (int): Conversations in flight.
+        qps (float): Summary requests per second; ``None`` for no limit.
+        checkpoint (str): File listing finished conversations, read at the
+            start and appended to as conversations finish.
+        timeout (float): Timeout of each RPC.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        output: IO[str],
+        mode: str = STATELESS,
+        conversation_profile: Any = None,
+        max_context_size: int = DEFAULT_MAX_CONTEXT_SIZE,
+        concurrency: int = 8,
+        qps: Optional[float] = None,
+        checkpoint: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ):
+        if mode not in MODES:
+            raise ValueError("mode must be one of {}".format(", ".join(MODES)))
+        if mode == STATELESS and conversation_profile is None:
+            raise ValueError("Stateless summaries require a conversation_profile.")
+        if not 0 < max_context_size <= MAX_CONTEXT_SIZE:
+            raise ValueError(
+                "max_context_size must be between 1 and {}".format(MAX_CONTEXT_SIZE)
+            )
+        self._client = client
+        self._output = output
+        self.mode = mode
+        self.conversation_profile = conversation_profile
+        self.max_context_size = max_context_size
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(qps)
+        self.checkpoint = checkpoint
+        self._kwargs = {} if timeout is None else {"timeout": timeout}
+        self._lock = threading.Lock()
+
+    def _request(self, name: str) -> gcd_conversation.GenerateStatelessSummaryRequest:
+        messages = self._client.list_messages(
+            request={
+                "parent": name,
+                "page_size": min(self.max_context_size, MAX_CONTEXT_SIZE),
+            },
+            **self._kwargs
+        )
+        return gcd_conversation.GenerateStatelessSummaryRequest(
+            stateless_conversation=minimal_conversation(
+                messages, location_of(name), self.max_context_size
+            ),
+            conversation_profile=self.conversation_profile,
+            max_context_size=self.max_context_size,
+        )
+
+    def summarize(self, name: str) -> Dict[str, Any]:
+        """Summarize one conversation.
+
+        Returns:
+            Dict[str, Any]: The JSON object written for it.
+        """
+        if self.mode == STATELESS:
+            request = self._request(name)
+            self.rate_limiter.acquire()
+            response = self._client.generate_stateless_summary(
+                request=request, **self._kwargs
+            )
+        else:
+            self.rate_limiter.acquire()
+            response = self._client.suggest_conversation_summary(
+                request={"conversation": name, "context_size": self.max_context_size},
+                **self._kwargs
+            )
+        return {
+            "conversation": name,
+            "summary": response.summary.text,
+            "text_sections": dict(response.summary.text_sections),
+            "latest_message": response.latest_message,
+            "context_size": response.context_size,
+        }
+
+    def _run_one(self, name: str, stats: SummaryStats, done: Optional[IO[str]]):
+        start = time.monotonic()
+        try:
+            record = self.summarize(name)
+        except Exception as exc:
+            record = {"conversation": name, "error": _error(exc)}
+        latency = time.monotonic() - start
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self._lock:
+            stats.latency.add(latency)
+            self._output.write(line)
+            if "error" in record:
+                stats.failed += 1
+                stats.errors[record["error"].split(":", 1)[0]] += 1
+                return
+            stats.succeeded += 1
+            if done is not None:
+                self._output.flush()
+                done.write(name + "\n")
+                done.flush()
+
+    def run(self, conversations: Iterable[Any]) -> SummaryStats:
+        """Summarize ``conversations``, names or ``Conversation``
+        messages, and block until all are done.
+
+        Failed conversations are reported in the output but not
+        checkpointed, so the next run retries them.
+        """
+        stats = SummaryStats()
+        finished = _read_checkpoint(self.checkpoint)
+        done = open(self.checkpoint, "a", encoding="utf-8") if self.checkpoint else None
+        start = time.monotonic()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        try:
+            with futures.ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="summary"
+            ) as executor:
+                for conversation in conversations:
+                    name = getattr(conversation, "name", conversation)
+                    if name in finished:
+                        stats.skipped += 1
+                        continue
+                    # Pull the next conversation only when a worker is
+                    # free, so a large pager is not read ahead.
+                    slots.acquire()
+                    executor.submit(self._run_one, name, stats, done).add_done_callback(
+                        lambda _: slots.release()
+                    )
+        finally:
+            if done is not None:
+                done.close()
+        self._output.flush()
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+
+__all__ = (
+    "BatchSummarizer",
+    "DEFAULT_MAX_CONTEXT_SIZE",
+    "MAX_CONTEXT_SIZE",
+    "MODES",
+    "RateLimiter",
+    "STATELESS",
+    "SUGGEST",
+    "SummaryStats",
+    "location_of",
+    "main",
+    "minimal_conversation",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Summarize a project's conversations from the command line."""
+    from google.cloud import dialogflow_v2
+
+    parser = argparse.ArgumentParser(
+        description="Summarize conversations into a JSON lines file."
+    )
+    parser.add_argument("--project", required=True)
+    parser.add_argument("--location", default="global")
+    parser.add_argument(
+        "--conversation-profile", help="Required for stateless summaries."
+    )
+    parser.add_argument("--mode", choices=MODES, default=STATELESS)
+    parser.add_argument(
+        "--filter", default="", help="list_conversations filter, e.g. lifecycle."
+    )
+    parser.add_argument("--output", default="-", help="Output file, or '-'.")
+    parser.add_argument("--checkpoint", help="File of finished conversations.")
+    parser.add_argument(
+        "--max-context-size", type=int, default=DEFAULT_MAX_CONTEXT_SIZE
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--qps", type=float)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args(argv)
+    if args.mode == STATELESS and not args.conversation_profile:
+        parser.error("stateless summaries require --conversation-profile")
+
+    client = dialogflow_v2.ConversationsClient()
+    profile = None
+    if args.mode == STATELESS:
+        profile = dialogflow_v2.ConversationProfilesClient().get_conversation_profile(
+            name=args.conversation_profile
+        )
+    conversations = client.list_conversations(
+        request={
+            "parent": "projects/{}/locations/{}".format(args.project, args.location),
+            "filter": args.filter,
+        }
+    )
+    output = (
+        sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    )
+    try:
+        summarizer = BatchSummarizer(
+            client,
+            output,
+            mode=args.mode,
+            conversation_profile=profile,
+            max_context_size=args.max_context_size,
+            concurrency=args.concurrency,
+            qps=args.qps,
+            checkpoint=args.checkpoint,
+            timeout=args.timeout,
+        )
+        stats = summarizer.run(conversations)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(stats.format(), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
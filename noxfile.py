@@ -186,6 +186,14 @@ def unit(session):
     default(session)
 
 
+@nox.session(python=DEFAULT_PYTHON_VERSION)
+def benchmark(session):
+    """Run the microbenchmarks and compare with earlier runs."""
+    session.install("-e", ".")
+    session.run("python", "-m", "tests.benchmark.marshalling", *session.posargs)
+    session.run("python", "-m", "tests.benchmark.notifications", *session.posargs)
+
+
 def install_systemtest_dependencies(session, *constraints):
 
     # Use pre-release gRPC for system tests.
@@ -60,6 +60,24 @@ s.replace(
     "",
 )
 
+# Add the microbenchmark session
+s.replace(
+    "noxfile.py",
+    r'''(def unit\(session\):
+    """Run the unit test suite."""
+    default\(session\)
+)''',
+    r'''\1
+
+@nox.session(python=DEFAULT_PYTHON_VERSION)
+def benchmark(session):
+    """Run the microbenchmarks and compare with earlier runs."""
+    session.install("-e", ".")
+    session.run("python", "-m", "tests.benchmark.marshalling", *session.posargs)
+    session.run("python", "-m", "tests.benchmark.notifications", *session.posargs)
+''',
+)
+
 # run format session for all directories which have a noxfile
 for noxfile in Path(".").glob("**/noxfile.py"):
     s.shell.run(["nox", "-s", "format"], cwd=noxfile.parent, hide_output=False)
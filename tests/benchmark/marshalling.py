@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Microbenchmarks for proto-plus marshalling of hot message types.
+
+Each case times construction from Python values, attribute access,
+``serialize``, ``deserialize``, ``to_dict`` and ``to_json``. Results are
+appended to a JSON-lines history file and compared with the most recent
+earlier run from the same environment (Python, protobuf and proto-plus
+versions and protobuf backend), so regressions show up as a percentage
+change::
+
+    python -m tests.benchmark.marshalling
+    python -m tests.benchmark.marshalling --filter EntityType --fail-on-regression
+
+or ``nox -s benchmark``.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.protobuf import __version__ as protobuf_version
+from google.protobuf.internal import api_implementation
+
+from google.cloud.dialogflow_v2.types import (
+    entity_type,
+    intent,
+    participant,
+    session,
+    webhook,
+)
+
+DEFAULT_HISTORY = os.path.join(".benchmarks", "marshalling.jsonl")
+OPERATIONS = ("construct", "access", "serialize", "deserialize", "to_dict", "to_json")
+
+
+def _struct(depth: int = 2, width: int = 5) -> Dict[str, Any]:
+    """A nested ``Struct`` payload of the kind webhooks and parameters carry."""
+    value: Dict[str, Any] = {
+        "name": "Alex",
+        "count": 3.0,
+        "enabled": True,
+        "tags": ["a", "b", "c"],
+    }
+    if depth:
+        for index in range(width):
+            value["child{}".format(index)] = _struct(depth - 1, width)
+    return value
+
+
+def _query_result() -> Dict[str, Any]:
+    return {
+        "query_text": "book a table for four at seven tonight",
+        "language_code": "en-US",
+        "speech_recognition_confidence": 0.92,
+        "action": "book.table",
+        "parameters": _struct(),
+        "all_required_params_present": True,
+        "fulfillment_text": "Booked a table for four at 7 PM.",
+        "fulfillment_messages": [
+            {"text": {"text": ["Booked a table for four at 7 PM."]}},
+            {"payload": _struct(depth=1)},
+        ],
+        "output_contexts": [
+            {
+                "name": "projects/p/agent/sessions/s/contexts/booking-{}".format(i),
+                "lifespan_count": 5,
+                "parameters": _struct(depth=1),
+            }
+            for i in range(3)
+        ],
+        "intent": {
+            "name": "projects/p/agent/intents/0b5d0b1c",
+            "display_name": "book.table",
+        },
+        "intent_detection_confidence": 0.87,
+        "diagnostic_info": _struct(depth=1),
+        "sentiment_analysis_result": {
+            "query_text_sentiment": {"score": 0.4, "magnitude": 0.6}
+        },
+    }
+
+
+def _detect_intent_request() -> Dict[str, Any]:
+    return {
+        "session": "projects/p/agent/sessions/0123456789",
+        "query_params": {
+            "time_zone": "America/New_York",
+            "contexts": [
+                {
+                    "name": "projects/p/agent/sessions/0123456789/contexts/c{}".format(
+                        i
+                    ),
+                    "lifespan_count": 2,
+                    "parameters": {"slot": "value{}".format(i)},
+                }
+                for i in range(3)
+            ],
+            "payload": _struct(depth=1),
+        },
+        "query_input": {
+            "text": {
+                "text": "book a table for four at seven tonight",
+                "language_code": "en-US",
+            }
+        },
+    }
+
+
+def _detect_intent_response() -> Dict[str, Any]:
+    return {
+        "response_id": "5e6b9c4a-8f3d-4a53-9d7e-2f1a9b0c6d21",
+        "query_result": _query_result(),
+    }
+
+
+def _intent(training_phrases: int = 500) -> Dict[str, Any]:
+    return {
+        "name": "projects/p/agent/intents/0b5d0b1c",
+        "display_name": "book.table",
+        "priority": 500000,
+        "training_phrases": [
+            {
+                "type_": "EXAMPLE",
+                "parts": [
+                    {"text": "book a table for "},
+                    {
+                        "text": str(i % 12 + 1),
+                        "entity_type": "@sys.number",
+                        "alias": "guests",
+                    },
+                    {"text": " at "},
+                    {"text": "seven", "entity_type": "@sys.time", "alias": "time"},
+                ],
+            }
+            for i in range(training_phrases)
+        ],
+        "parameters": [
+            {
+                "display_name": name,
+                "entity_type_display_name": entity,
+                "value": "$" + name,
+                "mandatory": True,
+                "prompts": ["What {}?".format(name)],
+            }
+            for name, entity in (("guests", "@sys.number"), ("time", "@sys.time"))
+        ],
+        "messages": [{"text": {"text": ["Booked a table for $guests at $time."]}}],
+    }
+
+
+def _entity_type(entities: int = 10000) -> Dict[str, Any]:
+    return {
+        "name": "projects/p/agent/entityTypes/3f2a",
+        "display_name": "product",
+        "kind": "KIND_MAP",
+        "auto_expansion_mode": "AUTO_EXPANSION_MODE_DEFAULT",
+        "entities": [
+            {
+                "value": "product-{}".format(i),
+                "synonyms": [
+                    "product-{}".format(i),
+                    "item {}".format(i),
+                    "sku{}".format(i),
+                ],
+            }
+            for i in range(entities)
+        ],
+    }
+
+
+def _analyze_content_response() -> Dict[str, Any]:
+    return {
+        "reply_text": "Booked a table for four at 7 PM.",
+        "message": {
+            "name": "projects/p/conversations/c/messages/m",
+            "content": "book a table for four at seven tonight",
+            "language_code": "en-US",
+            "participant": "projects/p/conversations/c/participants/u",
+            "participant_role": "END_USER",
+        },
+        "automated_agent_reply": {
+            "detect_intent_response": _detect_intent_response(),
+            "automated_agent_reply_type": "FINAL",
+        },
+        "human_agent_suggestion_results": [
+            {
+                "suggest_faq_answers_response": {
+                    "faq_answers": [
+                        {
+                            "answer": "We are open from 5 PM to 11 PM.",
+                            "confidence": 0.8,
+                            "question": "When are you open?",
+                            "source": "projects/p/knowledgeBases/k/documents/d",
+                            "metadata": {"section": "hours"},
+                            "answer_record": "projects/p/answerRecords/a{}".format(i),
+                        }
+                        for i in range(3)
+                    ],
+                    "latest_message": "projects/p/conversations/c/messages/m",
+                    "context_size": 10,
+                }
+            }
+        ],
+    }
+
+
+def _webhook_request() -> Dict[str, Any]:
+    return {
+        "session": "projects/p/agent/sessions/0123456789",
+        "response_id": "5e6b9c4a-8f3d-4a53-9d7e-2f1a9b0c6d21",
+        "query_result": _query_result(),
+        "original_detect_intent_request": {
+            "source": "telephony",
+            "version": "2",
+            "payload": _struct(),
+        },
+    }
+
+
+def _access_query_result(result) -> Any:
+    parameters = result.parameters
+    return (
+        result.query_text,
+        result.intent.display_name,
+        parameters["name"],
+        parameters["child0"]["child1"]["tags"][0],
+        [context.name for context in result.output_contexts],
+        result.fulfillment_messages[0].text.text[0],
+    )
+
+
+def _access_intent(message) -> Any:
+    return [
+        "".join(part.text for part in phrase.parts)
+        for phrase in message.training_phrases
+    ]
+
+
+def _access_entity_type(message) -> Any:
+    return {entity.value: entity.synonyms[0] for entity in message.entities}
+
+
+class Case(object):
+    """A message type, a payload and an attribute-access workload.
+
+    Args:
+        name (str): Name shown in reports and stored in the history.
+        message_type: The proto-plus message class.
+        payload (Callable[[], Dict[str, Any]]): Builds the field values.
+        access (Callable[[Any], Any]): Reads the fields hot paths read.
+    """
+
+    def __init__(self, name, message_type, payload, access):
+        self.name = name
+        self.message_type = message_type
+        self.payload = payload
+        self.access = access
+
+    def operations(self) -> Dict[str, Callable[[], Any]]:
+        """Return a zero-argument callable per operation."""
+        message_type = self.message_type
+        values = self.payload()
+        message = message_type(values)
+        data = message_type.serialize(message)
+        access = self.access
+        return {
+            "construct": lambda: message_type(values),
+            # Deserialize first so that wrappers are not cached between runs.
+            "access": lambda: access(message_type.deserialize(data)),
+            "serialize": lambda: message_type.serialize(message),
+            "deserialize": lambda: message_type.deserialize(data),
+            "to_dict": lambda: message_type.to_dict(message),
+            "to_json": lambda: message_type.to_json(message),
+        }
+
+
+CASES = (
+    Case(
+        "DetectIntentRequest",
+        session.DetectIntentRequest,
+        _detect_intent_request,
+        lambda m: (m.session, m.query_input.text.text, m.query_params.payload["name"]),
+    ),
+    Case(
+        "DetectIntentResponse",
+        session.DetectIntentResponse,
+        _detect_intent_response,
+        lambda m: _access_query_result(m.query_result),
+    ),
+    Case("QueryResult", session.QueryResult, _query_result, _access_query_result),
+    Case("Intent", intent.Intent, _intent, _access_intent),
+    Case("EntityType", entity_type.EntityType, _entity_type, _access_entity_type),
+    Case(
+        "AnalyzeContentResponse",
+        participant.AnalyzeContentResponse,
+        _analyze_content_response,
+        lambda m: (
+            m.reply_text,
+            _access_query_result(
+                m.automated_agent_reply.detect_intent_response.query_result
+            ),
+            [
+                answer.answer
+                for result in m.human_agent_suggestion_results
+                for answer in result.suggest_faq_answers_response.faq_answers
+            ],
+        ),
+    ),
+    Case(
+        "WebhookRequest",
+        webhook.WebhookRequest,
+        _webhook_request,
+        lambda m: (
+            _access_query_result(m.query_result),
+            m.original_detect_intent_request.payload["child0"]["name"],
+        ),
+    ),
+)
+
+
+def measure(
+    func: Callable[[], Any], min_time: float = 0.2, repeat: int = 5
+) -> Dict[str, float]:
+    """Time ``func`` like :mod:`timeit`, auto-ranging the loop count.
+
+    Returns:
+        Dict[str, float]: Seconds per call: ``min`` and ``median`` over
+        ``repeat`` rounds of at least ``min_time`` seconds each, and the
+        number of calls per round.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or number >= 1 << 20:
+            break
+        number *= 10
+    number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number)
+    return {
+        "min": min(rounds),
+        "median": statistics.median(rounds),
+        "number": number,
+    }
+
+
+def environment() -> Dict[str, str]:
+    """Return the properties that make runs comparable."""
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: NO COVER
+        import importlib_metadata as metadata  # type: ignore
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "protobuf": protobuf_version,
+        "protobuf_backend": api_implementation.Type(),
+        "proto_plus": metadata.version("proto-plus"),
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+            .stdout.decode("utf-8")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    cases=CASES,
+    pattern: Optional[str] = None,
+    min_time: float = 0.2,
+    repeat: int = 5,
+) -> Dict[str, Dict[str, float]]:
+    """Run the benchmarks whose ``Case.operation`` name matches
+    ``pattern``.
+
+    Returns:
+        Dict[str, Dict[str, float]]: :func:`measure` results by name.
+    """
+    results = {}
+    for case in cases:
+        for operation, func in case.operations().items():
+            name = "{}.{}".format(case.name, operation)
+            if pattern and not re.search(pattern, name):
+                continue
+            results[name] = measure(func, min_time=min_time, repeat=repeat)
+    return results
+
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    """Return the runs recorded in ``path``, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as stream:
+        return [json.loads(line) for line in stream if line.strip()]
+
+
+def save(path: str, entry: Dict[str, Any]) -> None:
+    """Append a run to the history in ``path``."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as stream:
+        stream.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    history: List[Dict[str, Any]],
+    env: Dict[str, str],
+) -> Dict[str, Tuple[float, float]]:
+    """Compare ``results`` with the latest run of each benchmark in the
+    same environment.
+
+    Returns:
+        Dict[str, Tuple[float, float]]: ``(baseline median, relative
+        change)`` by benchmark name; positive changes are slower.
+    """
+    changes = {}
+    for entry in reversed(history):
+        if entry.get("environment") != env:
+            continue
+        for name, result in results.items():
+            if name in changes or name not in entry["results"]:
+                continue
+            baseline = entry["results"][name]["median"]
+            changes[name] = (baseline, result["median"] / baseline - 1.0)
+    return changes
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:8.2f} {}".format(seconds / scale, unit)
+    return "{:8.2f} ns".format(seconds / 1e-9)
+
+
+def report(
+    results: Dict[str, Dict[str, float]],
+    changes: Dict[str, Tuple[float, float]],
+    threshold: float,
+) -> Tuple[str, List[str]]:
+    """Return a table of the results and the names of regressions."""
+    width = max([len(name) for name in results] + [9])
+    lines = [
+        "{:{width}}  {:>11}  {:>11}  {:>8}".format(
+            "benchmark", "median", "min", "change", width=width
+        )
+    ]
+    regressions = []
+    for name, result in results.items():
+        change = ""
+        if name in changes:
+            relative = changes[name][1]
+            change = "{:+7.1f}%".format(relative * 100)
+            if relative > threshold:
+                change += " !"
+                regressions.append(name)
+        lines.append(
+            "{:{width}}  {}  {}  {}".format(
+                name,
+                _format_seconds(result["median"]),
+                _format_seconds(result["min"]),
+                change,
+                width=width,
+            )
+        )
+    return "\n".join(lines), regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", help="Regex selecting Case.operation names.")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not record this run."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression.",
+    )
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--label", help="Free-form note stored with the run.")
+    args = parser.parse_args(argv)
+
+    env = environment()
+    results = run(pattern=args.filter, min_time=args.min_time, repeat=args.repeat)
+    history = load_history(args.history)
+    table, regressions = report(results, compare(results, history, env), args.threshold)
+    print(table)
+    if not args.no_save:
+        save(
+            args.history,
+            {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "commit": _commit(),
+                "label": args.label,
+                "environment": env,
+                "results": results,
+            },
+        )
+    if regressions:
+        print(
+            "\n{} regression(s) over {:.0%}: {}".format(
+                len(regressions), args.threshold, ", ".join(regressions)
+            )
+        )
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Microbenchmarks for decoding conversation profile notifications.
+
+Each case times the proto-plus route (``deserialize`` or
+``json_format.Parse`` and ``wrap``) against the lazy views of
+:mod:`google.cloud.dialogflow_helpers.notification_events`, reading only
+the header fields and reading the payload too. History and comparison
+work as in :mod:`tests.benchmark.marshalling`::
+
+    python -m tests.benchmark.notifications --filter JSON
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+from google.protobuf import json_format
+
+from google.cloud.dialogflow_helpers import notification_events
+from google.cloud.dialogflow_v2.types import (
+    conversation_event,
+    human_agent_assistant_event,
+)
+from tests.benchmark import marshalling
+
+DEFAULT_HISTORY = os.path.join(".benchmarks", "notifications.jsonl")
+ROUTES = ("proto_plus.header", "proto_plus.payload", "lazy.header", "lazy.payload")
+BATCH_SIZE = 100
+
+MessageFormat = notification_events.MessageFormat
+
+
+def _conversation_event() -> Dict[str, Any]:
+    return {
+        "conversation": "projects/p/locations/global/conversations/c",
+        "type_": "NEW_MESSAGE",
+        "new_message_payload": marshalling._analyze_content_response()["message"],
+    }
+
+
+def _human_agent_assistant_event() -> Dict[str, Any]:
+    return {
+        "conversation": "projects/p/locations/global/conversations/c",
+        "participant": "projects/p/locations/global/conversations/c/participants/a",
+        "suggestion_results": marshalling._analyze_content_response()[
+            "human_agent_suggestion_results"
+        ]
+        * 3,
+    }
+
+
+class Case(object):
+    """An event type, its payload and the fields consumers read.
+
+    Args:
+        name (str): Name shown in reports and stored in the history.
+        message_type: The proto-plus event class.
+        view_class: The matching lazy view class.
+        payload (Callable[[], Dict[str, Any]]): Builds the event.
+        header (Callable[[Any], Any]): Reads the routing fields.
+        body (Callable[[Any], Any]): Reads the payload.
+    """
+
+    def __init__(self, name, message_type, view_class, payload, header, body):
+        self.name = name
+        self.message_type = message_type
+        self.view_class = view_class
+        self.payload = payload
+        self.header = header
+        self.body = body
+
+    def operations(self, message_format) -> Dict[str, Callable[[], Any]]:
+        """Return a zero-argument callable per route, each decoding a
+        batch of :data:`BATCH_SIZE` notifications."""
+        message_type = self.message_type
+        message = message_type(self.payload())
+        if message_format == MessageFormat.JSON:
+            data = message_type.to_json(message).encode("utf-8")
+            pb_type = message_type.pb()
+
+            def proto_plus(data):
+                return message_type.wrap(
+                    json_format.Parse(data, pb_type(), ignore_unknown_fields=True)
+                )
+
+        else:
+            data = message_type.serialize(message)
+            proto_plus = message_type.deserialize
+        batch = [data] * BATCH_SIZE
+        view_class = self.view_class
+        header, body = self.header, self.body
+
+        def decode_batch(payloads):
+            return notification_events.decode_batch(payloads, view_class)
+
+        return {
+            "proto_plus.header": lambda: [header(proto_plus(d)) for d in batch],
+            "proto_plus.payload": lambda: [
+                (header(m), body(m)) for m in map(proto_plus, batch)
+            ],
+            "lazy.header": lambda: [header(v) for v in decode_batch(batch)],
+            "lazy.payload": lambda: [(header(v), body(v)) for v in decode_batch(batch)],
+        }
+
+
+CASES = (
+    Case(
+        "ConversationEvent",
+        conversation_event.ConversationEvent,
+        notification_events.ConversationEventView,
+        _conversation_event,
+        lambda e: (e.conversation, e.type_),
+        lambda e: e.new_message_payload.content,
+    ),
+    Case(
+        "HumanAgentAssistantEvent",
+        human_agent_assistant_event.HumanAgentAssistantEvent,
+        notification_events.HumanAgentAssistantEventView,
+        _human_agent_assistant_event,
+        lambda e: (e.conversation, e.participant),
+        lambda e: [
+            answer.answer
+            for result in e.suggestion_results
+            for answer in result.suggest_faq_answers_response.faq_answers
+        ],
+    ),
+)
+
+
+def run(
+    cases=CASES,
+    pattern: Optional[str] = None,
+    min_time: float = 0.2,
+    repeat: int = 5,
+) -> Dict[str, Dict[str, float]]:
+    """Run the benchmarks whose ``Case.FORMAT.route`` name matches
+    ``pattern``.
+
+    Returns:
+        Dict[str, Dict[str, float]]: :func:`marshalling.measure` results
+        by name, in seconds per batch.
+    """
+    results = {}
+    for case in cases:
+        for message_format in (MessageFormat.PROTO, MessageFormat.JSON):
+            for route, func in case.operations(message_format).items():
+                name = "{}.{}.{}".format(case.name, message_format.name, route)
+                if pattern and not re.search(pattern, name):
+                    continue
+                results[name] = marshalling.measure(
+                    func, min_time=min_time, repeat=repeat
+                )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", help="Regex selecting Case.FORMAT.route names.")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not record this run."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression.",
+    )
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--label", help="Free-form note stored with the run.")
+    args = parser.parse_args(argv)
+
+    env = marshalling.environment()
+    results = run(pattern=args.filter, min_time=args.min_time, repeat=args.repeat)
+    history = marshalling.load_history(args.history)
+    table, regressions = marshalling.report(
+        results, marshalling.compare(results, history, env), args.threshold
+    )
+    print(table)
+    if not args.no_save:
+        marshalling.save(
+            args.history,
+            {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "commit": marshalling._commit(),
+                "label": args.label,
+                "environment": env,
+                "results": results,
+            },
+        )
+    if regressions:
+        print(
+            "\n{} regression(s) over {:.0%}: {}".format(
+                len(regressions), args.threshold, ", ".join(regressions)
+            )
+        )
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":  # pragma: NO COVER
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import datetime
+import io
+import json
+import re
+
+from google.auth import credentials as ga_credentials
+import grpc
+import pytest
+
+from google.cloud import dialogflow_v2, dialogflow_v2beta1
+from google.cloud.dialogflow_helpers import answer_record_export, fake_server
+
+PARENT = "projects/p/locations/global"
+START = datetime.datetime(2023, 6, 1, tzinfo=datetime.timezone.utc)
+HOUR = datetime.timedelta(hours=1)
+# One record every 10 minutes over 6 hours.
+TIMES = [START + datetime.timedelta(minutes=10 * i) for i in range(36)]
+
+TIME_FIELD = "answer_feedback.display_time"
+
+_WINDOW = re.compile(
+    r'answer_feedback\.display_time >= "([^"]+)" AND '
+    r'answer_feedback\.display_time < "([^"]+)"'
+)
+
+
+def _parse(value):
+    return answer_record_export._parse_time(value)
+
+
+def _list_answer_records(request, context):
+    match = _WINDOW.search(request.filter)
+    lower, upper = _parse(match.group(1)), _parse(match.group(2))
+    if lower == START + HOUR and "fail" in request.filter:
+        context.abort(grpc.StatusCode.INTERNAL, "boom")
+    # Reverse chronological, like the service.
+    names = [
+        "{}/answerRecords/r{}".format(PARENT, i)
+        for i, t in reversed(list(enumerate(TIMES)))
+        if lower <= t < upper
+    ]
+    start = int(request.page_token or 0)
+    end = min(start + request.page_size, len(names))
+    return {
+        "answer_records": [{"name": n} for n in names[start:end]],
+        "next_page_token": str(end) if end < len(names) else "",
+    }
+
+
+@pytest.fixture
+def client():
+    with fake_server.FakeDialogflowServer(
+        version="v2beta1", services=("answer_records",)
+    ) as server:
+        server.set_response("AnswerRecords.ListAnswerRecords", _list_answer_records)
+        yield server.create_client(dialogflow_v2beta1.AnswerRecordsClient)
+
+
+def _expected(lower=0, upper=len(TIMES)):
+    return [
+        "{}/answerRecords/r{}".format(PARENT, i) for i in reversed(range(lower, upper))
+    ]
+
+
+def test_time_windows():
+    windows = answer_record_export.time_windows(
+        START, START + datetime.timedelta(minutes=150), HOUR
+    )
+    assert windows == [
+        (
+            START + datetime.timedelta(minutes=90),
+            START + datetime.timedelta(minutes=150),
+        ),
+        (
+            START + datetime.timedelta(minutes=30),
+            START + datetime.timedelta(minutes=90),
+        ),
+        (START, START + datetime.timedelta(minutes=30)),
+    ]
+    assert answer_record_export.time_windows(START, START, HOUR) == []
+    with pytest.raises(ValueError):
+        answer_record_export.time_windows(START, START + HOUR, datetime.timedelta(0))
+
+
+def test_window_filter():
+    window = (START, START + HOUR)
+    assert answer_record_export.window_filter(window, "t") == (
+        't >= "2023-06-01T00:00:00Z" AND t < "2023-06-01T01:00:00Z"'
+    )
+    assert answer_record_export.window_filter(window, "t", 'source = "AGENT"') == (
+        '(source = "AGENT") AND t >= "2023-06-01T00:00:00Z" AND '
+        't < "2023-06-01T01:00:00Z"'
+    )
+    assert answer_record_export.window_key(window) == (
+        "2023-06-01T00:00:00Z/2023-06-01T01:00:00Z"
+    )
+
+
+def test_records_ordered(client):
+    exporter = answer_record_export.AnswerRecordExporter(
+        client, TIME_FIELD, concurrency=3, page_size=4, buffer_pages=1
+    )
+    windows = answer_record_export.time_windows(START, START + 6 * HOUR, HOUR)
+    names = [r.name for r in exporter.records(PARENT, windows)]
+    assert names == _expected()
+
+
+def test_records_early_close(client):
+    exporter = answer_record_export.AnswerRecordExporter(
+        client, TIME_FIELD, concurrency=4, page_size=2, buffer_pages=1
+    )
+    windows = answer_record_export.time_windows(START, START + 6 * HOUR, HOUR)
+    records = exporter.records(PARENT, windows)
+    assert [next(records).name for _ in range(3)] == _expected()[:3]
+    records.close()
+
+
+def test_page_size_validated(client):
+    with pytest.raises(ValueError):
+        answer_record_export.AnswerRecordExporter(client, TIME_FIELD, page_size=101)
+
+
+def test_v2_client_rejected():
+    client = dialogflow_v2.AnswerRecordsClient(
+        credentials=ga_credentials.AnonymousCredentials()
+    )
+    with pytest.raises(TypeError):
+        answer_record_export.AnswerRecordExporter(client, TIME_FIELD)
+
+
+def test_export_and_resume(client, tmp_path):
+    path = str(tmp_path / "checkpoint")
+    windows = answer_record_export.time_windows(START, START + 6 * HOUR, HOUR)
+    output = io.StringIO()
+
+    checkpoint = answer_record_export.Checkpoint(path)
+    exporter = answer_record_export.AnswerRecordExporter(
+        client, TIME_FIELD, concurrency=2, page_size=4, checkpoint=checkpoint
+    )
+    stats = exporter.export(PARENT, windows, output, filter="fail")
+    checkpoint.close()
+    assert stats.windows == 5
+    assert list(stats.failed) == [answer_record_export.window_key(windows[4])]
+    assert stats.format().endswith(", 1 windows failed")
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["name"] for line in lines] == _expected(12) + _expected(0, 6)
+
+    # Simulate a run interrupted halfway through the failed window.
+    with open(path, "a", encoding="utf-8") as stream:
+        for name in _expected(6, 12)[:3]:
+            stream.write(
+                "{} {}\n".format(answer_record_export.window_key(windows[4]), name)
+            )
+
+    checkpoint = answer_record_export.Checkpoint(path)
+    exporter = answer_record_export.AnswerRecordExporter(
+        client, TIME_FIELD, concurrency=2, page_size=4, checkpoint=checkpoint
+    )
+    output = io.StringIO()
+    stats = exporter.export(PARENT, windows, output)
+    checkpoint.close()
+    assert stats.skipped_windows == 5
+    assert stats.skipped == 3
+    assert stats.windows == 1
+    assert not stats.failed
+    names = [json.loads(line)["name"] for line in output.getvalue().splitlines()]
+    assert names == _expected(6, 12)[3:]
+
+    checkpoint = answer_record_export.Checkpoint(path)
+    assert len(checkpoint.finished) == 6
+    assert checkpoint.exported(answer_record_export.window_key(windows[4])) == set()
+    checkpoint.close()
+
+
+def test_main(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(dialogflow_v2beta1, "AnswerRecordsClient", lambda: client)
+    output = tmp_path / "records.jsonl"
+    code = answer_record_export.main(
+        [
+            "--project",
+            "p",
+            "--start",
+            "2023-06-01T00:00:00Z",
+            "--end",
+            "2023-06-01T03:00:00Z",
+            "--window-minutes",
+            "30",
+            "--time-field",
+            TIME_FIELD,
+            "--output",
+            str(output),
+            "--checkpoint",
+            str(tmp_path / "done"),
+        ]
+    )
+    assert code == 0
+    names = [json.loads(line)["name"] for line in output.read_text().splitlines()]
+    assert names == _expected(0, 18)
+
+
+def test_main_requires_time_field(capsys):
+    with pytest.raises(SystemExit):
+        answer_record_export.main(
+            [
+                "--project",
+                "p",
+                "--start",
+                "2023-06-01T00:00:00Z",
+                "--end",
+                "2023-06-01T03:00:00Z",
+            ]
+        )
+    assert "required: --time-field" in capsys.readouterr().err
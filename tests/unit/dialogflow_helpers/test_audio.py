@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from array import array
+import io
+import math
+
+import pytest
+
+from google.cloud.dialogflow_helpers import audio
+from google.cloud.dialogflow_v2.types import AudioEncoding
+
+LINEAR_16 = AudioEncoding.AUDIO_ENCODING_LINEAR_16
+MULAW = AudioEncoding.AUDIO_ENCODING_MULAW
+
+
+def _tone(seconds, rate=16000, amplitude=8000):
+    count = int(seconds * rate)
+    return array(
+        "h",
+        (int(amplitude * math.sin(2 * math.pi * 440 * i / rate)) for i in range(count)),
+    )
+
+
+def _silence(seconds, rate=16000):
+    return array("h", [0] * int(seconds * rate))
+
+
+def test_mulaw_round_trip():
+    samples = array("h", [0, 1000, -1000, 32000, -32000, 12345])
+    decoded = audio.decode_mulaw(audio.encode_mulaw(samples))
+    for original, restored in zip(samples, decoded):
+        assert abs(original - restored) <= max(abs(original) // 16, 8)
+
+
+def test_passthrough_chunks_by_duration():
+    pipeline = audio.AudioPipeline(LINEAR_16, 16000)
+    data = _tone(0.25).tobytes()
+
+    chunks = list(pipeline.chunks(io.BytesIO(data)))
+
+    assert [len(chunk) for chunk in chunks] == [3200, 3200, 1600]
+    assert b"".join(chunks) == data
+    assert pipeline.chunk_duration_ms == 100
+    assert pipeline.stats.chunks == 3
+    assert pipeline.stats.bytes_out == len(data)
+
+
+def test_transcode_mulaw_to_linear16_and_resample():
+    pipeline = audio.AudioPipeline(
+        MULAW,
+        8000,
+        target_encoding=LINEAR_16,
+        target_sample_rate_hertz=16000,
+        read_size=333,
+    )
+    source = audio.encode_mulaw(_tone(0.5, rate=8000))
+
+    chunks = list(pipeline.chunks(source))
+
+    assert all(len(chunk) == 3200 for chunk in chunks[:-1])
+    total = sum(len(chunk) for chunk in chunks) // 2
+    assert abs(total - 8000) <= 2
+    config = pipeline.input_audio_config("en-US", single_utterance=True)
+    assert config.audio_encoding == LINEAR_16
+    assert config.sample_rate_hertz == 16000
+    assert config.single_utterance
+
+
+def test_downsample_linear16_to_mulaw():
+    pipeline = audio.AudioPipeline(
+        LINEAR_16, 16000, target_encoding=MULAW, target_sample_rate_hertz=8000
+    )
+    chunks = list(
+        pipeline.chunks([_tone(0.2).tobytes()[:1001], _tone(0.2).tobytes()[1001:]])
+    )
+
+    assert [len(chunk) for chunk in chunks] == [800, 800]
+
+
+def test_compressed_audio_is_only_rechunked():
+    pipeline = audio.AudioPipeline(
+        AudioEncoding.AUDIO_ENCODING_OGG_OPUS, 16000, chunk_bytes=10
+    )
+    assert list(pipeline.chunks(b"x" * 25)) == [b"x" * 10, b"x" * 10, b"x" * 5]
+    assert pipeline.chunk_duration_ms is None
+
+    with pytest.raises(ValueError):
+        audio.AudioPipeline(
+            AudioEncoding.AUDIO_ENCODING_OGG_OPUS, 16000, target_encoding=LINEAR_16
+        )
+    with pytest.raises(ValueError):
+        audio.AudioPipeline(
+            AudioEncoding.AUDIO_ENCODING_FLAC, 16000, vad=audio.EnergyVad()
+        )
+
+
+def test_vad_trims_silence_and_stops():
+    samples = _silence(1.0)
+    samples.extend(_tone(0.5))
+    samples.extend(_silence(2.0))
+    vad = audio.EnergyVad(pre_roll_ms=200, end_silence_ms=500)
+    pipeline = audio.AudioPipeline(LINEAR_16, 16000, vad=vad)
+
+    chunks = list(pipeline.chunks(samples.tobytes()))
+
+    # 200ms of pre-roll, 500ms of speech and 500ms of trailing silence.
+    assert len(chunks) == 12
+    assert pipeline.stats.stopped_early
+    assert pipeline.stats.dropped_ms == pytest.approx(800)
+
+
+def test_streaming_detect_intent_requests():
+    config = audio.AudioPipeline(LINEAR_16, 16000).input_audio_config("en-US")
+    requests = list(
+        audio.streaming_detect_intent_requests(
+            "projects/p/agent/sessions/s", [b"a", b"b"], config, single_utterance=True
+        )
+    )
+
+    assert requests[0].session == "projects/p/agent/sessions/s"
+    assert requests[0].query_input.audio_config.single_utterance
+    assert not config.single_utterance
+    assert [r.input_audio for r in requests[1:]] == [b"a", b"b"]
+
+
+def test_streaming_analyze_content_requests():
+    config = audio.AudioPipeline(MULAW, 8000).input_audio_config("en-US")
+    requests = list(
+        audio.streaming_analyze_content_requests(
+            "projects/p/conversations/c/participants/u", [b"a"], config
+        )
+    )
+
+    assert requests[0].participant == "projects/p/conversations/c/participants/u"
+    assert requests[0].audio_config.audio_encoding == MULAW
+    assert requests[1].input_audio == b"a"
+
+
+@pytest.mark.asyncio
+async def test_async_chunks_and_requests():
+    pipeline = audio.AudioPipeline(LINEAR_16, 16000)
+    data = _tone(0.15).tobytes()
+
+    async def source():
+        yield data[:1000]
+        yield data[1000:]
+
+    requests = audio.astreaming_analyze_content_requests(
+        "projects/p/conversations/c/participants/u",
+        pipeline.achunks(source()),
+        pipeline.input_audio_config("en-US"),
+    )
+    received = [request async for request in requests]
+
+    assert [len(r.input_audio) for r in received[1:]] == [3200, 1600]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pytest
+
+from tests.benchmark import marshalling
+
+
+@pytest.mark.parametrize("case", marshalling.CASES, ids=lambda case: case.name)
+def test_case_operations(case):
+    operations = case.operations()
+
+    assert tuple(operations) == marshalling.OPERATIONS
+    for func in operations.values():
+        func()
+
+
+def test_sizes():
+    message = marshalling.intent.Intent(marshalling._intent())
+    assert len(message.training_phrases) == 500
+    message = marshalling.entity_type.EntityType(marshalling._entity_type())
+    assert len(message.entities) == 10000
+
+
+def test_main_tracks_history(tmp_path, capsys):
+    history = str(tmp_path / "history.jsonl")
+    argv = [
+        "--filter",
+        r"^DetectIntentRequest\.serialize$",
+        "--min-time",
+        "0.001",
+        "--repeat",
+        "1",
+        "--history",
+        history,
+    ]
+
+    assert marshalling.main(argv) == 0
+    entries = marshalling.load_history(history)
+    assert len(entries) == 1
+    assert list(entries[0]["results"]) == ["DetectIntentRequest.serialize"]
+    assert entries[0]["environment"] == marshalling.environment()
+
+    # Make the recorded run look ten times faster than any real one.
+    entries[0]["results"]["DetectIntentRequest.serialize"]["median"] = 1e-12
+    (tmp_path / "history.jsonl").write_text("")
+    marshalling.save(history, entries[0])
+    capsys.readouterr()
+
+    assert marshalling.main(argv + ["--fail-on-regression", "--no-save"]) == 1
+    out = capsys.readouterr().out
+    assert "1 regression(s)" in out
+    assert len(marshalling.load_history(history)) == 1
+
+
+def test_compare_ignores_other_environments():
+    results = {"A.serialize": {"median": 2.0, "min": 2.0, "number": 1}}
+    history = [
+        {"environment": {"python": "x"}, "results": {"A.serialize": {"median": 1.0}}},
+        {"environment": {"python": "y"}, "results": {"A.serialize": {"median": 4.0}}},
+    ]
+
+    changes = marshalling.compare(results, history, {"python": "x"})
+
+    assert changes == {"A.serialize": (1.0, 1.0)}
+    table, regressions = marshalling.report(results, changes, threshold=0.5)
+    assert regressions == ["A.serialize"]
+    assert "+100.0%" in table
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pytest
+
+from tests.benchmark import marshalling, notifications
+
+
+@pytest.mark.parametrize(
+    "message_format",
+    [notifications.MessageFormat.PROTO, notifications.MessageFormat.JSON],
+)
+@pytest.mark.parametrize("case", notifications.CASES, ids=lambda case: case.name)
+def test_routes_agree(case, message_format):
+    operations = case.operations(message_format)
+
+    assert tuple(operations) == notifications.ROUTES
+    results = {route: func() for route, func in operations.items()}
+    assert len(results["lazy.payload"]) == notifications.BATCH_SIZE
+    assert results["lazy.header"] == results["proto_plus.header"]
+    assert results["lazy.payload"] == results["proto_plus.payload"]
+
+
+def test_main(tmp_path, capsys):
+    history = str(tmp_path / "history.jsonl")
+
+    argv = ["--filter", r"^ConversationEvent\.JSON\.lazy\.header$"]
+    argv += ["--min-time", "0.001", "--repeat", "1", "--history", history]
+    assert notifications.main(argv) == 0
+    entries = marshalling.load_history(history)
+    assert list(entries[0]["results"]) == ["ConversationEvent.JSON.lazy.header"]
+    assert "ConversationEvent.JSON.lazy.header" in capsys.readouterr().out
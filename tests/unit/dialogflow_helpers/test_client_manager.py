@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+
+import grpc
+from grpc.experimental import aio
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import client_manager, fake_server
+from google.cloud.dialogflow_helpers.shared_channel import SharedChannel
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer() as server:
+        yield server
+
+
+def _manager(server, asyncio=False, before_open=None, **kwargs):
+    opened = []
+
+    def factory(project, credentials):
+        if before_open is not None:
+            before_open(project)
+        if asyncio:
+            channel = aio.insecure_channel(server.address)
+        else:
+            channel = grpc.insecure_channel(server.address)
+        shared = SharedChannel(channels=[channel], asyncio=asyncio)
+        opened.append((project, shared))
+        return shared
+
+    manager = client_manager.TenantClientManager(
+        channel_factory=factory, asyncio=asyncio, **kwargs
+    )
+    return manager, opened
+
+
+def test_reuses_clients_per_tenant(server):
+    manager, opened = _manager(server)
+    first = object()
+    second = object()
+
+    sessions = manager.get(dialogflow_v2.SessionsClient, "a", first)
+    assert manager.get(dialogflow_v2.SessionsClient, "a", first) is sessions
+    participants = manager.get(dialogflow_v2.ParticipantsClient, "a", first)
+    other = manager.get(dialogflow_v2.SessionsClient, "a", second)
+
+    assert other is not sessions
+    sessions.detect_intent(session="projects/a/agent/sessions/s")
+    participants.analyze_content(
+        participant="projects/a/conversations/c/participants/p"
+    )
+    # Clients of one tenant share its channel.
+    assert [project for project, _ in opened] == ["a", "a"]
+    assert manager.tenants == 2
+    assert manager.stats.hits == 1
+    assert manager.stats.misses == 3
+    assert manager.stats.hit_rate == 0.25
+    assert manager.stats.creation_seconds.count == 3
+
+    manager.close()
+    assert all(shared.closed for _, shared in opened)
+    with pytest.raises(ValueError):
+        manager.get(dialogflow_v2.SessionsClient, "a", first)
+
+
+def test_capacity_and_idle_eviction(server):
+    clock = FakeClock()
+    manager, opened = _manager(server, max_channels=2, idle_timeout=60, clock=clock)
+
+    manager.get(dialogflow_v2.SessionsClient, "a")
+    manager.get(dialogflow_v2.SessionsClient, "b")
+    manager.get(dialogflow_v2.SessionsClient, "a")
+    manager.get(dialogflow_v2.SessionsClient, "c")
+
+    # "b" was least recently used.
+    assert [shared.closed for _, shared in opened] == [False, True, False]
+    assert manager.stats.capacity_evictions == 1
+    assert manager.channels == 2
+
+    with manager.client(dialogflow_v2.SessionsClient, "c") as sessions:
+        clock.now = 120
+        assert manager.evict_idle() == 1
+        sessions.detect_intent(session="projects/c/agent/sessions/s")
+    assert not opened[2][1].closed
+    clock.now = 180
+    manager.get(dialogflow_v2.SessionsClient, "d")
+    assert opened[2][1].closed
+    assert manager.stats.idle_evictions == 2
+    assert manager.evict("d")
+    assert manager.tenants == 0
+
+
+@pytest.mark.asyncio
+async def test_async_eviction(server):
+    manager, opened = _manager(server, asyncio=True, max_channels=1)
+
+    sessions = manager.get(dialogflow_v2.SessionsAsyncClient, "a")
+    await sessions.detect_intent(session="projects/a/agent/sessions/s")
+    manager.get(dialogflow_v2.SessionsAsyncClient, "b")
+    await manager.close()
+
+    assert all(shared.closed for _, shared in opened)
+    assert manager.stats.capacity_evictions == 1
+
+
+def test_channels_opened_outside_lock(server):
+    barrier = threading.Barrier(2)
+    release = threading.Event()
+
+    def before_open(project):
+        if project == "slow":
+            assert release.wait(timeout=5)
+        else:
+            barrier.wait(timeout=5)
+
+    manager, opened = _manager(server, before_open=before_open)
+    slow = threading.Thread(
+        target=manager.get, args=(dialogflow_v2.SessionsClient, "slow")
+    )
+    slow.start()
+    # Two lookups of one tenant race while "slow" is still connecting.
+    clients = []
+    threads = [
+        threading.Thread(
+            target=lambda: clients.append(
+                manager.get(dialogflow_v2.SessionsClient, "a")
+            )
+        )
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    slow.join()
+
+    assert clients[0] is clients[1]
+    assert manager.tenants == 2
+    assert manager.stats.channels_created == 2
+    assert manager.stats.misses + manager.stats.hits == 3
+    # The losing lookup's channel was closed again.
+    assert sorted(shared.closed for project, shared in opened if project == "a") == [
+        False,
+        True,
+    ]
+    manager.close()
+
+
+def test_tenant_evicted_while_creating_client(server):
+    manager, opened = _manager(server)
+    manager.get(dialogflow_v2.SessionsClient, "a")
+    shared = opened[0][1]
+    create_client = shared.client
+
+    def evict_then_create(client_class):
+        # Another thread evicts the tenant between the lookup and here.
+        evictor = threading.Thread(target=manager.evict, args=("a",))
+        evictor.start()
+        evictor.join()
+        return create_client(client_class)
+
+    shared.client = evict_then_create
+    participants = manager.get(dialogflow_v2.ParticipantsClient, "a")
+
+    assert shared.closed
+    assert len(opened) == 2
+    assert not opened[1][1].closed
+    participants.analyze_content(
+        participant="projects/a/conversations/c/participants/p"
+    )
+    assert manager.tenants == 1
+    manager.close()
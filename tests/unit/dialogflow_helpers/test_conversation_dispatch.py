@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import threading
+import time
+
+from google.api_core import exceptions as core_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import conversation_dispatch
+
+
+def _participant(conversation):
+    return "projects/p/conversations/{}/participants/u".format(conversation)
+
+
+class _Client(object):
+    """Records the order of requests per conversation."""
+
+    def __init__(self, delay=0.01, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self._lock = threading.Lock()
+
+    def _begin(self, request):
+        with self._lock:
+            self.calls.append(request.text_input.text)
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+
+    def _end(self, request):
+        with self._lock:
+            self.concurrent -= 1
+        if request.text_input.text in self.fail:
+            self.fail.discard(request.text_input.text)
+            raise core_exceptions.ServiceUnavailable("try again")
+        return dialogflow_v2.AnalyzeContentResponse(reply_text=request.text_input.text)
+
+    def analyze_content(self, request, **kwargs):
+        self._begin(request)
+        time.sleep(self.delay)
+        return self._end(request)
+
+
+class _AsyncClient(_Client):
+    async def analyze_content(self, request, **kwargs):
+        self._begin(request)
+        await asyncio.sleep(self.delay)
+        return self._end(request)
+
+
+def _ordered(calls, conversations, per_conversation):
+    for conversation in range(conversations):
+        texts = [c for c in calls if c.startswith("{}:".format(conversation))]
+        assert texts == [
+            "{}:{}".format(conversation, i) for i in range(per_conversation)
+        ]
+
+
+def test_ordered_per_conversation_and_concurrent_across():
+    client = _Client()
+    with conversation_dispatch.OrderedDispatcher(client, max_workers=4) as dispatcher:
+        results = [
+            dispatcher.submit(
+                participant=_participant(c),
+                text_input={"text": "{}:{}".format(c, i), "language_code": "en"},
+            )
+            for i in range(5)
+            for c in range(4)
+        ]
+        assert dispatcher.join(timeout=10)
+
+    assert [f.result().reply_text for f in results[:4]] == ["0:0", "1:0", "2:0", "3:0"]
+    _ordered(client.calls, 4, 5)
+    assert client.max_concurrent > 1
+    assert dispatcher.lanes() == {}
+    assert dispatcher.wait.count == 20
+    with pytest.raises(RuntimeError):
+        dispatcher.submit(participant=_participant(0))
+
+
+def test_request_id_deduplication_and_retry():
+    client = _Client(fail={"b"})
+    with conversation_dispatch.OrderedDispatcher(client) as dispatcher:
+        first = dispatcher.submit(participant=_participant(0), text_input={"text": "a"})
+        request = {
+            "participant": _participant(0),
+            "text_input": {"text": "b"},
+            "request_id": "r-1",
+        }
+        failed = dispatcher.submit(request)
+        assert dispatcher.submit(request) is failed
+        with pytest.raises(core_exceptions.ServiceUnavailable):
+            failed.result()
+
+        retried = dispatcher.submit(request)
+        assert retried is not failed
+        assert retried.result().reply_text == "b"
+        assert dispatcher.submit(request) is retried
+
+    assert first.result().reply_text == "a"
+    assert client.calls == ["a", "b", "b"]
+
+
+def test_lane_bound_and_lag():
+    now = [0.0]
+    release = threading.Event()
+
+    class Blocking(_Client):
+        def analyze_content(self, request, **kwargs):
+            release.wait(5)
+            return dialogflow_v2.AnalyzeContentResponse()
+
+    dispatcher = conversation_dispatch.OrderedDispatcher(
+        Blocking(), max_queue=2, clock=lambda: now[0]
+    )
+    participant = _participant(0)
+    for _ in range(3):
+        dispatcher.submit(participant=participant)
+    with pytest.raises(conversation_dispatch.LaneFull):
+        dispatcher.submit(participant=participant, block=False)
+    # Other conversations have their own lane.
+    dispatcher.submit(participant=_participant(1))
+
+    now[0] = 3.0
+    stats = dispatcher.lanes()["projects/p/conversations/0"]
+    assert stats == conversation_dispatch.LaneStats(
+        queued=2, in_flight=True, lag=3.0, completed=0
+    )
+    assert dispatcher.lag(participant) == 3.0
+    with pytest.raises(conversation_dispatch.LaneFull):
+        dispatcher.submit(participant=participant, queue_timeout=-1)
+
+    release.set()
+    dispatcher.close()
+    assert dispatcher.lag(participant) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher():
+    client = _AsyncClient(fail={"1:1"})
+    async with conversation_dispatch.AsyncOrderedDispatcher(
+        client, max_concurrency=2, max_queue=2
+    ) as dispatcher:
+        results = []
+        for i in range(4):
+            for c in range(3):
+                results.append(
+                    await dispatcher.submit(
+                        participant=_participant(c),
+                        text_input={"text": "{}:{}".format(c, i)},
+                    )
+                )
+        assert max(s.queued for s in dispatcher.lanes().values()) <= 2
+        await dispatcher.join()
+
+    _ordered(client.calls, 3, 4)
+    assert client.max_concurrent == 2
+    assert isinstance(results[4].exception(), core_exceptions.ServiceUnavailable)
+    assert results[5].result().reply_text == "2:1"
+    assert dispatcher.lanes() == {}
+
+
+@pytest.mark.asyncio
+async def test_async_close_without_waiting():
+    client = _AsyncClient(delay=5)
+    dispatcher = conversation_dispatch.AsyncOrderedDispatcher(client)
+    first = await dispatcher.submit(participant=_participant(0), request_id="x")
+    assert await dispatcher.submit(participant=_participant(0), request_id="x") is first
+    with pytest.raises(conversation_dispatch.LaneFull):
+        dispatcher.max_queue = 0
+        await dispatcher.submit(participant=_participant(0), block=False)
+    second = await dispatcher.submit(participant=_participant(1))
+    await asyncio.sleep(0)
+
+    await dispatcher.close(wait=False)
+
+    assert first.cancelled() and second.cancelled()
+    with pytest.raises(RuntimeError):
+        await dispatcher.submit(participant=_participant(2))
+
+
+@pytest.mark.asyncio
+async def test_async_retry_respects_lane_bound():
+    client = _AsyncClient(fail={"0:0"})
+    dispatcher = conversation_dispatch.AsyncOrderedDispatcher(client, max_queue=1)
+    failed = await dispatcher.submit(
+        participant=_participant(0), text_input={"text": "0:0"}, request_id="r"
+    )
+    with pytest.raises(core_exceptions.ServiceUnavailable):
+        await failed
+
+    client.delay = 5
+    await dispatcher.submit(participant=_participant(0), text_input={"text": "0:1"})
+    await asyncio.sleep(0)
+    await dispatcher.submit(participant=_participant(0), text_input={"text": "0:2"})
+    # The retry of the failed request does not skip the full lane.
+    with pytest.raises(conversation_dispatch.LaneFull):
+        await dispatcher.submit(
+            participant=_participant(0),
+            text_input={"text": "0:0"},
+            request_id="r",
+            block=False,
+        )
+    with pytest.raises(conversation_dispatch.LaneFull):
+        await dispatcher.submit(
+            participant=_participant(0),
+            text_input={"text": "0:0"},
+            request_id="r",
+            queue_timeout=0.05,
+        )
+    assert dispatcher.lanes()[_participant(0).rsplit("/", 2)[0]].queued == 1
+    await dispatcher.close(wait=False)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import csv
+import io
+import json
+
+import grpc
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import conversation_export, fake_server
+
+PARENT = "projects/p/locations/global"
+
+
+def _page(items, field, request, total):
+    start = int(request.page_token or 0)
+    end = min(start + request.page_size, total)
+    return {
+        field: [items(i) for i in range(start, end)],
+        "next_page_token": str(end) if end < total else "",
+    }
+
+
+def _list_messages(request, context):
+    if request.parent.endswith("/c3"):
+        context.abort(grpc.StatusCode.PERMISSION_DENIED, "no access")
+    return _page(
+        lambda i: {
+            "name": "{}/messages/m{}".format(request.parent, i),
+            "content": 'text, "quoted" {}'.format(i),
+            "participant": request.parent + "/participants/u",
+            "participant_role": "END_USER",
+            "create_time": {"seconds": 1700000000 + i},
+            "sentiment_analysis": {
+                "query_text_sentiment": {"score": 0.5, "magnitude": 1.0}
+            }
+            if i % 2
+            else {},
+        },
+        "messages",
+        request,
+        5,
+    )
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer(
+        services=("conversations", "participants")
+    ) as server:
+        server.set_response(
+            "Conversations.ListConversations",
+            lambda request, context: _page(
+                lambda i: {
+                    "name": "{}/conversations/c{}".format(PARENT, i),
+                    "lifecycle_state": "COMPLETED",
+                    "start_time": {"seconds": 1700000000},
+                },
+                "conversations",
+                request,
+                7,
+            ),
+        )
+        server.set_response("Conversations.ListMessages", _list_messages)
+        server.set_response(
+            "Participants.ListParticipants",
+            lambda request, context: {
+                "participants": [
+                    {"name": request.parent + "/participants/u", "role": "END_USER"},
+                    {"name": request.parent + "/participants/a", "role": "HUMAN_AGENT"},
+                ]
+            },
+        )
+        yield server
+
+
+@pytest.mark.parametrize("format", conversation_export.FORMATS)
+def test_export(server, format):
+    streams = {table: io.StringIO() for table in conversation_export.COLUMNS}
+    writers = {
+        table: conversation_export.TableWriter(
+            stream, conversation_export.COLUMNS[table], format
+        )
+        for table, stream in streams.items()
+    }
+    progress = []
+    exporter = conversation_export.ConversationExporter(
+        server.create_client(dialogflow_v2.ConversationsClient),
+        writers,
+        participants_client=server.create_client(dialogflow_v2.ParticipantsClient),
+        concurrency=3,
+        page_size=2,
+        progress=progress.append,
+    )
+
+    stats = exporter.export(PARENT, filter='lifecycle_state = "COMPLETED"')
+
+    assert stats.rows == {"conversations": 7, "participants": 14, "messages": 30}
+    assert list(stats.failed) == [PARENT + "/conversations/c3"]
+    assert "PermissionDenied" in stats.failed[PARENT + "/conversations/c3"]
+    assert len(progress) == 7
+    assert server.calls["Conversations.ListConversations"] == 4
+    assert server.calls["Conversations.ListMessages"] == 6 * 3 + 1
+    assert "30 messages" in stats.format() and "1 failed" in stats.format()
+
+    if format == conversation_export.CSV:
+        rows = list(csv.DictReader(io.StringIO(streams["messages"].getvalue())))
+    else:
+        rows = [
+            json.loads(line) for line in streams["messages"].getvalue().splitlines()
+        ]
+    rows.sort(key=lambda row: row["name"])
+    first = rows[0]
+    assert first["conversation"] == PARENT + "/conversations/c0"
+    assert first["content"] == 'text, "quoted" 0'
+    assert first["participant_role"] == "END_USER"
+    assert first["create_time"] == "2023-11-14T22:13:20Z"
+    assert first["sentiment_score"] in (None, "")
+    assert float(rows[1]["sentiment_magnitude"]) == 1.0
+
+
+def test_open_writers(tmp_path):
+    writers = conversation_export.open_writers(
+        str(tmp_path), conversation_export.CSV, tables=["conversations"]
+    )
+    writers["conversations"].write([["c", "COMPLETED", None, "", None, None]])
+    conversation_export.close_writers(writers)
+
+    assert (tmp_path / "conversations.csv").read_text().splitlines() == [
+        ",".join(conversation_export.COLUMNS["conversations"]),
+        "c,COMPLETED,,,,",
+    ]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        conversation_export.TableWriter(io.StringIO(), ("a",), "parquet")
+    with pytest.raises(ValueError):
+        conversation_export.ConversationExporter(None, {"calls": None})
+    with pytest.raises(ValueError):
+        conversation_export.ConversationExporter(None, {"participants": None})
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+import datetime
+import threading
+import time
+
+from google.auth import credentials as ga_credentials
+from google.auth import exceptions as auth_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import credential_refresh
+
+
+class FakeCredentials(ga_credentials.Credentials):
+    def __init__(self, lifetime=3600.0, fail=0):
+        super(FakeCredentials, self).__init__()
+        self.lifetime = lifetime
+        self.fail = fail
+        self.calls = 0
+        self.refreshed = threading.Event()
+
+    def refresh(self, request):
+        self.calls += 1
+        if self.fail:
+            self.fail -= 1
+            raise auth_exceptions.RefreshError("token endpoint unavailable")
+        self.token = "token-{}".format(self.calls)
+        self.expiry = credential_refresh._utcnow() + datetime.timedelta(
+            seconds=self.lifetime
+        )
+        self.refreshed.set()
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_refreshes_before_expiry():
+    credentials = FakeCredentials(lifetime=1.2)
+    refresher = credential_refresh.refresh_in_background(
+        credentials, margin=1.0, request=mock.Mock()
+    )
+    try:
+        # The first refresh fetches a token; later ones happen 1s early.
+        _wait(lambda: refresher.refreshes >= 3)
+        assert credentials.token == "token-{}".format(credentials.calls)
+        assert refresher.last_duration >= 0
+    finally:
+        refresher.release()
+    assert not refresher.running
+
+
+def test_release_does_not_wait_for_hung_refresh():
+    unblock = threading.Event()
+    credentials = FakeCredentials()
+    credentials.refresh = lambda request: unblock.wait()
+    refresher = credential_refresh.refresh_in_background(
+        credentials, request=mock.Mock()
+    )
+    try:
+        start = time.monotonic()
+        refresher.release(timeout=0.1)
+        assert time.monotonic() - start < 1.0
+        assert not refresher.running
+    finally:
+        unblock.set()
+
+
+def test_shared_per_credentials():
+    credentials = FakeCredentials()
+    first = credential_refresh.refresh_in_background(credentials, request=mock.Mock())
+    second = credential_refresh.refresh_in_background(credentials)
+    other = credential_refresh.refresh_in_background(
+        FakeCredentials(), request=mock.Mock()
+    )
+
+    assert first is second
+    assert first is not other
+    credentials.refreshed.wait(5)
+    first.release()
+    assert second.running
+    second.release()
+    other.release()
+    assert not second.running
+    assert credential_refresh._refreshers == {}
+
+
+def test_failures_back_off_and_recover():
+    credentials = FakeCredentials(fail=1)
+    refresher = credential_refresh.BackgroundRefresher(credentials, request=mock.Mock())
+    with mock.patch.object(credential_refresh, "_MAX_BACKOFF", 0.01):
+        refresher.start()
+        try:
+            assert credentials.refreshed.wait(5)
+        finally:
+            refresher.stop()
+
+    assert refresher.failures == 1
+    assert isinstance(refresher.last_error, auth_exceptions.RefreshError)
+    assert refresher.refreshes == 1
+    # A fresh token is not refreshed again until the margin is reached.
+    assert refresher.seconds_until_refresh() > 3000
+
+
+def test_enable_on_clients():
+    credentials = FakeCredentials()
+    sessions = dialogflow_v2.SessionsClient(credentials=credentials)
+    participants = dialogflow_v2.ParticipantsClient(
+        credentials=credentials, transport="rest"
+    )
+
+    refresher = credential_refresh.enable_background_refresh(
+        sessions, request=mock.Mock()
+    )
+    try:
+        assert credential_refresh.enable_background_refresh(participants) is refresher
+        assert credentials.refreshed.wait(5)
+    finally:
+        refresher.release()
+        refresher.release()
+
+    transport = dialogflow_v2.SessionsClient.get_transport_class("grpc")(
+        channel=mock.Mock()
+    )
+    with pytest.raises(ValueError):
+        credential_refresh.enable_background_refresh(transport)
+
+
+def test_default_margin_exceeds_auth_threshold():
+    assert credential_refresh.DEFAULT_MARGIN > credential_refresh._AUTH_THRESHOLD
+
+
+def test_concurrent_callers_start_one_thread():
+    credentials = FakeCredentials()
+    started = []
+
+    class SlowThread(threading.Thread):
+        def start(self):
+            # Widen the window in which the refresher is not yet running.
+            time.sleep(0.05)
+            started.append(self)
+            super(SlowThread, self).start()
+
+    barrier = threading.Barrier(4)
+    refreshers = []
+
+    def use():
+        barrier.wait(5)
+        refreshers.append(
+            credential_refresh.refresh_in_background(credentials, request=mock.Mock())
+        )
+
+    callers = [threading.Thread(target=use) for _ in range(4)]
+    with mock.patch.object(credential_refresh.threading, "Thread", SlowThread):
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+    assert len(started) == 1
+    assert len(set(map(id, refreshers))) == 1
+    for refresher in refreshers:
+        refresher.release()
+    assert not started[0].is_alive()
+    assert credential_refresh._refreshers == {}
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import io
+import json
+import os
+
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+from concurrent import futures
+
+from google.longrunning import operations_pb2
+from google.protobuf import any_pb2
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import dataset_builder, fake_server
+
+DATASET = "projects/p/locations/global/conversationDatasets/d"
+
+
+def _transcript(i, turns=2):
+    return {
+        "id": "c/{}".format(i),
+        "entries": [
+            {
+                "role": "END_USER" if t % 2 else "HUMAN_AGENT",
+                "text": "turn {}".format(t),
+            }
+            for t in range(turns)
+        ],
+    }
+
+
+def test_convert_transcript():
+    converted = dataset_builder.convert_transcript(
+        {
+            "entries": [
+                {"role": "agent", "text": " hi ", "time": "2023-06-01T00:00:00Z"},
+                {"role": "CUSTOMER", "text": "hello", "user_id": 7},
+                {
+                    "role": "AUTOMATED_AGENT",
+                    "text": "bye",
+                    "start_timestamp_usec": 1685577605000000,
+                },
+            ]
+        }
+    )
+    assert converted == {
+        "conversation_info": {"categories": []},
+        "entries": [
+            {
+                "start_timestamp_usec": 1685577600000000,
+                "text": "hi",
+                "role": "AGENT",
+                "user_id": 1,
+            },
+            {
+                "start_timestamp_usec": 1685577601000000,
+                "text": "hello",
+                "role": "CUSTOMER",
+                "user_id": 7,
+            },
+            {
+                "start_timestamp_usec": 1685577605000000,
+                "text": "bye",
+                "role": "AGENT",
+                "user_id": 1,
+            },
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "entries,message",
+    [
+        ([], "both an agent and a customer"),
+        ([{"role": "AGENT", "text": "a"}], "both an agent and a customer"),
+        ([{"role": "BOT", "text": "a"}], "unknown role"),
+        ([{"role": "AGENT", "text": " "}], "no text"),
+        (
+            [
+                {"role": "AGENT", "text": "a", "start_timestamp_usec": 10},
+                {"role": "CUSTOMER", "text": "b", "start_timestamp_usec": 5},
+            ],
+            "out of order",
+        ),
+        ([{"role": "AGENT", "text": "a", "time": "yesterday"}], "Invalid time"),
+    ],
+)
+def test_convert_transcript_invalid(entries, message):
+    with pytest.raises(dataset_builder.InvalidTranscript, match=message):
+        dataset_builder.convert_transcript({"entries": entries})
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_build_balanced(tmp_path, processes):
+    transcripts = [_transcript(i, turns=2 + i % 5) for i in range(40)]
+    transcripts.insert(5, {"id": "bad", "entries": [{"role": "AGENT", "text": "x"}]})
+    rejects = io.StringIO()
+    progress = mock.Mock()
+    sink = dataset_builder.DirectorySink(str(tmp_path), uri="gs://b/d")
+    builder = dataset_builder.DatasetBuilder(
+        sink,
+        shards=4,
+        processes=processes,
+        batch_size=3,
+        rejects=rejects,
+        progress=progress,
+    )
+    stats = builder.build(iter(transcripts))
+    assert stats.conversations == 40
+    assert stats.invalid == 1
+    assert json.loads(rejects.getvalue())["id"] == "bad"
+    assert sum(stats.shard_conversations) == 40
+    assert progress.call_count == 14
+    assert "40 conversations" in stats.format()
+
+    files = {}
+    for shard in range(4):
+        directory = tmp_path / dataset_builder.shard_name(shard)
+        names = os.listdir(str(directory))
+        assert len(names) == stats.shard_conversations[shard]
+        assert sum(os.path.getsize(str(directory / n)) for n in names) == (
+            stats.shard_bytes[shard]
+        )
+        files.update((n, directory / n) for n in names)
+    # Greedy placement keeps shards within one conversation of each other.
+    largest = max(os.path.getsize(str(path)) for path in files.values())
+    assert max(stats.shard_bytes) - min(stats.shard_bytes) <= largest
+    seventh = dataset_builder.conversation_filename("c/7")
+    assert seventh in files
+    assert len(json.loads(files[seventh].read_text())["entries"]) == 4
+
+    config = builder.input_config()
+    assert list(config.gcs_source.uris) == [
+        "gs://b/d/shard-0000{}/*.json".format(i) for i in range(4)
+    ]
+
+
+def test_conversation_filename():
+    assert dataset_builder.conversation_filename("a_b") == "a_b.json"
+    assert dataset_builder.conversation_filename("a/b").startswith("a_b-")
+    assert dataset_builder.conversation_filename(
+        "a/b"
+    ) != dataset_builder.conversation_filename("a:b")
+
+
+def test_build_rejects_colliding_files(tmp_path):
+    transcripts = [dict(_transcript(0), id=name) for name in ("a/b", "a_b", "a/b")]
+    rejects = io.StringIO()
+    builder = dataset_builder.DatasetBuilder(
+        dataset_builder.DirectorySink(str(tmp_path), uri="gs://b/d"),
+        shards=1,
+        processes=0,
+        rejects=rejects,
+    )
+    stats = builder.build(transcripts)
+    assert stats.conversations == 2
+    assert stats.invalid == 1
+    reject = json.loads(rejects.getvalue())
+    assert reject["id"] == "a/b"
+    assert "Duplicate" in reject["error"]
+    assert sorted(os.listdir(str(tmp_path / dataset_builder.shard_name(0)))) == sorted(
+        dataset_builder.conversation_filename(name) for name in ("a/b", "a_b")
+    )
+
+
+def test_input_config_skips_empty_shards(tmp_path):
+    builder = dataset_builder.DatasetBuilder(
+        dataset_builder.DirectorySink(str(tmp_path), uri="gs://b/d"),
+        shards=8,
+        processes=0,
+    )
+    with pytest.raises(ValueError):
+        builder.input_config()
+    builder.build([_transcript(i) for i in range(3)])
+    assert len(builder.input_config().gcs_source.uris) == 3
+
+
+def test_directory_sink_needs_uri(tmp_path):
+    with pytest.raises(ValueError):
+        dataset_builder.DirectorySink(str(tmp_path)).pattern(0)
+
+
+def test_build_write_error(tmp_path):
+    sink = mock.Mock()
+    sink.write.side_effect = OSError("disk full")
+    builder = dataset_builder.DatasetBuilder(sink, processes=0, batch_size=2)
+    with pytest.raises(OSError):
+        builder.build(_transcript(i) for i in range(10))
+
+
+def test_gcs_sink():
+    client = mock.Mock()
+    sink = dataset_builder.GcsSink("gs://bucket/some/prefix/", client=client)
+    client.bucket.assert_called_once_with("bucket")
+    sink.write(3, "c.json", b"{}")
+    client.bucket.return_value.blob.assert_called_once_with(
+        "some/prefix/shard-00003/c.json"
+    )
+    assert sink.pattern(3) == "gs://bucket/some/prefix/shard-00003/*.json"
+    with pytest.raises(ValueError):
+        dataset_builder.GcsSink("/tmp/x", client=client)
+
+
+def test_import_conversation_data():
+    response = dialogflow_v2.ImportConversationDataOperationResponse(
+        conversation_dataset=DATASET, import_count=40
+    )
+    metadata = dialogflow_v2.ImportConversationDataOperationMetadata(
+        conversation_dataset=DATASET
+    )
+    result = any_pb2.Any()
+    result.Pack(type(response).pb(response))
+    packed = any_pb2.Any()
+    packed.Pack(type(metadata).pb(metadata))
+    requests = []
+
+    def respond(request, context):
+        requests.append(request)
+        return operations_pb2.Operation(
+            name="operations/1", done=True, response=result, metadata=packed
+        )
+
+    with fake_server.FakeDialogflowServer(
+        services=("conversation_datasets",)
+    ) as server:
+        server.set_response("ConversationDatasets.ImportConversationData", respond)
+        client = server.create_client(dialogflow_v2.ConversationDatasetsClient)
+        progress = mock.Mock()
+        config = dialogflow_v2.InputConfig(
+            gcs_source=dialogflow_v2.GcsSources(uris=["gs://b/d/shard-00000/*.json"])
+        )
+        imported = dataset_builder.import_conversation_data(
+            client, DATASET, config, progress=progress
+        )
+    assert imported.import_count == 40
+    assert requests[0].input_config.gcs_source.uris == ["gs://b/d/shard-00000/*.json"]
+    progress.assert_called_once()
+    assert progress.call_args[0][0].conversation_dataset == DATASET
+
+
+def test_import_conversation_data_polls():
+    operation = mock.Mock()
+    operation.done.side_effect = [False, False, True]
+    operation.result.return_value = "response"
+    client = mock.Mock()
+    client.import_conversation_data.return_value = operation
+    progress = mock.Mock()
+    sleep = mock.Mock()
+    assert (
+        dataset_builder.import_conversation_data(
+            client, DATASET, {}, poll_interval=5, progress=progress, sleep=sleep
+        )
+        == "response"
+    )
+    assert sleep.call_args_list == [mock.call(5), mock.call(5)]
+    assert progress.call_count == 3
+
+
+def test_import_conversation_data_timeout():
+    client = mock.Mock()
+    client.import_conversation_data.return_value.done.return_value = False
+    with pytest.raises(futures.TimeoutError):
+        dataset_builder.import_conversation_data(
+            client, DATASET, {}, timeout=0, sleep=mock.Mock()
+        )
+
+
+def test_main(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text(
+        "".join(json.dumps(_transcript(i)) + "\n" for i in range(5)) + "\n{}\n"
+    )
+    rejects = tmp_path / "rejects.jsonl"
+    code = dataset_builder.main(
+        [
+            "--input",
+            str(path),
+            "--output",
+            str(tmp_path / "out"),
+            "--shards",
+            "2",
+            "--processes",
+            "0",
+            "--rejects",
+            str(rejects),
+        ]
+    )
+    assert code == 0
+    assert len(rejects.read_text().splitlines()) == 1
+    assert sorted(os.listdir(str(tmp_path / "out"))) == ["shard-00000", "shard-00001"]
+
+
+def test_main_import_needs_gcs_output(tmp_path, capsys):
+    path = tmp_path / "in.jsonl"
+    path.write_text(json.dumps(_transcript(0)) + "\n")
+    with pytest.raises(SystemExit):
+        dataset_builder.main(
+            [
+                "--input",
+                str(path),
+                "--output",
+                str(tmp_path / "out"),
+                "--dataset",
+                DATASET,
+            ]
+        )
+    assert "--dataset requires a gs:// --output" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
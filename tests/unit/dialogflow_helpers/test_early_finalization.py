@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pytest
+
+from google.cloud.dialogflow_helpers import early_finalization
+from google.cloud.dialogflow_v2.types import AudioEncoding, session
+
+MessageType = session.StreamingRecognitionResult.MessageType
+
+
+def _requests(chunks=10):
+    yield session.StreamingDetectIntentRequest(
+        session="projects/p/agent/sessions/s",
+        query_input={
+            "audio_config": {
+                "audio_encoding": AudioEncoding.AUDIO_ENCODING_LINEAR_16,
+                "sample_rate_hertz": 16000,
+                "language_code": "en-US",
+            }
+        },
+    )
+    for _ in range(chunks):
+        yield session.StreamingDetectIntentRequest(input_audio=b"\x00" * 3200)
+
+
+def _responses(requests, received, end_after=2):
+    for request in requests:
+        received.append(request)
+        if len(received) == end_after + 1:
+            yield session.StreamingDetectIntentResponse(
+                recognition_result={"message_type": MessageType.END_OF_SINGLE_UTTERANCE}
+            )
+    yield session.StreamingDetectIntentResponse(query_result={"query_text": "hi"})
+
+
+class FakeSessionsClient(object):
+    def __init__(self, end_after=2):
+        self.received = []
+        self.end_after = end_after
+
+    def streaming_detect_intent(self, requests, **kwargs):
+        return _responses(requests, self.received, self.end_after)
+
+
+def test_half_closes_after_end_of_utterance():
+    client = FakeSessionsClient()
+
+    stream = early_finalization.streaming_detect_intent(
+        client, _requests(), measure_skipped=True
+    )
+    responses = list(stream)
+
+    assert len(responses) == 2
+    assert client.received[0].query_input.audio_config.single_utterance
+    assert len(client.received) == 3
+    assert stream.final_response.query_result.query_text == "hi"
+    savings = stream.savings
+    assert savings.early
+    assert savings.chunks_sent == 2
+    assert savings.chunks_skipped == 8
+    assert savings.bytes_skipped == 8 * 3200
+    assert savings.audio_seconds_skipped == pytest.approx(0.8)
+    assert savings.result_latency >= 0
+    assert savings.half_closed_at >= savings.end_of_utterance_at
+
+
+def test_without_end_of_utterance_sends_everything():
+    client = FakeSessionsClient(end_after=50)
+
+    stream = early_finalization.streaming_detect_intent(
+        client, _requests(), single_utterance=False
+    )
+    list(stream)
+
+    assert not client.received[0].query_input.audio_config.single_utterance
+    assert len(client.received) == 11
+    assert not stream.savings.early
+    assert stream.savings.chunks_skipped == 0
+    assert stream.savings.audio_seconds_skipped == 0.0
+    assert stream.savings.result_latency is None
+
+
+def test_leaves_source_unread_by_default():
+    source = _requests()
+    stream = early_finalization.streaming_detect_intent(FakeSessionsClient(), source)
+    list(stream)
+
+    assert stream.savings.chunks_skipped == 1
+    assert len(list(source)) == 7
+
+
+def test_on_final_transcript():
+    class Client(object):
+        received = []
+
+        def streaming_detect_intent(self, requests, **kwargs):
+            for request in requests:
+                self.received.append(request)
+                if len(self.received) == 2:
+                    yield session.StreamingDetectIntentResponse(
+                        recognition_result={
+                            "message_type": MessageType.TRANSCRIPT,
+                            "is_final": True,
+                        }
+                    )
+
+    client = Client()
+    stream = early_finalization.streaming_detect_intent(
+        client, _requests(), on_final_transcript=True
+    )
+    list(stream)
+
+    assert len(client.received) == 2
+    assert stream.final_response is None
+
+
+@pytest.mark.asyncio
+async def test_streaming_detect_intent_async():
+    received = []
+
+    class FakeSessionsAsyncClient(object):
+        async def streaming_detect_intent(self, requests, **kwargs):
+            async def responses():
+                async for request in requests:
+                    received.append(request)
+                    if len(received) == 3:
+                        yield session.StreamingDetectIntentResponse(
+                            recognition_result={
+                                "message_type": MessageType.END_OF_SINGLE_UTTERANCE
+                            }
+                        )
+                yield session.StreamingDetectIntentResponse(
+                    query_result={"query_text": "hi"}
+                )
+
+            return responses()
+
+    async def requests():
+        for request in _requests():
+            yield request
+
+    stream = await early_finalization.streaming_detect_intent_async(
+        FakeSessionsAsyncClient(), requests(), measure_skipped=True
+    )
+    responses = [response async for response in stream]
+
+    assert len(responses) == 2
+    assert len(received) == 3
+    assert stream.savings.chunks_skipped == 8
+    assert stream.final_response.query_result.query_text == "hi"
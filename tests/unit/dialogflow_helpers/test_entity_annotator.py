@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import io
+import json
+import zipfile
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import entity_annotator
+
+Kind = dialogflow_v2.EntityType.Kind
+
+CITY = dialogflow_v2.EntityType(
+    name="projects/p/agent/entityTypes/1",
+    display_name="city",
+    kind=Kind.KIND_MAP,
+    entities=[
+        {"value": "New York", "synonyms": ["New York", "NYC", "big apple"]},
+        {"value": "York", "synonyms": ["York"]},
+    ],
+)
+SIZE = {
+    "display_name": "size",
+    "kind": Kind.KIND_LIST,
+    "auto_expansion_mode": dialogflow_v2.EntityType.AutoExpansionMode.AUTO_EXPANSION_MODE_DEFAULT,
+    "entities": [
+        {"value": "large", "synonyms": ["large"]},
+        {"value": "@city:city", "synonyms": ["@city:city"]},
+        {"value": "@sys.number", "synonyms": ["@sys.number"]},
+    ],
+}
+ORDER = {
+    "display_name": "order-id",
+    "kind": Kind.KIND_REGEXP,
+    "entities": [{"value": r"ord-\d+", "synonyms": [r"ord-\d+"]}],
+}
+
+
+def _spans(matches):
+    return [(m.entity_type, m.value, m.text) for m in matches]
+
+
+def test_annotate():
+    annotator = entity_annotator.EntityAnnotator([CITY, SIZE, ORDER])
+    text = "Two LARGE pizzas to new  york, not Yorkshire; ORD-12 please"
+    matches = annotator.annotate(text)
+
+    assert _spans(matches) == [
+        ("size", "LARGE", "LARGE"),
+        ("city", "New York", "new  york"),
+        ("size", "New York", "new  york"),
+        ("order-id", "ORD-12", "ORD-12"),
+    ]
+    assert text[matches[1].start : matches[1].end] == "new  york"
+    assert matches[0].expandable
+    assert not matches[1].expandable
+    assert annotator.entity_types == ["city", "order-id", "size"]
+
+
+def test_offsets_with_length_changing_case():
+    annotator = entity_annotator.EntityAnnotator([CITY])
+    text = "İ  flew to NYC"
+
+    (match,) = annotator.annotate(text)
+    assert (match.start, match.end, match.value) == (11, 14, "New York")
+
+
+def test_incremental_updates():
+    annotator = entity_annotator.EntityAnnotator([CITY])
+    assert _spans(annotator.annotate("nyc")) == [("city", "New York", "nyc")]
+
+    annotator.update_entities(
+        "projects/p/agent/entityTypes/1",
+        [{"value": "Paris", "synonyms": ["Paris", "city of light"]}],
+    )
+    annotator.delete_entities("city", ["New York"])
+    assert _spans(annotator.annotate("nyc or the city of light")) == [
+        ("city", "Paris", "city of light")
+    ]
+
+    annotator.update_entity_types([SIZE])
+    annotator.delete_entity_types(["projects/p/agent/entityTypes/1"])
+    assert annotator.entity_types == ["size"]
+    assert annotator.annotate("paris") == []
+    assert annotator.stats.builds == 3
+    assert annotator.stats.utterances == 3
+    assert "utterances/s" in annotator.stats.format()
+
+
+def _agent_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("agent.json", "{}")
+        archive.writestr(
+            "entities/fruit.json",
+            json.dumps({"name": "fruit", "isEnum": False, "automatedExpansion": True}),
+        )
+        archive.writestr(
+            "entities/fruit_entries_en.json",
+            json.dumps([{"value": "apple", "synonyms": ["apple", "apples"]}]),
+        )
+        archive.writestr(
+            "entities/fruit_entries_de.json",
+            json.dumps([{"value": "apple", "synonyms": ["Apfel"]}]),
+        )
+    return buffer.getvalue()
+
+
+def test_from_agent_zip():
+    annotator = entity_annotator.EntityAnnotator.from_agent_zip(_agent_zip())
+    (match,) = annotator.annotate("two apples")
+
+    assert (match.entity_type, match.value, match.expandable) == (
+        "fruit",
+        "apple",
+        True,
+    )
+    german = entity_annotator.EntityAnnotator.from_agent_zip(
+        _agent_zip(), language_code="de"
+    )
+    assert _spans(german.annotate("ein Apfel")) == [("fruit", "apple", "Apfel")]
+
+
+def test_main(tmpdir, capsys):
+    agent = tmpdir.join("agent.zip")
+    agent.write_binary(_agent_zip())
+    utterances = tmpdir.join("utterances.txt")
+    utterances.write("an apple\nnothing\n" * 3)
+
+    assert (
+        entity_annotator.main(
+            [str(agent), str(utterances), "--batch-size", "4", "--print-matches"]
+        )
+        == 0
+    )
+    out, err = capsys.readouterr()
+    lines = [json.loads(line) for line in out.splitlines()]
+    assert len(lines) == 6
+    assert lines[0]["matches"][0]["value"] == "apple"
+    assert err.startswith("6 utterances, 3 matches")
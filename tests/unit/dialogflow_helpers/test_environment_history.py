@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import environment_history, fake_server
+
+PROD = "projects/p/agent/environments/prod"
+STAGING = "projects/p/agent/environments/staging"
+
+
+class History(object):
+    """Environment histories served newest first, with paging."""
+
+    def __init__(self):
+        self.entries = {PROD: [], STAGING: []}
+        self.requests = []
+
+    def append(self, environment, version):
+        entries = self.entries[environment]
+        entries.insert(
+            0,
+            {
+                "agent_version": "projects/p/agent/versions/{}".format(version),
+                "description": "v{}".format(version),
+                "create_time": {"seconds": 1700000000 + 60 * len(entries)},
+            },
+        )
+
+    def __call__(self, request, context):
+        self.requests.append(request)
+        entries = self.entries[request.parent]
+        start = int(request.page_token or 0)
+        end = min(start + request.page_size, len(entries))
+        return {
+            "parent": request.parent,
+            "entries": entries[start:end],
+            "next_page_token": str(end) if end < len(entries) else "",
+        }
+
+
+@pytest.fixture
+def history():
+    history = History()
+    for version in (1, 2, 3, 3, 4):
+        history.append(PROD, version)
+    history.append(STAGING, 9)
+    return history
+
+
+@pytest.fixture
+def server(history):
+    with fake_server.FakeDialogflowServer(services=("environments",)) as server:
+        server.set_response("Environments.GetEnvironmentHistory", history)
+        yield server
+
+
+def _versions(items):
+    return [entry.agent_version.rsplit("/", 1)[-1] for _, entry in items]
+
+
+def test_poll_incremental(server, history):
+    client = server.create_client(dialogflow_v2.EnvironmentsClient)
+    watcher = environment_history.EnvironmentWatcher(client, [PROD], page_size=2)
+    subscriber = mock.Mock()
+    watcher.subscribe(subscriber)
+
+    # The first poll only primes the cursor.
+    assert watcher.poll(PROD) == []
+    assert history.requests[-1].page_size == 1
+    assert watcher.agent_version(PROD).endswith("/4")
+    assert watcher.poll(PROD) == []
+    assert len(history.requests) == 2
+
+    for version in (5, 5, 6):
+        history.append(PROD, version)
+    items = watcher.poll(PROD)
+    assert _versions(items) == ["5", "5", "6"]
+    assert {name for name, _ in items} == {PROD}
+    # Two pages of new entries, stopping on the page with a known one.
+    assert len(history.requests) == 4
+    assert subscriber.call_args_list == [
+        mock.call(PROD, "projects/p/agent/versions/5", "projects/p/agent/versions/4"),
+        mock.call(PROD, "projects/p/agent/versions/6", "projects/p/agent/versions/5"),
+    ]
+    assert watcher.poll(PROD) == []
+
+
+def test_from_start_and_cursors(server, history):
+    client = server.create_client(dialogflow_v2.EnvironmentsClient)
+    watcher = environment_history.EnvironmentWatcher(
+        client, [PROD, STAGING], page_size=2, from_start=True
+    )
+    changes = []
+    unsubscribe = watcher.subscribe(lambda *args: changes.append(args))
+    items = watcher.poll_all()
+    assert _versions(items) == ["1", "2", "3", "3", "4", "9"]
+    assert [change[2] for change in changes] == [
+        None,
+        "projects/p/agent/versions/1",
+        "projects/p/agent/versions/2",
+        "projects/p/agent/versions/3",
+        None,
+    ]
+    unsubscribe()
+
+    cursors = watcher.cursors
+    assert cursors[PROD] == {
+        "create_time": "2023-11-14T22:17:20Z",
+        "agent_version": "projects/p/agent/versions/4",
+    }
+    history.append(PROD, 7)
+    resumed = environment_history.EnvironmentWatcher(
+        client, [PROD], from_start=True, cursors=cursors
+    )
+    assert _versions(resumed.poll(PROD)) == ["7"]
+    assert len(changes) == 5
+
+    resumed.remove(PROD)
+    assert resumed.environments == []
+    assert resumed.agent_version(PROD) is None
+
+
+def test_watch(server, history):
+    client = server.create_client(dialogflow_v2.EnvironmentsClient)
+    watcher = environment_history.EnvironmentWatcher(client)
+    watcher.add(PROD)
+    watcher.add(PROD)
+    watcher.poll(PROD)
+    history.append(PROD, 5)
+    history.append(PROD, 6)
+    stop = threading.Event()
+    seen = []
+    for name, entry in watcher.watch(interval=0, stop=stop):
+        seen.append(entry.description)
+        if len(seen) == 2:
+            history.append(PROD, 7)
+        elif len(seen) == 3:
+            stop.set()
+    assert seen == ["v5", "v6", "v7"]
+
+
+@pytest.mark.asyncio
+async def test_async_watch(server, history):
+    client = server.create_client(dialogflow_v2.EnvironmentsAsyncClient)
+    watcher = environment_history.AsyncEnvironmentWatcher(
+        client, [PROD, STAGING], page_size=2
+    )
+    subscriber = mock.Mock()
+    watcher.subscribe(subscriber)
+    assert await watcher.poll_all() == []
+
+    history.append(STAGING, 10)
+    history.append(PROD, 5)
+    seen = []
+    async for item in watcher.watch(interval=0):
+        seen.append(item)
+        if len(seen) == 2:
+            break
+    assert sorted((name, entry.description) for name, entry in seen) == [
+        (PROD, "v5"),
+        (STAGING, "v10"),
+    ]
+    assert subscriber.call_count == 2
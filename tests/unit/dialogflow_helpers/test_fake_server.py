@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import random
+import time
+
+from google.api_core import exceptions as core_exceptions
+import grpc
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import fake_server
+from google.cloud.dialogflow_v2.types import session
+
+SESSION = "projects/p/agent/sessions/s"
+TEXT_INPUT = {"text": {"text": "book a table", "language_code": "en"}}
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer(seed=0) as server:
+        yield server
+
+
+def test_methods():
+    server = fake_server.FakeDialogflowServer()
+    methods = server.methods()
+    assert "Sessions.DetectIntent" in methods
+    assert "Sessions.StreamingDetectIntent" in methods
+    assert "Participants.AnalyzeContent" in methods
+    assert "Intents.BatchUpdateIntents" in methods
+    assert "EntityTypes.BatchCreateEntities" in methods
+    with pytest.raises(ValueError):
+        server.set_latency("Sessions.Missing", fake_server.FixedLatency(0))
+    with pytest.raises(ValueError):
+        server.address
+
+
+def test_detect_intent_default(server):
+    client = server.create_client(dialogflow_v2.SessionsClient)
+
+    response = client.detect_intent(session=SESSION, query_input=TEXT_INPUT)
+
+    assert response.query_result.query_text == "book a table"
+    assert response.query_result.fulfillment_text == "book a table"
+    assert server.calls == {"Sessions.DetectIntent": 1}
+
+
+def test_streaming_detect_intent_single_utterance(server):
+    client = server.create_client(dialogflow_v2.SessionsClient)
+    server.utterance_chunks = 4
+    server.partial_every = 2
+
+    def requests():
+        yield session.StreamingDetectIntentRequest(
+            session=SESSION,
+            query_input={
+                "audio_config": {
+                    "audio_encoding": "AUDIO_ENCODING_LINEAR_16",
+                    "sample_rate_hertz": 16000,
+                    "language_code": "en",
+                    "single_utterance": True,
+                }
+            },
+        )
+        for _ in range(6):
+            yield session.StreamingDetectIntentRequest(input_audio=b"\x00" * 320)
+
+    responses = list(client.streaming_detect_intent(requests=requests()))
+
+    types = [r.recognition_result.message_type.name for r in responses[:-1]]
+    assert types == [
+        "TRANSCRIPT",
+        "TRANSCRIPT",
+        "END_OF_SINGLE_UTTERANCE",
+        "TRANSCRIPT",
+    ]
+    assert responses[-2].recognition_result.is_final
+    assert responses[-1].query_result.query_text == "hello world"
+
+
+def test_participants_and_crud_defaults(server):
+    participants = server.create_client(dialogflow_v2.ParticipantsClient)
+    response = participants.analyze_content(
+        participant="projects/p/conversations/c/participants/u",
+        text_input={"text": "hi", "language_code": "en"},
+    )
+    assert response.reply_text == "hi"
+    assert response.message.participant == "projects/p/conversations/c/participants/u"
+
+    intents = server.create_client(dialogflow_v2.IntentsClient)
+    created = intents.create_intent(
+        parent="projects/p/agent", intent={"display_name": "order"}
+    )
+    assert created.display_name == "order"
+    assert intents.get_intent(name="projects/p/agent/intents/i").name == (
+        "projects/p/agent/intents/i"
+    )
+    operation = intents.batch_update_intents(
+        parent="projects/p/agent", intent_batch_uri="gs://b/o"
+    )
+    assert isinstance(operation.result(), dialogflow_v2.BatchUpdateIntentsResponse)
+
+    entity_types = server.create_client(dialogflow_v2.EntityTypesClient)
+    assert list(entity_types.list_entity_types(parent="projects/p/agent")) == []
+    entity_types.batch_delete_entities(
+        parent="projects/p/agent/entityTypes/e", entity_values=["a"]
+    ).result()
+
+
+def test_canned_responses(server):
+    client = server.create_client(dialogflow_v2.SessionsClient)
+    server.set_response("Sessions.DetectIntent", {"response_id": "canned"})
+    assert client.detect_intent(session=SESSION).response_id == "canned"
+
+    server.set_response(
+        "Sessions.DetectIntent",
+        lambda request, context: session.DetectIntentResponse(
+            response_id=request.session
+        ),
+    )
+    assert client.detect_intent(session=SESSION).response_id == SESSION
+
+    server.set_response(
+        "Sessions.StreamingDetectIntent",
+        [{"response_id": "a"}, session.StreamingDetectIntentResponse(response_id="b")],
+    )
+    responses = client.streaming_detect_intent(
+        requests=iter([session.StreamingDetectIntentRequest(session=SESSION)])
+    )
+    assert [r.response_id for r in responses] == ["a", "b"]
+
+    server.set_response("Sessions.DetectIntent", None)
+    assert client.detect_intent(session=SESSION, query_input=TEXT_INPUT).query_result
+
+
+def test_error_injection_and_retries(server):
+    client = server.create_client(dialogflow_v2.SessionsClient)
+    server.inject_error("Sessions.DetectIntent", grpc.StatusCode.UNAVAILABLE, limit=2)
+
+    response = client.detect_intent(session=SESSION, query_input=TEXT_INPUT)
+
+    assert response.query_result.query_text == "book a table"
+    assert server.calls["Sessions.DetectIntent"] == 3
+    assert server.errors["Sessions.DetectIntent"] == 2
+
+    server.inject_error("*", grpc.StatusCode.PERMISSION_DENIED, details="nope")
+    with pytest.raises(core_exceptions.PermissionDenied):
+        client.detect_intent(session=SESSION)
+    server.clear_errors()
+    client.detect_intent(session=SESSION)
+
+
+def test_latency(server):
+    client = server.create_client(dialogflow_v2.SessionsClient)
+    server.set_latency("*", fake_server.FixedLatency(0.05))
+
+    start = time.monotonic()
+    client.detect_intent(session=SESSION)
+
+    assert time.monotonic() - start >= 0.05
+
+
+def test_latency_distributions():
+    rng = random.Random(0)
+    assert fake_server.FixedLatency(0.1).sample(rng) == 0.1
+    assert 0.1 <= fake_server.UniformLatency(0.1, 0.2).sample(rng) <= 0.2
+    assert fake_server.NormalLatency(0.0, 1.0).sample(rng) >= 0.0
+    assert fake_server.LogNormalLatency(0.05).sample(rng) > 0.0
+    assert fake_server.EmpiricalLatency([0.3]).sample(rng) == 0.3
+    with pytest.raises(ValueError):
+        fake_server.EmpiricalLatency([])
+
+
+@pytest.mark.asyncio
+async def test_async_client(server):
+    client = server.create_client(dialogflow_v2.SessionsAsyncClient)
+
+    response = await client.detect_intent(session=SESSION, query_input=TEXT_INPUT)
+
+    assert response.query_result.query_text == "book a table"
+    await client.transport.close()
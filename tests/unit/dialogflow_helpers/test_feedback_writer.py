@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import gc
+import subprocess
+import sys
+import threading
+import weakref
+
+from google.api_core import exceptions as core_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import feedback_writer
+
+RECORD = "projects/p/locations/global/answerRecords/{}"
+
+
+class _Client(object):
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def update_answer_record(self, request, timeout=None):
+        with self.lock:
+            self.requests.append(request)
+            if self.errors:
+                raise self.errors.pop(0)
+        return request.answer_record
+
+
+def _writer(client, **kwargs):
+    kwargs.setdefault("flush_at_exit", False)
+    return feedback_writer.FeedbackWriter(client, **kwargs)
+
+
+def test_coalesces_updates_per_record():
+    client = _Client()
+    writer = _writer(client, window=60)
+    writer.record(RECORD.format(1), {"displayed": True})
+    writer.record(RECORD.format(2), {"displayed": True})
+    writer.record(
+        RECORD.format(1),
+        {"clicked": True, "click_time": {"seconds": 5}},
+    )
+    writer.record(RECORD.format(1), {"correctness_level": "FULLY_CORRECT"})
+    writer.record(
+        RECORD.format(1),
+        {},
+        update_mask=["answer_feedback.displayed"],
+    )
+    assert writer.pending == 2
+    assert client.requests == []
+
+    assert writer.flush(timeout=10)
+
+    assert len(client.requests) == 2
+    request = next(
+        r for r in client.requests if r.answer_record.name == RECORD.format(1)
+    )
+    assert sorted(request.update_mask.paths) == [
+        "answer_feedback.click_time",
+        "answer_feedback.clicked",
+        "answer_feedback.correctness_level",
+        "answer_feedback.displayed",
+    ]
+    feedback = request.answer_record.answer_feedback
+    assert feedback.clicked and not feedback.displayed
+    assert feedback.click_time.timestamp() == 5
+    assert feedback.correctness_level == feedback.CorrectnessLevel.FULLY_CORRECT
+    assert writer.stats.as_dict() == dict(
+        recorded=5, coalesced=3, sent=2, retries=0, failed=0
+    )
+    assert writer.close()
+
+
+def test_window_elapses():
+    client = _Client()
+    with _writer(client, window=0.01) as writer:
+        writer.record(RECORD.format(1), {"displayed": True})
+        for _ in range(500):
+            if client.requests:
+                break
+            threading.Event().wait(0.01)
+    assert len(client.requests) == 1
+
+
+def test_retries_and_errors():
+    errors = []
+    client = _Client(
+        errors=[
+            core_exceptions.ServiceUnavailable("down"),
+            core_exceptions.InvalidArgument("bad"),
+        ]
+    )
+    writer = _writer(
+        client,
+        window=0,
+        max_concurrency=1,
+        on_error=lambda name, exc: errors.append((name, type(exc))),
+    )
+    # Retries back off from one second.
+    writer.record(RECORD.format(1), {"displayed": True})
+    writer.record(RECORD.format(2), {"clicked": True})
+    assert writer.close(timeout=10)
+
+    assert writer.stats.retries == 1
+    assert writer.stats.failed == 1
+    assert writer.stats.sent == 1
+    assert errors == [(RECORD.format(2), core_exceptions.InvalidArgument)]
+    with pytest.raises(RuntimeError):
+        writer.record(RECORD.format(1), {"displayed": True})
+
+
+def test_feedback_paths():
+    feedback = dialogflow_v2.AnswerFeedback(
+        clicked=True,
+        agent_assistant_detail_feedback={"answer_relevance": "RELEVANT"},
+    )
+    assert feedback_writer.feedback_paths(feedback) == {
+        "answer_feedback.clicked",
+        "answer_feedback.agent_assistant_detail_feedback",
+    }
+
+
+_EXIT_SCRIPT = """
+import concurrent.futures.thread
+import threading
+
+if HIDE_HOOK:
+    del threading._register_atexit
+
+from google.cloud.dialogflow_helpers import feedback_writer
+
+
+class Client(object):
+    def update_answer_record(self, request, timeout=None):
+        print("sent", request.answer_record.name, flush=True)
+
+
+writer = feedback_writer.FeedbackWriter(Client(), window=60)
+writer.record("projects/p/locations/global/answerRecords/1", {"clicked": True})
+"""
+
+
+# With the hook hidden, writers are closed from atexit instead.
+@pytest.mark.parametrize("hide_hook", [False, True])
+def test_flushes_at_interpreter_exit(hide_hook):
+    result = subprocess.run(
+        [sys.executable, "-c", _EXIT_SCRIPT.replace("HIDE_HOOK", str(hide_hook))],
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["sent", RECORD.format(1)]
+    assert "Traceback" not in result.stderr
+
+
+def test_closed_writers_are_not_kept_alive():
+    writers = [feedback_writer.FeedbackWriter(_Client()) for _ in range(3)]
+    assert len(feedback_writer._open_writers) >= 3
+    refs = [weakref.ref(writer) for writer in writers]
+    for writer in writers:
+        writer.close()
+    del writers, writer
+    gc.collect()
+
+    assert [ref() for ref in refs] == [None, None, None]
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+from concurrent import futures
+import datetime
+
+from google.api_core import exceptions as core_exceptions
+from google.auth import credentials as ga_credentials
+import grpc
+from grpc.experimental import aio
+import pytest
+from requests import Response
+from requests.sessions import Session
+
+from google.cloud.dialogflow_helpers import instrumentation
+from google.cloud.dialogflow_v2.services.sessions import (
+    SessionsAsyncClient,
+    SessionsClient,
+    transports,
+)
+from google.cloud.dialogflow_v2.types import session
+
+
+def _detect_intent(request, context):
+    return session.DetectIntentResponse(response_id="r-" + request.session)
+
+
+def _streaming_detect_intent(requests, context):
+    for request in requests:
+        yield session.StreamingDetectIntentResponse(response_id=request.session)
+
+
+@pytest.fixture
+def server():
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    handler = grpc.method_handlers_generic_handler(
+        "google.cloud.dialogflow.v2.Sessions",
+        {
+            "DetectIntent": grpc.unary_unary_rpc_method_handler(
+                _detect_intent,
+                request_deserializer=session.DetectIntentRequest.deserialize,
+                response_serializer=session.DetectIntentResponse.serialize,
+            ),
+            "StreamingDetectIntent": grpc.stream_stream_rpc_method_handler(
+                _streaming_detect_intent,
+                request_deserializer=session.StreamingDetectIntentRequest.deserialize,
+                response_serializer=session.StreamingDetectIntentResponse.serialize,
+            ),
+        },
+    )
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield "localhost:{}".format(port)
+    server.stop(None)
+
+
+class _UnavailableError(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self):
+        return "try again"
+
+    def trailing_metadata(self):
+        return None
+
+
+def _grpc_client(address):
+    transport = transports.SessionsGrpcTransport(channel=grpc.insecure_channel(address))
+    return SessionsClient(transport=transport)
+
+
+def test_histogram_percentiles():
+    histogram = instrumentation.Histogram()
+    for value in range(1, 101):
+        histogram.add(value / 1000.0)
+
+    assert histogram.count == 100
+    assert histogram.min == 0.001
+    assert histogram.max == 0.1
+    assert histogram.percentile(50) == pytest.approx(0.05, rel=0.1)
+    assert histogram.percentile(99) == pytest.approx(0.099, rel=0.1)
+    assert histogram.percentile(100) == pytest.approx(0.1)
+    assert sum(count for _, count in histogram.buckets()) == 100
+
+
+def test_histogram_merge():
+    first = instrumentation.Histogram()
+    second = instrumentation.Histogram()
+    first.add(1.0)
+    second.add(3.0)
+    first.merge(second)
+
+    assert first.count == 2
+    assert first.mean == 2.0
+    with pytest.raises(ValueError):
+        first.merge(instrumentation.Histogram(lowest=1.0))
+
+
+def test_empty_histogram():
+    assert instrumentation.Histogram().percentile(50) == 0.0
+    assert instrumentation.Histogram().mean == 0.0
+
+
+def test_instrument_grpc_unary(server):
+    recorder = instrumentation.HistogramRecorder()
+    client = _grpc_client(server)
+    instrumentation.instrument(client, recorder)
+
+    response = client.detect_intent(session="abc")
+
+    assert response.response_id == "r-abc"
+    assert recorder.methods() == ["Sessions.DetectIntent"]
+    stats = recorder.stats("Sessions.DetectIntent")
+    assert stats.calls == 1
+    assert stats.attempts == 1
+    assert stats.retries == 0
+    assert stats.statuses == {"OK": 1}
+    assert stats.request_bytes == len(
+        session.DetectIntentRequest.serialize(
+            session.DetectIntentRequest(session="abc")
+        )
+    )
+    assert stats.response_bytes == len(session.DetectIntentResponse.serialize(response))
+    assert stats.latency.count == 1
+
+
+def test_instrument_grpc_streaming(server):
+    records = []
+    recorder = mock.Mock(spec=instrumentation.RpcRecorder)
+    recorder.record.side_effect = records.append
+    client = _grpc_client(server)
+    instrumentation.instrument(client, recorder)
+
+    requests = [session.StreamingDetectIntentRequest(session=str(i)) for i in range(3)]
+    responses = list(client.streaming_detect_intent(requests=iter(requests)))
+
+    assert [r.response_id for r in responses] == ["0", "1", "2"]
+    assert len(records) == 1
+    record = records[0]
+    assert record.method == "Sessions.StreamingDetectIntent"
+    assert record.transport == "grpc"
+    assert record.attempts == 1
+    assert record.request_bytes == sum(len(r._pb.SerializeToString()) for r in requests)
+    assert record.response_bytes == sum(
+        len(r._pb.SerializeToString()) for r in responses
+    )
+    assert record.latency >= record.network_seconds
+
+
+def test_instrument_grpc_counts_retries():
+    channel = mock.Mock()
+    attempts = []
+
+    def unary_unary(method, request_serializer, response_deserializer, **kwargs):
+        def call(request, **kwargs):
+            attempts.append(request_serializer(request))
+            if len(attempts) < 3:
+                raise _UnavailableError()
+            return response_deserializer(b"")
+
+        return call
+
+    channel.unary_unary.side_effect = unary_unary
+    channel.stream_stream.return_value = mock.Mock()
+    records = []
+    recorder = mock.Mock(spec=instrumentation.RpcRecorder)
+    recorder.record.side_effect = records.append
+    client = SessionsClient(transport=transports.SessionsGrpcTransport(channel=channel))
+    instrumentation.instrument(client, recorder)
+
+    with mock.patch("time.sleep"):
+        client.detect_intent(session="abc")
+
+    assert len(attempts) == 3
+    assert records[0].attempts == 3
+    assert records[0].retries == 2
+    assert records[0].status == "OK"
+
+
+def test_instrument_grpc_error(server):
+    records = []
+    recorder = mock.Mock(spec=instrumentation.RpcRecorder)
+    recorder.record.side_effect = records.append
+    client = _grpc_client(server)
+    instrumentation.instrument(client, recorder)
+
+    with pytest.raises(core_exceptions.GoogleAPICallError):
+        client.get_location({"name": "projects/p/locations/l"})
+
+    assert records[0].method == "Sessions.GetLocation"
+    assert records[0].status == "UNIMPLEMENTED"
+
+
+def test_instrument_twice_raises(server):
+    client = _grpc_client(server)
+    instrumentation.instrument(client, instrumentation.RpcRecorder())
+    with pytest.raises(ValueError):
+        instrumentation.instrument(client, instrumentation.RpcRecorder())
+
+
+def test_instrument_rest():
+    records = []
+    recorder = mock.Mock(spec=instrumentation.RpcRecorder)
+    recorder.record.side_effect = records.append
+    client = SessionsClient(
+        credentials=ga_credentials.AnonymousCredentials(), transport="rest"
+    )
+    instrumentation.instrument(client, recorder)
+    interceptor = client.transport._interceptor
+
+    body = session.DetectIntentResponse.to_json(
+        session.DetectIntentResponse(response_id="rest")
+    ).encode("utf-8")
+
+    def send(self, prepared, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response._content = body
+        response.request = prepared
+        response.elapsed = datetime.timedelta(milliseconds=5)
+        return self.hooks["response"][-1](response) or response
+
+    with mock.patch.object(Session, "request") as request, mock.patch.object(
+        type(interceptor._interceptor), "pre_detect_intent", autospec=True
+    ) as pre:
+        pre.side_effect = lambda self, request, metadata: (request, metadata)
+
+        def fake_request(method, url, data=None, **kwargs):
+            prepared = mock.Mock(body=data.encode("utf-8"))
+            return send(client.transport._session, prepared)
+
+        request.side_effect = fake_request
+        response = client.detect_intent(
+            session="projects/p/agent/sessions/s",
+        )
+
+    assert response.response_id == "rest"
+    assert pre.call_count == 1
+    record = records[0]
+    assert record.method == "Sessions.DetectIntent"
+    assert record.transport == "rest"
+    assert record.attempts == 1
+    assert record.response_bytes == len(body)
+    assert record.request_bytes > 0
+    assert record.network_seconds == pytest.approx(0.005)
+
+
+def test_opentelemetry_recorder_requires_package():
+    with mock.patch.object(instrumentation, "otel_trace", None):
+        with pytest.raises(ImportError):
+            instrumentation.OpenTelemetryRecorder()
+
+
+def test_opentelemetry_recorder():
+    trace = mock.Mock()
+    metrics = mock.Mock()
+    with mock.patch.object(instrumentation, "otel_trace", trace), mock.patch.object(
+        instrumentation, "otel_metrics", metrics
+    ):
+        recorder = instrumentation.OpenTelemetryRecorder()
+        record = instrumentation.RpcRecord("Sessions.DetectIntent", "grpc")
+        record.latency = 0.25
+        record.attempts = 1
+        recorder.record(record)
+
+    span = trace.get_tracer.return_value.start_span.return_value
+    span.end.assert_called_once()
+    _, kwargs = trace.get_tracer.return_value.start_span.call_args
+    assert kwargs["attributes"]["rpc.method"] == "DetectIntent"
+    histogram = metrics.get_meter.return_value.create_histogram.return_value
+    assert histogram.record.called
+
+
+@pytest.mark.asyncio
+async def test_instrument_grpc_asyncio(server):
+    records = []
+    recorder = mock.Mock(spec=instrumentation.RpcRecorder)
+    recorder.record.side_effect = records.append
+    transport = transports.SessionsGrpcAsyncIOTransport(
+        channel=aio.insecure_channel(server)
+    )
+    client = SessionsAsyncClient(transport=transport)
+    instrumentation.instrument(client, recorder)
+
+    response = await client.detect_intent(session="abc")
+
+    assert response.response_id == "r-abc"
+    assert len(records) == 1
+    assert records[0].method == "Sessions.DetectIntent"
+    assert records[0].transport == "grpc_asyncio"
+    assert records[0].request_bytes > 0
+    assert records[0].response_bytes > 0
+    await transport.close()
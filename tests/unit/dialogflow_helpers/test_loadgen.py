@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+
+from google.api_core import exceptions as core_exceptions
+import grpc
+import pytest
+
+from google.cloud.dialogflow_helpers import fake_server, loadgen
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer(seed=0) as server:
+        yield server
+
+
+def _call(index):
+    if index % 4 == 3:
+        raise core_exceptions.ServiceUnavailable("busy")
+
+
+def test_run_closed_loop():
+    result = loadgen.run(_call, concurrency=4, requests=100)
+
+    assert result.requests == 100
+    assert result.ok == 75
+    assert result.errors == {"UNAVAILABLE": 25}
+    assert result.throughput > 0
+    assert result.cpu_per_request >= 0
+    assert "UNAVAILABLE=25" in result.format()
+
+
+def test_run_open_loop():
+    result = loadgen.run(_call, qps=1000, requests=50, warmup=2)
+
+    assert result.requests == 50
+    assert result.elapsed >= 0.049
+    assert set(result.as_dict(percentiles=(50, 99.9))["latency"]) == {
+        "p50",
+        "p99.9",
+        "mean",
+        "max",
+    }
+
+
+def test_run_requires_a_budget():
+    with pytest.raises(ValueError):
+        loadgen.run(_call)
+
+
+@pytest.mark.asyncio
+async def test_run_async():
+    async def call(index):
+        _call(index)
+
+    closed = await loadgen.run_async(call, concurrency=3, requests=20)
+    opened = await loadgen.run_async(call, qps=500, requests=20)
+
+    assert closed.requests == opened.requests == 20
+    assert closed.errors == {"UNAVAILABLE": 5}
+
+
+def _main(capsys, *argv):
+    assert loadgen.main(list(argv) + ["--json"]) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_main_detect_intent(server, capsys, tmp_path):
+    utterances = tmp_path / "utterances.txt"
+    utterances.write_text("hi\n\nbook a table\n")
+    server.inject_error(
+        "Sessions.DetectIntent", grpc.StatusCode.INVALID_ARGUMENT, rate=0.5
+    )
+
+    summary = _main(
+        capsys,
+        "--endpoint",
+        server.address,
+        "--insecure",
+        "--utterances",
+        str(utterances),
+        "--requests",
+        "20",
+        "--concurrency",
+        "2",
+    )
+
+    assert summary["requests"] == 20
+    assert summary["ok"] + summary["errors"]["INVALID_ARGUMENT"] == 20
+    assert summary["method"] == "detect_intent"
+    assert server.calls["Sessions.DetectIntent"] == 20
+
+
+def test_main_streaming_with_audio(server, capsys, tmp_path):
+    recording = tmp_path / "audio.raw"
+    recording.write_bytes(b"\x00" * 16000)
+
+    summary = _main(
+        capsys,
+        "--endpoint",
+        server.address,
+        "--insecure",
+        "--method",
+        "streaming_detect_intent",
+        "--audio",
+        str(recording),
+        "--requests",
+        "3",
+    )
+
+    assert summary["ok"] == 3
+    assert server.calls["Sessions.StreamingDetectIntent"] == 3
+
+
+def test_main_analyze_content_asyncio(server, capsys):
+    summary = _main(
+        capsys,
+        "--endpoint",
+        server.address,
+        "--insecure",
+        "--transport",
+        "grpc_asyncio",
+        "--method",
+        "analyze_content",
+        "--qps",
+        "200",
+        "--requests",
+        "10",
+    )
+
+    assert summary["ok"] == 10
+    assert summary["transport"] == "grpc_asyncio"
+    assert server.calls["Participants.AnalyzeContent"] == 10
+
+
+def test_main_fake_subprocess(capsys):
+    assert loadgen.main(["--fake", "--requests", "5"]) == 0
+
+    out = capsys.readouterr().out
+    assert out.startswith("detect_intent over grpc")
+    assert "requests:   5 (5 ok, 0 failed)" in out
+
+
+def test_parse_args_errors():
+    with pytest.raises(SystemExit):
+        loadgen._parse_args(["--insecure"])
+    with pytest.raises(SystemExit):
+        loadgen._parse_args(["--fake", "--transport", "rest"])
+    with pytest.raises(SystemExit):
+        loadgen._parse_args(
+            ["--transport", "rest", "--method", "streaming_detect_intent"]
+        )
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import csv
+import io
+
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import fake_server, model_evaluations
+
+PARENT = "projects/p/locations/global"
+MODELS = ["{}/conversationModels/m{}".format(PARENT, i) for i in range(3)]
+
+
+def _evaluation(model, i, finished=True):
+    evaluation = {
+        "name": "{}/evaluations/e{}".format(model, i),
+        "display_name": "eval {}".format(i),
+        "create_time": {"seconds": 1700000000 + i},
+    }
+    if finished:
+        index = int(model[-1])
+        evaluation["smart_reply_metrics"] = {
+            "allowlist_coverage": 0.5 + index / 10,
+            "conversation_count": 100 * (index + 1),
+            "top_n_metrics": [
+                {"n": 1, "recall": 0.1 * (index + 1)},
+                {"n": 3, "recall": 0.2 * (index + 1)},
+            ]
+            if index != 1
+            else [{"n": 5, "recall": 0.9}],
+        }
+    return evaluation
+
+
+def _list_evaluations(request, context):
+    model = request.parent
+    evaluations = [_evaluation(model, 0)]
+    if model == MODELS[2]:
+        # Still running: no metrics yet.
+        evaluations.append(_evaluation(model, 1, finished=False))
+    return {"conversation_model_evaluations": evaluations}
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer(services=("conversation_models",)) as server:
+        server.set_response(
+            "ConversationModels.ListConversationModels",
+            {"conversation_models": [{"name": m} for m in MODELS]},
+        )
+        server.set_response(
+            "ConversationModels.ListConversationModelEvaluations", _list_evaluations
+        )
+        server.set_response(
+            "ConversationModels.GetConversationModelEvaluation",
+            lambda request, context: _evaluation(
+                model_evaluations.model_of(request.name), 7
+            ),
+        )
+        yield server
+
+
+def test_model_of():
+    assert model_evaluations.model_of(MODELS[0] + "/evaluations/e1") == MODELS[0]
+
+
+def test_evaluations_cached(server, tmp_path):
+    client = server.create_client(dialogflow_v2.ConversationModelsClient)
+    cache = model_evaluations.EvaluationCache(str(tmp_path))
+    fetcher = model_evaluations.EvaluationFetcher(client, cache, concurrency=3)
+
+    models = fetcher.models(PARENT)
+    assert [m.name for m in models] == MODELS
+    evaluations = fetcher.evaluations(models)
+    assert [e.name for e in evaluations] == [
+        MODELS[0] + "/evaluations/e0",
+        MODELS[1] + "/evaluations/e0",
+        MODELS[2] + "/evaluations/e0",
+        MODELS[2] + "/evaluations/e1",
+    ]
+    assert server.calls["ConversationModels.ListConversationModelEvaluations"] == 3
+    # The unfinished evaluation is not cached.
+    assert len(cache) == 3
+
+    cache = model_evaluations.EvaluationCache(str(tmp_path))
+    fetcher = model_evaluations.EvaluationFetcher(client, cache)
+    evaluations = fetcher.evaluations(MODELS, cached_only=True)
+    assert fetcher.rpcs == 0
+    assert [e.name for e in evaluations] == [
+        MODELS[i] + "/evaluations/e0" for i in range(3)
+    ]
+    assert evaluations[2].smart_reply_metrics.conversation_count == 300
+
+
+def test_get(server):
+    client = server.create_client(dialogflow_v2.ConversationModelsClient)
+    fetcher = model_evaluations.EvaluationFetcher(client)
+    names = [m + "/evaluations/e7" for m in MODELS]
+    assert [e.name for e in fetcher.get(names)] == names
+    assert [e.name for e in fetcher.get(reversed(names))] == names[::-1]
+    assert server.calls["ConversationModels.GetConversationModelEvaluation"] == 3
+    assert fetcher.rpcs == 3
+
+
+def test_comparison_table():
+    evaluations = [
+        dialogflow_v2.ConversationModelEvaluation(_evaluation(m, 0)) for m in MODELS
+    ] + [dialogflow_v2.ConversationModelEvaluation(_evaluation(MODELS[2], 1, False))]
+    columns, rows = model_evaluations.comparison_table(evaluations, sort="recall@3")
+    assert columns == list(model_evaluations.COLUMNS) + [
+        "recall@1",
+        "recall@3",
+        "recall@5",
+    ]
+    assert [row["evaluation"].split("/")[-3] for row in rows] == [
+        "m2",
+        "m0",
+        "m1",
+        "m2",
+    ]
+    assert rows[0]["recall@3"] == pytest.approx(0.6)
+    assert rows[2]["recall@1"] is None
+    assert rows[3]["allowlist_coverage"] is None
+
+    with pytest.raises(ValueError):
+        model_evaluations.comparison_table(evaluations, sort="recall@2")
+
+    text = model_evaluations.format_table(columns, rows).splitlines()
+    assert len(text) == 5
+    assert text[0].split() == columns
+    assert text[1].split()[:2] == ["m2", "e0"]
+    assert text[3].split()[-3:] == ["-", "-", "0.9000"]
+
+    stream = io.StringIO()
+    model_evaluations.write_csv(stream, columns, rows)
+    table = list(csv.reader(io.StringIO(stream.getvalue())))
+    assert table[0] == columns
+    assert table[3][columns.index("recall@1")] == ""
+
+
+def test_main(server, tmp_path, monkeypatch, capsys):
+    client = server.create_client(dialogflow_v2.ConversationModelsClient)
+    monkeypatch.setattr(dialogflow_v2, "ConversationModelsClient", lambda: client)
+    args = ["--project", "p", "--cache-dir", str(tmp_path), "--sort", "recall@1"]
+    assert model_evaluations.main(args) == 0
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 5
+    assert err.strip() == "4 evaluations, 4 RPCs"
+
+    assert model_evaluations.main(args + ["--cached-only", "--format", "csv"]) == 0
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 4
+    assert err.strip() == "3 evaluations, 0 RPCs"
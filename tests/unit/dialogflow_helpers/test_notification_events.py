@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import notification_events
+
+MessageFormat = notification_events.MessageFormat
+CONVERSATION = "projects/p/conversations/c"
+
+NEW_MESSAGE = dialogflow_v2.ConversationEvent(
+    conversation=CONVERSATION,
+    type_=dialogflow_v2.ConversationEvent.Type.NEW_MESSAGE,
+    new_message_payload={"content": "hello", "participant_role": "END_USER"},
+)
+ERROR = dialogflow_v2.ConversationEvent(
+    conversation=CONVERSATION,
+    type_=dialogflow_v2.ConversationEvent.Type.UNRECOVERABLE_ERROR,
+    error_status={"code": 13, "message": "boom"},
+)
+SUGGESTIONS = dialogflow_v2.HumanAgentAssistantEvent(
+    conversation=CONVERSATION,
+    participant=CONVERSATION + "/participants/agent",
+    suggestion_results=[
+        {"suggest_faq_answers_response": {"faq_answers": [{"answer": "a"}]}},
+        {"error": {"code": 5}},
+    ],
+)
+
+
+def _encode(message, message_format):
+    if message_format == MessageFormat.JSON:
+        return type(message).to_json(message).encode("utf-8")
+    return type(message).serialize(message)
+
+
+def test_detect_format():
+    assert notification_events.detect_format(b' \n{"a": 1}') == MessageFormat.JSON
+    assert notification_events.detect_format('{"a": 1}') == MessageFormat.JSON
+    assert (
+        notification_events.detect_format(_encode(NEW_MESSAGE, MessageFormat.PROTO))
+        == MessageFormat.PROTO
+    )
+
+
+def test_detect_format_proto_with_brace_length():
+    # A 123-byte conversation name is encoded as b"\n{" + name.
+    conversation = "projects/p/conversations/" + "c" * 98
+    assert len(conversation) == 123
+    event = dialogflow_v2.ConversationEvent(
+        conversation=conversation,
+        type_=dialogflow_v2.ConversationEvent.Type.CONVERSATION_STARTED,
+    )
+    data = _encode(event, MessageFormat.PROTO)
+    assert data[:2] == b"\n{"
+    assert notification_events.detect_format(data) == MessageFormat.PROTO
+    assert notification_events.decode_conversation_event(data).conversation == (
+        conversation
+    )
+
+
+@pytest.mark.parametrize("message_format", [MessageFormat.PROTO, MessageFormat.JSON])
+def test_conversation_event(message_format):
+    data = _encode(NEW_MESSAGE, message_format)
+    event = notification_events.decode_conversation_event(data)
+
+    assert event.format == message_format
+    assert event.conversation == CONVERSATION
+    assert event.type_ == event.Type.NEW_MESSAGE
+    assert event._cache == {}
+    assert event.new_message_payload.content == "hello"
+    assert event.new_message_payload is event.new_message_payload
+    assert event.error_status is None
+    assert event.to_message() == NEW_MESSAGE
+
+    error = notification_events.decode_conversation_event(
+        mock.Mock(data=_encode(ERROR, message_format))
+    )
+    assert error.type_ == error.Type.UNRECOVERABLE_ERROR
+    assert error.error_status.message == "boom"
+    assert error.new_message_payload is None
+
+
+@pytest.mark.parametrize("message_format", [MessageFormat.PROTO, MessageFormat.JSON])
+def test_human_agent_assistant_event(message_format):
+    data = _encode(SUGGESTIONS, message_format)
+    event = notification_events.decode_human_agent_assistant_event(data, message_format)
+
+    assert event.conversation == CONVERSATION
+    assert event.participant.endswith("/participants/agent")
+    results = event.suggestion_results
+    assert results[0].suggest_faq_answers_response.faq_answers[0].answer == "a"
+    assert results[1].error.code == 5
+    assert event.to_message() == SUGGESTIONS
+
+
+def test_json_enum_names_and_proto_field_names():
+    event = notification_events.decode_conversation_event(
+        b'{"conversation": "c", "type": "CONVERSATION_STARTED",'
+        b' "new_message_payload": {"content": "x"}, "unknown": 1}'
+    )
+
+    assert event.type_ == event.Type.CONVERSATION_STARTED
+    assert event.new_message_payload.content == "x"
+
+
+def test_decode_batch():
+    payloads = [
+        _encode(NEW_MESSAGE, MessageFormat.PROTO),
+        _encode(ERROR, MessageFormat.JSON),
+    ]
+    events = notification_events.decode_batch(payloads)
+
+    assert [event.format for event in events] == [
+        MessageFormat.PROTO,
+        MessageFormat.JSON,
+    ]
+    assert [event.type_ for event in events] == [
+        NEW_MESSAGE.type_,
+        ERROR.type_,
+    ]
+    (event,) = notification_events.decode_batch(
+        [_encode(SUGGESTIONS, MessageFormat.PROTO)],
+        notification_events.HumanAgentAssistantEventView,
+        MessageFormat.PROTO,
+    )
+    assert len(event.suggestion_results) == 2
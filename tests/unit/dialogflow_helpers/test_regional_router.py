@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+
+import grpc
+from grpc.experimental import aio
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import fake_server, regional_router
+from google.cloud.dialogflow_helpers.shared_channel import SharedChannel
+
+GLOBAL_SESSION = "projects/p/agent/sessions/s"
+EU_SESSION = "projects/p/locations/europe-west1/agent/sessions/s"
+EU_PARTICIPANT = "projects/p/locations/europe-west1/conversations/c/participants/u"
+DETECT_INTENT = "Sessions.DetectIntent"
+
+
+@pytest.fixture
+def servers():
+    with fake_server.FakeDialogflowServer() as default:
+        with fake_server.FakeDialogflowServer() as europe:
+            yield {
+                "dialogflow.googleapis.com": default,
+                "europe-west1-dialogflow.googleapis.com": europe,
+            }
+
+
+def _factory(servers, asyncio=False):
+    def create(host):
+        address = servers[host].address
+        if asyncio:
+            channel = aio.insecure_channel(address)
+        else:
+            channel = grpc.insecure_channel(address)
+        return SharedChannel(host=host, channels=[channel], asyncio=asyncio)
+
+    return create
+
+
+def test_location_of():
+    router = regional_router.RegionalRouter(dialogflow_v2.ParticipantsClient)
+
+    assert router.location_of(EU_PARTICIPANT) == "europe-west1"
+    assert router.location_of("projects/p/locations/us-east1") == "us-east1"
+    assert router.location_of("projects/p/conversations/c") == "global"
+    assert regional_router.endpoint_for("global") == "dialogflow.googleapis.com"
+    assert (
+        regional_router.endpoint_for("europe-west1")
+        == "europe-west1-dialogflow.googleapis.com"
+    )
+
+
+def test_routes_only_rpcs():
+    router = regional_router.RegionalRouter(dialogflow_v2.SessionsClient)
+
+    assert callable(router.detect_intent)
+    assert callable(router.list_locations)
+    for name in ("session_path", "from_service_account_file", "get_transport_class"):
+        with pytest.raises(AttributeError):
+            getattr(router, name)
+    assert router.locations == []
+
+
+def test_routes_by_resource(servers):
+    with regional_router.RegionalRouter(
+        dialogflow_v2.SessionsClient, channel_factory=_factory(servers)
+    ) as router:
+        router.detect_intent(session=EU_SESSION)
+        router.detect_intent(request={"session": EU_SESSION})
+        router.detect_intent(dialogflow_v2.DetectIntentRequest(session=GLOBAL_SESSION))
+        # Streaming calls are routed on their first request.
+        responses = router.streaming_detect_intent(
+            requests=iter(
+                [dialogflow_v2.StreamingDetectIntentRequest(session=EU_SESSION)]
+            )
+        )
+        list(responses)
+
+        assert router.locations == ["europe-west1", "global"]
+        assert router.calls == {"europe-west1": 3, "global": 1}
+
+    europe = servers["europe-west1-dialogflow.googleapis.com"]
+    assert europe.calls[DETECT_INTENT] == 2
+    assert servers["dialogflow.googleapis.com"].calls[DETECT_INTENT] == 1
+    with pytest.raises(ValueError):
+        router.client_for("global")
+
+
+@pytest.mark.asyncio
+async def test_async_routing(servers):
+    router = regional_router.RegionalRouter(
+        dialogflow_v2.SessionsAsyncClient,
+        channel_factory=_factory(servers, asyncio=True),
+    )
+    router.warm(["europe-west1"])
+    await router.detect_intent(session=EU_SESSION)
+
+    async def requests():
+        yield dialogflow_v2.StreamingDetectIntentRequest(session=EU_SESSION)
+
+    # Routed on the first request, read ahead of the call.
+    stream = await router.streaming_detect_intent(requests=requests())
+    async for _ in stream:
+        pass
+    stream = await router.streaming_detect_intent(
+        requests=requests(), location="europe-west1"
+    )
+    async for _ in stream:
+        pass
+    await router.close()
+
+    assert router.calls == {"europe-west1": 3}
+    europe = servers["europe-west1-dialogflow.googleapis.com"]
+    assert europe.calls[DETECT_INTENT] == 1
+    assert europe.calls["Sessions.StreamingDetectIntent"] == 2
+
+
+def test_client_created_outside_lock(servers):
+    created = []
+    barrier = threading.Barrier(2)
+    factory = _factory(servers)
+
+    def slow_factory(host):
+        # Both callers build a channel; the router lock is not held.
+        barrier.wait(timeout=5)
+        channel = factory(host)
+        created.append(channel)
+        return channel
+
+    router = regional_router.RegionalRouter(
+        dialogflow_v2.SessionsClient, channel_factory=slow_factory
+    )
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(router.client_for("global")))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients[0] is clients[1]
+    assert len(created) == 2
+    assert sorted(channel.closed for channel in created) == [False, True]
+    router.close()
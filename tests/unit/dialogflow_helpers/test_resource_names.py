@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import re
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import resource_names
+
+MESSAGE = "projects/{project}/conversations/{conversation}/messages/{message}"
+
+
+def test_render_and_parse():
+    template = resource_names.path_template(MESSAGE)
+    name = "projects/p/conversations/c/messages/m"
+
+    assert resource_names.path_template(MESSAGE) is template
+    assert template.variables == ("project", "conversation", "message")
+    assert template.render("p", "c", "m") == name
+    assert template.render("p", conversation="c", message="m") == name
+    assert template.parse(name) == {
+        "project": "p",
+        "conversation": "c",
+        "message": "m",
+    }
+    assert template.parse("projects/p/conversations/c") == {}
+    assert template.parse_many([name, "bad"]) == [template.parse(name), {}]
+    assert template.matches(name)
+
+
+def test_matches_generated_patterns():
+    template = resource_names.path_template(
+        "projects/{project}/agent/sessions/{session}/contexts/{context}"
+    )
+    generated = (
+        r"^projects/(?P<project>.+?)/agent/sessions/(?P<session>.+?)"
+        r"/contexts/(?P<context>.+?)$"
+    )
+
+    assert template.pattern.pattern == generated
+    for name in (
+        "projects/p/agent/sessions/s/contexts/c",
+        "projects/p/agent/sessions/s/contexts/c/contexts/d",
+        "projects/p/agent/sessions/s/contexts/c\n",
+        "projects//agent/sessions/s/contexts/c",
+    ):
+        m = re.match(generated, name)
+        assert template.parse(name) == (m.groupdict() if m else {})
+
+
+def test_parse_many_templates():
+    names = [
+        "projects/p/agent/intents/i",
+        "projects/p/locations/l/agent/intents/i",
+        "other",
+    ]
+    results = resource_names.parse_many(
+        names,
+        [
+            "projects/{project}/locations/{location}/agent/intents/{intent}",
+            "projects/{project}/agent/intents/{intent}",
+        ],
+    )
+
+    assert results[0] == (
+        "projects/{project}/agent/intents/{intent}",
+        {"project": "p", "intent": "i"},
+    )
+    assert results[1][1]["location"] == "l"
+    assert results[2] == (None, {})
+
+
+def test_matches_client_helpers():
+    client = dialogflow_v2.ParticipantsClient
+    template = resource_names.path_template(MESSAGE)
+    name = client.message_path("p", "c", "m")
+
+    assert template.render(project="p", conversation="c", message="m") == name
+    assert template.parse(name) == client.parse_message_path(name)
+    assert template.parse("projects/p") == client.parse_message_path("projects/p")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+from google.api_core import exceptions as core_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import session_contexts
+
+SESSION = "projects/p/agent/sessions/s"
+
+
+def _response(**lifespans):
+    return dialogflow_v2.DetectIntentResponse(
+        query_result=dialogflow_v2.QueryResult(
+            output_contexts=[
+                dialogflow_v2.Context(
+                    name=SESSION + "/contexts/" + context_id,
+                    lifespan_count=lifespan,
+                )
+                for context_id, lifespan in lifespans.items()
+            ]
+        )
+    )
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reads_and_writes_locally():
+    contexts = session_contexts.SessionContexts(SESSION)
+    client = mock.Mock()
+    client.detect_intent.return_value = _response(greeting=2, order=3)
+
+    contexts.set_context("Order", lifespan_count=3, parameters={"id": 7})
+    assert contexts.get_context("order").parameters["id"] == 7
+    contexts.detect_intent(client, query_input={"text": {"text": "hi"}})
+
+    request = client.detect_intent.call_args.kwargs["request"]
+    assert request.session == SESSION
+    assert [c.name for c in request.query_params.contexts] == [
+        SESSION + "/contexts/Order"
+    ]
+    assert not contexts.pending
+    assert sorted(c.name for c in contexts.list_contexts()) == [
+        SESSION + "/contexts/greeting",
+        SESSION + "/contexts/order",
+    ]
+    assert contexts.get_context(SESSION + "/contexts/greeting").lifespan_count == 2
+
+    contexts.delete_context("greeting")
+    assert "greeting" not in contexts
+    client.detect_intent.return_value = _response(order=2)
+    contexts.detect_intent(client, query_input={"text": {"text": "ok"}})
+    assert request.query_params.contexts[0].lifespan_count == 3
+    sent = client.detect_intent.call_args.kwargs["request"].query_params.contexts
+    assert [(c.name, c.lifespan_count) for c in sent] == [
+        (SESSION + "/contexts/greeting", 0)
+    ]
+    assert [c.name for c in contexts.list_contexts()] == [SESSION + "/contexts/order"]
+
+
+def test_failed_query_restores_writes():
+    contexts = session_contexts.SessionContexts(SESSION)
+    client = mock.Mock()
+    client.detect_intent.side_effect = core_exceptions.ServiceUnavailable("down")
+
+    contexts.set_context("order")
+    with pytest.raises(core_exceptions.ServiceUnavailable):
+        contexts.detect_intent(
+            client,
+            request={"query_params": {"contexts": [{"name": SESSION + "/contexts/x"}]}},
+        )
+
+    assert [c.name for c in contexts.pending] == [SESSION + "/contexts/order"]
+
+
+def test_expires_after_ttl():
+    clock = FakeClock()
+    contexts = session_contexts.SessionContexts(SESSION, ttl=60, clock=clock)
+    contexts.observe(_response(greeting=5))
+
+    clock.now = 59
+    assert "greeting" in contexts
+    clock.now = 60
+    assert contexts.list_contexts() == []
+
+
+def test_analyze_content_learns_session():
+    contexts = session_contexts.SessionContexts()
+    response = dialogflow_v2.AnalyzeContentResponse(
+        automated_agent_reply={"detect_intent_response": _response(greeting=1)}
+    )
+    client = mock.Mock()
+    client.analyze_content.return_value = response
+
+    with pytest.raises(ValueError):
+        contexts.set_context("order")
+    contexts.analyze_content(
+        client,
+        participant="projects/p/conversations/c/participants/u",
+        text_input={"text": "hi", "language_code": "en"},
+    )
+    assert contexts.session == SESSION
+    assert contexts.get_context("greeting") is not None
+    assert not contexts.observe(dialogflow_v2.AnalyzeContentResponse())
+    assert not contexts.observe(dialogflow_v2.StreamingDetectIntentResponse())
+
+
+@pytest.mark.asyncio
+async def test_async_detect_intent():
+    contexts = session_contexts.SessionContexts(SESSION)
+    client = mock.Mock()
+    client.detect_intent = mock.AsyncMock(return_value=_response(greeting=1))
+
+    await contexts.adetect_intent(client, query_input={"event": {"name": "WELCOME"}})
+
+    assert "greeting" in contexts
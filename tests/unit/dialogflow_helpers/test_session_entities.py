@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+from google.api_core import exceptions as core_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import session_entities
+
+SESSION = "projects/p/agent/sessions/s"
+CONTACTS = {"alice": ["Alice", "Al"], "bob": ["Bob"]}
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _sent(client):
+    request = client.detect_intent.call_args.kwargs["request"]
+    return [s.name for s in request.query_params.session_entity_types]
+
+
+def test_attaches_only_changes():
+    clock = FakeClock()
+    manager = session_entities.SessionEntityManager(ttl=600, clock=clock)
+    client = mock.Mock()
+
+    assert manager.set_entities(SESSION, "contact", CONTACTS)
+    manager.set_entities(SESSION, "order", {"42": ["42"]})
+    manager.detect_intent(client, session=SESSION, query_input={"text": {}})
+    assert _sent(client) == [
+        SESSION + "/entityTypes/contact",
+        SESSION + "/entityTypes/order",
+    ]
+
+    # The same entities in another order are not sent again.
+    assert not manager.set_entities(
+        SESSION, "contact", {"bob": ["Bob"], "alice": ["Al", "Alice"]}
+    )
+    clock.now = 100
+    manager.detect_intent(client, session=SESSION, query_input={"text": {}})
+    assert _sent(client) == []
+
+    manager.set_entities(SESSION, "order", {"43": ["43"]})
+    clock.now = 200
+    manager.detect_intent(client, session=SESSION, query_input={"text": {}})
+    assert _sent(client) == [SESSION + "/entityTypes/order"]
+    assert manager.sent == 3
+    assert manager.skipped == 1
+
+    # Close to the server's expiry, everything is sent again.
+    clock.now = 780
+    assert len(manager.pending(SESSION)) == 2
+
+
+def test_failed_query_keeps_changes():
+    manager = session_entities.SessionEntityManager()
+    client = mock.Mock()
+    client.detect_intent.side_effect = core_exceptions.ServiceUnavailable("down")
+
+    manager.set_entities(SESSION, "contact", CONTACTS)
+    with pytest.raises(core_exceptions.ServiceUnavailable):
+        manager.detect_intent(client, request={"session": SESSION})
+
+    assert [s.name for s in manager.pending(SESSION)] == [
+        SESSION + "/entityTypes/contact"
+    ]
+
+
+def test_sync_creates_missing():
+    manager = session_entities.SessionEntityManager()
+    client = mock.Mock()
+    client.update_session_entity_type.side_effect = core_exceptions.NotFound("gone")
+
+    manager.set_entities(
+        SESSION, "contact", CONTACTS, override_mode=session_entities.SUPPLEMENT
+    )
+    assert manager.sync(client, SESSION) == 1
+
+    created = client.create_session_entity_type.call_args.kwargs
+    assert created["parent"] == SESSION
+    entity_type = created["session_entity_type"]
+    assert entity_type.entity_override_mode == session_entities.SUPPLEMENT
+    assert [e.value for e in entity_type.entities] == ["alice", "bob"]
+
+
+def test_sync_does_not_extend_ttl():
+    clock = FakeClock()
+    manager = session_entities.SessionEntityManager(ttl=600, clock=clock)
+    client = mock.Mock()
+
+    manager.set_entities(SESSION, "contact", CONTACTS)
+    manager.detect_intent(client, session=SESSION)
+    manager.set_entities(SESSION, "contact", {"carol": ["Carol"]})
+    clock.now = 500
+    assert manager.sync(client, SESSION) == 1
+    assert manager.sync(client, SESSION) == 0
+    assert manager._sessions[SESSION].last_query == 0
+
+    # The session expires 600s after the query, not after the sync.
+    clock.now = 580
+    assert len(manager.pending(SESSION)) == 1
+    assert manager.sync(client, SESSION) == 1
+
+
+def test_analyze_content_and_pruning():
+    clock = FakeClock()
+    manager = session_entities.SessionEntityManager(ttl=600, clock=clock)
+    client = mock.Mock()
+
+    manager.set_entities(
+        SESSION, "contact", [dialogflow_v2.EntityType.Entity(value="a")]
+    )
+    manager.analyze_content(
+        client, SESSION, participant="projects/p/conversations/c/participants/u"
+    )
+    request = client.analyze_content.call_args.kwargs["request"]
+    assert len(request.query_params.session_entity_types) == 1
+    assert manager.pending(SESSION) == []
+
+    clock.now = 600
+    manager.set_entities("projects/p/agent/sessions/t", "contact", {})
+    assert list(manager._sessions) == ["projects/p/agent/sessions/t"]
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+import grpc
+from grpc.experimental import aio
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import fake_server, shared_channel
+from google.cloud.dialogflow_v2.services.sessions import transports
+
+SESSION = "projects/p/agent/sessions/s"
+
+
+@pytest.fixture
+def server():
+    with fake_server.FakeDialogflowServer() as server:
+        yield server
+
+
+def test_clients_share_one_channel(server):
+    channel = mock.Mock(wraps=grpc.insecure_channel(server.address))
+    shared = shared_channel.SharedChannel(channels=[channel])
+
+    sessions = shared.client(dialogflow_v2.SessionsClient)
+    intents = shared.client(dialogflow_v2.IntentsClient)
+    participants = shared.client(dialogflow_v2.ParticipantsClient)
+    assert shared.references == 4
+
+    with sessions:
+        sessions.detect_intent(session=SESSION)
+    # Closing twice releases a single reference.
+    intents.transport.close()
+    intents.transport.close()
+    assert shared.references == 2
+
+    participants.analyze_content(
+        participant="projects/p/conversations/c/participants/u"
+    )
+    shared.close()
+    shared.close()
+    assert not shared.closed
+    channel.close.assert_not_called()
+
+    participants.transport.close()
+    assert shared.closed
+    channel.close.assert_called_once_with()
+    with pytest.raises(ValueError):
+        shared.acquire()
+
+
+def test_connect(server):
+    channel = mock.Mock(wraps=grpc.insecure_channel(server.address))
+    with shared_channel.SharedChannel(channels=[channel]) as shared:
+        shared.connect()
+
+    callback = channel.subscribe.call_args[0][0]
+    channel.subscribe.assert_called_once_with(callback, try_to_connect=True)
+    channel.unsubscribe.assert_called_once_with(callback)
+
+
+def test_pool_round_robin():
+    channels = [mock.Mock(), mock.Mock()]
+    shared = shared_channel.SharedChannel(channels=channels)
+    transport = shared.transport(transports.SessionsGrpcTransport)
+
+    stub = transport.detect_intent
+    assert isinstance(stub, grpc.UnaryUnaryMultiCallable)
+    assert isinstance(transport.streaming_detect_intent, grpc.StreamStreamMultiCallable)
+    stub("a")
+    stub("b")
+    stub.with_call("c")
+
+    first = channels[0].unary_unary.return_value
+    second = channels[1].unary_unary.return_value
+    first.assert_called_once_with("a")
+    second.assert_called_once_with("b")
+    first.with_call.assert_called_once_with("c")
+
+    transport.close()
+    shared.close()
+    for channel in channels:
+        channel.close.assert_called_once_with()
+
+
+def test_creates_channels_with_transport_settings():
+    with mock.patch.object(
+        transports.SessionsGrpcTransport, "create_channel"
+    ) as create_channel:
+        shared = shared_channel.SharedChannel(
+            host="us-central1-dialogflow.googleapis.com", pool_size=2
+        )
+
+    assert create_channel.call_count == 2
+    args, kwargs = create_channel.call_args
+    assert args == ("us-central1-dialogflow.googleapis.com:443",)
+    assert ("grpc.use_local_subchannel_pool", 1) in kwargs["options"]
+    assert ("grpc.max_send_message_length", -1) in kwargs["options"]
+    transport = shared.transport(transports.SessionsGrpcTransport)
+    assert transport._host == "us-central1-dialogflow.googleapis.com:443"
+
+    with pytest.raises(ValueError):
+        shared.transport(transports.SessionsGrpcAsyncIOTransport)
+    with pytest.raises(ValueError):
+        shared_channel.SharedChannel(pool_size=0)
+
+
+@pytest.mark.asyncio
+async def test_asyncio_clients(server):
+    shared = shared_channel.SharedChannel(
+        asyncio=True, channels=[aio.insecure_channel(server.address)]
+    )
+    sessions = shared.client(dialogflow_v2.SessionsAsyncClient)
+    contexts = shared.client(dialogflow_v2.ContextsAsyncClient)
+
+    async with sessions:
+        response = await sessions.detect_intent(session=SESSION)
+    assert response.query_result
+    assert shared.references == 2
+
+    await shared.close()
+    assert not shared.closed
+    await contexts.transport.close()
+    assert shared.closed
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import datetime
+
+import pytest
+
+from google.cloud.dialogflow_helpers import streaming_latency
+from google.cloud.dialogflow_v2.types import participant, session
+
+MessageType = session.StreamingRecognitionResult.MessageType
+
+
+def _requests(chunks=3):
+    yield session.StreamingDetectIntentRequest(session="projects/p/agent/sessions/s")
+    for _ in range(chunks):
+        yield session.StreamingDetectIntentRequest(input_audio=b"\x00" * 320)
+
+
+def _debugging_info():
+    return session.CloudConversationDebuggingInfo(
+        audio_data_chunks=3,
+        first_audio_duration=datetime.timedelta(milliseconds=20),
+        result_end_time_offset=datetime.timedelta(milliseconds=900),
+        single_utterance_end_time_offset=datetime.timedelta(milliseconds=1200),
+        speech_partial_results_end_times=[datetime.timedelta(milliseconds=300)],
+        client_half_close_time_offset=datetime.timedelta(milliseconds=1300),
+        client_half_close_streaming_time_offset=datetime.timedelta(milliseconds=1500),
+    )
+
+
+class FakeSessionsClient(object):
+    def __init__(self):
+        self.requests = []
+
+    def streaming_detect_intent(self, requests, **kwargs):
+        def responses():
+            for request in requests:
+                self.requests.append(request)
+                if request.input_audio and len(self.requests) == 2:
+                    yield session.StreamingDetectIntentResponse(
+                        recognition_result={
+                            "message_type": MessageType.TRANSCRIPT,
+                            "transcript": "hel",
+                        }
+                    )
+            yield session.StreamingDetectIntentResponse(
+                recognition_result={
+                    "message_type": MessageType.TRANSCRIPT,
+                    "transcript": "hello",
+                    "is_final": True,
+                }
+            )
+            yield session.StreamingDetectIntentResponse(
+                recognition_result={"message_type": MessageType.END_OF_SINGLE_UTTERANCE}
+            )
+            yield session.StreamingDetectIntentResponse(
+                query_result={"query_text": "hello"},
+                debugging_info=_debugging_info(),
+            )
+
+        return responses()
+
+
+def test_streaming_detect_intent_breakdown():
+    client = FakeSessionsClient()
+    tracker = streaming_latency.StreamLatencyTracker()
+
+    responses = list(tracker.streaming_detect_intent(client, _requests()))
+
+    assert len(responses) == 4
+    assert client.requests[0].enable_debugging_info
+    assert len(tracker.breakdowns) == 1
+    breakdown = tracker.breakdowns[0]
+    assert breakdown.session == "projects/p/agent/sessions/s"
+    assert breakdown.audio_chunks == 3
+    assert breakdown.audio_bytes == 960
+    assert breakdown.server_audio_chunks == 3
+    assert breakdown.time_to_first_partial >= 0
+    assert breakdown.time_to_final_transcript >= breakdown.time_to_first_partial
+    assert breakdown.post_half_close_latency >= 0
+    assert breakdown.total >= breakdown.post_half_close_latency
+    assert breakdown.first_audio_duration == pytest.approx(0.02)
+    assert breakdown.endpointing_delay == pytest.approx(0.3)
+    assert breakdown.streaming_lag == pytest.approx(0.2)
+    assert breakdown.speech_partial_offsets == [pytest.approx(0.3)]
+    assert breakdown.no_speech_timeout is None
+
+    summary = tracker.summary()
+    assert summary["total"]["count"] == 1
+    assert set(summary["endpointing_delay"]) == {"count", "mean", "p50", "p90", "p99"}
+    # The fake consumes every request before signalling the end of speech.
+    assert breakdown.half_close_lag == 0.0
+    assert summary["half_close_lag"]["p99"] == 0.0
+
+
+def test_half_close_lag_measures_audio_sent_after_end_of_utterance():
+    tracker = streaming_latency.StreamLatencyTracker()
+    timeline = tracker.timeline()
+
+    requests = timeline.requests(_requests(chunks=2))
+    next(requests)
+    next(requests)
+    timeline._on_response(
+        session.StreamingDetectIntentResponse(
+            recognition_result={"message_type": MessageType.END_OF_SINGLE_UTTERANCE}
+        )
+    )
+    list(requests)
+
+    breakdown = timeline.breakdown()
+    assert breakdown.half_close_lag >= 0
+    assert breakdown.audio_chunks == 2
+    assert breakdown.total is None
+
+
+def test_text_only_stream_leaves_audio_components_unset():
+    timeline = streaming_latency.StreamTimeline()
+    list(
+        timeline.requests(
+            [
+                participant.StreamingAnalyzeContentRequest(
+                    participant="projects/p/conversations/c/participants/u",
+                    input_text="hi",
+                )
+            ]
+        )
+    )
+    list(
+        timeline.responses(
+            [participant.StreamingAnalyzeContentResponse(reply_text="hello")]
+        )
+    )
+
+    breakdown = timeline.breakdown()
+    assert breakdown.session == "projects/p/conversations/c/participants/u"
+    assert breakdown.first_chunk_delay is None
+    assert breakdown.time_to_first_partial is None
+    assert breakdown.post_half_close_latency >= 0
+    assert "session" in breakdown.as_dict()
+
+
+def test_tracker_keeps_recent_breakdowns():
+    tracker = streaming_latency.StreamLatencyTracker(keep=2)
+    for _ in range(3):
+        list(tracker.streaming_detect_intent(FakeSessionsClient(), _requests()))
+
+    assert len(tracker.breakdowns) == 2
+    assert tracker.histograms["total"].count == 3
+
+
+@pytest.mark.asyncio
+async def test_streaming_detect_intent_async():
+    class FakeSessionsAsyncClient(object):
+        async def streaming_detect_intent(self, requests, **kwargs):
+            async def responses():
+                received = [request async for request in requests]
+                assert received[0].enable_debugging_info
+                yield session.StreamingDetectIntentResponse(
+                    query_result={"query_text": "hello"},
+                    debugging_info=_debugging_info(),
+                )
+
+            return responses()
+
+    async def requests():
+        for request in _requests():
+            yield request
+
+    tracker = streaming_latency.StreamLatencyTracker()
+    stream = await tracker.streaming_detect_intent_async(
+        FakeSessionsAsyncClient(), requests()
+    )
+    responses = [response async for response in stream]
+
+    assert len(responses) == 1
+    assert tracker.breakdowns[0].audio_chunks == 3
+    assert tracker.breakdowns[0].endpointing_delay == pytest.approx(0.3)
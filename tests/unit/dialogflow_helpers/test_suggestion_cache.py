@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# try/except added for compatibility with python < 3.8
+try:
+    from unittest import mock
+except ImportError:  # pragma: NO COVER
+    import mock
+
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import suggestion_cache
+
+CONVERSATION = "projects/p/conversations/c"
+AGENT = CONVERSATION + "/participants/agent"
+USER = CONVERSATION + "/participants/user"
+Feature = suggestion_cache.Feature
+
+
+def _message(number, participant=USER, role="END_USER"):
+    return {
+        "name": "{}/messages/m{}".format(CONVERSATION, number),
+        "participant": participant,
+        "participant_role": role,
+    }
+
+
+def _faq_result(number, context_size=3, answer="a"):
+    return {
+        "suggest_faq_answers_response": {
+            "faq_answers": [{"answer": answer}],
+            "latest_message": "{}/messages/m{}".format(CONVERSATION, number),
+            "context_size": context_size,
+        }
+    }
+
+
+def _analyze_content_response(number, **kwargs):
+    return dialogflow_v2.AnalyzeContentResponse(message=_message(number), **kwargs)
+
+
+def test_observe_feeds_suggest_calls():
+    cache = suggestion_cache.SuggestionCache()
+    client = mock.Mock()
+    response = _analyze_content_response(
+        1,
+        human_agent_suggestion_results=[
+            _faq_result(1),
+            {"error": {"code": 13}},
+        ],
+    )
+
+    assert cache.observe(response, human_agent=AGENT) == 1
+
+    result = cache.suggest_faq_answers(client, parent=AGENT)
+    assert result.faq_answers[0].answer == "a"
+    # Fewer messages than requested means any larger request is the same.
+    request = {"parent": AGENT, "latest_message": CONVERSATION + "/messages/m1"}
+    assert cache.suggest_faq_answers(client, dict(request, context_size=50)) is result
+    assert cache.get(Feature.FAQ, dict(request, context_size=2)) is None
+    # Other features and participants are not cached.
+    assert cache.get(Feature.ARTICLE_SUGGESTION, request) is None
+    assert cache.get(Feature.FAQ, dict(request, parent=USER)) is None
+    assert (cache.hits, cache.misses) == (2, 0)
+    client.suggest_faq_answers.assert_not_called()
+
+
+def test_new_message_invalidates_latest():
+    cache = suggestion_cache.SuggestionCache()
+    cache.set_participant(AGENT, suggestion_cache.Role.HUMAN_AGENT)
+    cache.observe(
+        _analyze_content_response(1, human_agent_suggestion_results=[_faq_result(1)])
+    )
+    cache.observe(_analyze_content_response(2))
+    client = mock.Mock()
+    client.suggest_faq_answers.return_value = dialogflow_v2.SuggestFaqAnswersResponse(
+        _faq_result(2, answer="b")["suggest_faq_answers_response"]
+    )
+
+    result = cache.suggest_faq_answers(client, parent=AGENT, timeout=5)
+
+    assert result.faq_answers[0].answer == "b"
+    client.suggest_faq_answers.assert_called_once_with(
+        request=dialogflow_v2.SuggestFaqAnswersRequest(parent=AGENT), timeout=5
+    )
+    assert cache.suggest_faq_answers(client, parent=AGENT).faq_answers[0].answer == "b"
+    assert client.suggest_faq_answers.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_participants_learned_from_messages():
+    cache = suggestion_cache.SuggestionCache()
+    cache.observe(
+        dialogflow_v2.AnalyzeContentResponse(
+            message=_message(1, AGENT, "HUMAN_AGENT"),
+            end_user_suggestion_results=[_faq_result(1)],
+        )
+    )
+    # The end user is not known yet.
+    assert cache.get(Feature.FAQ, {"parent": USER}) is None
+
+    cache.observe(
+        _analyze_content_response(
+            2, human_agent_suggestion_results=[_faq_result(2, answer="x")]
+        )
+    )
+    assert cache.get(Feature.FAQ, {"parent": AGENT}).faq_answers[0].answer == "x"
+
+
+def test_uncacheable_requests_and_full_context():
+    cache = suggestion_cache.SuggestionCache()
+    latest = CONVERSATION + "/messages/m9"
+    response = dialogflow_v2.SuggestSmartRepliesResponse(
+        latest_message=latest, context_size=20
+    )
+    cache.put(AGENT, Feature.SMART_REPLY, response)
+    request = {"parent": AGENT, "latest_message": latest}
+
+    assert cache.get(Feature.SMART_REPLY, request) is response
+    assert cache.get(Feature.SMART_REPLY, dict(request, context_size=30)) is None
+    assert (
+        cache.get(Feature.SMART_REPLY, dict(request, current_text_input={"text": "hi"}))
+        is None
+    )
+
+    cache.forget(CONVERSATION)
+    assert cache.get(Feature.SMART_REPLY, request) is None
+
+
+def test_bounds():
+    cache = suggestion_cache.SuggestionCache(max_conversations=1)
+    for number in range(6):
+        cache.put(
+            AGENT,
+            Feature.ARTICLE_SUGGESTION,
+            dialogflow_v2.SuggestArticlesResponse(
+                latest_message="{}/messages/m{}".format(CONVERSATION, number)
+            ),
+        )
+    request = {"parent": AGENT, "latest_message": CONVERSATION + "/messages/m{}"}
+    hits = [
+        cache.get(
+            Feature.ARTICLE_SUGGESTION,
+            dict(request, latest_message=request["latest_message"].format(number)),
+        )
+        is not None
+        for number in range(6)
+    ]
+    assert hits == [False, False, True, True, True, True]
+
+    cache.set_participant("projects/p/conversations/other/participants/a", 1)
+    assert (
+        cache.get(
+            Feature.ARTICLE_SUGGESTION,
+            dict(request, latest_message=CONVERSATION + "/messages/m5"),
+        )
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_async():
+    cache = suggestion_cache.SuggestionCache()
+    client = mock.Mock()
+    client.analyze_content = mock.AsyncMock(
+        return_value=_analyze_content_response(
+            1, human_agent_suggestion_results=[_faq_result(1)]
+        )
+    )
+    client.suggest_faq_answers = mock.AsyncMock()
+
+    await cache.aanalyze_content(
+        client, participant=USER, text_input={"text": "hi"}, human_agent=AGENT
+    )
+    client.analyze_content.assert_awaited_once_with(
+        request=dialogflow_v2.AnalyzeContentRequest(
+            participant=USER, text_input={"text": "hi"}
+        )
+    )
+    result = await cache.asuggest_faq_answers(client, parent=AGENT)
+
+    assert result.faq_answers[0].answer == "a"
+    client.suggest_faq_answers.assert_not_awaited()
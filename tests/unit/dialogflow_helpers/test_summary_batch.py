@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import io
+import json
+import threading
+
+from google.api_core import exceptions as core_exceptions
+import pytest
+
+from google.cloud import dialogflow_v2
+from google.cloud.dialogflow_helpers import summary_batch
+
+
+def _name(index):
+    return "projects/p/locations/us/conversations/c{}".format(index)
+
+
+class _Client(object):
+    def __init__(self, messages=30, fail=()):
+        self.messages = messages
+        self.fail = set(fail)
+        self.read = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def list_messages(self, request, **kwargs):
+        # Newest first, like the API.
+        for index in reversed(range(self.messages)):
+            with self._lock:
+                self.read[request["parent"]] = self.read.get(request["parent"], 0) + 1
+            yield dialogflow_v2.Message(
+                name="{}/messages/m{}".format(request["parent"], index),
+                content="message {}".format(index),
+                language_code="en",
+                participant=request["parent"] + "/participants/u",
+                participant_role="END_USER",
+                sentiment_analysis={"query_text_sentiment": {"score": 0.5}},
+            )
+
+    def _respond(self, conversation, request):
+        with self._lock:
+            self.requests.append(request)
+        if conversation in self.fail:
+            raise core_exceptions.ResourceExhausted("slow down")
+        return {
+            "summary": {
+                "text": "summary of " + conversation,
+                "text_sections": {"a": "b"},
+            },
+            "latest_message": conversation + "/messages/m29",
+            "context_size": 10,
+        }
+
+    def generate_stateless_summary(self, request, **kwargs):
+        messages = request.stateless_conversation.messages
+        conversation = messages[0].participant.split("/participants/")[0]
+        return dialogflow_v2.GenerateStatelessSummaryResponse(
+            self._respond(conversation, request)
+        )
+
+    def suggest_conversation_summary(self, request, **kwargs):
+        return dialogflow_v2.SuggestConversationSummaryResponse(
+            self._respond(request["conversation"], request)
+        )
+
+
+def test_minimal_conversation_keeps_newest_in_order():
+    client = _Client(messages=30)
+    messages = client.list_messages({"parent": _name(0)})
+
+    minimal = summary_batch.minimal_conversation(
+        messages, "projects/p/locations/us", max_context_size=10
+    )
+
+    assert [m.content for m in minimal.messages] == [
+        "message {}".format(i) for i in range(20, 30)
+    ]
+    assert "sentiment_analysis" not in minimal.messages[0]
+    assert minimal.parent == "projects/p/locations/us"
+    # Only one message past the limit was read from the pager.
+    assert client.read[_name(0)] == 11
+
+
+def test_location_of():
+    assert summary_batch.location_of(_name(1)) == "projects/p/locations/us"
+    assert (
+        summary_batch.location_of("projects/p/conversations/c")
+        == "projects/p/locations/global"
+    )
+
+
+def test_stateless_run_with_checkpoint(tmp_path):
+    client = _Client(fail={_name(3)})
+    checkpoint = str(tmp_path / "done")
+    output = io.StringIO()
+    summarizer = summary_batch.BatchSummarizer(
+        client,
+        output,
+        conversation_profile=dialogflow_v2.ConversationProfile(language_code="en"),
+        max_context_size=5,
+        concurrency=3,
+        checkpoint=checkpoint,
+    )
+
+    stats = summarizer.run(
+        [_name(i) for i in range(4)] + [dialogflow_v2.Conversation(name=_name(4))]
+    )
+
+    assert (stats.succeeded, stats.failed, stats.skipped) == (4, 1, 0)
+    assert stats.errors == {"RESOURCE_EXHAUSTED": 1}
+    records = {
+        r["conversation"]: r
+        for r in map(json.loads, output.getvalue().split("\n")[:-1])
+    }
+    assert records[_name(0)]["summary"] == "summary of " + _name(0)
+    assert records[_name(0)]["text_sections"] == {"a": "b"}
+    assert records[_name(3)]["error"] == "RESOURCE_EXHAUSTED: slow down"
+    request = client.requests[0]
+    assert request.max_context_size == 5
+    assert len(request.stateless_conversation.messages) == 5
+    assert request.conversation_profile.language_code == "en"
+
+    client.fail.clear()
+    stats = summarizer.run([_name(i) for i in range(5)])
+    assert (stats.succeeded, stats.failed, stats.skipped) == (1, 0, 4)
+    assert sorted(open(checkpoint).read().split()) == [_name(i) for i in range(5)]
+    assert "1 summarized" in stats.format()
+
+
+def test_suggest_mode():
+    client = _Client()
+    output = io.StringIO()
+    summarizer = summary_batch.BatchSummarizer(
+        client, output, mode=summary_batch.SUGGEST, max_context_size=50
+    )
+
+    stats = summarizer.run([_name(0)])
+
+    assert stats.succeeded == 1
+    assert client.read == {}
+    assert client.requests == [{"conversation": _name(0), "context_size": 50}]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        summary_batch.BatchSummarizer(_Client(), io.StringIO())
+    with pytest.raises(ValueError):
+        summary_batch.BatchSummarizer(
+            _Client(), io.StringIO(), mode=summary_batch.SUGGEST, max_context_size=0
+        )
+    with pytest.raises(ValueError):
+        summary_batch.BatchSummarizer(_Client(), io.StringIO(), mode="x")
+
+
+def test_rate_limiter():
+    now = [10.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+
+    limiter = summary_batch.RateLimiter(4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert sleeps == [0.25, 0.5]
+
+    now[0] = 20.0
+    limiter.acquire()
+    assert sleeps == [0.25, 0.5]
+    summary_batch.RateLimiter(None).acquire()